@@ -5,14 +5,26 @@ EmaAgent 主入口模块
 并向外提供普通调用与流式调用两套接口
 """
 import asyncio
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Optional, TYPE_CHECKING, List, Dict, Any, Callable, Awaitable
+from typing import Optional, TYPE_CHECKING, List, Dict, Any, Callable, Awaitable, Iterator, Set, Tuple
 
 from agent.react import ReActAgent
+from agent.session_lock import SessionLocks
 from llm.client import LLMClient
 from llm.config import LLMConfig
-from memory.compressor import Compressor
-from memory.schema import AssistantMessage, AgentRuntimeState, Session, UserMessage
+from llm.cache import configure_response_cache, get_response_cache
+from llm.hedging import configure_hedging, get_hedge_policy
+from llm.pool import close_openai_clients, configure_client_pool
+from llm.provider_pool import configure_provider_pool, get_provider_pool
+from llm.retry import configure_retry_policy
+from llm.scheduler import configure_llm_scheduler
+from llm.telemetry import configure_llm_telemetry, telemetry_scope
+from llm.tokenizer import MESSAGE_OVERHEAD_TOKENS, TokenCounter, load_token_counter
+from memory.compressor import CompressionScheduler, Compressor
+from memory.embedding import create_embedder
+from memory.longterm import LongTermMemory, MemoryItem, extract_facts, format_memories
+from memory.schema import AssistantMessage, AgentRuntimeState, CompressionRecord, Session, UserMessage
 from narrative.core import NarrativeMemory
 from prompts import PERSONA_PROFILE_PROMPT, STORY_SUMMARY_PROMPT
 from ema_mcp.manager import MCPManager
@@ -29,8 +41,23 @@ VALID_MODES = {"chat", "agent", "narrative", "finish"}
 
 MAX_ATTACHMENT_EXCERPT_CHARS = 12000
 MAX_MERGED_INPUT_CHARS = 20000
-MAX_SINGLE_MESSAGE_CHARS = 32000
-MAX_TOTAL_CONTEXT_CHARS = 180000
+# 单条消息 token 上限 避免附件正文或历史单条过长
+MAX_SINGLE_MESSAGE_TOKENS = 16000
+# 关闭时等待后台压缩完成的最长秒数 超时后取消 下次对话后会重新调度
+COMPRESSION_SHUTDOWN_TIMEOUT = 10
+# 历史摘要最多占用的 token 数(同时不超过总预算的 1/4)
+MAX_SUMMARY_TOKENS = 4000
+# 长期记忆默认最多占用的 token 数(同时不超过总预算的 1/8)
+MAX_MEMORY_TOKENS = 1000
+# 检索长期记忆时查询文本的最大字符数 附件正文不参与检索
+MAX_MEMORY_QUERY_CHARS = 500
+# 长期记忆检索(含查询向量化)的默认最长等待秒数 超时后本轮不注入记忆
+MEMORY_RECALL_TIMEOUT = 1.5
+# 上下文预算预留的余量 覆盖近似计数误差与请求格式开销
+PROMPT_RESERVE_TOKENS = 1024
+
+# 当前调用最近一次构建的 prompt token 数 按协程上下文隔离 并发会话互不干扰
+_prompt_tokens: ContextVar[int] = ContextVar("ema_prompt_tokens", default=0)
 
 
 class EmaAgent:
@@ -56,6 +83,16 @@ class EmaAgent:
         # narrative 组件可能涉及较重的资源加载 因此采用懒加载方式 并使用锁保护初始化过程 防止并发请求导致重复初始化
         self._narrative_init_lock = asyncio.Lock()
         self._reload_lock = asyncio.Lock()
+        # 后台压缩调度器跨配置重载保留 保证同一会话始终只有一个进行中的压缩
+        self.compression_scheduler = CompressionScheduler(on_commit=self._on_compression_committed)
+        # 会话级锁 共享的 EmaAgent 同时服务多个会话时 同一会话的调用按到达顺序串行执行
+        self.session_locks = SessionLocks()
+        # 长期记忆跨配置重载保留 首次使用时加载 嵌入器变化时后台重新向量化
+        self._long_term_memory: Optional[LongTermMemory] = None
+        self._memory_init_lock = asyncio.Lock()
+        self._memory_tasks: Set["asyncio.Task[Any]"] = set()
+        # 会话删除后清除其记忆 改名后把记忆归到新ID 否则已删除会话的内容仍会被召回
+        self.session_service.add_listener(on_delete=self._on_session_deleted, on_rename=self._on_session_renamed)
         self._init_components()
 
     @property
@@ -110,6 +147,65 @@ class EmaAgent:
         """
         return self.paths.load_mcp_config()
 
+    def _model_configs(self, names: List[str], settings: Dict[str, Any], usage: str) -> List[LLMConfig]:
+        """
+        按 `llm_models` 中的模型名构建额外的模型配置
+
+        跳过不在 `llm_models` 中的模型与缺少密钥的模型
+
+        Args:
+            names (List[str]): 模型名
+            settings (Dict[str, Any]): 用户设置
+            usage (str): 日志中的用途名称
+
+        Returns:
+            List[LLMConfig]: 模型配置
+        """
+        config = self._config_cache or {}
+        catalog = config.get("llm_models") or {}
+        configs: List[LLMConfig] = []
+        for name in names:
+            if name not in catalog:
+                logger.warning(f"⚠️ {usage}模型 {name} 不在 llm_models 中 已跳过")
+                continue
+            model_config = LLMConfig.from_runtime(config, settings, model=name)
+            if not model_config.api_key:
+                logger.warning(f"⚠️ {usage}模型 {name} 缺少 API 密钥 已跳过")
+                continue
+            configs.append(model_config)
+        return configs
+
+    def _hedge_configs(self, settings: Dict[str, Any]) -> List[LLMConfig]:
+        """
+        构建对冲用的备用模型配置 跳过主模型
+
+        Args:
+            settings (Dict[str, Any]): 用户设置
+
+        Returns:
+            List[LLMConfig]: 备用模型配置 对冲关闭时为空
+        """
+        policy = get_hedge_policy()
+        if not policy.enabled:
+            return []
+        names = [name for name in policy.config["models"] if name != self.llm_config.model]
+        return self._model_configs(names, settings, "对冲")
+
+    def _pool_configs(self, settings: Dict[str, Any]) -> List[LLMConfig]:
+        """
+        构建服务商池中各模型的配置
+
+        Args:
+            settings (Dict[str, Any]): 用户设置
+
+        Returns:
+            List[LLMConfig]: 模型配置 服务商池关闭时为空
+        """
+        pool = get_provider_pool()
+        if not pool.enabled:
+            return []
+        return self._model_configs(list(pool.members), settings, "服务商池")
+
     def _init_components(self):
         """
         初始化全部核心组件
@@ -119,9 +215,30 @@ class EmaAgent:
         self._load_config()
 
         # 从配置缓存与路径设置中构建 LLM 配置对象 并初始化 LLM 客户端 
-        self.llm_config = LLMConfig.from_runtime(self._config_cache or {}, self.paths.load_settings())
-        self.llm_client = LLMClient(config=self.llm_config)
+        # LLM narrative 与 embedding 共用的连接池参数 只影响之后新建的客户端
+        configure_client_pool((self._config_cache or {}).get("http_pool"))
+        # 响应缓存为进程级单例 重载配置时保留已缓存的回复
+        configure_response_cache(
+            (self._config_cache or {}).get("llm", {}).get("response_cache"),
+            self.paths.data_dir / "llm_cache.db",
+        )
+        # 请求调度器同为进程级单例 排队中的请求按新限额继续调度
+        configure_llm_scheduler((self._config_cache or {}).get("llm", {}).get("scheduler"))
+        configure_retry_policy((self._config_cache or {}).get("llm", {}).get("retry"))
+        configure_hedging((self._config_cache or {}).get("llm", {}).get("hedging"))
+        configure_provider_pool((self._config_cache or {}).get("llm", {}).get("provider_pool"))
+        configure_llm_telemetry((self._config_cache or {}).get("llm", {}).get("telemetry"))
+        settings = self.paths.load_settings()
+        self.llm_config = LLMConfig.from_runtime(self._config_cache or {}, settings)
+        self.llm_client = LLMClient(
+            config=self.llm_config,
+            hedges=self._hedge_configs(settings),
+            pool=self._pool_configs(settings),
+        )
         self.tts_config = (self._config_cache or {}).get("tts", {})
+        self.memory_config = (self._config_cache or {}).get("long_term_memory", {})
+        if self._long_term_memory is not None:
+            self._refresh_memory_embedder(self._long_term_memory)
 
         # 初始化 ReAct Agent 与文本压缩器 这两个组件在 agent 模式与 narrative 模式下都会用到
         self.agent = ReActAgent(llm_client=self.llm_client, max_steps=20)
@@ -148,6 +265,8 @@ class EmaAgent:
         self.mcp_manager: Optional[MCPManager] = None
         self._mcp_init_lock = asyncio.Lock()
         self.system_prompt = PERSONA_PROFILE_PROMPT
+        # 系统提示 token 数缓存: (计数器名称, 提示文本, token 数)
+        self._system_tokens_cache: Optional[Tuple[str, str, int]] = None
         self.live2d_service = get_live2d_service()
 
     async def initialize_mcp(self) -> None:
@@ -272,6 +391,15 @@ class EmaAgent:
 
             logger.info("Agent config reloaded.")
 
+    async def initialize_tokenizer(self):
+        """
+        预加载当前模型的 token 计数器
+
+        tiktoken 首次加载需要下载编码文件 启动时在线程中完成 超时则退化为近似计数
+        """
+        counter = await load_token_counter(self.llm_config.tokenizer)
+        logger.info(f"token 计数器就绪: {counter.name}")
+
     async def initialize_narrative(self):
         """
         懒加载 Narrative 记忆组件
@@ -391,7 +519,8 @@ class EmaAgent:
         """
         同步式完整调用入口
 
-        该方法在内部完成会话压缩 模式分发 文本生成 TTS 与保存
+        该方法在内部完成模式分发 文本生成 TTS 与保存 并在结束后调度后台压缩
+        同一会话的并发调用排队执行
 
         Args:
             user_input (str): 用户输入文本
@@ -400,43 +529,51 @@ class EmaAgent:
             attachments (Optional[List[Dict[str, Any]]]): 附件信息列表
 
         Returns:
-            dict: 包含 intent answer duration session_id stopped
+            dict: 包含 intent answer duration session_id stopped prompt_tokens
+                以及 llm(本轮各次 LLM 调用的首 token 延迟 耗时 token 用量与估算费用)
         """
         # 记录调用开始时间 以便后续计算总耗时 这对于性能监控和用户体验优化非常重要
         start_time = datetime.now()
+        _prompt_tokens.set(0)
         # 根据 session_id 获取或创建会话对象
         session = self.session_service.get_or_create_session(session_id)
 
-        # 在处理用户输入之前 先检查当前会话上下文是否过大 如果超过预设限制 则调用压缩器进行压缩
-        compressed = await session.compress_if_needed(self.compressor)
-        if compressed:
-            logger.info("在处理 run() 之前上下文已被压缩。")
-
-        # 选择执行模式
-        intent = self._normalize_mode(mode)
-        # 合并用户上传的附件
-        merged_input = self._compose_user_input(user_input, attachments)
+        # 同一会话的调用串行执行 不同会话互不阻塞
+        async with self.session_locks.hold(session):
+            # 选择执行模式
+            intent = self._normalize_mode(mode)
+            # 合并用户上传的附件
+            merged_input = self._compose_user_input(user_input, attachments)
+
+            await self._set_emotion_by_intent(intent)
+
+            # 本轮的 LLM 调用按会话与模式计入遥测 后台任务继承同一上下文
+            with telemetry_scope(session.session_id, intent) as telemetry:
+                if self.tts_manager:
+                    self.tts_manager.reset()
+
+                if intent == "narrative":
+                    answer = await self._handle_narrative(session, merged_input)
+                elif intent == "agent":
+                    answer = await self._handle_agent(session, merged_input)
+                elif intent == "finish":
+                    answer = "再见呀！期待下次见面~"
+                    session.add_message(UserMessage(content=merged_input))
+                    session.add_message(AssistantMessage(content=answer))
+                    await self._speak(answer)
+                else:
+                    answer = await self._handle_chat(session, merged_input)
 
-        await self._set_emotion_by_intent(intent)
+                # 本轮调用的 LLM 明细 在调度后台任务前汇总 后台压缩与记忆提取只计入会话统计
+                llm_usage = telemetry.summary()
 
-        if self.tts_manager:
-            self.tts_manager.reset()
-
-        if intent == "narrative":
-            answer = await self._handle_narrative(session, merged_input)
-        elif intent == "agent":
-            answer = await self._handle_agent(session, merged_input)
-        elif intent == "finish":
-            answer = "再见呀！期待下次见面~"
-            session.add_message(UserMessage(content=merged_input))
-            session.add_message(AssistantMessage(content=answer))
-            await self._speak(answer)
-        else:
-            answer = await self._handle_chat(session, merged_input)
-
-        # 每次调用结束后 将 total_runs 计数器加1 并保存会话状态 以便后续分析和监控
-        session.total_runs += 1
-        self.session_service.save_session(session)
+                # 每次调用结束后 将 total_runs 计数器加1 并保存会话状态 以便后续分析和监控
+                session.total_runs += 1
+                self.session_service.save_session(session)
+                # 本轮结束后在后台检查并压缩历史 下一轮使用最近一次已提交的摘要 不等待压缩完成
+                self.compression_scheduler.schedule(session, self.compressor)
+                # 用户陈述的事实在后台写入长期记忆 只取原始输入 不含附件正文
+                self._schedule_memory_task(self._remember_facts(session.session_id, user_input))
 
         duration = (datetime.now() - start_time).total_seconds()
         await self._analyze_and_set_emotion(answer)
@@ -446,6 +583,8 @@ class EmaAgent:
             "duration": duration,
             "session_id": session.session_id,
             "stopped": False,
+            "prompt_tokens": _prompt_tokens.get(),
+            "llm": llm_usage,
         }
 
     async def run_stream(
@@ -461,6 +600,7 @@ class EmaAgent:
         流式调用入口
 
         该方法逐 token 回调并在结束后返回完整结果
+        同一会话的并发调用排队执行
 
         Args:
             user_input (str): 用户输入文本
@@ -471,54 +611,62 @@ class EmaAgent:
             should_stop (Optional[Callable[[], bool]]): 外部中断判定函数
 
         Returns:
-            dict: 包含 intent answer duration session_id stopped
+            dict: 包含 intent answer duration session_id stopped prompt_tokens
+                以及 llm(本轮各次 LLM 调用的首 token 延迟 耗时 token 用量与估算费用)
         """
         # 记录调用开始时间 以便后续计算总耗时 这对于性能监控和用户体验优化非常重要
         start_time = datetime.now()
+        _prompt_tokens.set(0)
         # 根据 session_id 获取或创建会话对象
         session = self.session_service.get_or_create_session(session_id)
 
-        # 在处理用户输入之前 先检查当前会话上下文是否过大 如果超过预设限制 则调用压缩器进行压缩
-        compressed = await session.compress_if_needed(self.compressor)
-        if compressed:
-            logger.info("在处理 run_stream() 之前上下文已被压缩。")
-
-        # 选择执行模式
-        intent = self._normalize_mode(mode)
-        # 合并用户上传的附件
-        merged_input = self._compose_user_input(user_input, attachments)
-
-        await self._set_emotion_by_intent(intent)
-
-        # 根据不同模式调用对应的处理函数 这些函数内部会使用 on_token 回调逐 token 返回生成结果 
-        # 同时接受 should_stop 函数以支持外部中断生成过程
-        stopped = False
-        if intent == "narrative":
-            answer, stopped = await self._handle_narrative_stream(
-                session, merged_input, on_token=on_token, should_stop=should_stop
-            )
-        elif intent == "agent":
-            answer, stopped = await self._handle_agent_stream(
-                session, merged_input, on_token=on_token, should_stop=should_stop
-            )
-        elif intent == "finish":
-            answer = "再见呀！期待下次见面~"
-            session.add_message(UserMessage(content=merged_input))
-            session.add_message(AssistantMessage(content=answer))
-            if on_token:
-                result = on_token(answer)
-                if asyncio.iscoroutine(result):
-                    await result
-        else:
-            answer, stopped = await self._handle_chat_stream(
-                session,
-                merged_input,
-                on_token=on_token,
-                should_stop=should_stop,
-            )
-
-        session.total_runs += 1
-        self.session_service.save_session(session)
+        # 同一会话的调用串行执行 不同会话互不阻塞
+        async with self.session_locks.hold(session):
+            # 选择执行模式
+            intent = self._normalize_mode(mode)
+            # 合并用户上传的附件
+            merged_input = self._compose_user_input(user_input, attachments)
+
+            await self._set_emotion_by_intent(intent)
+
+            # 本轮的 LLM 调用按会话与模式计入遥测 后台任务继承同一上下文
+            with telemetry_scope(session.session_id, intent) as telemetry:
+                # 根据不同模式调用对应的处理函数 这些函数内部会使用 on_token 回调逐 token 返回生成结果 
+                # 同时接受 should_stop 函数以支持外部中断生成过程
+                stopped = False
+                if intent == "narrative":
+                    answer, stopped = await self._handle_narrative_stream(
+                        session, merged_input, on_token=on_token, should_stop=should_stop
+                    )
+                elif intent == "agent":
+                    answer, stopped = await self._handle_agent_stream(
+                        session, merged_input, on_token=on_token, should_stop=should_stop
+                    )
+                elif intent == "finish":
+                    answer = "再见呀！期待下次见面~"
+                    session.add_message(UserMessage(content=merged_input))
+                    session.add_message(AssistantMessage(content=answer))
+                    if on_token:
+                        result = on_token(answer)
+                        if asyncio.iscoroutine(result):
+                            await result
+                else:
+                    answer, stopped = await self._handle_chat_stream(
+                        session,
+                        merged_input,
+                        on_token=on_token,
+                        should_stop=should_stop,
+                    )
+
+                # 本轮调用的 LLM 明细 在调度后台任务前汇总 后台压缩与记忆提取只计入会话统计
+                llm_usage = telemetry.summary()
+
+                session.total_runs += 1
+                self.session_service.save_session(session)
+                # 本轮结束后在后台检查并压缩历史 下一轮使用最近一次已提交的摘要 不等待压缩完成
+                self.compression_scheduler.schedule(session, self.compressor)
+                # 用户陈述的事实在后台写入长期记忆 只取原始输入 不含附件正文
+                self._schedule_memory_task(self._remember_facts(session.session_id, user_input))
 
         duration = (datetime.now() - start_time).total_seconds()
         if answer:
@@ -529,6 +677,8 @@ class EmaAgent:
             "duration": duration,
             "session_id": session.session_id,
             "stopped": stopped,
+            "prompt_tokens": _prompt_tokens.get(),
+            "llm": llm_usage,
         }
 
     async def _set_emotion_by_intent(self, intent: str):
@@ -777,6 +927,7 @@ class EmaAgent:
 
         该方法会注入系统提示并合并会话上下文
         同时支持额外系统文本与额外用户文本
+        上下文按当前模型的 token 预算保留最近消息 实际 token 数记录到本次调用结果
 
         Args:
             session (Session): 当前会话对象
@@ -788,48 +939,220 @@ class EmaAgent:
         """
         # 基础系统提示为预设的人设与背景介绍 
         # 如果调用时提供了额外的系统提示文本 则将其追加到基础提示后 以便在特定场景下提供更多指导信息
+        counter = await load_token_counter(self.llm_config.tokenizer)
+        budget = self._prompt_token_budget()
+        single_limit = min(MAX_SINGLE_MESSAGE_TOKENS, budget)
+
         system_prompt = self.system_prompt
+        system_tokens = self._system_prompt_tokens(counter)
         if extra_system:
             system_prompt += f"\n\n{extra_system}"
+            system_tokens += counter.count(f"\n\n{extra_system}")
+        system_msg, used = self._fit_message(
+            {"role": "system", "content": system_prompt}, system_tokens, counter, single_limit
+        )
 
-        # 构建消息列表 首先是系统提示 然后是会话上下文中的消息
-        # 这些消息会按照时间顺序排列 以便 LLM 理解对话历史
-        messages: List[Dict[str, Any]] = [{"role": "system", "content": system_prompt}]
-        # 遍历会话上下文中的消息 将它们转换为字典格式并添加到消息列表中
-        for msg in session.get_context_for_llm():
-            messages.append(msg.to_dict())
+        # 历史摘要: 在摘要预算内选取覆盖全部历史的最粗粒度节点 预算不足时保留较新的节点
+        summary_msg: Optional[Dict[str, Any]] = None
+        summary_budget = min(MAX_SUMMARY_TOKENS, budget // 4, budget - used)
+        nodes = session.compression_history.select_nodes(counter, summary_budget - MESSAGE_OVERHEAD_TOKENS)
+        summary = session.summary_message(nodes)
+        if summary is not None:
+            tokens = summary.token_count(counter)
+            if used + tokens <= budget:
+                summary_msg = summary.to_dict()
+                used += tokens
+
+        # 长期记忆: 以最新用户消息检索其他会话的摘要与事实 在记忆预算内按相关度注入
+        memory_msg: Optional[Dict[str, Any]] = None
+        memory_budget = min(int(self.memory_config.get("max_tokens", MAX_MEMORY_TOKENS)), budget // 8, budget - used)
+        memory_text = await self._recall_memories(session, counter, memory_budget - MESSAGE_OVERHEAD_TOKENS)
+        if memory_text:
+            memory_msg = {"role": "system", "content": memory_text}
+            used += MESSAGE_OVERHEAD_TOKENS + counter.count(memory_text)
+
+        # 会话上下文按时间顺序排列 从最新消息向前累加 token 超出预算即停止
+        # 每条历史消息的 token 数缓存在消息对象上 多轮对话中只需统计新增消息
+        kept: List[Dict[str, Any]] = []
+        for msg, tokens in self._iter_context_newest_first(session, extra_user, counter):
+            msg, tokens = self._fit_message(msg, tokens, counter, single_limit)
+            if used + tokens > budget:
+                break
+            kept.append(msg)
+            used += tokens
+
+        kept.reverse()
+        _prompt_tokens.set(used)
+        if memory_msg is not None:
+            kept.insert(0, memory_msg)
+        if summary_msg is not None:
+            kept.insert(0, summary_msg)
+        return [system_msg] + kept
+
+    async def _recall_memories(self, session: Session, counter: TokenCounter, budget: int) -> str:
+        """
+        检索与最新用户消息相关的长期记忆 并在预算内拼接为注入文本
+
+        检索失败或超过 long_term_memory.recall_timeout 秒只记录日志 本轮不注入记忆 不阻塞回复
+
+        Args:
+            session (Session): 当前会话对象
+            counter (TokenCounter): token 计数器
+            budget (int): 记忆文本可用的 token 数
+
+        Returns:
+            str: 注入文本 无相关记忆时返回空字符串
+        """
+        if budget <= 0 or not self.memory_config.get("enabled", False):
+            return ""
+        query = next(
+            (m.content for m in reversed(session.messages) if m.role == "user" and isinstance(m.content, str)),
+            "",
+        )
+        if not query.strip():
+            return ""
+
+        timeout = float(self.memory_config.get("recall_timeout", MEMORY_RECALL_TIMEOUT))
+        try:
+            memories = await asyncio.wait_for(self._recall(session, query[:MAX_MEMORY_QUERY_CHARS]), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ 长期记忆检索超过 {timeout}s 本轮不注入记忆")
+            return ""
+        except Exception as e:
+            logger.warning(f"⚠️ 长期记忆检索失败: {e}")
+            return ""
+
+        header = "[长期记忆] 以下是与当前话题相关的过往对话片段 仅供参考:"
+        lines: List[str] = []
+        used = counter.count(header)
+        for line in format_memories(memories):
+            tokens = counter.count("\n" + line)
+            if used + tokens > budget:
+                break
+            lines.append(line)
+            used += tokens
+        return "\n".join([header] + lines) if lines else ""
+
+    async def _recall(self, session: Session, query: str) -> List[Tuple[MemoryItem, float]]:
+        """
+        检索长期记忆 记忆库首次加载不随检索超时取消 完成后供后续轮次使用
+
+        Args:
+            session (Session): 当前会话对象
+            query (str): 查询文本
 
-        # 如果调用时提供了额外的用户文本 则将其追加到最后一个用户消息后 以便在特定场景下提供更多上下文信息
+        Returns:
+            List[Tuple[MemoryItem, float]]: (记忆, 相似度) 未启用时返回空列表
+        """
+        memory = await asyncio.shield(self._get_long_term_memory())
+        if memory is None:
+            return []
+        return await memory.recall(
+            query,
+            k=int(self.memory_config.get("top_k", 5)),
+            exclude_session=session.session_id,
+            min_score=float(self.memory_config.get("min_score", 0.35)),
+        )
+
+    def _iter_context_newest_first(
+        self,
+        session: Session,
+        extra_user: str,
+        counter: TokenCounter,
+    ) -> Iterator[Tuple[Dict[str, Any], int]]:
+        """
+        从新到旧产出上下文消息字典及其 token 数
+
+        额外用户文本合并到最后一条用户消息前 否则作为新的用户消息追加
+
+        Args:
+            session (Session): 当前会话对象
+            extra_user (str): 追加到用户侧的文本
+            counter (TokenCounter): token 计数器
+
+        Returns:
+            Iterator[Tuple[Dict[str, Any], int]]: (消息字典, token 数)
+        """
+        # 摘要由调用方按预算单独挑选
+        context = session.get_context_for_llm(include_summary=False)
         if extra_user:
-            if messages and messages[-1]["role"] == "user":
-                messages[-1]["content"] = f"{extra_user}\n\n{messages[-1]['content']}"
+            if context and context[-1].role == "user":
+                msg = context.pop().to_dict()
+                msg["content"] = f"{extra_user}\n\n{msg['content']}"
             else:
-                messages.append({"role": "user", "content": extra_user})
+                msg = {"role": "user", "content": extra_user}
+            yield msg, MESSAGE_OVERHEAD_TOKENS + counter.count(msg["content"])
+
+        for message in reversed(context):
+            yield message.to_dict(), message.token_count(counter)
+
+    def _prompt_token_budget(self) -> int:
+        """
+        计算输入 prompt 的 token 预算
+
+        预算 = 模型上下文窗口 - 生成长度 - 预留余量 并受 max_prompt_tokens 约束
+
+        Returns:
+            int: token 预算
+        """
+        cfg = self.llm_config
+        budget = cfg.context_window - cfg.max_tokens - PROMPT_RESERVE_TOKENS
+        if cfg.max_prompt_tokens > 0:
+            budget = min(budget, cfg.max_prompt_tokens)
+        return max(budget, MESSAGE_OVERHEAD_TOKENS)
+
+    def _system_prompt_tokens(self, counter: TokenCounter) -> int:
+        """
+        统计基础系统提示的 token 数 按计数器与提示文本缓存
 
-        # 单条消息保护 避免附件正文或历史单条过长
-        for msg in messages:
-            content = msg.get("content")
-            if isinstance(content, str):
-                msg["content"] = self._truncate_text(content, MAX_SINGLE_MESSAGE_CHARS)
+        Args:
+            counter (TokenCounter): token 计数器
 
-        # 总上下文保护 保留 system 与最近消息
-        total_chars = sum(len(str(m.get("content", ""))) for m in messages)
-        if total_chars > MAX_TOTAL_CONTEXT_CHARS:
-            system_msg = messages[0] if messages else {"role": "system", "content": system_prompt}
-            kept: List[Dict[str, Any]] = []
-            used = len(str(system_msg.get("content", "")))
+        Returns:
+            int: token 数
+        """
+        cached = self._system_tokens_cache
+        if cached is not None and cached[0] == counter.name and cached[1] is self.system_prompt:
+            return cached[2]
+        tokens = MESSAGE_OVERHEAD_TOKENS + counter.count(self.system_prompt)
+        self._system_tokens_cache = (counter.name, self.system_prompt, tokens)
+        return tokens
 
-            for msg in reversed(messages[1:]):
-                length = len(str(msg.get("content", "")))
-                if used + length > MAX_TOTAL_CONTEXT_CHARS:
-                    continue
-                kept.append(msg)
-                used += length
+    def _fit_message(
+        self,
+        msg: Dict[str, Any],
+        tokens: int,
+        counter: TokenCounter,
+        limit: int,
+    ) -> Tuple[Dict[str, Any], int]:
+        """
+        将单条消息截断到 token 上限以内 保留前后关键片段
 
-            kept.reverse()
-            messages = [system_msg] + kept
+        按 token 与字符的比例估算截断长度 截断标记自身也占 token 因此最多收缩数次
 
-        return messages
+        Args:
+            msg (Dict[str, Any]): 消息字典 超限时原地修改 content
+            tokens (int): 消息当前 token 数
+            counter (TokenCounter): token 计数器
+            limit (int): 单条消息 token 上限
+
+        Returns:
+            Tuple[Dict[str, Any], int]: 消息字典与截断后的 token 数
+        """
+        content = msg.get("content")
+        if tokens <= limit or not isinstance(content, str) or not content:
+            return msg, tokens
+
+        overhead = tokens - counter.count(content)
+        ratio = max(limit - overhead, 0) / max(tokens - overhead, 1)
+        for _ in range(3):
+            truncated = self._truncate_text(content, int(len(content) * ratio))
+            tokens = overhead + counter.count(truncated)
+            if tokens <= limit:
+                break
+            ratio *= 0.9
+        msg["content"] = truncated
+        return msg, tokens
 
     async def _chat_with_tts(self, messages: List[Dict[str, Any]], session: Session) -> str:
         """
@@ -851,10 +1174,11 @@ class EmaAgent:
                 stream=True,
                 on_token_callback=self.tts_manager.add_text_stream,
                 emit_stdout=True,
+                caller="reply",
             )
             await self.tts_manager.flush()
         else:
-            response = await self.llm_client.chat(messages=messages, stream=False)
+            response = await self.llm_client.chat(messages=messages, stream=False, caller="reply")
 
         session.add_message(AssistantMessage(content=response))
         return response
@@ -882,18 +1206,23 @@ class EmaAgent:
         chunks: List[str] = []
         stopped = False
 
-        async for token in self.llm_client.stream_chat(messages=messages):
-            # 在每次收到新 token 时 首先检查 should_stop 函数 如果该函数存在且返回 True 则中断生成过程 并设置 stopped 标记为 True 以便后续处理知道生成被中断了
-            if should_stop and should_stop():
-                stopped = True
-                break
-
-            # 将新 token 添加到结果列表中 并调用 on_token 回调函数 以支持实时显示生成内容
-            chunks.append(token)
-            if on_token:
-                result = on_token(token)
-                if asyncio.iscoroutine(result):
-                    await result
+        tokens = self.llm_client.stream_chat(messages=messages, caller="reply")
+        try:
+            async for token in tokens:
+                # 在每次收到新 token 时 首先检查 should_stop 函数 如果该函数存在且返回 True 则中断生成过程 并设置 stopped 标记为 True 以便后续处理知道生成被中断了
+                if should_stop and should_stop():
+                    stopped = True
+                    break
+
+                # 将新 token 添加到结果列表中 并调用 on_token 回调函数 以支持实时显示生成内容
+                chunks.append(token)
+                if on_token:
+                    result = on_token(token)
+                    if asyncio.iscoroutine(result):
+                        await result
+        finally:
+            # 中断时立即关闭流 释放上游请求并结束本次调用的遥测记录
+            await tokens.aclose()
 
         # 将所有 token 拼接成完整的回复文本 并去除首尾空白 如果生成过程中被中断了 则该文本可能是不完整的 但仍然可以作为当前已生成内容的展示
         response = "".join(chunks).strip()
@@ -915,11 +1244,196 @@ class EmaAgent:
             await self.tts_manager.add_text_stream(text)
             await self.tts_manager.flush()
 
+    def _on_compression_committed(self, session: Session, records: List[CompressionRecord]) -> None:
+        """
+        后台压缩提交后保存会话
+
+        Args:
+            session (Session): 已提交压缩的会话
+            records (List[CompressionRecord]): 本次提交新增的压缩记录
+
+        Returns:
+            None
+        """
+        self.session_service.save_session(session)
+        # 只把本次新增的 0 级摘要写入长期记忆 按消息范围去重
+        entries = [
+            (
+                "summary",
+                record.summary,
+                session.session_id,
+                f"{session.session_id}:summary:{record.compressed_range[0]}-{record.compressed_range[1]}",
+            )
+            for record in records
+            if record.level == 0 and record.summary
+        ]
+        if entries:
+            self._schedule_memory_task(self._remember(entries))
+
+    def _on_session_deleted(self, session_id: str) -> None:
+        """
+        会话删除后在后台清除来自该会话的长期记忆
+
+        Args:
+            session_id (str): 已删除的会话ID
+
+        Returns:
+            None
+        """
+        self._schedule_memory_task(self._forget_memories(session_id))
+
+    def _on_session_renamed(self, old_id: str, new_id: str) -> None:
+        """
+        会话改名后在后台把长期记忆归到新会话ID 保证检索时仍能排除当前会话
+
+        Args:
+            old_id (str): 原会话ID
+            new_id (str): 新会话ID
+
+        Returns:
+            None
+        """
+        self._schedule_memory_task(self._rename_memories(old_id, new_id))
+
+    async def _forget_memories(self, session_id: str) -> None:
+        """
+        删除来自某个会话的长期记忆 失败只记录日志
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            None
+        """
+        try:
+            memory = await self._get_long_term_memory()
+            if memory is not None:
+                removed = memory.forget_session(session_id)
+                if removed:
+                    logger.info(f"🧠 已清除会话 {session_id} 的 {removed} 条长期记忆")
+        except Exception as e:
+            logger.warning(f"⚠️ 长期记忆清除失败: {e}")
+
+    async def _rename_memories(self, old_id: str, new_id: str) -> None:
+        """
+        将长期记忆从原会话ID改归新会话ID 失败只记录日志
+
+        Args:
+            old_id (str): 原会话ID
+            new_id (str): 新会话ID
+
+        Returns:
+            None
+        """
+        try:
+            memory = await self._get_long_term_memory()
+            if memory is not None:
+                memory.rename_session(old_id, new_id)
+        except Exception as e:
+            logger.warning(f"⚠️ 长期记忆改名失败: {e}")
+
+    async def _get_long_term_memory(self) -> Optional[LongTermMemory]:
+        """
+        获取长期记忆库 首次调用时在线程中加载
+
+        Returns:
+            Optional[LongTermMemory]: 记忆库 未启用时返回 None
+        """
+        if not self.memory_config.get("enabled", False):
+            return None
+        if self._long_term_memory is not None:
+            return self._long_term_memory
+
+        async with self._memory_init_lock:
+            if self._long_term_memory is None:
+                memory = await asyncio.to_thread(
+                    LongTermMemory,
+                    self.paths.long_term_memory_dir,
+                    self._create_memory_embedder(),
+                    int(self.memory_config.get("nprobe", 16)),
+                )
+                if not memory.ready:
+                    self._schedule_memory_task(memory.reembed())
+                self._long_term_memory = memory
+        return self._long_term_memory
+
+    def _create_memory_embedder(self):
+        """
+        按当前配置创建长期记忆嵌入器
+
+        Returns:
+            Embedder: 嵌入器实例
+        """
+        return create_embedder(
+            (self._config_cache or {}).get("embeddings"),
+            mode=str(self.memory_config.get("embedder", "local")),
+            local_dim=int(self.memory_config.get("local_dim", 256)),
+        )
+
+    def _refresh_memory_embedder(self, memory: LongTermMemory) -> None:
+        """
+        配置重载后切换嵌入器 模型或维度变化时后台重新向量化
+
+        Args:
+            memory (LongTermMemory): 已加载的记忆库
+
+        Returns:
+            None
+        """
+        if memory.use_embedder(self._create_memory_embedder()):
+            self._schedule_memory_task(memory.reembed())
+
+    async def _remember_facts(self, session_id: str, user_input: str) -> None:
+        """
+        提取用户输入中的事实陈述并写入长期记忆
+
+        Args:
+            session_id (str): 会话ID
+            user_input (str): 用户原始输入
+
+        Returns:
+            None
+        """
+        facts = extract_facts(user_input)
+        if facts:
+            await self._remember([("fact", fact, session_id, None) for fact in facts])
+
+    async def _remember(self, entries: List[Tuple[str, str, str, Optional[str]]]) -> None:
+        """
+        批量写入长期记忆 失败只记录日志
+
+        Args:
+            entries (List[Tuple[str, str, str, Optional[str]]]): (类型, 文本, 会话ID, 去重键)
+
+        Returns:
+            None
+        """
+        try:
+            memory = await self._get_long_term_memory()
+            if memory is not None:
+                await memory.remember_many(entries)
+        except Exception as e:
+            logger.warning(f"⚠️ 长期记忆写入失败: {e}")
+
+    def _schedule_memory_task(self, coro: Awaitable[Any]) -> None:
+        """
+        在后台运行长期记忆任务 关闭时统一等待
+
+        Args:
+            coro (Awaitable[Any]): 协程对象
+
+        Returns:
+            None
+        """
+        task = asyncio.ensure_future(coro)
+        self._memory_tasks.add(task)
+        task.add_done_callback(self._memory_tasks.discard)
+
     async def close(self):
         """
         释放代理持有的资源
 
-        包括 MCP Server、narrative 资源与 tts 资源
+        包括进行中的后台压缩与长期记忆写入、MCP Server、narrative 资源、tts 资源、共享的 LLM 连接池与响应缓存数据库
 
         Args:
             None
@@ -927,12 +1441,19 @@ class EmaAgent:
         Returns:
             None
         """
+        self.session_service.remove_listener(on_delete=self._on_session_deleted, on_rename=self._on_session_renamed)
+        await self.compression_scheduler.close(timeout=COMPRESSION_SHUTDOWN_TIMEOUT)
+        if self._memory_tasks:
+            await asyncio.wait(list(self._memory_tasks), timeout=COMPRESSION_SHUTDOWN_TIMEOUT)
         if self.mcp_manager:
             await self.mcp_manager.stop_all()
         if self.narrative:
             await self.narrative.finalize()
         if self.tts_manager:
             self.tts_manager.stop()
+        # 压缩 记忆与 narrative 均已结束 最后关闭共享客户端的 keep-alive 连接
+        await close_openai_clients()
+        get_response_cache().close()
 
 _ema_agent: Optional["EmaAgent"] = None
 
@@ -987,6 +1508,8 @@ async def main():
         pass
     finally:
         await app.close()
+        # 排空会话写回队列 保证最后一轮对话已落盘
+        app.session_service.close()
 
 
 if __name__ == "__main__":
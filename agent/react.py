@@ -189,6 +189,7 @@ class ReActAgent:
         response = await self.llm_client.chat_with_tools(
             messages=messages,
             tools=self.tools.to_params(),
+            caller="react",
         )
 
         # 解析 LLM 输出的内容与工具调用
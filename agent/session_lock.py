@@ -0,0 +1,105 @@
+"""
+会话级串行化模块
+
+同一会话的多次调用(多个 WebSocket 或 WebSocket 与 HTTP 并发)按到达顺序依次执行
+不同会话之间完全并行
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict
+
+from memory.schema import Session
+
+
+@dataclass
+class _LockEntry:
+    """
+    单个会话的锁与引用计数
+
+    Args:
+        lock (asyncio.Lock): 会话锁
+        users (int): 持有或等待该锁的调用数
+    """
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    users: int = 0
+
+
+class SessionLocks:
+    """
+    按会话分配的异步锁
+
+    以会话对象为键: 缓存保证同一会话ID对应同一对象 会话重命名后新旧ID的调用仍落在同一把锁上
+    没有调用持有或等待时立即释放条目 锁表大小只与活跃会话数相关
+
+    Args:
+        None
+
+    Returns:
+        SessionLocks: SessionLocks 实例
+
+    Examples:
+        >>> locks = SessionLocks()
+        >>> async with locks.hold(session):
+        ...     session.add_message(UserMessage("hi"))
+    """
+
+    def __init__(self):
+        """
+        初始化空锁表
+        """
+        # key 为会话对象 id 条目存在期间调用方持有会话强引用 id 不会被复用
+        self._entries: Dict[int, _LockEntry] = {}
+
+    @asynccontextmanager
+    async def hold(self, session: Session) -> AsyncIterator[None]:
+        """
+        独占会话直到退出上下文
+
+        Args:
+            session (Session): 会话对象
+
+        Returns:
+            AsyncIterator[None]: 异步上下文
+        """
+        key = id(session)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _LockEntry()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                self._entries.pop(key, None)
+
+    def is_busy(self, session: Session) -> bool:
+        """
+        判断会话是否有进行中的调用
+
+        Args:
+            session (Session): 会话对象
+
+        Returns:
+            bool: 有调用持有锁返回 True
+        """
+        entry = self._entries.get(id(session))
+        return entry is not None and entry.lock.locked()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        导出锁表统计
+
+        Args:
+            None
+
+        Returns:
+            Dict[str, Any]: 活跃会话数与排队等待的调用数
+        """
+        return {
+            "active_sessions": len(self._entries),
+            "waiting": sum(entry.users - 1 for entry in self._entries.values() if entry.lock.locked()),
+        }
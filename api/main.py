@@ -24,6 +24,7 @@ from config.paths import init_paths
 paths = init_paths(PROJECT_ROOT)
 paths.ensure_directories()
 from api.routes import chat, sessions, audio, settings, news, music, live2d, game
+from api.services.session_service import get_session_service
 from utils.logger import logger
 
 
@@ -58,9 +59,15 @@ app.include_router(game.router, prefix="/api/game", tags=["Game"])
 
 @app.on_event("startup")
 async def warmup_on_startup():
-    """预热 Narrative LightRAG + MCP 工具，减少首次请求的延迟"""
+    """预热 token 计数器 Narrative LightRAG + MCP 工具，减少首次请求的延迟"""
     _ema_agent = get_agent(server_mode=True)
 
+    # 预加载 token 计数器 首轮对话不再等待 tiktoken 编码文件下载
+    try:
+        await _ema_agent.initialize_tokenizer()
+    except Exception as exc:
+        logger.error(f"❌ [Startup] token 计数器加载失败: {exc}")
+
     # 预热 Narrative
     try:
         await _ema_agent.initialize_narrative()
@@ -75,6 +82,22 @@ async def warmup_on_startup():
     except Exception as exc:
         logger.error(f"❌ [Startup] MCP 工具初始化失败: {exc}")
 
+    # 后台归档长期未更新的会话 不阻塞启动
+    asyncio.create_task(_archive_cold_sessions())
+
+
+async def _archive_cold_sessions():
+    """归档超过 archive_after_days 未更新的会话"""
+    try:
+        stats = await asyncio.to_thread(get_session_service().archive_cold_sessions)
+        if stats["archived"]:
+            logger.info(
+                f"✅ [Startup] 冷会话归档完成: {stats['archived']} 个 "
+                f"{stats['raw_bytes']} -> {stats['archived_bytes']} 字节"
+            )
+    except Exception as exc:
+        logger.error(f"❌ [Startup] 冷会话归档失败: {exc}")
+
 
 @app.on_event("shutdown")
 async def shutdown_cleanup():
@@ -88,6 +111,16 @@ async def shutdown_cleanup():
     except Exception as exc:
         logger.error(f"❌ [Shutdown] 资源清理失败: {exc}")
 
+    # 排空会话写回队列 保证最后一轮对话已落盘
+    try:
+        drained = await asyncio.to_thread(get_session_service().close, 30)
+        if drained:
+            logger.info("✅ [Shutdown] 会话写回队列已排空")
+        else:
+            logger.warning("⚠️ [Shutdown] 会话写回队列排空超时")
+    except Exception as exc:
+        logger.error(f"❌ [Shutdown] 会话写回队列排空失败: {exc}")
+
 
 # ==================== 音频文件服务（核心路由，优先级最高）====================
 audio_output = paths.audio_output_dir
@@ -15,6 +15,7 @@ from .music import (
 )
 from .news import CategoryInfo, CharacterInfo, NewsItem, SourceInfo
 from .sessions import (
+    ForkRequest,
     MessageInfo,
     MessagesResponse,
     NewSessionRequest,
@@ -47,6 +48,7 @@ __all__ = [
     "MessagesResponse",
     "SessionRenameRequest",
     "NewSessionRequest",
+    "ForkRequest",
 ]
 
 from .settings import (
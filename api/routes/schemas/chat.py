@@ -20,6 +20,8 @@ class ChatResponse(BaseModel):
     audio_url: Optional[str] = None
     stopped: bool = False
     intent: str = "chat"
+    prompt_tokens: int = 0
+    llm: Optional[Dict[str, Any]] = None
 
 
 class AttachmentUploadItem(BaseModel):
@@ -1,6 +1,6 @@
-from typing import List
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class SessionInfo(BaseModel):
@@ -12,6 +12,7 @@ class SessionInfo(BaseModel):
     - updated_at (str): 更新时间
     - last_message_at (str): 最近消息时间
     - message_count (int): 消息数量
+    - parent_id (Optional[str]): 分支会话的父会话标识 普通会话为 None
     """
 
     id: str
@@ -19,6 +20,7 @@ class SessionInfo(BaseModel):
     updated_at: str
     last_message_at: str
     message_count: int
+    parent_id: Optional[str] = None
 
 
 class SessionListResponse(BaseModel):
@@ -26,20 +28,24 @@ class SessionListResponse(BaseModel):
     会话列表响应模型
 
     - sessions (List[SessionInfo]): 会话列表
+    - total (int): 会话总数 用于分页
     """
 
     sessions: List[SessionInfo]
+    total: int = 0
 
 
 class MessageInfo(BaseModel):
     """
     消息信息模型
 
+    - index (Optional[int]): 消息在完整历史中的位置 用作翻页游标
     - role (str): 消息角色
     - content (str): 消息内容
     - timestamp (str): 时间戳
     """
 
+    index: Optional[int] = None
     role: str
     content: str
     timestamp: str
@@ -50,9 +56,41 @@ class MessagesResponse(BaseModel):
     消息列表响应模型
 
     - messages (List[MessageInfo]): 消息列表
+    - has_more (bool): 游标方向上是否还有更多消息
     """
 
     messages: List[MessageInfo]
+    has_more: bool = False
+
+
+class SearchHit(BaseModel):
+    """
+    检索命中模型
+
+    - session_id (str): 会话ID
+    - index (int): 消息在完整历史中的位置 可作为 before/since 游标定位上下文
+    - role (str): 消息角色
+    - timestamp (str): 时间戳
+    - snippet (str): 命中位置附近的片段
+    """
+
+    session_id: str
+    index: int
+    role: str
+    timestamp: str
+    snippet: str
+
+
+class SearchResponse(BaseModel):
+    """
+    检索响应模型
+
+    - results (List[SearchHit]): 按相关度排序的命中列表
+    - total (int): 命中总数
+    """
+
+    results: List[SearchHit]
+    total: int = 0
 
 
 class RenameRequest(BaseModel):
@@ -73,3 +111,15 @@ class NewSessionRequest(BaseModel):
     """
 
     session_id: str
+
+
+class ForkRequest(BaseModel):
+    """
+    会话分支请求模型
+
+    - at (int): 分支点 新会话保留父会话的前 at 条消息
+    - name (Optional[str]): 分支会话名称 默认自动生成
+    """
+
+    at: int = Field(..., ge=0)
+    name: Optional[str] = None
@@ -2,13 +2,21 @@
 Session routes.
 """
 
-from fastapi import APIRouter, HTTPException
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 
 from api.routes.schemas.sessions import (
+    ForkRequest,
     MessageInfo,
     MessagesResponse,
     NewSessionRequest,
     RenameRequest,
+    SearchHit,
+    SearchResponse,
     SessionInfo,
     SessionListResponse,
 )
@@ -16,14 +24,20 @@ from api.services.session_service import get_session_service
 
 router = APIRouter()
 
+# 导入时每累计多少行交给线程池写入一次
+IMPORT_LINES_PER_BATCH = 1000
+
 
 @router.get("/sessions", response_model=SessionListResponse)
-async def list_sessions():
+async def list_sessions(
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+):
     """
-    获取会话列表
+    获取会话列表 按更新时间倒序 支持 offset/limit 分页
     """
     service = get_session_service()
-    sessions_data = service.list_sessions()
+    sessions_data, total = service.list_sessions(offset=offset, limit=limit)
 
     sessions = [
         SessionInfo(
@@ -32,10 +46,104 @@ async def list_sessions():
             updated_at=s["updated_at"],
             last_message_at=s["updated_at"],
             message_count=s["message_count"],
+            parent_id=s.get("parent_id"),
         )
         for s in sessions_data
     ]
-    return SessionListResponse(sessions=sessions)
+    return SessionListResponse(sessions=sessions, total=total)
+
+
+@router.get("/sessions/search", response_model=SearchResponse)
+async def search_sessions(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    session_id: Optional[str] = Query(None),
+):
+    """
+    全文检索全部会话历史 按相关度返回会话ID 消息位置与片段
+    """
+    service = get_session_service()
+    hits, total = service.search_messages(q, limit=limit, offset=offset, session_id=session_id)
+    return SearchResponse(results=[SearchHit(**hit) for hit in hits], total=total)
+
+
+@router.post("/sessions/catalog/rebuild")
+async def rebuild_session_catalog():
+    """
+    扫描会话目录重建会话索引
+    """
+    service = get_session_service()
+    total = await asyncio.to_thread(service.rebuild_catalog)
+    return {"status": "rebuilt", "total": total}
+
+
+@router.post("/sessions/archive")
+async def archive_cold_sessions(days: Optional[float] = Query(None, gt=0)):
+    """
+    归档超过指定天数未更新的会话 未指定时使用配置中的 archive_after_days
+    """
+    service = get_session_service()
+    return await asyncio.to_thread(service.archive_cold_sessions, days)
+
+
+@router.get("/sessions/export")
+async def export_sessions(ids: Optional[List[str]] = Query(None)):
+    """
+    流式导出会话(元信息 消息 压缩历史)为 NDJSON 未指定 ids 时导出全部
+    """
+    service = get_session_service()
+    filename = f"sessions-{datetime.now().strftime('%Y%m%d-%H%M%S')}.ndjson"
+    return StreamingResponse(
+        service.export_sessions(ids),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post("/sessions/import")
+async def import_sessions(request: Request, on_conflict: str = Query("rename", pattern="^(rename|skip)$")):
+    """
+    流式导入 NDJSON 会话 请求体按行解析 每凑满一批在线程池中写入
+    """
+    service = get_session_service()
+    importer = service.create_importer(on_conflict)
+    buffer = b""
+    lines: List[bytes] = []
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            *complete, buffer = buffer.split(b"\n")
+            lines.extend(complete)
+            if len(lines) >= IMPORT_LINES_PER_BATCH:
+                await asyncio.to_thread(importer.feed_lines, lines)
+                lines = []
+        lines.append(buffer)
+        await asyncio.to_thread(importer.feed_lines, lines)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        # 无论成功与否都结束导入 清理未写完的会话目录
+        summary = await asyncio.to_thread(importer.close)
+    return summary
+
+
+@router.get("/sessions/cache/stats")
+async def get_session_cache_stats():
+    """
+    获取会话缓存统计 用于按主机内存调整缓存上限
+    """
+    service = get_session_service()
+    return service.get_cache_stats()
+
+
+@router.get("/sessions/persist/stats")
+async def get_session_persist_stats():
+    """
+    获取会话后台写回队列深度与写入延迟
+    """
+    service = get_session_service()
+    return service.get_persist_stats()
 
 
 @router.post("/sessions/new")
@@ -53,17 +161,25 @@ async def create_new_session(request: NewSessionRequest):
 
 
 @router.get("/sessions/{session_id}/messages", response_model=MessagesResponse)
-async def get_session_messages(session_id: str):
+async def get_session_messages(
+    session_id: str,
+    since: Optional[int] = Query(None, ge=-1),
+    before: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+):
     """
-    获取指定会话消息
+    获取指定会话消息 支持 since/before 游标与 limit 分页
     """
     service = get_session_service()
-    messages_data = service.get_session_messages(session_id)
+    # 读取快照需持有 snapshot_lock 并可能解压归档 放到线程中执行 避免阻塞事件循环
+    messages_data, has_more = await asyncio.to_thread(
+        service.get_session_messages, session_id, since=since, before=before, limit=limit
+    )
     messages = [
-        MessageInfo(role=m["role"], content=m["content"], timestamp=m["timestamp"])
+        MessageInfo(index=m["index"], role=m["role"], content=m["content"], timestamp=m["timestamp"])
         for m in messages_data
     ]
-    return MessagesResponse(messages=messages)
+    return MessagesResponse(messages=messages, has_more=has_more)
 
 
 @router.delete("/sessions/{session_id}")
@@ -86,3 +202,24 @@ async def rename_session(session_id: str, request: RenameRequest):
     if service.rename_session(session_id, request.new_name):
         return {"status": "renamed", "session_id": session_id, "new_id": request.new_name}
     raise HTTPException(status_code=404, detail="Session not found or name conflict")
+
+
+@router.post("/sessions/{session_id}/fork")
+async def fork_session(session_id: str, request: ForkRequest):
+    """
+    从第 at 条消息处创建分支会话 分支与父会话共享前缀
+    """
+    service = get_session_service()
+    try:
+        # 分支需在 write_lock 下落盘父会话与分支快照 放到线程中执行 避免阻塞事件循环
+        branch = await asyncio.to_thread(service.fork_session, session_id, request.at, request.name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if branch is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {
+        "status": "forked",
+        "session_id": branch.session_id,
+        "parent_id": session_id,
+        "branch_point": branch.branch_point,
+    }
@@ -4,7 +4,9 @@
 本文件仅保留 HTTP 路由映射，具体业务逻辑由 settings_service 承载。
 """
 
-from fastapi import APIRouter
+from typing import Optional
+
+from fastapi import APIRouter, Query
 
 from api.routes.schemas.settings import (
     ApiConfigModel,
@@ -75,6 +77,19 @@ async def get_system_status():
     return await _settings_service.get_system_status()
 
 
+@router.get("/settings/llm/stats")
+async def get_llm_stats():
+    return await _settings_service.get_llm_stats()
+
+
+@router.get("/settings/llm/telemetry")
+async def get_llm_telemetry(
+    session_id: Optional[str] = Query(None, description="只返回该会话的统计"),
+    recent: int = Query(20, ge=0, le=200, description="返回的最近调用条数"),
+):
+    return await _settings_service.get_llm_telemetry(session_id=session_id, recent=recent)
+
+
 @router.get("/settings/theme")
 async def get_theme_settings():
     return await _settings_service.get_theme_settings()
@@ -478,6 +478,8 @@ class ChatService:
                                 "stopped": bool(result.get("stopped", False)),
                                 "full_audio_url": full_audio_url,
                                 "intent": result.get("intent", "chat"),
+                                "prompt_tokens": int(result.get("prompt_tokens", 0)),
+                                "llm": result.get("llm"),
                             }
                         )
                     
@@ -632,6 +634,8 @@ class ChatService:
             "audio_url": audio_url,
             "stopped": bool(result.get("stopped", False)),
             "intent": result.get("intent", "chat"),
+            "prompt_tokens": int(result.get("prompt_tokens", 0)),
+            "llm": result.get("llm"),
         }
 
 
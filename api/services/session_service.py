@@ -5,15 +5,16 @@
 负责创建 删除 重命名 列表读取 与消息读取
 """
 import json
-import shutil
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Iterator, Tuple
 from pathlib import Path
-from threading import Lock
+from threading import Lock, Thread
 
 from config.paths import get_paths
 from memory.manager import SessionManager
 from memory.schema import Session
+from memory.transfer import SessionImporter, iter_export
+from utils.logger import logger
 
 
 class SessionService:
@@ -53,7 +54,58 @@ class SessionService:
         self._manager: Optional[SessionManager] = None
         # 记录重命名映射，解决流式回复过程中改名后写回旧 ID 的并发问题
         self._renamed_ids: Dict[str, str] = {}
+        # 会话删除与改名的监听者 用于同步会话目录之外的派生数据(如长期记忆)
+        self._delete_listeners: List[Callable[[str], None]] = []
+        self._rename_listeners: List[Callable[[str, str], None]] = []
         self._initialized = True
+
+    def add_listener(
+        self,
+        on_delete: Optional[Callable[[str], None]] = None,
+        on_rename: Optional[Callable[[str, str], None]] = None,
+    ) -> None:
+        """
+        注册会话删除与改名的监听者
+
+        Args:
+            on_delete (Optional[Callable[[str], None]]): 删除成功后以会话标识调用
+            on_rename (Optional[Callable[[str, str], None]]): 改名成功后以 (原标识, 新标识) 调用
+        """
+        if on_delete is not None:
+            self._delete_listeners.append(on_delete)
+        if on_rename is not None:
+            self._rename_listeners.append(on_rename)
+
+    def remove_listener(
+        self,
+        on_delete: Optional[Callable[[str], None]] = None,
+        on_rename: Optional[Callable[[str, str], None]] = None,
+    ) -> None:
+        """
+        移除已注册的监听者
+
+        Args:
+            on_delete (Optional[Callable[[str], None]]): 删除监听者
+            on_rename (Optional[Callable[[str, str], None]]): 改名监听者
+        """
+        if on_delete in self._delete_listeners:
+            self._delete_listeners.remove(on_delete)
+        if on_rename in self._rename_listeners:
+            self._rename_listeners.remove(on_rename)
+
+    def _notify(self, listeners: List[Callable[..., None]], *args: str) -> None:
+        """
+        调用监听者 单个监听者失败只记录日志
+
+        Args:
+            listeners (List[Callable[..., None]]): 监听者列表
+            *args (str): 会话标识参数
+        """
+        for listener in list(listeners):
+            try:
+                listener(*args)
+            except Exception as e:
+                logger.warning(f"⚠️ 会话变更监听者执行失败: {e}")
 
     @property
     def manager(self) -> SessionManager:
@@ -70,17 +122,96 @@ class SessionService:
         if self._manager is None:
             # 读取最新路径配置 保证会话目录可切换
             paths = get_paths()
+            session_cfg = self._load_session_config()
             # 传入 storage_path 让 manager 负责具体文件组织
-            self._manager = SessionManager(storage_path=paths.sessions_dir)
+            self._manager = SessionManager(
+                storage_path=paths.sessions_dir,
+                storage_mode=session_cfg.get("storage_mode", "journal"),
+                compact_threshold=int(session_cfg.get("compact_threshold", 200)),
+                cache_max_sessions=int(session_cfg.get("cache_max_sessions", 64)),
+                cache_max_bytes=int(session_cfg.get("cache_max_bytes", 256 * 1024 * 1024)),
+                write_behind=bool(session_cfg.get("write_behind", True)),
+                archive_after_days=float(session_cfg.get("archive_after_days", 0)),
+                archive_codec=session_cfg.get("archive_codec", "gzip"),
+                snapshot_codec=session_cfg.get("snapshot_codec", "json"),
+            )
         return self._manager
 
-    def reload(self):
+    def _load_session_config(self) -> Dict[str, Any]:
+        """
+        读取 config.json 中的 sessions 配置
+
+        Returns:
+            Dict[str, Any]: 会话存储与缓存配置 缺失时返回空字典
+        """
+        try:
+            session_cfg = get_paths().load_config().get("sessions", {})
+        except Exception:
+            # 配置文件缺失或损坏时使用默认值 不影响会话读写
+            return {}
+        return session_cfg if isinstance(session_cfg, dict) else {}
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """
+        获取会话缓存统计
+
+        Returns:
+            Dict[str, Any]: 命中 未命中 淘汰计数与常驻容量
+        """
+        return self.manager.cache_stats()
+
+    def get_persist_stats(self) -> Dict[str, Any]:
+        """
+        获取后台写回队列统计
+
+        Returns:
+            Dict[str, Any]: 队列深度 合并次数与写入延迟
+        """
+        return self.manager.persist_stats()
+
+    async def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待已入队的会话保存全部落盘
+
+        Args:
+            timeout (Optional[float]): 最长等待秒数 None 表示一直等待
+
+        Returns:
+            bool: 在超时前排空返回 True
+        """
+        return await self.manager.aflush(timeout)
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        排空写回队列 进程退出前调用
+
+        Args:
+            timeout (Optional[float]): 最长等待秒数
+
+        Returns:
+            bool: 是否在超时前排空
+        """
+        if self._manager is None:
+            return True
+        return self._manager.close(timeout)
+
+    async def reload(self, timeout: float = 5.0):
         """
         重置管理器缓存
+
+        Args:
+            timeout (float): 等待旧管理器写回队列排空的最长秒数
         """
-        # 下次访问 manager 时会重新初始化
-        # 清空 manager 引用 强制后续请求重新绑定路径
+        old = self._manager
+        if old is None:
+            return
+        # 先在线程池中等待旧管理器的写回队列排空 不阻塞事件循环 超时后仍切换
+        if not await old.aflush(timeout):
+            logger.warning(f"⚠️ 重置会话管理器时写回队列未在 {timeout}s 内排空 剩余保存由旧管理器在后台完成")
+        # 下次访问 manager 时会重新初始化 清空引用 强制后续请求重新绑定路径
         self._manager = None
+        # 停止旧管理器的写线程并等待压实 放到后台线程 不在请求路径上等待
+        Thread(target=old.close, args=(timeout,), name="session-manager-close", daemon=True).start()
 
     def _resolve_session_id(self, session_id: str) -> str:
         """
@@ -130,8 +261,8 @@ class SessionService:
             self._renamed_ids.pop(original_id, None)
 
         # 统一走 manager 保存
-        # 调用底层保存接口 触发 session 与 messages 落盘
-        self.manager.save_session(session)
+        # 保存进入后台写回队列 不在请求路径上序列化与写盘
+        self.manager.schedule_save(session)
 
     def create_new_session(self, session_id: str) -> Session:
         """
@@ -173,117 +304,180 @@ class SessionService:
             bool: 是否删除成功
         """
         session_id = self._resolve_session_id(session_id)
-        # 解析会话目录路径
-        paths = get_paths()
-        session_path = paths.sessions_dir / session_id
-        # 仅在目录存在时继续删除流程
-        if session_path.exists():
-            try:
-                # 删除整个会话目录
-                shutil.rmtree(session_path)
-                # 同步删除缓存项
-                if session_id in self.manager._cache:
-                    del self.manager._cache[session_id]
-                return True
-            except Exception:
-                # 删除失败统一返回 False 由上层决定提示
-                return False
-        return False
-
-    def list_sessions(self) -> List[Dict[str, Any]]:
-        """
-        列出全部会话摘要
+        # 由 manager 统一删除目录 缓存 索引 并丢弃尚未落盘的保存
+        if not self.manager.delete_session(session_id):
+            return False
+        self._notify(self._delete_listeners, session_id)
+        return True
+
+    def fork_session(self, session_id: str, at: int, name: Optional[str] = None) -> Optional[Session]:
+        """
+        从会话的第 at 条消息处创建分支 分支与父会话共享前缀消息
 
         Args:
-            None:
+            session_id (str): 父会话标识
+            at (int): 分支点 分支保留父会话的前 at 条消息
+            name (Optional[str]): 分支会话名称 默认自动生成 同名冲突时追加时分秒后缀
 
         Returns:
-            List[Dict[str Any]]: 会话摘要列表 按更新时间倒序
+            Optional[Session]: 分支会话对象 父会话不存在返回 None
+
+        Raises:
+            ValueError: 分支点超出父会话消息范围时抛出
         """
-        # 读取会话目录配置
-        paths = get_paths()
-        sessions_dir = paths.sessions_dir
-        sessions = []
+        session_id = self._resolve_session_id(session_id)
+        final_id = name
+        if final_id and (get_paths().sessions_dir / final_id).exists():
+            # 与 create_new_session 一致 使用当前时间尾缀避免目录名冲突
+            final_id = f"{name}_{datetime.now().strftime('%H%M%S')}"
+        return self.manager.fork_session(session_id, at, new_id=final_id)
+
+    def list_sessions(self, offset: int = 0, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        分页列出会话摘要
 
-        # 会话目录不存在时返回空列表
-        if not sessions_dir.exists():
-            return sessions
+        摘要来自会话目录索引 不加载任何消息历史
 
-        # 遍历目录读取每个会话
-        for session_dir in sessions_dir.iterdir():
-            if not session_dir.is_dir():
-                # 跳过非目录文件
-                continue
-            try:
-                # 使用 manager 加载 保证数据结构一致
-                session = self.manager.get_or_create_session(session_dir.name)
+        Args:
+            offset (int): 跳过条数
+            limit (Optional[int]): 返回条数上限 None 表示全部
 
+        Returns:
+            Tuple[List[Dict[str Any]], int]: 按更新时间倒序的会话摘要列表与会话总数
+        """
+        entries, total = self.manager.list_session_summaries(offset=offset, limit=limit)
+        sessions = [
+            {
+                "id": entry["session_id"],
                 # 标题使用 session_id 避免旧数据 title 不可靠
-                title = session.session_id
-
-                sessions.append({
-                    "id": session.session_id,
-                    "title": title,
-                    "created_at": (session.created_at.isoformat()
-                                   if hasattr(session.created_at, 'isoformat')
-                                   else str(session.created_at)),
-                    "updated_at": (session.updated_at.isoformat()
-                                   if hasattr(session.updated_at, 'isoformat')
-                                   else str(session.updated_at)),
-                    "message_count": len(session.messages),
-                })
-            except Exception as e:
-                # 保留错误打印 便于排查坏会话文件
-                print(f"❌ 读取 Session 错误 {session_dir.name}: {e}")
-                import traceback
-                traceback.print_exc()
-
-        # 前端显示按最近更新时间排序
-        sessions.sort(key=lambda s: s["updated_at"], reverse=True)
-        return sessions
-
-    def get_session_messages(self, session_id: str) -> List[Dict[str, Any]]:
-        """
-        获取会话消息列表
-
-        仅返回 user 与 assistant 消息
+                "title": entry["session_id"],
+                "created_at": entry["created_at"],
+                "updated_at": entry["updated_at"],
+                "message_count": entry["message_count"],
+                "parent_id": entry.get("parent_id"),
+            }
+            for entry in entries
+        ]
+        return sessions, total
+
+    def rebuild_catalog(self) -> int:
+        """
+        重建会话目录索引
+
+        Returns:
+            int: 重建后的会话数
+        """
+        return self.manager.rebuild_catalog()
+
+    def archive_cold_sessions(self, days: Optional[float] = None) -> Dict[str, Any]:
+        """
+        归档长期未更新的会话
+
+        Args:
+            days (Optional[float]): 未更新天数阈值 None 表示使用配置中的 archive_after_days
+
+        Returns:
+            Dict[str, Any]: 归档会话数 跳过数 压缩前后总字节数
+        """
+        return self.manager.archive_cold_sessions(days)
+
+    def export_sessions(self, session_ids: Optional[List[str]] = None) -> Iterator[str]:
+        """
+        流式导出会话为 NDJSON 行
+
+        Args:
+            session_ids (Optional[List[str]]): 要导出的会话ID 默认导出全部
+
+        Returns:
+            Iterator[str]: NDJSON 行迭代器
+        """
+        if session_ids is not None:
+            session_ids = [self._resolve_session_id(sid) for sid in session_ids]
+        return iter_export(self.manager, session_ids)
+
+    def create_importer(self, on_conflict: str = "rename") -> SessionImporter:
+        """
+        创建 NDJSON 会话导入器
+
+        Args:
+            on_conflict (str): 会话ID冲突策略 "rename" 或 "skip"
+
+        Returns:
+            SessionImporter: 导入器 调用方逐行 feed 后 close 获取统计
+        """
+        return SessionImporter(self.manager, on_conflict=on_conflict)
+
+    def search_messages(
+        self,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        session_id: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        全文检索全部会话历史
+
+        Args:
+            query (str): 检索词
+            limit (int): 返回条数上限
+            offset (int): 跳过条数
+            session_id (Optional[str]): 只在指定会话中检索
+
+        Returns:
+            Tuple[List[Dict[str, Any]], int]: 按相关度排序的命中列表与命中总数
+        """
+        if session_id is not None:
+            session_id = self._resolve_session_id(session_id)
+        return self.manager.search_messages(query, limit=limit, offset=offset, session_id=session_id)
+
+    def get_session_messages(
+        self,
+        session_id: str,
+        since: Optional[int] = None,
+        before: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        分页获取会话消息列表
+
+        仅返回 user 与 assistant 消息 每条消息带有其在完整历史中的位置 index
+        客户端以首条 index 作为 before 向前翻页 以末条 index 作为 since 拉取新消息
 
         Args:
             session_id (str): 会话标识
+            since (Optional[int]): 只返回 index 大于 since 的消息
+            before (Optional[int]): 只返回 index 小于 before 的消息
+            limit (Optional[int]): 每页条数上限 None 表示全部
 
         Returns:
-            List[Dict[str Any]]: 消息字典列表
+            Tuple[List[Dict[str Any]], bool]: 消息字典列表与是否还有更多
         """
         try:
             session_id = self._resolve_session_id(session_id)
-            # 加载会话后转换为前端所需字段
-            session = self.manager.get_or_create_session(session_id)
-            filtered_messages: List[Dict[str, Any]] = []
-            for msg in session.messages:
-                # 仅输出 user 与 assistant
-                if msg.role not in ["user", "assistant"]:
-                    continue
-
-                # 跳过带 tool_calls 的 assistant 思考片段 避免前端显示内部推理
-                if msg.role == "assistant" and getattr(msg, "tool_calls", None):
-                    continue
-
-                filtered_messages.append(
-                    {
-                        # role 用于前端区分消息气泡方向
-                        "role": msg.role,
-                        # content 保留原始文本 不做摘要压缩
-                        "content": msg.content,
-                        # timestamp 统一输出字符串 兼容多种时间类型
-                        "timestamp": (msg.timestamp.isoformat()
-                                      if hasattr(msg.timestamp, 'isoformat')
-                                      else str(msg.timestamp)),
-                    }
-                )
-            return filtered_messages
+            window = self.manager.get_message_window(session_id, since=since, before=before, limit=limit)
+            if window is None:
+                # 会话不存在时沿用原行为创建空会话
+                self.manager.get_or_create_session(session_id)
+                return [], False
+
+            items, has_more = window
+            filtered_messages: List[Dict[str, Any]] = [
+                {
+                    # index 作为翻页游标
+                    "index": index,
+                    # role 用于前端区分消息气泡方向
+                    "role": msg["role"],
+                    # content 保留原始文本 不做摘要压缩
+                    "content": msg.get("content") or "",
+                    # timestamp 统一输出字符串 兼容多种时间类型
+                    "timestamp": str(msg.get("timestamp", "")),
+                }
+                for index, msg in items
+            ]
+            return filtered_messages, has_more
         except Exception:
             # 任意异常时返回空列表 保持接口稳定
-            return []
+            return [], False
 
     def rename_session(self, session_id: str, new_name: str) -> bool:
         """
@@ -313,29 +507,42 @@ class SessionService:
             if new_dir.exists():
                 return False
 
-            # 1 执行目录重命名
-            old_dir.rename(new_dir)
-
-            # 2 更新 session.json 内 session_id 与可选 title
-            session_file = new_dir / "session.json"
-            if session_file.exists():
-                # 读取原始 session 元数据
-                with open(session_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                # 覆盖会话标识 保证文件内容与目录一致
-                data["session_id"] = new_name
-                if "title" in data:
-                    # title 存在时同步更新显示名称
-                    data["title"] = new_name
-                # 写回磁盘并保留中文
-                with open(session_file, "w", encoding="utf-8") as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-
-            # 3 更新缓存与重命名映射
-            cached_session = self.manager._cache.pop(session_id, None)
-            if cached_session is not None:
-                cached_session.session_id = new_name
-                self.manager._cache[new_name] = cached_session
+            # 持有写锁 避免后台写回在改名中途写入旧目录
+            with self.manager.write_lock:
+                # 1 执行目录重命名 持有快照锁 避免进行中的后台压实向旧目录写入快照
+                journal = self.manager._get_journal(session_id)
+                with journal.snapshot_lock:
+                    # 使进行中的压实作废 旧路径的日志对象随后移除
+                    journal.generation += 1
+                    old_dir.rename(new_dir)
+                self.manager._drop_journal(session_id)
+
+                # 2 更新 session.json 内 session_id 与可选 title
+                session_file = new_dir / "session.json"
+                if session_file.exists():
+                    # 读取原始 session 元数据
+                    with open(session_file, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                    # 覆盖会话标识 保证文件内容与目录一致
+                    data["session_id"] = new_name
+                    if "title" in data:
+                        # title 存在时同步更新显示名称
+                        data["title"] = new_name
+                    # 写回磁盘并保留中文
+                    with open(session_file, "w", encoding="utf-8") as f:
+                        json.dump(data, f, ensure_ascii=False, indent=2)
+
+                # 3 同步目录索引
+                self.manager.catalog.rename(session_id, new_name)
+                self.manager.search.rename(session_id, new_name)
+                # 分支通过父会话ID引用共享前缀 同步指向新ID
+                self.manager.repoint_branches(session_id, new_name)
+
+                # 4 更新缓存与重命名映射
+                cached_session = self.manager._cache.pop(session_id, None)
+                if cached_session is not None:
+                    cached_session.session_id = new_name
+                    self.manager._cache[new_name] = cached_session
 
             # 记录 old -> new，确保流式中的旧 session 对象保存时回写到新目录
             self._renamed_ids[session_id] = new_name
@@ -344,6 +551,7 @@ class SessionService:
                 if current_id == session_id:
                     self._renamed_ids[old_id] = new_name
 
+            self._notify(self._rename_listeners, session_id, new_name)
             return True
         except Exception as e:
             # 打印异常细节方便快速定位问题
@@ -29,6 +29,14 @@ from api.routes.schemas.settings import (
 )
 from audio.base import looks_like_env_key_name, resolve_provider_api_key
 from config.paths import get_paths
+from llm.cache import get_response_cache
+from llm.pool import get_client_registry
+from llm.hedging import get_hedge_policy
+from llm.provider_pool import get_provider_pool
+from llm.retry import get_retry_policy
+from llm.scheduler import get_llm_scheduler
+from llm.singleflight import get_single_flight
+from llm.telemetry import get_llm_telemetry
 from utils.logger import logger
 
 PROVIDER_ENV_MAP: Dict[str, str] = {
@@ -1034,6 +1042,39 @@ class ApiSettingsModule:
             llm=llm_ready,
         )
 
+    def get_llm_stats(self) -> Dict[str, Any]:
+        """
+        获取 LLM 响应缓存与共享客户端统计。
+
+        Args:
+            None
+
+        Returns:
+            Dict[str, Any]: response_cache 命中率、single_flight 请求合并、scheduler 排队等待、retry 重试、hedging 对冲与首 token 延迟、provider_pool 各模型健康与熔断状态、client_pool 客户端复用统计。
+        """
+        return {
+            "response_cache": get_response_cache().stats(),
+            "single_flight": get_single_flight().stats(),
+            "scheduler": get_llm_scheduler().stats(),
+            "retry": get_retry_policy().stats(),
+            "hedging": get_hedge_policy().stats(),
+            "provider_pool": get_provider_pool().stats(),
+            "client_pool": get_client_registry().stats(),
+        }
+
+    def get_llm_telemetry(self, session_id: Optional[str] = None, recent: int = 20) -> Dict[str, Any]:
+        """
+        获取 LLM 调用遥测统计。
+
+        Args:
+            session_id (Optional[str]): 只返回该会话的统计，为空时返回全部维度。
+            recent (int): 返回的最近调用明细条数。
+
+        Returns:
+            Dict[str, Any]: 按模式、调用方、模型与会话聚合的首 token 延迟、耗时、token 用量与估算费用，以及最近调用明细。
+        """
+        return get_llm_telemetry().stats(session_id=session_id, recent=recent)
+
 
 class PathSettingsModule:
     """
@@ -1875,6 +1916,31 @@ class SettingsService:
         """
         return self.api_module.get_system_status()
 
+    async def get_llm_stats(self) -> Dict[str, Any]:
+        """
+        获取 LLM 调用统计。
+
+        Args:
+            None
+
+        Returns:
+            Dict[str, Any]: 响应缓存、请求合并、调度排队、重试、对冲、服务商池与共享客户端统计。
+        """
+        return self.api_module.get_llm_stats()
+
+    async def get_llm_telemetry(self, session_id: Optional[str] = None, recent: int = 20) -> Dict[str, Any]:
+        """
+        获取 LLM 调用遥测统计。
+
+        Args:
+            session_id (Optional[str]): 只返回该会话的统计。
+            recent (int): 返回的最近调用明细条数。
+
+        Returns:
+            Dict[str, Any]: 首 token 延迟、耗时、token 用量与估算费用的聚合统计。
+        """
+        return self.api_module.get_llm_telemetry(session_id=session_id, recent=recent)
+
     async def get_theme_settings(self) -> Dict[str, Any]:
         """
         获取主题配置。
@@ -0,0 +1,5 @@
+"""
+性能基准脚本
+
+每个脚本可直接在仓库根目录运行 结果打印为表格 数值随机器变化 只用于同机对比
+"""
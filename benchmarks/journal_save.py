@@ -0,0 +1,73 @@
+"""
+会话保存基准
+
+对比两种存储模式下每轮对话的保存耗时随历史长度的变化:
+- journal: 只追加本轮新增的消息与元信息到 journal.jsonl
+- snapshot: 每轮整份重写 session.json messages 与 compression 快照
+
+每个规模先写出一次完整快照(不计时) 之后每轮追加一问一答并 save_session 取中位数
+
+用法:
+    python -m benchmarks.journal_save [--sizes 10,1000,10000,50000] [--turns 20]
+"""
+
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from memory.manager import SessionManager
+from memory.schema import AssistantMessage, UserMessage
+
+
+def per_turn_save(storage_mode: str, size: int, turns: int) -> float:
+    """
+    测量指定历史长度下每轮保存的中位耗时
+
+    Args:
+        storage_mode (str): 存储模式 journal 或 snapshot
+        size (int): 计时前会话已有的消息条数
+        turns (int): 计时的轮数
+
+    Returns:
+        float: 每轮保存耗时的中位数(秒)
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="ema-journal-"))
+    # 计时期间不触发后台压实 只测量每轮保存本身
+    manager = SessionManager(workdir, storage_mode=storage_mode, write_behind=False, compact_threshold=10 ** 9)
+    try:
+        session = manager.create_session("bench")
+        for i in range(size):
+            session.add_message(UserMessage(f"问题 {i} " * 8) if i % 2 == 0 else AssistantMessage(f"回答 {i} " * 16))
+        manager.save_session(session)
+
+        samples: List[float] = []
+        for turn in range(turns):
+            session.add_message(UserMessage(f"新问题 {turn}"))
+            session.add_message(AssistantMessage(f"新回答 {turn}"))
+            started = time.perf_counter()
+            manager.save_session(session)
+            samples.append(time.perf_counter() - started)
+        return statistics.median(samples)
+    finally:
+        manager.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="会话保存基准")
+    parser.add_argument("--sizes", default="10,1000,10000,50000", help="逗号分隔的历史消息条数")
+    parser.add_argument("--turns", type=int, default=20, help="每个规模计时的轮数")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    print(f"median save per turn over {args.turns} turns")
+    print(f"{'messages':>9s} {'journal':>10s} {'snapshot':>10s}")
+    for size in sizes:
+        journal = per_turn_save("journal", size, args.turns)
+        snapshot = per_turn_save("snapshot", size, args.turns)
+        print(f"{size:9d} {journal * 1000:8.2f}ms {snapshot * 1000:8.2f}ms")
@@ -0,0 +1,123 @@
+"""
+消息表示基准
+
+1. 内存: 10 万条消息常驻时 __slots__ 消息与等价的普通 dataclass 的占用
+2. CPU: 重复构建上下文时逐条序列化的耗时
+   基线为每次重新生成字典的普通 dataclass 对比 to_dict(缓存后复制) 与 to_wire(只读缓存)
+
+用法:
+    python -m benchmarks.message_repr [--messages 100000] [--context 40] [--builds 20000]
+"""
+
+import json
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from memory.schema import AssistantMessage, Message, UserMessage
+
+
+@dataclass
+class BaselineMessage:
+    """紧凑表示之前的消息: 普通 dataclass 每个实例带 __dict__ 每次 to_dict 重新生成"""
+
+    role: str
+    content: str
+    timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
+    name: Optional[str] = None
+    tool_call_id: Optional[str] = None
+    tool_calls: Optional[List[Dict[str, Any]]] = None
+    base64_image: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        # 与紧凑表示之前的 Message.to_dict 相同
+        message = {"role": self.role, "timestamp": self.timestamp}
+        if self.content is not None:
+            if isinstance(self.content, (dict, list)):
+                message["content"] = json.dumps(self.content, ensure_ascii=False)
+            else:
+                message["content"] = str(self.content)
+        else:
+            message["content"] = ""
+        if self.role == "assistant" and self.tool_calls:
+            message["tool_calls"] = self.tool_calls
+        if self.role == "tool":
+            if self.name is not None:
+                message["name"] = self.name
+            if self.tool_call_id is not None:
+                message["tool_call_id"] = self.tool_call_id
+        return message
+
+
+def _baseline(i: int) -> BaselineMessage:
+    return BaselineMessage(role="user" if i % 2 == 0 else "assistant", content=f"你好 hello {i}")
+
+
+def _slotted(i: int) -> Message:
+    return UserMessage(content=f"你好 hello {i}") if i % 2 == 0 else AssistantMessage(content=f"你好 hello {i}")
+
+
+def traced_bytes(factory: Callable[[int], Any], count: int) -> int:
+    """
+    统计构建 count 条消息后常驻的字节数
+
+    Args:
+        factory (Callable[[int], Any]): 按序号创建消息的函数
+        count (int): 消息条数
+
+    Returns:
+        int: tracemalloc 统计的常驻字节数
+    """
+    tracemalloc.start()
+    messages = [factory(i) for i in range(count)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del messages
+    return current
+
+
+def context_builds(serialize: Callable[[Any], Any], context: List[Any], builds: int) -> float:
+    """
+    重复序列化同一段上下文
+
+    Args:
+        serialize (Callable[[Any], Any]): 单条消息的序列化方法
+        context (List[Any]): 上下文消息
+        builds (int): 构建次数
+
+    Returns:
+        float: 总耗时(秒)
+    """
+    started = time.perf_counter()
+    for _ in range(builds):
+        [serialize(m) for m in context]
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="消息表示基准")
+    parser.add_argument("--messages", type=int, default=100_000, help="内存测量的消息条数")
+    parser.add_argument("--context", type=int, default=40, help="每次上下文构建的消息条数")
+    parser.add_argument("--builds", type=int, default=20_000, help="上下文构建次数")
+    args = parser.parse_args()
+
+    base = traced_bytes(_baseline, args.messages)
+    slotted = traced_bytes(_slotted, args.messages)
+    print(f"memory, {args.messages} messages")
+    print(f"  dataclass  {base / 1e6:7.1f} MB  {base / args.messages:6.0f} B/msg")
+    print(f"  __slots__  {slotted / 1e6:7.1f} MB  {slotted / args.messages:6.0f} B/msg  ({1 - slotted / base:.0%} less)")
+
+    baseline_ctx = [_baseline(i) for i in range(args.context)]
+    slotted_ctx = [_slotted(i) for i in range(args.context)]
+    print(f"cpu, {args.builds} context builds x {args.context} messages")
+    rows = [
+        ("dataclass.to_dict", context_builds(BaselineMessage.to_dict, baseline_ctx, args.builds)),
+        ("Message.to_dict", context_builds(Message.to_dict, slotted_ctx, args.builds)),
+        ("Message.to_wire", context_builds(Message.to_wire, slotted_ctx, args.builds)),
+    ]
+    for name, seconds in rows:
+        print(f"  {name:18s} {seconds * 1000:7.0f} ms  {seconds / args.builds * 1e6:6.1f} us/build")
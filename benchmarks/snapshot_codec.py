@@ -0,0 +1,126 @@
+"""
+快照编解码基准
+
+对合成的大会话比较各快照格式的保存 解析 加载(含 Message.from_dict)耗时与文件大小
+未安装的可选依赖(msgpack orjson)对应的格式会被跳过或退化 输出中会注明
+
+用法:
+    python -m benchmarks.snapshot_codec [--messages 50000] [--repeat 3]
+"""
+
+import json
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from memory import codec as codec_module
+from memory.codec import MESSAGES_STEM, available_snapshot_codecs, get_snapshot_codec, read_snapshot
+from memory.message_index import dump_messages
+from memory.schema import AssistantMessage, Message, UserMessage
+
+
+# 合成消息使用的中英文混合词表
+_WORDS = "今天 天气 不错 我们 去 公园 散步 吧 the quick brown fox jumps over lazy dog 代码 测试 性能".split()
+
+
+def synthetic_messages(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    生成 user / assistant 交替的合成消息字典
+
+    Args:
+        count (int): 消息条数
+        seed (int): 随机种子
+
+    Returns:
+        List[Dict[str, Any]]: 消息字典列表
+    """
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        text = " ".join(rng.choices(_WORDS, k=rng.randint(5, 60)))
+        message = UserMessage(content=text) if i % 2 == 0 else AssistantMessage(content=text)
+        messages.append(message.to_dict(cache=False))
+    return messages
+
+
+def best_of(fn: Callable[[], Any], repeat: int) -> Tuple[float, Any]:
+    """
+    多次运行取最短耗时
+
+    Args:
+        fn (Callable[[], Any]): 被测函数
+        repeat (int): 运行次数
+
+    Returns:
+        Tuple[float, Any]: 最短耗时(秒)与最后一次的返回值
+    """
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def _pretty_json_baseline(path: Path, data: List[Dict[str, Any]]) -> Path:
+    """可插拔编解码之前的写法: json.dump(indent=2, ensure_ascii=False)"""
+    file = path / "messages.json"
+    with open(file, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return file
+
+
+def run(count: int, repeat: int) -> List[Tuple[str, float, float, float, int]]:
+    """
+    运行基准
+
+    Args:
+        count (int): 合成会话的消息条数
+        repeat (int): 每项测量的运行次数
+
+    Returns:
+        List[Tuple[str, float, float, float, int]]: (格式, 保存秒, 解析秒, 加载秒, 文件字节数)
+    """
+    data = synthetic_messages(count)
+    workdir = Path(tempfile.mkdtemp(prefix="ema-codec-"))
+    rows = []
+    try:
+        base = workdir / "baseline"
+        base.mkdir()
+        save, file = best_of(lambda: _pretty_json_baseline(base, data), repeat)
+        parse, _ = best_of(lambda: json.loads(file.read_text(encoding="utf-8")), repeat)
+        load, _ = best_of(lambda: [Message.from_dict(m) for m in json.loads(file.read_text(encoding="utf-8"))], repeat)
+        rows.append(("json.dump indent=2", save, parse, load, file.stat().st_size))
+
+        for name in available_snapshot_codecs():
+            codec = get_snapshot_codec(name)
+            target = workdir / name
+            target.mkdir()
+            save, file = best_of(lambda: dump_messages(target, data, codec), repeat)
+            parse, _ = best_of(lambda: read_snapshot(target, MESSAGES_STEM), repeat)
+            load, _ = best_of(lambda: [Message.from_dict(m) for m in read_snapshot(target, MESSAGES_STEM)], repeat)
+            rows.append((name, save, parse, load, file.stat().st_size))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="快照编解码基准")
+    parser.add_argument("--messages", type=int, default=50_000, help="合成会话的消息条数")
+    parser.add_argument("--repeat", type=int, default=3, help="每项测量的运行次数 取最短")
+    args = parser.parse_args()
+
+    print(f"消息 {args.messages} 条 orjson: {'是' if codec_module.orjson else '否'} msgpack: {'是' if codec_module.msgpack else '否'}")
+    print(f"{'codec':20s} {'save':>9s} {'parse':>9s} {'load':>9s} {'size':>9s} {'save MB/s':>9s} {'parse MB/s':>10s}")
+    for name, save, parse, load, size in run(args.messages, args.repeat):
+        mb = size / 1e6
+        print(
+            f"{name:20s} {save * 1000:7.0f}ms {parse * 1000:7.0f}ms {load * 1000:7.0f}ms "
+            f"{mb:7.2f}MB {mb / save:9.0f} {mb / parse:10.0f}"
+        )
@@ -9,7 +9,7 @@ import os
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 try:
     # 可选依赖 yaml 不存在时仅使用 json 配置
@@ -301,6 +301,16 @@ class PathConfig:
         path.mkdir(parents=True, exist_ok=True)
         return path
 
+    @property
+    def long_term_memory_dir(self) -> Path:
+        """
+        获取长期记忆目录路径
+
+        Returns:
+            ./EmaAgent/data/long_term_memory
+        """
+        return self.data_dir / "long_term_memory"
+
     @property
     def narrative_dir(self) -> Path:
         """
@@ -515,6 +525,20 @@ class PathConfig:
         # 返回解析后的 json 数据
         return json.loads(self.settings_json.read_text(encoding="utf-8"))
 
+    def config_version(self) -> Tuple[int, ...]:
+        """
+        获取配置版本 以 config.json config.yaml settings.json .env 的修改时间表示
+
+        用于缓存由配置派生的运行参数 文件未变化时无需重新解析
+        """
+        version = []
+        for path in (self.config_json, self.config_yaml, self.settings_json, self.env_file):
+            try:
+                version.append(path.stat().st_mtime_ns)
+            except OSError:
+                version.append(0)
+        return tuple(version)
+
     def save_settings(self, settings: Dict[str, Any]) -> None:
         """
         保存 settings.json 配置
@@ -534,6 +558,7 @@ class PathConfig:
         # 收集需要确保存在的目录列表
         dirs = [
             self.sessions_dir,
+            self.long_term_memory_dir,
             self.data_dir,
             self.uploads_dir,
             self.memory_dir,
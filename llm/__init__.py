@@ -3,11 +3,56 @@ LLM 模块 - 大语言模型客户端
 
 LLMClient: LLM客户端基类
 LLMConfig: LLM配置
+TokenCounter: token 计数器
+get_openai_client: 共享的 OpenAI 兼容客户端
+get_response_cache: LLM 响应缓存
+get_single_flight: 进行中相同请求的合并器
+get_llm_scheduler: 按服务商限流 按优先级排队的请求调度器
+get_retry_policy: 按错误类型重试并受全局预算约束的重试策略
+get_hedge_policy: 流式请求对冲与首 token 延迟统计
+get_provider_pool: 按权重与健康状态分流并自动切换的多模型服务商池
+get_llm_telemetry: 按会话 模式与调用方聚合的调用耗时 token 用量与费用统计
 """
+from .cache import ResponseCache, configure_response_cache, get_response_cache
 from .client import LLMClient
 from .config import LLMConfig
+from .hedging import HedgePolicy, configure_hedging, get_hedge_policy
+from .pool import close_openai_clients, configure_client_pool, get_openai_client
+from .provider_pool import ProviderPool, configure_provider_pool, get_provider_pool
+from .retry import RetryPolicy, configure_retry_policy, get_retry_policy
+from .scheduler import LLMScheduler, configure_llm_scheduler, get_llm_scheduler
+from .singleflight import SingleFlight, get_single_flight
+from .telemetry import LLMTelemetry, configure_llm_telemetry, get_llm_telemetry, telemetry_scope
+from .tokenizer import TokenCounter, get_token_counter, register_token_counter
 
 __all__ = [
     "LLMClient",
     "LLMConfig",
+    "TokenCounter",
+    "get_token_counter",
+    "register_token_counter",
+    "get_openai_client",
+    "configure_client_pool",
+    "close_openai_clients",
+    "ResponseCache",
+    "get_response_cache",
+    "configure_response_cache",
+    "SingleFlight",
+    "get_single_flight",
+    "LLMScheduler",
+    "get_llm_scheduler",
+    "configure_llm_scheduler",
+    "RetryPolicy",
+    "get_retry_policy",
+    "configure_retry_policy",
+    "HedgePolicy",
+    "get_hedge_policy",
+    "configure_hedging",
+    "ProviderPool",
+    "get_provider_pool",
+    "configure_provider_pool",
+    "LLMTelemetry",
+    "get_llm_telemetry",
+    "configure_llm_telemetry",
+    "telemetry_scope",
 ]
\ No newline at end of file
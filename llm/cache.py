@@ -0,0 +1,492 @@
+"""
+LLM 响应缓存
+
+路由分类 上下文压缩等低温度调用的输入经常重复 命中缓存时直接返回上次的回复 不再请求模型:
+
+1. 缓存键为 base_url model messages 与采样参数的规范化 JSON 的 sha256 超时等与输出无关的参数不参与
+2. 内存 LRU 按条数淘汰 可选 SQLite 持久化 进程重启后仍可命中
+3. 条目超过 TTL 视为过期 读取时惰性删除
+4. 同一键的并发未命中只向模型发出一次请求 其余调用等待该请求的结果
+5. 默认关闭 开启后仅缓存 temperature 不高于 max_temperature 的调用 调用方可按次强制缓存或绕过
+
+配置见 config.json 的 `llm.response_cache`
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.logger import logger
+
+
+# 响应缓存默认参数
+DEFAULT_CACHE_CONFIG: Dict[str, Any] = {
+    "enabled": False,
+    "max_entries": 2048,
+    "ttl_seconds": 86400,
+    "persist": False,
+    "max_disk_entries": 20000,
+    "max_temperature": 0.3,
+}
+
+# 不影响模型输出的请求参数 不参与缓存键计算
+_IGNORED_PARAMS = {"timeout", "stream", "extra_headers"}
+
+
+class ResponseCache:
+    """
+    LLM 文本响应缓存
+
+    Args:
+        config (Optional[Dict[str, Any]]): 缓存配置 缺省字段使用 DEFAULT_CACHE_CONFIG
+        db_path (Optional[Path]): 持久化数据库路径 persist 开启时使用
+
+    Returns:
+        ResponseCache: 缓存实例
+
+    Examples:
+        >>> cache = ResponseCache({"enabled": True})
+        >>> key = cache.make_key({"model": "deepseek-chat", "messages": msgs, "temperature": 0.3})
+        >>> text = await cache.get_or_call(key, lambda: call_llm())
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, db_path: Optional[Path] = None):
+        """
+        初始化缓存 持久化数据库延迟打开
+
+        Args:
+            config (Optional[Dict[str, Any]]): 缓存配置
+            db_path (Optional[Path]): 持久化数据库路径
+        """
+        self._lock = threading.Lock()
+        # 键 -> (写入时间, 回复文本) 按访问顺序排列 末尾为最近使用
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        # 键 -> (事件循环, 进行中的请求)
+        self._inflight: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_path: Optional[Path] = None
+        self._disk_writes = 0
+        self.config: Dict[str, Any] = dict(DEFAULT_CACHE_CONFIG)
+        self._reset_counters()
+        self.configure(config, db_path)
+
+    def _reset_counters(self) -> None:
+        """
+        清零命中统计
+
+        Returns:
+            None
+        """
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.bypassed = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def configure(self, config: Optional[Dict[str, Any]], db_path: Optional[Path] = None) -> None:
+        """
+        更新缓存配置
+
+        缩小 max_entries 时立即淘汰多余条目 关闭 persist 时关闭数据库连接 已写入的数据保留
+
+        Args:
+            config (Optional[Dict[str, Any]]): 缓存配置
+            db_path (Optional[Path]): 持久化数据库路径
+
+        Returns:
+            None
+        """
+        merged = dict(DEFAULT_CACHE_CONFIG)
+        merged.update({k: v for k, v in (config or {}).items() if k in DEFAULT_CACHE_CONFIG})
+        with self._lock:
+            self.config = merged
+            self._evict_locked()
+            if db_path is not None and db_path != self._db_path:
+                self._close_db_locked()
+                self._db_path = db_path
+            if not (merged["enabled"] and merged["persist"]):
+                self._close_db_locked()
+
+    @property
+    def enabled(self) -> bool:
+        """
+        缓存是否开启
+
+        Returns:
+            bool: 是否开启
+        """
+        return bool(self.config["enabled"])
+
+    def should_cache(self, temperature: Optional[float], cache: Optional[bool] = None) -> bool:
+        """
+        判断本次调用是否走缓存
+
+        Args:
+            temperature (Optional[float]): 实际使用的采样温度
+            cache (Optional[bool]): 调用级开关 None 表示按配置自动判断 True 强制缓存 False 绕过
+
+        Returns:
+            bool: 是否走缓存
+        """
+        if not self.enabled:
+            return False
+        if cache is False:
+            with self._lock:
+                self.bypassed += 1
+            return False
+        if cache:
+            return True
+        return temperature is not None and float(temperature) <= float(self.config["max_temperature"])
+
+    @staticmethod
+    def make_key(params: Dict[str, Any]) -> str:
+        """
+        计算请求参数的缓存键
+
+        Args:
+            params (Dict[str, Any]): 请求参数 需包含 model 与 messages
+
+        Returns:
+            str: sha256 十六进制摘要
+        """
+        canonical = {k: v for k, v in params.items() if k not in _IGNORED_PARAMS and v is not None}
+        raw = json.dumps(canonical, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get_or_call(self, key: str, call: Callable[[], Awaitable[str]]) -> Tuple[str, bool]:
+        """
+        读取缓存 未命中时执行 call 并写入缓存
+
+        同一事件循环中同一键的并发调用共享一次 call 其异常同样传给所有等待者 不写入缓存
+
+        Args:
+            key (str): 缓存键
+            call (Callable[[], Awaitable[str]]): 未命中时调用的协程工厂
+
+        Returns:
+            Tuple[str, bool]: 回复文本 与是否来自缓存(含等待进行中的请求)
+        """
+        text = self._get_memory(key)
+        if text is None and self._db_enabled():
+            text = await asyncio.to_thread(self._get_disk, key)
+        if text is not None:
+            return text, True
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            pending = self._inflight.get(key)
+            joined = pending is not None and pending[0] is loop
+            if joined:
+                self.coalesced += 1
+                future = pending[1]
+            else:
+                future = loop.create_future()
+                self._inflight[key] = (loop, future)
+                self.misses += 1
+
+        if joined:
+            # shield: 等待者被取消时不影响发起者与其他等待者
+            return await asyncio.shield(future), True
+
+        try:
+            text = await call()
+        except BaseException as e:
+            self._finish(key, future)
+            if future.done():
+                pass
+            elif isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # 没有等待者时避免 "exception was never retrieved" 警告
+                future.exception()
+            raise
+        await self.put(key, text)
+        self._finish(key, future)
+        if not future.done():
+            future.set_result(text)
+        return text, False
+
+    def _finish(self, key: str, future: asyncio.Future) -> None:
+        """
+        移除进行中的请求记录
+
+        Args:
+            key (str): 缓存键
+            future (asyncio.Future): 请求对应的 Future
+
+        Returns:
+            None
+        """
+        with self._lock:
+            pending = self._inflight.get(key)
+            if pending is not None and pending[1] is future:
+                del self._inflight[key]
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        """
+        从内存 LRU 读取 命中时移到末尾 过期条目删除
+
+        Args:
+            key (str): 缓存键
+
+        Returns:
+            Optional[str]: 回复文本 未命中返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._is_expired(entry[0]):
+                del self._entries[key]
+                self.expired += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        """
+        从持久化数据库读取 命中时回填内存 LRU
+
+        Args:
+            key (str): 缓存键
+
+        Returns:
+            Optional[str]: 回复文本 未命中返回 None
+        """
+        with self._lock:
+            conn = self._open_db_locked()
+            if conn is None:
+                return None
+            row = conn.execute("SELECT created_at, response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            created_at, text = row
+            if self._is_expired(created_at):
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                self.expired += 1
+                return None
+            self._entries[key] = (created_at, text)
+            self._evict_locked()
+            self.hits += 1
+            self.disk_hits += 1
+            return text
+
+    async def put(self, key: str, text: str) -> None:
+        """
+        写入缓存 开启持久化时同步写入数据库
+
+        Args:
+            key (str): 缓存键
+            text (str): 回复文本
+
+        Returns:
+            None
+        """
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (now, text)
+            self._entries.move_to_end(key)
+            self._evict_locked()
+        if self._db_enabled():
+            await asyncio.to_thread(self._put_disk, key, now, text)
+
+    def _put_disk(self, key: str, created_at: float, text: str) -> None:
+        """
+        写入持久化数据库 每 256 次写入按条数上限清理最旧条目
+
+        Args:
+            key (str): 缓存键
+            created_at (float): 写入时间
+            text (str): 回复文本
+
+        Returns:
+            None
+        """
+        with self._lock:
+            conn = self._open_db_locked()
+            if conn is None:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, created_at, response) VALUES (?, ?, ?)",
+                (key, created_at, text),
+            )
+            self._disk_writes += 1
+            if self._disk_writes % 256 == 0:
+                conn.execute(
+                    "DELETE FROM responses WHERE key NOT IN "
+                    "(SELECT key FROM responses ORDER BY created_at DESC LIMIT ?)",
+                    (int(self.config["max_disk_entries"]),),
+                )
+            conn.commit()
+
+    def _is_expired(self, created_at: float) -> bool:
+        """
+        判断条目是否超过 TTL
+
+        Args:
+            created_at (float): 写入时间
+
+        Returns:
+            bool: 是否过期 ttl_seconds 不大于 0 时永不过期
+        """
+        ttl = float(self.config["ttl_seconds"])
+        return ttl > 0 and time.time() - created_at > ttl
+
+    def _evict_locked(self) -> None:
+        """
+        按 max_entries 淘汰最久未使用的条目 调用方需持有锁
+
+        Returns:
+            None
+        """
+        limit = max(int(self.config["max_entries"]), 0)
+        while len(self._entries) > limit:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _db_enabled(self) -> bool:
+        """
+        是否启用持久化
+
+        Returns:
+            bool: 开启 persist 且配置了数据库路径
+        """
+        return bool(self.config["enabled"] and self.config["persist"] and self._db_path is not None)
+
+    def _open_db_locked(self) -> Optional[sqlite3.Connection]:
+        """
+        打开持久化数据库 调用方需持有锁
+
+        Returns:
+            Optional[sqlite3.Connection]: 数据库连接 未启用或打开失败返回 None
+        """
+        if self._conn is not None:
+            return self._conn
+        if not self._db_enabled():
+            return None
+        try:
+            self._db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self._db_path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, created_at REAL NOT NULL, response TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_created ON responses (created_at)")
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 打开 LLM 响应缓存数据库失败 仅使用内存缓存: {e}")
+            self.config["persist"] = False
+            return None
+        self._conn = conn
+        return conn
+
+    def _close_db_locked(self) -> None:
+        """
+        关闭持久化数据库 调用方需持有锁
+
+        Returns:
+            None
+        """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def clear(self, disk: bool = True) -> None:
+        """
+        清空缓存与统计
+
+        Args:
+            disk (bool): 是否同时清空持久化数据
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._entries.clear()
+            self._reset_counters()
+            if disk:
+                conn = self._open_db_locked()
+                if conn is not None:
+                    conn.execute("DELETE FROM responses")
+                    conn.commit()
+
+    def close(self) -> None:
+        """
+        关闭持久化数据库 内存条目保留
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._close_db_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        hit_rate 为未向模型发出请求的调用占比 (hits + coalesced) / (hits + coalesced + misses)
+
+        Returns:
+            Dict[str, Any]: 开关 条目数 命中 未命中 命中率 淘汰与过期次数
+
+        Examples:
+            >>> cache.stats()["hit_rate"]
+            0.5
+        """
+        with self._lock:
+            served = self.hits + self.coalesced
+            lookups = served + self.misses
+            return {
+                "enabled": self.enabled,
+                "persist": bool(self.config["persist"]),
+                "entries": len(self._entries),
+                "inflight": len(self._inflight),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "bypassed": self.bypassed,
+                "hit_rate": round(served / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+
+_cache = ResponseCache()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    获取进程级响应缓存
+
+    Returns:
+        ResponseCache: 缓存单例
+    """
+    return _cache
+
+
+def configure_response_cache(config: Optional[Dict[str, Any]], db_path: Optional[Path] = None) -> None:
+    """
+    按 config.json 的 llm.response_cache 配置响应缓存
+
+    Args:
+        config (Optional[Dict[str, Any]]): 缓存配置
+        db_path (Optional[Path]): 持久化数据库路径
+
+    Returns:
+        None
+    """
+    _cache.configure(config, db_path)
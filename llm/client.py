@@ -4,24 +4,64 @@ Describe:
 
 1. 基于 `AsyncOpenAI` 兼容接口统一接入不同提供商.
 2. 统一请求参数拼装，减少上层重复逻辑.
-3. 提供重试、异常分类与日志记录，增强稳定性.
+3. 暂时性错误按 `llm.retry` 策略重试，并提供异常分类与日志记录.
+4. 底层客户端取自 `llm.pool` 注册表，与 narrative、embedding 共享连接池.
+5. `chat` 可选接入 `llm.cache` 响应缓存，低温度的重复请求直接返回缓存结果.
+6. 进行中的相同请求经 `llm.singleflight` 合并，只向模型发出一次请求.
+7. 发往模型的请求经 `llm.scheduler` 按服务商限流、按优先级排队.
+8. 用户对话的流式请求可经 `llm.hedging` 对冲到备用模型，首 token 迟迟未到时改用先产出的一路.
+9. 开启 `llm.provider_pool` 时请求按权重与健康状态分流到多个模型，服务商故障时自动切换.
+10. 每次调用经 `llm.telemetry` 记录首 token 延迟、耗时、token 用量与估算费用.
 """
 import asyncio
+import time
 from typing import List, Dict, Optional, Callable, Awaitable, AsyncIterator
 
 from openai import AsyncOpenAI, OpenAIError, AuthenticationError, RateLimitError, APIError
 from openai.types.chat import ChatCompletionMessage
-from tenacity import (
-    retry,
-    retry_if_exception_type,
-    stop_after_attempt,
-    wait_random_exponential,
-)
-
+from .cache import ResponseCache, get_response_cache
 from .config import LLMConfig
+from .hedging import get_hedge_policy, model_label
+from .tokenizer import get_token_counter
+from .pool import get_openai_client
+from .provider_pool import get_provider_pool
+from .retry import get_retry_policy
+from .scheduler import get_llm_scheduler
+from .singleflight import get_single_flight
+from .telemetry import current_call, get_llm_telemetry, trace_call
 from utils.logger import logger
 
 
+def _rejects_stream_options(error: Exception) -> bool:
+    """
+    判断错误是否为接口拒绝 stream_options 参数
+
+    仅当 400 错误的消息或响应体中提到 stream_options / include_usage 时成立
+
+    Args:
+        error (Exception): 流式请求抛出的异常
+
+    Returns:
+        bool: 是否为 stream_options 不被支持导致的错误
+    """
+    if getattr(error, "status_code", None) != 400:
+        return False
+    detail = f"{error} {getattr(error, 'body', '')}".lower()
+    return "stream_options" in detail or "include_usage" in detail
+
+
+def _mark_coalesced() -> None:
+    """
+    将当前调用标记为合并到进行中的请求 上游用量只记在发起方的调用上 合并方按缓存命中统计
+
+    Returns:
+        None
+    """
+    trace = current_call()
+    if trace is not None:
+        trace.cached = True
+
+
 class LLMClient:
     """
     统一的异步 LLM 客户端
@@ -32,6 +72,8 @@ class LLMClient:
 
     Args:
         config (LLMConfig): 运行时模型配置，包括供应商、模型名、密钥和超参数
+        hedges (Optional[List[LLMConfig]]): 对冲用的备用模型配置，按启动顺序排列
+        pool (Optional[List[LLMConfig]]): 服务商池中各模型的配置
 
     Returns:
         None : 实例化后可调用 `chat`、`stream_chat`、`chat_with_tools` 方法
@@ -41,28 +83,46 @@ class LLMClient:
     >>> client = LLMClient(cfg)
     """
 
-    def __init__(self, config: LLMConfig) -> None:
+    def __init__(
+        self,
+        config: LLMConfig,
+        hedges: Optional[List[LLMConfig]] = None,
+        pool: Optional[List[LLMConfig]] = None,
+    ) -> None:
         """
         初始化统一 LLM 客户端实例
 
         1. 保存配置对象
-        2. 创建 OpenAI 兼容异步客户端
+        2. 为对冲备用模型与服务商池中的模型创建子客户端，子客户端不再对冲或分流
         3. 记录初始化日志，便于排障
 
+        底层客户端在请求时从共享注册表获取，不在此处创建连接
+
         Args:
             config (LLMConfig): 完整运行配置
+            hedges (Optional[List[LLMConfig]]): 对冲用的备用模型配置
+            pool (Optional[List[LLMConfig]]): 服务商池中各模型的配置
         """
         # 保存配置，供后续请求统一读取
         self.config = config
-        # 初始化底层 OpenAI 兼容客户端(可对接多家兼容服务)
-        self.client = AsyncOpenAI(
-            api_key=config.api_key,
-            base_url=config.base_url,
-            timeout=config.timeout,
-        )
+        self.hedges = [LLMClient(hedge) for hedge in hedges or []]
+        self.pool_members = {member.model: LLMClient(member) for member in pool or []}
         # 输出关键初始化信息，便于确认当前正在使用的模型与供应商
         logger.info(f"LLM client initialized: {config.provider} | {config.model}")
 
+    @property
+    def client(self) -> AsyncOpenAI:
+        """
+        获取共享的 OpenAI 兼容客户端
+
+        同一 (base_url, api_key) 的 LLMClient、narrative 与 embedding 调用复用同一连接池，
+        超时按请求传入。SDK 自带的自动重试关闭，重试统一由 `llm.retry` 策略负责
+
+        Returns:
+            AsyncOpenAI: 当前事件循环中的共享客户端
+        """
+        return get_openai_client(self.config.api_key, self.config.base_url).with_options(max_retries=0)
+
     def _build_params(
         self,
         messages: List[Dict],
@@ -96,21 +156,17 @@ class LLMClient:
         # 将系统消息放在前面，保持对话上下文结构一致
         all_messages = (system_msgs or []) + messages
         # 统一输出请求参数，调用级参数优先于配置默认值，额外参数直接透传
+        # 共享客户端不携带超时设置，按请求传入配置中的超时
         return {
             "model": self.config.model,
             "messages": all_messages,
             "temperature": temperature if temperature is not None else self.config.temperature,
             "max_tokens": max_tokens if max_tokens is not None else self.config.max_tokens,
             "top_p": self.config.top_p,
+            "timeout": self.config.timeout,
             **kwargs,
         }
     
-    # `retry` 装饰器实现自动重试机制，针对 OpenAIError、ValueError 和其他异常进行分类重试，增强稳定性
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(3),
-        retry=retry_if_exception_type((OpenAIError, Exception, ValueError)),
-    )
     async def chat(
         self,
         messages: List[Dict],
@@ -120,6 +176,9 @@ class LLMClient:
         max_tokens: Optional[int] = None,
         on_token_callback: Optional[Callable[[str], Awaitable[None]]] = None,
         emit_stdout: bool = False,
+        cache: Optional[bool] = None,
+        priority: str = "interactive",
+        caller: str = "chat",
         **kwargs,
     ) -> str:
         """
@@ -128,7 +187,8 @@ class LLMClient:
         1. 支持非流式：直接获取完整响应
         2. 支持流式：逐 token 收集后拼接为完整响应
         3. 支持 token 回调，可用于前端流式显示
-        4. 内置异常分类与重试策略
+        4. 超时、限流与 5xx 等暂时性错误按 `llm.retry` 策略重试，其余错误直接上抛
+        5. 响应缓存开启时，相同模型、消息与采样参数的请求直接返回缓存文本
 
         Args:
             messages (List[Dict]): 对话消息列表
@@ -138,6 +198,10 @@ class LLMClient:
             max_tokens (Optional[int]): 调用级最大生成长度
             on_token_callback (Optional[Callable[[str], Awaitable[None]]]): 流式 token 回调函数
             emit_stdout (bool): 是否同步输出到标准输出
+            cache (Optional[bool]): 调用级缓存开关，None 按 `llm.response_cache` 配置判断，
+                True 强制缓存，False 绕过缓存
+            priority (str): 调度优先级 interactive / agent / background
+            caller (str): 遥测中的调用方名称
             **kwargs (Any): 额外透传参数
 
         Returns:
@@ -161,40 +225,36 @@ class LLMClient:
                 **kwargs,
             )
 
-            # 非流式: 一次性请求并直接返回内容
-            if not stream:
-                response = await self.client.chat.completions.create(**params, stream=False)
-                if not response.choices or not response.choices[0].message.content:
-                    raise ValueError("LLM返回了无效或者空的响应")
-                return response.choices[0].message.content
-
-            # 可选: 将流式 token 同步打印到终端
-            if emit_stdout:
-                print("Ema: ", end="", flush=True)
-
-            # 流式: 逐 token 收集 最后再拼接成完整文本返回
-            chunks: List[str] = []
-            async for token in self.stream_chat(
-                messages=messages,
-                system_msgs=system_msgs,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                on_token_callback=on_token_callback,
-                **kwargs,
-            ):
-                chunks.append(token)
-                if emit_stdout:
-                    print(token, end="", flush=True)
-
-            # 流式输出结束后补换行 避免污染终端提示符
-            if emit_stdout:
-                print()
-
-            # 拼接并校验最终响应 防止返回空字符串
-            full_response = "".join(chunks).strip()
-            if not full_response:
-                raise ValueError("LLM 流式输出返回了空的响应")
-            return full_response
+            async def generate() -> str:
+                return await self._generate(
+                    params,
+                    key,
+                    stream=stream,
+                    on_token_callback=on_token_callback,
+                    emit_stdout=emit_stdout,
+                    priority=priority,
+                )
+
+            with self._trace(caller, "stream" if stream else "chat", params) as trace:
+                key = self._request_key(params)
+                response_cache = get_response_cache()
+                if not response_cache.should_cache(params["temperature"], cache):
+                    text = await generate()
+                else:
+                    text, cached = await response_cache.get_or_call(key, generate)
+                    if cached and trace is not None:
+                        trace.cached = True
+                    if cached and stream:
+                        # 缓存命中时没有逐 token 输出 整段文本一次性交给回调与终端
+                        if on_token_callback:
+                            result = on_token_callback(text)
+                            if asyncio.iscoroutine(result):
+                                await result
+                        if emit_stdout:
+                            print(f"Ema: {text}", flush=True)
+                if trace is not None and trace.first_token is None:
+                    trace.on_text(text)
+                return text
 
         # 参数/响应校验类错误 直接上抛给调用方处理
         except ValueError:
@@ -215,6 +275,234 @@ class LLMClient:
             logger.exception(f"未预期错误: {e}")
             raise
 
+    def _trace(self, caller: str, kind: str, params: Dict):
+        """
+        开始记录一次调用的遥测
+
+        Args:
+            caller (str): 调用方名称
+            kind (str): 调用类型 chat / stream / tools
+            params (Dict): 请求参数 接口未返回 usage 时用于估算 prompt token
+
+        Returns:
+            ContextManager[Optional[CallTrace]]: 调用记录的上下文管理器
+        """
+        return trace_call(
+            caller,
+            kind,
+            self.config.provider,
+            params["model"],
+            tokenizer=self.config.tokenizer,
+            messages=params["messages"],
+        )
+
+    def _request_key(self, params: Dict) -> str:
+        """
+        计算请求键 供响应缓存与请求合并使用
+
+        键包含接口地址 不同服务商的同名模型互不影响
+
+        Args:
+            params (Dict): 请求参数
+
+        Returns:
+            str: 请求参数规范化后的 sha256 摘要
+        """
+        return ResponseCache.make_key({**params, "base_url": self.config.base_url})
+
+    async def _coalesce(self, key: str, call: Callable[[], Awaitable]) -> object:
+        """
+        按配置合并进行中的相同非流式请求
+
+        Args:
+            key (str): 请求键
+            call (Callable[[], Awaitable]): 发起上游请求的协程工厂
+
+        Returns:
+            object: 上游请求结果
+        """
+        if not self.config.coalesce_requests:
+            return await call()
+        return await get_single_flight().do(key, call, on_join=_mark_coalesced)
+
+    def _estimate_tokens(self, params: Dict) -> int:
+        """
+        估算请求的 prompt token 数 仅在服务商配置了 token 限额时计算
+
+        Args:
+            params (Dict): 请求参数
+
+        Returns:
+            int: 估算的 token 数 无需估算时返回 0
+        """
+        if not get_llm_scheduler().needs_tokens(self.config.provider):
+            return 0
+        counter = get_token_counter(self.config.tokenizer)
+        total = 0
+        for message in params.get("messages", []):
+            content = message.get("content") or ""
+            total += counter.count(content if isinstance(content, str) else str(content))
+        return total
+
+    def _completion_tokens(self, response: object, text: str) -> int:
+        """
+        获取生成的 token 数 响应未携带 usage 时按文本估算
+
+        Args:
+            response (object): 接口响应
+            text (str): 生成的文本
+
+        Returns:
+            int: 生成的 token 数
+        """
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "completion_tokens", None) is not None:
+            return int(usage.completion_tokens)
+        return get_token_counter(self.config.tokenizer).count(text) if text else 0
+
+    def _pool_candidates(self, priority: str) -> List[str]:
+        """
+        获取服务商池中当前任务的候选模型
+
+        Args:
+            priority (str): 调度优先级 即任务类型
+
+        Returns:
+            List[str]: 候选模型名 未配置服务商池时为空
+        """
+        if not self.pool_members:
+            return []
+        return get_provider_pool().candidates(priority, list(self.pool_members))
+
+    async def _create(self, params: Dict, priority: str):
+        """
+        发起非流式请求 暂时性错误按重试策略重试 开启服务商池时按候选模型依次切换
+
+        Args:
+            params (Dict): 请求参数
+            priority (str): 调度优先级
+
+        Returns:
+            ChatCompletion: 接口响应
+        """
+        names = self._pool_candidates(priority)
+        if names:
+            return await get_provider_pool().run(
+                names,
+                lambda name, retry: self.pool_members[name]._create_member(params, priority, retry),
+            )
+        return await get_retry_policy().run(lambda: self._create_once(params, priority), label=self.config.provider)
+
+    async def _create_member(self, params: Dict, priority: str, retry: bool):
+        """
+        作为服务商池成员发起非流式请求 模型替换为本客户端的模型
+
+        Args:
+            params (Dict): 请求参数
+            priority (str): 调度优先级
+            retry (bool): 是否按重试策略重试 否则只请求一次 失败后由服务商池切换模型
+
+        Returns:
+            ChatCompletion: 接口响应
+        """
+        params = {**params, "model": self.config.model}
+        if retry:
+            return await self._create(params, priority)
+        get_retry_policy().record_request()
+        return await self._create_once(params, priority)
+
+    async def _create_once(self, params: Dict, priority: str):
+        """
+        经调度器发起一次非流式请求 重试等待期间不占用调度器槽位
+
+        Args:
+            params (Dict): 请求参数
+            priority (str): 调度优先级
+
+        Returns:
+            ChatCompletion: 接口响应
+        """
+        scheduler = get_llm_scheduler()
+        async with scheduler.slot(self.config.provider, priority, self._estimate_tokens(params)) as ticket:
+            response = await self.client.chat.completions.create(**params, stream=False)
+            trace = current_call()
+            if trace is not None:
+                trace.on_usage(getattr(response, "usage", None), self.config.provider, params["model"])
+            if scheduler.needs_tokens(self.config.provider):
+                message = response.choices[0].message if response.choices else None
+                ticket.settle(self._completion_tokens(response, (message.content or "") if message else ""))
+            return response
+
+    async def _complete(self, params: Dict, priority: str) -> str:
+        """
+        发起一次非流式请求并校验回复内容
+
+        Args:
+            params (Dict): 请求参数
+            priority (str): 调度优先级
+
+        Returns:
+            str: 回复文本
+
+        Raises:
+            ValueError: 响应为空或格式不合法
+        """
+        response = await self._create(params, priority)
+        if not response.choices or not response.choices[0].message.content:
+            raise ValueError("LLM返回了无效或者空的响应")
+        return response.choices[0].message.content
+
+    async def _generate(
+        self,
+        params: Dict,
+        key: str,
+        stream: bool,
+        on_token_callback: Optional[Callable[[str], Awaitable[None]]] = None,
+        emit_stdout: bool = False,
+        priority: str = "interactive",
+    ) -> str:
+        """
+        向模型发起请求并返回完整文本 不经过响应缓存
+
+        Args:
+            params (Dict): `_build_params` 生成的请求参数
+            key (str): 请求键
+            stream (bool): 是否启用流式输出
+            on_token_callback (Optional[Callable[[str], Awaitable[None]]]): 流式 token 回调函数
+            emit_stdout (bool): 是否同步输出到标准输出
+            priority (str): 调度优先级
+
+        Returns:
+            str: 完整回复文本
+
+        Raises:
+            ValueError: 响应为空或格式不合法
+        """
+        # 非流式: 一次性请求并直接返回内容 进行中的相同请求共享结果
+        if not stream:
+            return await self._coalesce(f"chat:{key}", lambda: self._complete(params, priority))
+
+        # 可选: 将流式 token 同步打印到终端
+        if emit_stdout:
+            print("Ema: ", end="", flush=True)
+
+        # 流式: 逐 token 收集 最后再拼接成完整文本返回
+        chunks: List[str] = []
+        async for token in self._stream_params(params, on_token_callback, key, priority):
+            chunks.append(token)
+            if emit_stdout:
+                print(token, end="", flush=True)
+
+        # 流式输出结束后补换行 避免污染终端提示符
+        if emit_stdout:
+            print()
+
+        # 拼接并校验最终响应 防止返回空字符串
+        full_response = "".join(chunks).strip()
+        if not full_response:
+            raise ValueError("LLM 流式输出返回了空的响应")
+        return full_response
+
     async def stream_chat(
         self,
         messages: List[Dict],
@@ -222,6 +510,8 @@ class LLMClient:
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
         on_token_callback: Optional[Callable[[str], Awaitable[None]]] = None,
+        priority: str = "interactive",
+        caller: str = "stream_chat",
         **kwargs,
     ) -> AsyncIterator[str]:
         """
@@ -237,6 +527,8 @@ class LLMClient:
             temperature (Optional[float]): 调用级温度参数
             max_tokens (Optional[int]): 调用级最大生成长度
             on_token_callback (Optional[Callable[[str], Awaitable[None]]]): token 回调
+            priority (str): 调度优先级 interactive / agent / background
+            caller (str): 遥测中的调用方名称
             **kwargs (Any): 额外透传参数
 
         Returns:
@@ -254,32 +546,187 @@ class LLMClient:
             max_tokens=max_tokens,
             **kwargs,
         )
+        with self._trace(caller, "stream", params):
+            async for token in self._stream_params(params, on_token_callback, priority=priority):
+                yield token
+
+    async def _stream_params(
+        self,
+        params: Dict,
+        on_token_callback: Optional[Callable[[str], Awaitable[None]]] = None,
+        key: Optional[str] = None,
+        priority: str = "interactive",
+    ) -> AsyncIterator[str]:
+        """
+        按已构建的请求参数发起流式请求并产出 token
+
+        进行中的相同流式请求共享同一上游流 后加入的调用先收到已产出的 token
+        interactive 请求在对冲开启且配置了备用模型时 由主模型与备用模型竞速产出
+
+        Args:
+            params (Dict): `_build_params` 生成的请求参数
+            on_token_callback (Optional[Callable[[str], Awaitable[None]]]): token 回调
+            key (Optional[str]): 请求键 None 时按参数计算
+            priority (str): 调度优先级
+
+        Returns:
+            AsyncIterator[str]: 按顺序产出的 token 序列
+        """
+        if self.hedges and priority == "interactive" and get_hedge_policy().enabled:
+            open_stream = lambda: self._hedged_tokens(params, priority)
+        else:
+            open_stream = lambda: self._source_tokens(params, priority)
+
+        if self.config.coalesce_requests:
+            key = key or self._request_key(params)
+            tokens = get_single_flight().stream(f"stream:{key}", open_stream, on_join=_mark_coalesced)
+        else:
+            tokens = open_stream()
+
+        trace = current_call()
+        try:
+            async for token in tokens:
+                if trace is not None:
+                    trace.on_token(token)
+                # 如存在回调则执行 兼容协程与普通函数
+                if on_token_callback:
+                    result = on_token_callback(token)
+                    if asyncio.iscoroutine(result):
+                        await result
+
+                # 将 token 返回给上层调用者
+                yield token
+        finally:
+            # 调用方提前退出时立即释放上游流(或合并流中的订阅)
+            await tokens.aclose()
+
+    def _hedged_tokens(self, params: Dict, priority: str) -> AsyncIterator[str]:
+        """
+        主模型与备用模型竞速的流式请求 备用模型沿用相同的消息与采样参数
+
+        Args:
+            params (Dict): 主模型的请求参数
+            priority (str): 调度优先级
+
+        Returns:
+            AsyncIterator[str]: 最先产出首个 token 的一路的 token 序列
+        """
+        contenders = [(model_label(self.config.provider, params["model"]), lambda: self._source_tokens(params, priority))]
+        for hedge in self.hedges:
+            hedge_params = {**params, "model": hedge.config.model}
+            contenders.append(
+                (
+                    model_label(hedge.config.provider, hedge.config.model),
+                    lambda hedge=hedge, hedge_params=hedge_params: hedge._upstream_tokens(hedge_params, priority),
+                )
+            )
+        return get_hedge_policy().race(contenders)
+
+    def _source_tokens(self, params: Dict, priority: str) -> AsyncIterator[str]:
+        """
+        主模型的上游 token 流 开启服务商池时按候选模型依次切换
+
+        Args:
+            params (Dict): 请求参数
+            priority (str): 调度优先级
+
+        Returns:
+            AsyncIterator[str]: 上游 token 序列
+        """
+        names = self._pool_candidates(priority)
+        if not names:
+            return self._upstream_tokens(params, priority)
+        return get_provider_pool().stream(
+            names,
+            lambda name, retry: self.pool_members[name]._upstream_tokens(
+                {**params, "model": self.pool_members[name].config.model}, priority, retry=retry
+            ),
+        )
+
+    async def _upstream_tokens(self, params: Dict, priority: str, retry: bool = True) -> AsyncIterator[str]:
+        """
+        经调度器向模型发起流式请求 过滤空 chunk 与空 token
+
+        流式输出期间持续占用调度器的并发槽位
+        产出首个 token 前的暂时性错误按重试策略重试 之后的错误直接上抛 避免调用方收到重复内容
+        首 token 延迟(不含排队)记入对冲策略 用于自动调整 hedge 延迟
+        遥测开启时请求接口在最后一个 chunk 返回 usage 并上报给当前调用的遥测记录
+        服务商以 400 拒绝 stream_options(错误中提到该参数)时去掉该参数重试一次 并在之后的请求中不再携带
+
+        Args:
+            params (Dict): 请求参数
+            priority (str): 调度优先级
+            retry (bool): 是否按重试策略重试 否则失败后直接上抛 由服务商池切换模型
+
+        Returns:
+            AsyncIterator[str]: 上游 token 序列
+        """
+        scheduler = get_llm_scheduler()
+        policy = get_retry_policy()
+        policy.record_request()
+        trace = current_call()
+        telemetry = get_llm_telemetry()
+        with_usage = (
+            trace is not None
+            and "stream_options" not in params
+            and telemetry.wants_stream_usage(self.config.provider)
+        )
+        if with_usage:
+            params = {**params, "stream_options": {"include_usage": True}}
+        attempt = 0
+        while True:
+            attempt += 1
+            chunks: List[str] = []
+            try:
+                async with scheduler.slot(self.config.provider, priority, self._estimate_tokens(params)) as ticket:
+                    started = time.perf_counter()
+                    try:
+                        # 发起流式请求并逐 chunk 解析
+                        response = await self.client.chat.completions.create(**params, stream=True)
+                        async for chunk in response:
+                            # usage 位于最后一个不含候选的 chunk
+                            if trace is not None and getattr(chunk, "usage", None) is not None:
+                                trace.on_usage(chunk.usage, self.config.provider, params["model"])
+                            # 无可用候选时跳过
+                            if not chunk.choices:
+                                continue
+                            # 提取增量文本 空文本直接忽略
+                            token = chunk.choices[0].delta.content or ""
+                            if token:
+                                if not chunks:
+                                    get_hedge_policy().record_ttft(
+                                        model_label(self.config.provider, params["model"]),
+                                        time.perf_counter() - started,
+                                    )
+                                    if trace is not None:
+                                        trace.on_usage(None, self.config.provider, params["model"])
+                                chunks.append(token)
+                                yield token
+                    finally:
+                        if chunks and scheduler.needs_tokens(self.config.provider):
+                            ticket.settle(self._completion_tokens(None, "".join(chunks)))
+                return
+            except Exception as e:
+                if chunks:
+                    policy.record_partial_stream()
+                    raise
+                # 部分兼容接口不认识 stream_options 直接返回 400 去掉后重试一次 并记住该服务商
+                # 上下文超长 内容审核等其他 400 照常上抛
+                if with_usage and _rejects_stream_options(e):
+                    logger.warning(f"⚠️ {self.config.provider} 不支持 stream_options 改为按 tokenizer 估算 usage")
+                    telemetry.mark_stream_usage_unsupported(self.config.provider)
+                    params = {k: v for k, v in params.items() if k != "stream_options"}
+                    with_usage = False
+                    attempt -= 1
+                    continue
+                delay = policy.next_delay(e, attempt) if retry else None
+                if delay is None:
+                    raise
+                logger.warning(
+                    f"⚠️ {self.config.provider} 流式请求失败 {delay:.2f}s 后重试 (第 {attempt} 次): {type(e).__name__}: {e}"
+                )
+                await asyncio.sleep(delay)
 
-        # 发起流式请求并逐 chunk 解析
-        response = await self.client.chat.completions.create(**params, stream=True)
-        async for chunk in response:
-            # 无可用候选时跳过
-            if not chunk.choices:
-                continue
-            # 提取增量文本 空文本直接忽略
-            token = chunk.choices[0].delta.content or ""
-            if not token:
-                continue
-
-            # 如存在回调则执行 兼容协程与普通函数
-            if on_token_callback:
-                result = on_token_callback(token)
-                if asyncio.iscoroutine(result):
-                    await result
-
-            # 将 token 返回给上层调用者
-            yield token
-
-    @retry(
-        wait=wait_random_exponential(min=1, max=60),
-        stop=stop_after_attempt(6),
-        retry=retry_if_exception_type((OpenAIError, Exception, ValueError)),
-    )
     async def chat_with_tools(
         self,
         messages: List[Dict],
@@ -289,6 +736,8 @@ class LLMClient:
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
         timeout: int = 300,
+        priority: str = "agent",
+        caller: str = "chat_with_tools",
         **kwargs,
     ) -> ChatCompletionMessage | None:
         """
@@ -306,6 +755,8 @@ class LLMClient:
             temperature (Optional[float]): 调用级温度参数
             max_tokens (Optional[int]): 调用级最大生成长度
             timeout (int): 本次请求超时秒数
+            priority (str): 调度优先级 interactive / agent / background
+            caller (str): 遥测中的调用方名称
             **kwargs (Any): 额外透传参数
 
         Returns:
@@ -330,18 +781,26 @@ class LLMClient:
                         raise ValueError("每一个工具定义必须是包含 'type' 字段的字典")
 
             # 工具调用模式固定为非流式 便于完整解析 tool_calls
-            completion: ChatCompletionMessage = await self.client.chat.completions.create(
-                model=self.config.model,
-                messages=all_messages,
-                tools=tools,
-                tool_choice=tool_choice,
-                temperature=temperature if temperature is not None else self.config.temperature,
-                max_tokens=max_tokens if max_tokens is not None else self.config.max_tokens,
-                top_p=self.config.top_p,
-                timeout=timeout,
-                stream=False,
+            params = {
+                "model": self.config.model,
+                "messages": all_messages,
+                "tools": tools,
+                "tool_choice": tool_choice,
+                "temperature": temperature if temperature is not None else self.config.temperature,
+                "max_tokens": max_tokens if max_tokens is not None else self.config.max_tokens,
+                "top_p": self.config.top_p,
+                "timeout": timeout,
                 **kwargs,
-            )
+            }
+            # 进行中的相同请求共享同一次工具调用结果
+            with self._trace(caller, "tools", params) as trace:
+                completion = await self._coalesce(
+                    f"tools:{self._request_key(params)}",
+                    lambda: self._create(params, priority),
+                )
+                if trace is not None:
+                    message = completion.choices[0].message if completion.choices else None
+                    trace.on_text((message.content or "") if message else "")
 
             # 响应为空或格式异常时返回 None 让上层决定兜底策略
             if not completion.choices or not completion.choices[0].message:
@@ -26,6 +26,10 @@ class LLMConfig:
         max_tokens (int): 最大生成长度
         top_p (float): Top-p 采样参数
         timeout (int): 请求超时秒数
+        context_window (int): 模型上下文窗口 token 数
+        max_prompt_tokens (int): 单次请求输入 token 上限 0 表示仅受上下文窗口约束
+        tokenizer (str): token 计数器名称 见 `llm.tokenizer`
+        coalesce_requests (bool): 是否合并进行中的相同请求 见 `llm.singleflight`
 
     Returns:
         LLMConfig: 配置实例对象
@@ -46,6 +50,11 @@ class LLMConfig:
     top_p: float = 1.0
     timeout: int = 60
 
+    context_window: int = 128000
+    max_prompt_tokens: int = 0
+    tokenizer: str = "auto"
+    coalesce_requests: bool = True
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "LLMConfig":
         """
@@ -78,10 +87,19 @@ class LLMConfig:
             max_tokens=llm.get("max_tokens", 4096),
             top_p=llm.get("top_p", 1.0),
             timeout=llm.get("timeout", 60),
+            context_window=llm.get("context_window", 128000),
+            max_prompt_tokens=llm.get("max_prompt_tokens", 0),
+            tokenizer=llm.get("tokenizer", "auto"),
+            coalesce_requests=llm.get("coalesce_requests", True),
         )
 
     @classmethod
-    def from_runtime(cls, config: Dict[str, Any], settings: Optional[Dict[str, Any]] = None) -> "LLMConfig":
+    def from_runtime(
+        cls,
+        config: Dict[str, Any],
+        settings: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+    ) -> "LLMConfig":
         """
         从运行期多来源配置合并得到最终生效参数
 
@@ -92,6 +110,7 @@ class LLMConfig:
         Args:
             config (Dict[str, Any]): 主配置字典(通常来自 config.json)
             settings (Optional[Dict[str, Any]]): 用户设置字典(通常来自 settings.json)
+            model (Optional[str]): 指定 `llm_models` 中的模型 覆盖用户选择 用于对冲等备用模型
 
         Returns:
             LLMConfig: 最终运行时配置对象
@@ -107,9 +126,10 @@ class LLMConfig:
         model_catalog = config.get("llm_models", {})
         api_settings = settings.get("api", {})
 
-        # 解析当前选中模型 优先级: settings > 默认配置 > 内置兜底
+        # 解析当前选中模型 优先级: 指定模型 > settings > 默认配置 > 内置兜底
         selected_model = (
-            api_settings.get("selected_model")
+            model
+            or api_settings.get("selected_model")
             or api_settings.get("openai_model")
             or llm_defaults.get("model")
             or "deepseek-chat"
@@ -150,4 +170,9 @@ class LLMConfig:
             max_tokens=api_settings.get("max_tokens", llm_defaults.get("max_tokens", 4096)),
             top_p=api_settings.get("top_p", llm_defaults.get("top_p", 1.0)),
             timeout=api_settings.get("timeout", llm_defaults.get("timeout", 60)),
+            # 上下文预算参数以模型元数据为准 缺省时回退到默认配置
+            context_window=model_meta.get("context_window", llm_defaults.get("context_window", 128000)),
+            max_prompt_tokens=llm_defaults.get("max_prompt_tokens", 0),
+            tokenizer=model_meta.get("tokenizer", llm_defaults.get("tokenizer", "auto")),
+            coalesce_requests=llm_defaults.get("coalesce_requests", True),
         )
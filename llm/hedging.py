@@ -0,0 +1,348 @@
+"""
+流式请求对冲(hedging)
+
+用户对话的流式请求在 hedge 延迟内没有收到首个 token 时 向备用模型发出相同请求
+哪一路先产出首个 token 就从哪一路继续输出 其余请求立即取消:
+
+1. 备用模型取自 config.json 的 `llm_models` 由 `llm.hedging.models` 按顺序指定 每经过一个延迟追加一路
+2. 主请求在首个 token 前失败时立即启动下一路 兼作故障切换
+3. 按模型记录首 token 延迟(TTFT) 被对冲取消的请求以取消时已等待的时长记为样本 避免慢请求从统计中消失
+   auto_delay 开启且样本足够时 hedge 延迟取主模型 TTFT 的 percentile 分位数
+   并限制在 [min_delay_ms, max_delay_ms] 样本不足时使用 delay_ms
+
+配置见 config.json 的 `llm.hedging` 默认关闭
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from utils.logger import logger
+
+
+# 对冲默认参数
+DEFAULT_HEDGING_CONFIG: Dict[str, Any] = {
+    "enabled": False,
+    "models": [],
+    "delay_ms": 1500,
+    "auto_delay": True,
+    "percentile": 0.95,
+    "min_delay_ms": 300,
+    "max_delay_ms": 5000,
+    "min_samples": 20,
+}
+
+# 每个模型保留的最近 TTFT 样本数
+_TTFT_SAMPLES = 512
+# 统计中输出的分位数
+_REPORTED_PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    """
+    计算已排序样本的分位数
+
+    Args:
+        samples (List[float]): 升序样本
+        q (float): 分位 0~1
+
+    Returns:
+        float: 分位数
+    """
+    index = min(int(len(samples) * q), len(samples) - 1)
+    return samples[index]
+
+
+async def _first_token(stream: AsyncIterator[str]) -> str:
+    """
+    等待 token 流的首个 token
+
+    Args:
+        stream (AsyncIterator[str]): token 流
+
+    Returns:
+        str: 首个 token
+
+    Raises:
+        StopAsyncIteration: 流未产出任何 token 即结束
+    """
+    return await stream.__anext__()
+
+
+class HedgePolicy:
+    """
+    TTFT 统计与 hedge 延迟计算
+
+    Args:
+        config (Optional[Dict[str, Any]]): 对冲配置 缺省字段使用 DEFAULT_HEDGING_CONFIG
+
+    Returns:
+        HedgePolicy: 策略实例
+
+    Examples:
+        >>> policy = HedgePolicy({"enabled": True, "delay_ms": 800})
+        >>> policy.record_ttft("deepseek:deepseek-chat", 0.42)
+        >>> policy.delay("deepseek:deepseek-chat")
+        0.8
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        初始化策略
+
+        Args:
+            config (Optional[Dict[str, Any]]): 对冲配置
+        """
+        self._lock = threading.Lock()
+        self._ttft: Dict[str, Deque[float]] = {}
+        self.config: Dict[str, Any] = dict(DEFAULT_HEDGING_CONFIG)
+        self.counts: Dict[str, int] = {"streams": 0, "hedged": 0, "primary_won": 0, "hedge_won": 0, "failover": 0}
+        self.wins: Dict[str, int] = {}
+        self.configure(config)
+
+    def configure(self, config: Optional[Dict[str, Any]]) -> None:
+        """
+        更新对冲配置 已记录的 TTFT 样本保留
+
+        Args:
+            config (Optional[Dict[str, Any]]): 对冲配置
+
+        Returns:
+            None
+        """
+        merged = dict(DEFAULT_HEDGING_CONFIG)
+        merged.update({k: v for k, v in (config or {}).items() if k in DEFAULT_HEDGING_CONFIG})
+        merged["models"] = [str(name) for name in merged.get("models") or []]
+        with self._lock:
+            self.config = merged
+
+    @property
+    def enabled(self) -> bool:
+        """
+        对冲是否开启
+
+        Returns:
+            bool: 是否开启
+        """
+        return bool(self.config["enabled"])
+
+    def record_ttft(self, model: str, seconds: float) -> None:
+        """
+        记录一次首 token 延迟
+
+        Args:
+            model (str): 模型标识 provider:model
+            seconds (float): 从发出请求到收到首个 token 的秒数
+
+        Returns:
+            None
+        """
+        with self._lock:
+            samples = self._ttft.get(model)
+            if samples is None:
+                samples = self._ttft[model] = deque(maxlen=_TTFT_SAMPLES)
+            samples.append(seconds)
+
+    def delay(self, model: str) -> float:
+        """
+        获取模型当前的 hedge 延迟
+
+        Args:
+            model (str): 主模型标识 provider:model
+
+        Returns:
+            float: 延迟秒数
+        """
+        with self._lock:
+            config = self.config
+            samples = sorted(self._ttft.get(model, ()))
+        if not config["auto_delay"] or len(samples) < int(config["min_samples"]):
+            return float(config["delay_ms"]) / 1000.0
+        value = _percentile(samples, float(config["percentile"])) * 1000.0
+        return min(max(value, float(config["min_delay_ms"])), float(config["max_delay_ms"])) / 1000.0
+
+    def _count(self, key: str, winner: Optional[str] = None) -> None:
+        """
+        累加对冲计数
+
+        Args:
+            key (str): 计数名称
+            winner (Optional[str]): 胜出的模型标识
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.counts[key] += 1
+            if winner is not None:
+                self.wins[winner] = self.wins.get(winner, 0) + 1
+
+    async def race(
+        self,
+        contenders: List[Tuple[str, Callable[[], AsyncIterator[str]]]],
+    ) -> AsyncIterator[str]:
+        """
+        按 hedge 延迟依次启动各路流式请求 从最先产出首个 token 的一路继续输出
+
+        Args:
+            contenders (List[Tuple[str, Callable[[], AsyncIterator[str]]]]): (模型标识, 创建 token 流的工厂)
+                第一项为主模型 其余为备用模型
+
+        Returns:
+            AsyncIterator[str]: 胜出一路的完整 token 序列
+
+        Raises:
+            Exception: 所有请求都在首个 token 前失败时抛出主请求的异常
+        """
+        self._count("streams")
+        delay = self.delay(contenders[0][0])
+        # 任务 -> (序号, 模型标识, token 流)
+        running: Dict["asyncio.Task[str]", Tuple[int, str, AsyncIterator[str]]] = {}
+        launched: Dict[int, float] = {}
+        errors: List[BaseException] = []
+        next_index = 0
+        winner: Optional[Tuple[int, str, AsyncIterator[str]]] = None
+        first_token = ""
+
+        def launch() -> None:
+            nonlocal next_index
+            label, open_stream = contenders[next_index]
+            stream = open_stream()
+            launched[next_index] = time.perf_counter()
+            running[asyncio.ensure_future(_first_token(stream))] = (next_index, label, stream)
+            next_index += 1
+
+        launch()
+        try:
+            while running or next_index < len(contenders):
+                if not running:
+                    # 当前各路都已失败 立即启动下一路
+                    self._count("failover")
+                    launch()
+                    continue
+                timeout = delay if next_index < len(contenders) else None
+                done, _ = await asyncio.wait(set(running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if next_index == 1:
+                        self._count("hedged")
+                    logger.info(f"⏱️ {delay * 1000:.0f}ms 内未收到首 token 对冲请求 {contenders[next_index][0]}")
+                    launch()
+                    continue
+                for task in done:
+                    entry = running.pop(task)
+                    if task.cancelled():
+                        continue
+                    error = task.exception()
+                    if error is None:
+                        if winner is None:
+                            winner, first_token = entry, task.result()
+                        else:
+                            # 同时产出首 token 的其他路 作为输家关闭
+                            running[task] = entry
+                    elif isinstance(error, StopAsyncIteration):
+                        # 未产出任何 token 即结束 视为空响应
+                        errors.append(ValueError(f"{entry[1]} 返回了空的流式响应"))
+                    else:
+                        errors.append(error)
+                if winner is not None:
+                    break
+        finally:
+            # 取消并关闭未胜出的各路请求 尚未产出首 token 的一路以已等待时长作为 TTFT 下界样本
+            now = time.perf_counter()
+            for task, (index, label, stream) in running.items():
+                if winner is not None and not task.done():
+                    self.record_ttft(label, now - launched[index])
+                task.cancel()
+            for task, (_, _, stream) in running.items():
+                try:
+                    await task
+                except BaseException:
+                    pass
+                try:
+                    await stream.aclose()
+                except BaseException:
+                    pass
+
+        if winner is None:
+            raise errors[0] if errors else RuntimeError("没有可用的对冲请求")
+
+        index, label, stream = winner
+        if next_index > 1:
+            self._count("primary_won" if index == 0 else "hedge_won", label)
+        try:
+            yield first_token
+            async for token in stream:
+                yield token
+        finally:
+            await stream.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取对冲统计
+
+        Returns:
+            Dict[str, Any]: 对冲次数 各模型胜出次数 TTFT 分位数(毫秒)与当前 hedge 延迟
+
+        Examples:
+            >>> get_hedge_policy().stats()["hedged"]
+            0
+        """
+        with self._lock:
+            ttft = {model: sorted(samples) for model, samples in self._ttft.items()}
+            result: Dict[str, Any] = {
+                "enabled": self.enabled,
+                **self.counts,
+                "wins": dict(self.wins),
+            }
+        models: Dict[str, Any] = {}
+        for model, samples in ttft.items():
+            if not samples:
+                continue
+            entry = {f"p{int(q * 100)}_ms": round(_percentile(samples, q) * 1000, 1) for q in _REPORTED_PERCENTILES}
+            entry["samples"] = len(samples)
+            entry["hedge_delay_ms"] = round(self.delay(model) * 1000, 1)
+            models[model] = entry
+        result["ttft"] = models
+        return result
+
+
+_policy = HedgePolicy()
+
+
+def get_hedge_policy() -> HedgePolicy:
+    """
+    获取进程级对冲策略
+
+    Returns:
+        HedgePolicy: 策略单例
+    """
+    return _policy
+
+
+def configure_hedging(config: Optional[Dict[str, Any]]) -> None:
+    """
+    按 config.json 的 llm.hedging 配置对冲策略
+
+    Args:
+        config (Optional[Dict[str, Any]]): 对冲配置
+
+    Returns:
+        None
+    """
+    _policy.configure(config)
+
+
+def model_label(provider: str, model: str) -> str:
+    """
+    生成 TTFT 统计使用的模型标识
+
+    Args:
+        provider (str): 服务商
+        model (str): 模型名
+
+    Returns:
+        str: provider:model
+    """
+    return f"{provider}:{model}"
@@ -0,0 +1,243 @@
+"""
+OpenAI 兼容客户端注册表
+
+LLMClient narrative 的 LightRAG 调用函数与 embedding 嵌入器共用同一组 `AsyncOpenAI`:
+
+1. 按 (base_url, api_key) 复用客户端 同一服务商的请求共享 HTTP 连接池与 keep-alive 连接
+   避免每次调用重新创建客户端 加载证书与 TLS 握手
+2. 连接池上限与空闲连接保活时间由 config.json 的 `http_pool` 配置
+3. httpx 连接绑定创建时的事件循环 客户端按事件循环分组 事件循环被回收后对应客户端一并释放
+
+超时按请求传入 不同超时的调用方仍共享同一个连接池
+"""
+
+import asyncio
+import importlib.util
+import threading
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+from utils.logger import logger
+
+
+# 连接池默认参数
+DEFAULT_POOL_CONFIG: Dict[str, Any] = {
+    "max_connections": 64,
+    "max_keepalive_connections": 16,
+    "keepalive_expiry": 120.0,
+    "connect_timeout": 10.0,
+    "http2": False,
+}
+
+
+class ClientRegistry:
+    """
+    AsyncOpenAI 客户端注册表
+
+    Args:
+        pool_config (Optional[Dict[str, Any]]): 连接池配置 缺省字段使用 DEFAULT_POOL_CONFIG
+
+    Returns:
+        ClientRegistry: 注册表实例
+
+    Examples:
+        >>> registry = ClientRegistry()
+        >>> client = registry.get("sk-xxx", "https://api.deepseek.com/v1")
+        >>> client is registry.get("sk-xxx", "https://api.deepseek.com/v1")
+        True
+    """
+
+    def __init__(self, pool_config: Optional[Dict[str, Any]] = None):
+        """
+        初始化注册表 客户端延迟创建
+
+        Args:
+            pool_config (Optional[Dict[str, Any]]): 连接池配置
+        """
+        self._lock = threading.Lock()
+        # 事件循环 -> {(base_url, api_key): 客户端} 不在事件循环中获取的客户端归入 None 分组
+        self._by_loop: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], AsyncOpenAI]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._unbound: Dict[Tuple[str, str], AsyncOpenAI] = {}
+        self.pool_config: Dict[str, Any] = dict(DEFAULT_POOL_CONFIG)
+        self.created = 0
+        self.reused = 0
+        self.configure(pool_config)
+
+    def configure(self, pool_config: Optional[Dict[str, Any]]) -> None:
+        """
+        更新连接池配置 只影响之后新建的客户端
+
+        Args:
+            pool_config (Optional[Dict[str, Any]]): 连接池配置
+
+        Returns:
+            None
+        """
+        config = dict(DEFAULT_POOL_CONFIG)
+        config.update({k: v for k, v in (pool_config or {}).items() if k in DEFAULT_POOL_CONFIG})
+        if config["http2"] and importlib.util.find_spec("h2") is None:
+            logger.warning("⚠️ 未安装 h2 HTTP/2 不可用 使用 HTTP/1.1 连接池")
+            config["http2"] = False
+        with self._lock:
+            self.pool_config = config
+
+    def get(self, api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+        """
+        获取 (base_url, api_key) 对应的客户端 不存在时创建
+
+        Args:
+            api_key (str): 接口密钥
+            base_url (Optional[str]): 接口地址 None 表示 OpenAI 官方地址
+
+        Returns:
+            AsyncOpenAI: 共享的客户端实例
+        """
+        key = ((base_url or "").rstrip("/"), api_key or "")
+        try:
+            loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        with self._lock:
+            clients = self._unbound if loop is None else self._by_loop.setdefault(loop, {})
+            client = clients.get(key)
+            if client is not None:
+                self.reused += 1
+                return client
+            client = self._create(api_key, base_url)
+            clients[key] = client
+            self.created += 1
+
+        logger.debug(f"🔌 创建共享 LLM 客户端: {key[0] or 'openai'}")
+        return client
+
+    def _create(self, api_key: str, base_url: Optional[str]) -> AsyncOpenAI:
+        """
+        按连接池配置创建客户端
+
+        Args:
+            api_key (str): 接口密钥
+            base_url (Optional[str]): 接口地址
+
+        Returns:
+            AsyncOpenAI: 客户端实例
+        """
+        config = self.pool_config
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=int(config["max_connections"]),
+                max_keepalive_connections=int(config["max_keepalive_connections"]),
+                keepalive_expiry=float(config["keepalive_expiry"]),
+            ),
+            # 默认超时 调用方按请求覆盖 连接建立单独限时
+            timeout=httpx.Timeout(600.0, connect=float(config["connect_timeout"])),
+            follow_redirects=True,
+            http2=bool(config["http2"]),
+        )
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+
+    async def aclose(self) -> int:
+        """
+        关闭当前事件循环分组与未绑定分组中的客户端 释放 keep-alive 连接
+
+        关闭后再次获取会创建新的客户端
+
+        Returns:
+            int: 关闭的客户端数
+        """
+        try:
+            loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        with self._lock:
+            clients = list(self._unbound.values())
+            self._unbound.clear()
+            if loop is not None:
+                clients.extend(self._by_loop.pop(loop, {}).values())
+
+        for client in clients:
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"⚠️ 关闭 LLM 客户端失败: {e}")
+        return len(clients)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取注册表统计
+
+        Returns:
+            Dict[str, Any]: 常驻客户端数 创建与复用次数 连接池配置
+
+        Examples:
+            >>> registry.stats()["clients"]
+            1
+        """
+        with self._lock:
+            clients = len(self._unbound) + sum(len(group) for group in self._by_loop.values())
+            return {
+                "clients": clients,
+                "created": self.created,
+                "reused": self.reused,
+                "pool": dict(self.pool_config),
+            }
+
+
+_registry = ClientRegistry()
+
+
+def get_client_registry() -> ClientRegistry:
+    """
+    获取进程级客户端注册表
+
+    Returns:
+        ClientRegistry: 注册表单例
+    """
+    return _registry
+
+
+def get_openai_client(api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+    """
+    获取共享的 AsyncOpenAI 客户端
+
+    Args:
+        api_key (str): 接口密钥
+        base_url (Optional[str]): 接口地址
+
+    Returns:
+        AsyncOpenAI: 共享的客户端实例
+
+    Examples:
+        >>> client = get_openai_client(cfg.api_key, cfg.base_url)
+        >>> await client.chat.completions.create(model=cfg.model, messages=msgs, timeout=cfg.timeout)
+    """
+    return _registry.get(api_key, base_url)
+
+
+def configure_client_pool(pool_config: Optional[Dict[str, Any]]) -> None:
+    """
+    按 config.json 的 http_pool 配置连接池
+
+    Args:
+        pool_config (Optional[Dict[str, Any]]): 连接池配置
+
+    Returns:
+        None
+    """
+    _registry.configure(pool_config)
+
+
+async def close_openai_clients() -> int:
+    """
+    关闭共享客户端 进程退出前调用
+
+    Returns:
+        int: 关闭的客户端数
+    """
+    return await _registry.aclose()
@@ -0,0 +1,510 @@
+"""
+多模型服务商池
+
+LLMClient 的请求可在 config.json 的 `llm_models` 中的多个模型之间分流 单个服务商故障时自动切换:
+
+1. `llm.provider_pool.members` 指定参与分流的模型与权重 `routes` 按调度优先级(任务类型)限定可用模型
+2. 被动健康检查 按模型统计最近 window 次请求的错误率与响应延迟 EWMA(流式请求取首 token 延迟)
+3. 有效权重 = 配置权重 x (1 - 错误率) x (最快模型延迟 / 本模型延迟) 按有效权重加权随机排序候选模型
+4. 熔断 错误率超过 error_threshold 或连续失败 consecutive_failures 次后熔断 open_seconds 秒
+   到期后半开 只放行一个探测请求 成功则恢复 失败则熔断时间加倍(不超过 max_open_seconds)
+5. 故障切换 超时 连接错误 限流 5xx 与认证/模型不存在等服务商侧错误切换到下一个候选模型
+   非最后一个候选只尝试一次 最后一个候选按 `llm.retry` 策略重试 流式请求产出 token 后不再切换
+6. 所有候选都处于熔断时仍按恢复时间先后尝试 不因熔断直接拒绝请求
+
+配置见 config.json 的 `llm.provider_pool` 默认关闭
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+from openai import AuthenticationError, NotFoundError, PermissionDeniedError
+
+from .retry import classify_error
+from utils.logger import logger
+
+
+# 健康检查与熔断默认参数
+DEFAULT_HEALTH_CONFIG: Dict[str, Any] = {
+    "window": 20,
+    "min_requests": 5,
+    "error_threshold": 0.5,
+    "consecutive_failures": 3,
+    "open_seconds": 30.0,
+    "max_open_seconds": 300.0,
+    "latency_alpha": 0.2,
+}
+
+# 服务商池默认配置
+DEFAULT_POOL_CONFIG: Dict[str, Any] = {
+    "enabled": False,
+    "members": {},
+    "routes": {},
+    "health": dict(DEFAULT_HEALTH_CONFIG),
+}
+
+# 错误率折算权重的下限 避免出错较多但未熔断的模型完全失去流量
+_MIN_HEALTH_FACTOR = 0.05
+
+
+def is_provider_error(exc: BaseException) -> bool:
+    """
+    判断异常是否由服务商一侧引起 是则计入健康统计并切换到下一个模型
+
+    Args:
+        exc (BaseException): 请求异常
+
+    Returns:
+        bool: 暂时性错误与认证失败 无权限 模型不存在返回 True 参数错误等请求本身的问题返回 False
+
+    Examples:
+        >>> is_provider_error(ValueError("bad"))
+        False
+    """
+    if isinstance(exc, (AuthenticationError, PermissionDeniedError, NotFoundError)):
+        return True
+    return classify_error(exc) is not None
+
+
+class MemberHealth:
+    """
+    单个模型的健康状态与熔断器
+
+    Args:
+        window (int): 错误率统计的请求数窗口
+
+    Returns:
+        MemberHealth: 健康状态记录
+    """
+
+    def __init__(self, window: int):
+        """
+        初始化健康状态 熔断器为关闭状态
+
+        Args:
+            window (int): 错误率统计的请求数窗口
+        """
+        self.outcomes: Deque[bool] = deque(maxlen=max(int(window), 1))
+        self.latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.open_until = 0.0
+        self.open_seconds = 0.0
+        self.probing = False
+        self.counts: Dict[str, int] = {"requests": 0, "errors": 0, "failovers": 0, "opened": 0}
+
+    @property
+    def error_rate(self) -> float:
+        """
+        窗口内的错误率
+
+        Returns:
+            float: 0~1 无样本时为 0
+        """
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for ok in self.outcomes if not ok) / len(self.outcomes)
+
+
+class ProviderPool:
+    """
+    按权重与健康状态在多个模型之间分流的服务商池
+
+    Args:
+        config (Optional[Dict[str, Any]]): 池配置 缺省字段使用 DEFAULT_POOL_CONFIG
+
+    Returns:
+        ProviderPool: 服务商池实例
+
+    Examples:
+        >>> pool = ProviderPool({"enabled": True, "members": {"deepseek-chat": 3, "qwen-plus": 1}})
+        >>> sorted(pool.candidates("interactive", ["deepseek-chat", "qwen-plus"]))
+        ['deepseek-chat', 'qwen-plus']
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        初始化服务商池
+
+        Args:
+            config (Optional[Dict[str, Any]]): 池配置
+        """
+        self._lock = threading.Lock()
+        self._members: Dict[str, MemberHealth] = {}
+        self.config: Dict[str, Any] = dict(DEFAULT_POOL_CONFIG)
+        self.health: Dict[str, Any] = dict(DEFAULT_HEALTH_CONFIG)
+        self.configure(config)
+
+    def configure(self, config: Optional[Dict[str, Any]]) -> None:
+        """
+        更新池配置 已有模型的健康状态保留
+
+        Args:
+            config (Optional[Dict[str, Any]]): 池配置
+
+        Returns:
+            None
+        """
+        merged = dict(DEFAULT_POOL_CONFIG)
+        merged.update({k: v for k, v in (config or {}).items() if k in DEFAULT_POOL_CONFIG})
+        health = dict(DEFAULT_HEALTH_CONFIG)
+        health.update({k: v for k, v in (merged.get("health") or {}).items() if k in DEFAULT_HEALTH_CONFIG})
+        members = {str(name): float(weight) for name, weight in (merged.get("members") or {}).items()}
+        merged["members"] = {name: weight for name, weight in members.items() if weight > 0}
+        merged["routes"] = {str(task): [str(name) for name in names] for task, names in (merged.get("routes") or {}).items()}
+        with self._lock:
+            self.config = merged
+            self.health = health
+            for member in self._members.values():
+                if member.outcomes.maxlen != int(health["window"]):
+                    member.outcomes = deque(member.outcomes, maxlen=max(int(health["window"]), 1))
+
+    @property
+    def enabled(self) -> bool:
+        """
+        服务商池是否开启
+
+        Returns:
+            bool: 是否开启
+        """
+        return bool(self.config["enabled"])
+
+    @property
+    def members(self) -> Dict[str, float]:
+        """
+        参与分流的模型与配置权重
+
+        Returns:
+            Dict[str, float]: 模型名 -> 权重
+        """
+        return dict(self.config["members"])
+
+    def _member(self, name: str) -> MemberHealth:
+        """
+        获取模型的健康状态 调用方需持有锁
+
+        Args:
+            name (str): 模型名
+
+        Returns:
+            MemberHealth: 健康状态
+        """
+        member = self._members.get(name)
+        if member is None:
+            member = self._members[name] = MemberHealth(int(self.health["window"]))
+        return member
+
+    def _weights(self, names: List[str]) -> Dict[str, float]:
+        """
+        计算有效权重 调用方需持有锁
+
+        Args:
+            names (List[str]): 模型名
+
+        Returns:
+            Dict[str, float]: 模型名 -> 有效权重
+        """
+        members = self.config["members"]
+        latencies = [self._member(name).latency for name in names if self._member(name).latency]
+        fastest = min(latencies) if latencies else None
+        weights: Dict[str, float] = {}
+        for name in names:
+            member = self._member(name)
+            weight = float(members.get(name, 1.0)) * max(1.0 - member.error_rate, _MIN_HEALTH_FACTOR)
+            if fastest and member.latency:
+                weight *= fastest / member.latency
+            weights[name] = weight
+        return weights
+
+    def candidates(self, task: str, available: List[str]) -> List[str]:
+        """
+        获取任务的候选模型 按有效权重加权随机排序 熔断中的模型排在最后
+
+        Args:
+            task (str): 任务类型 即调度优先级 interactive / agent / background
+            available (List[str]): 调用方可用的模型名
+
+        Returns:
+            List[str]: 候选模型名 依次尝试 池关闭或没有可用模型时为空
+        """
+        if not self.enabled:
+            return []
+        route = self.config["routes"].get(task)
+        names = [name for name in (route if route else self.config["members"]) if name in available]
+        now = time.monotonic()
+        with self._lock:
+            healthy: List[str] = []
+            tripped: List[str] = []
+            for name in names:
+                member = self._member(name)
+                if member.state == "open" and now >= member.open_until:
+                    member.state = "half_open"
+                if member.state == "closed" or (member.state == "half_open" and not member.probing):
+                    healthy.append(name)
+                else:
+                    tripped.append(name)
+            weights = self._weights(healthy)
+            ordered: List[str] = []
+            while weights:
+                # 按有效权重不放回抽样
+                pick = random.uniform(0, sum(weights.values()))
+                for name, weight in weights.items():
+                    pick -= weight
+                    if pick <= 0:
+                        break
+                ordered.append(name)
+                del weights[name]
+            tripped.sort(key=lambda item: self._member(item).open_until)
+        return ordered + tripped
+
+    def begin(self, name: str) -> None:
+        """
+        开始一次对模型的请求 半开状态的模型占用探测名额
+
+        Args:
+            name (str): 模型名
+
+        Returns:
+            None
+        """
+        with self._lock:
+            member = self._member(name)
+            member.counts["requests"] += 1
+            if member.state == "half_open":
+                member.probing = True
+
+    def observe_latency(self, name: str, seconds: float) -> None:
+        """
+        记录一次响应延迟 流式请求为首 token 延迟
+
+        Args:
+            name (str): 模型名
+            seconds (float): 延迟秒数
+
+        Returns:
+            None
+        """
+        with self._lock:
+            member = self._member(name)
+            alpha = float(self.health["latency_alpha"])
+            member.latency = seconds if member.latency is None else alpha * seconds + (1 - alpha) * member.latency
+
+    def record(self, name: str, ok: bool) -> None:
+        """
+        记录请求结果并更新熔断器
+
+        Args:
+            name (str): 模型名
+            ok (bool): 是否成功 请求本身的错误(参数错误等)视为成功
+
+        Returns:
+            None
+        """
+        health = self.health
+        with self._lock:
+            member = self._member(name)
+            member.outcomes.append(ok)
+            member.probing = False
+            if ok:
+                member.consecutive_failures = 0
+                if member.state != "closed":
+                    logger.info(f"✅ 模型 {name} 探测成功 恢复分流")
+                    member.state = "closed"
+                    member.open_seconds = 0.0
+                    member.outcomes.clear()
+                return
+
+            member.counts["errors"] += 1
+            member.consecutive_failures += 1
+            tripped = member.state == "half_open"
+            if member.state == "closed":
+                tripped = member.consecutive_failures >= int(health["consecutive_failures"]) or (
+                    len(member.outcomes) >= int(health["min_requests"])
+                    and member.error_rate >= float(health["error_threshold"])
+                )
+            if tripped:
+                if member.state == "half_open":
+                    member.open_seconds = min(member.open_seconds * 2, float(health["max_open_seconds"]))
+                else:
+                    member.open_seconds = float(health["open_seconds"])
+                member.state = "open"
+                member.open_until = time.monotonic() + member.open_seconds
+                member.counts["opened"] += 1
+                logger.warning(
+                    f"⚠️ 模型 {name} 熔断 {member.open_seconds:.0f}s "
+                    f"(错误率 {member.error_rate:.0%} 连续失败 {member.consecutive_failures} 次)"
+                )
+
+    def abort(self, name: str) -> None:
+        """
+        请求被取消 不计入结果 释放半开探测名额
+
+        Args:
+            name (str): 模型名
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._member(name).probing = False
+
+    def _failover(self, name: str, next_name: str, exc: BaseException) -> None:
+        """
+        记录一次故障切换
+
+        Args:
+            name (str): 失败的模型名
+            next_name (str): 切换到的模型名
+            exc (BaseException): 失败原因
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._member(name).counts["failovers"] += 1
+        logger.warning(f"⚠️ 模型 {name} 请求失败 切换到 {next_name}: {type(exc).__name__}: {exc}")
+
+    async def run(self, names: List[str], call: Callable[[str, bool], Awaitable[Any]]) -> Any:
+        """
+        依次向候选模型发起非流式请求 服务商侧错误切换到下一个模型
+
+        Args:
+            names (List[str]): `candidates` 返回的候选模型
+            call (Callable[[str, bool], Awaitable[Any]]): 发起请求的协程工厂 参数为 (模型名, 是否允许重试)
+                只有最后一个候选允许重试
+
+        Returns:
+            Any: 请求结果
+
+        Raises:
+            Exception: 请求本身的错误 或最后一个候选的错误
+        """
+        for index, name in enumerate(names):
+            last = index == len(names) - 1
+            self.begin(name)
+            started = time.perf_counter()
+            try:
+                result = await call(name, last)
+            except asyncio.CancelledError:
+                self.abort(name)
+                raise
+            except Exception as e:
+                if not is_provider_error(e):
+                    self.record(name, True)
+                    raise
+                self.record(name, False)
+                if last:
+                    raise
+                self._failover(name, names[index + 1], e)
+                continue
+            self.observe_latency(name, time.perf_counter() - started)
+            self.record(name, True)
+            return result
+        raise RuntimeError("没有可用的候选模型")
+
+    async def stream(
+        self,
+        names: List[str],
+        open_stream: Callable[[str, bool], AsyncIterator[str]],
+    ) -> AsyncIterator[str]:
+        """
+        依次向候选模型发起流式请求 产出首个 token 前的服务商侧错误切换到下一个模型
+
+        Args:
+            names (List[str]): `candidates` 返回的候选模型
+            open_stream (Callable[[str, bool], AsyncIterator[str]]): 创建 token 流的工厂 参数为 (模型名, 是否允许重试)
+
+        Returns:
+            AsyncIterator[str]: 成功一路的 token 序列
+
+        Raises:
+            Exception: 请求本身的错误 输出中途的错误 或最后一个候选的错误
+        """
+        for index, name in enumerate(names):
+            last = index == len(names) - 1
+            self.begin(name)
+            started = time.perf_counter()
+            tokens = open_stream(name, last)
+            emitted = False
+            try:
+                async for token in tokens:
+                    if not emitted:
+                        emitted = True
+                        self.observe_latency(name, time.perf_counter() - started)
+                    yield token
+            except (asyncio.CancelledError, GeneratorExit):
+                self.abort(name)
+                raise
+            except Exception as e:
+                if not is_provider_error(e):
+                    self.record(name, True)
+                    raise
+                self.record(name, False)
+                if emitted or last:
+                    raise
+                self._failover(name, names[index + 1], e)
+                continue
+            finally:
+                await tokens.aclose()
+            self.record(name, True)
+            return
+        raise RuntimeError("没有可用的候选模型")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取服务商池统计
+
+        Returns:
+            Dict[str, Any]: 各模型的熔断状态 配置与有效权重 错误率 延迟 EWMA(毫秒) 请求 错误 切换与熔断次数
+
+        Examples:
+            >>> get_provider_pool().stats()["enabled"]
+            False
+        """
+        now = time.monotonic()
+        with self._lock:
+            names = list(dict.fromkeys([*self.config["members"], *self._members]))
+            weights = self._weights(names)
+            members: Dict[str, Any] = {}
+            for name in names:
+                member = self._member(name)
+                members[name] = {
+                    "state": member.state,
+                    "weight": self.config["members"].get(name, 0.0),
+                    "effective_weight": round(weights[name], 4),
+                    "error_rate": round(member.error_rate, 4),
+                    "latency_ewma_ms": round(member.latency * 1000, 1) if member.latency is not None else None,
+                    "open_remaining_s": round(max(member.open_until - now, 0.0), 1) if member.state == "open" else 0.0,
+                    **member.counts,
+                }
+            return {"enabled": self.enabled, "routes": dict(self.config["routes"]), "members": members}
+
+
+_pool = ProviderPool()
+
+
+def get_provider_pool() -> ProviderPool:
+    """
+    获取进程级服务商池
+
+    Returns:
+        ProviderPool: 服务商池单例
+    """
+    return _pool
+
+
+def configure_provider_pool(config: Optional[Dict[str, Any]]) -> None:
+    """
+    按 config.json 的 llm.provider_pool 配置服务商池
+
+    Args:
+        config (Optional[Dict[str, Any]]): 池配置
+
+    Returns:
+        None
+    """
+    _pool.configure(config)
@@ -0,0 +1,324 @@
+"""
+LLM 请求重试策略
+
+按异常类型决定是否重试 只重试暂时性错误:
+
+1. 超时与连接错误
+2. 408 / 409 / 429 与 5xx 响应 429 优先按响应头 Retry-After 等待 等待时间过长时直接失败
+3. 认证失败 参数错误 内容为空等其余错误不重试 取消(CancelledError)从不重试
+
+流式请求只在尚未产出 token 前重试 已输出部分内容后失败直接上抛 避免调用方收到重复内容
+
+全局重试预算限制一个时间窗口内的重试次数不超过请求数的 budget_ratio 倍(至少 budget_min_retries 次)
+服务商整体故障时大部分请求直接失败 而不是以重试放大请求量
+
+配置见 config.json 的 `llm.retry` 底层 SDK 的自动重试由 LLMClient 关闭 统一由本策略负责
+"""
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import httpx
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+from utils.logger import logger
+
+
+# 重试策略默认参数
+DEFAULT_RETRY_CONFIG: Dict[str, Any] = {
+    "max_attempts": 3,
+    "base_delay": 0.5,
+    "max_delay": 20.0,
+    "max_retry_after": 60.0,
+    "budget_ratio": 0.2,
+    "budget_min_retries": 5,
+    "budget_window": 60.0,
+}
+
+# 可重试的 HTTP 状态码 5xx 另行判断
+_RETRYABLE_STATUS = {408, 409, 429}
+
+
+def _retry_after(exc: APIStatusError) -> Optional[float]:
+    """
+    解析响应头中的 Retry-After
+
+    支持 retry-after-ms(毫秒) 与 retry-after(秒数或 HTTP 日期)
+
+    Args:
+        exc (APIStatusError): 状态码异常
+
+    Returns:
+        Optional[float]: 建议等待秒数 未提供或无法解析时返回 None
+    """
+    headers = getattr(exc.response, "headers", None) or {}
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(float(value) / 1000.0, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(parsed.timestamp() - time.time(), 0.0)
+
+
+def classify_error(exc: BaseException) -> Optional[str]:
+    """
+    判断异常是否为暂时性错误
+
+    Args:
+        exc (BaseException): 请求异常
+
+    Returns:
+        Optional[str]: 暂时性错误的类别 timeout / connection / rate_limit / server 不可重试时返回 None
+
+    Examples:
+        >>> classify_error(ValueError("LLM返回了无效或者空的响应")) is None
+        True
+    """
+    if isinstance(exc, (APITimeoutError, httpx.TimeoutException)):
+        return "timeout"
+    if isinstance(exc, (APIConnectionError, httpx.TransportError)):
+        return "connection"
+    if isinstance(exc, APIStatusError):
+        if exc.status_code == 429:
+            return "rate_limit"
+        if exc.status_code in _RETRYABLE_STATUS or exc.status_code >= 500:
+            return "server"
+    return None
+
+
+class RetryPolicy:
+    """
+    按错误类型重试 并受全局重试预算约束的策略
+
+    Args:
+        config (Optional[Dict[str, Any]]): 重试配置 缺省字段使用 DEFAULT_RETRY_CONFIG
+
+    Returns:
+        RetryPolicy: 策略实例
+
+    Examples:
+        >>> policy = RetryPolicy({"max_attempts": 3})
+        >>> response = await policy.run(lambda: client.chat.completions.create(**params))
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        初始化策略
+
+        Args:
+            config (Optional[Dict[str, Any]]): 重试配置
+        """
+        self._lock = threading.Lock()
+        # 预算窗口内的请求与重试时间戳
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self.config: Dict[str, Any] = dict(DEFAULT_RETRY_CONFIG)
+        self.counts: Dict[str, int] = {
+            "requests": 0,
+            "retries": 0,
+            "not_retryable": 0,
+            "exhausted": 0,
+            "budget_exhausted": 0,
+            "retry_after_too_long": 0,
+            "partial_stream": 0,
+        }
+        self.by_class: Dict[str, int] = {"timeout": 0, "connection": 0, "rate_limit": 0, "server": 0}
+        self.configure(config)
+
+    def configure(self, config: Optional[Dict[str, Any]]) -> None:
+        """
+        更新重试配置
+
+        Args:
+            config (Optional[Dict[str, Any]]): 重试配置
+
+        Returns:
+            None
+        """
+        merged = dict(DEFAULT_RETRY_CONFIG)
+        merged.update({k: v for k, v in (config or {}).items() if k in DEFAULT_RETRY_CONFIG})
+        with self._lock:
+            self.config = merged
+
+    def record_request(self) -> None:
+        """
+        记录一次新请求(不含重试) 为重试预算计数
+
+        Returns:
+            None
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            self._requests.append(now)
+            self.counts["requests"] += 1
+
+    def record_partial_stream(self) -> None:
+        """
+        记录一次已输出部分内容后失败 不再重试的流式请求
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.counts["partial_stream"] += 1
+
+    def next_delay(self, exc: BaseException, attempt: int) -> Optional[float]:
+        """
+        计算第 attempt 次失败后的重试等待时间 并占用一次重试预算
+
+        Args:
+            exc (BaseException): 本次失败的异常
+            attempt (int): 已执行的次数 从 1 开始
+
+        Returns:
+            Optional[float]: 等待秒数 不应重试时返回 None
+        """
+        kind = classify_error(exc)
+        with self._lock:
+            config = self.config
+            if kind is None:
+                self.counts["not_retryable"] += 1
+                return None
+            if attempt >= int(config["max_attempts"]):
+                self.counts["exhausted"] += 1
+                return None
+
+            # 指数退避 full jitter
+            ceiling = min(float(config["max_delay"]), float(config["base_delay"]) * (2 ** (attempt - 1)))
+            delay = random.uniform(0, ceiling)
+            if isinstance(exc, APIStatusError):
+                hint = _retry_after(exc)
+                if hint is not None:
+                    if hint > float(config["max_retry_after"]):
+                        self.counts["retry_after_too_long"] += 1
+                        return None
+                    delay = max(delay, hint)
+
+            now = time.monotonic()
+            self._trim(now)
+            allowed = max(
+                int(config["budget_min_retries"]),
+                int(len(self._requests) * float(config["budget_ratio"])),
+            )
+            if len(self._retries) >= allowed:
+                self.counts["budget_exhausted"] += 1
+                return None
+            self._retries.append(now)
+            self.counts["retries"] += 1
+            self.by_class[kind] += 1
+            return delay
+
+    def _trim(self, now: float) -> None:
+        """
+        移除预算窗口之外的记录 调用方需持有锁
+
+        Args:
+            now (float): 当前单调时间
+
+        Returns:
+            None
+        """
+        horizon = now - float(self.config["budget_window"])
+        while self._requests and self._requests[0] < horizon:
+            self._requests.popleft()
+        while self._retries and self._retries[0] < horizon:
+            self._retries.popleft()
+
+    async def run(self, call: Callable[[], Awaitable[Any]], label: str = "LLM") -> Any:
+        """
+        执行请求 暂时性错误按策略重试
+
+        Args:
+            call (Callable[[], Awaitable[Any]]): 发起请求的协程工厂 每次重试重新调用
+            label (str): 日志中的请求名称
+
+        Returns:
+            Any: 请求结果
+
+        Raises:
+            Exception: 不可重试的错误 或重试次数与预算用尽后的最后一次错误
+        """
+        self.record_request()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await call()
+            except Exception as e:
+                delay = self.next_delay(e, attempt)
+                if delay is None:
+                    raise
+                logger.warning(f"⚠️ {label} 请求失败 {delay:.2f}s 后重试 (第 {attempt} 次): {type(e).__name__}: {e}")
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取重试统计
+
+        Returns:
+            Dict[str, Any]: 请求与重试次数 各类放弃重试的次数 按错误类别的重试次数 当前窗口的预算使用
+
+        Examples:
+            >>> get_retry_policy().stats()["retries"]
+            0
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            allowed = max(
+                int(self.config["budget_min_retries"]),
+                int(len(self._requests) * float(self.config["budget_ratio"])),
+            )
+            return {
+                **self.counts,
+                "retries_by_class": dict(self.by_class),
+                "budget": {
+                    "window_requests": len(self._requests),
+                    "window_retries": len(self._retries),
+                    "allowed": allowed,
+                },
+            }
+
+
+_policy = RetryPolicy()
+
+
+def get_retry_policy() -> RetryPolicy:
+    """
+    获取进程级重试策略
+
+    Returns:
+        RetryPolicy: 策略单例
+    """
+    return _policy
+
+
+def configure_retry_policy(config: Optional[Dict[str, Any]]) -> None:
+    """
+    按 config.json 的 llm.retry 配置重试策略
+
+    Args:
+        config (Optional[Dict[str, Any]]): 重试配置
+
+    Returns:
+        None
+    """
+    _policy.configure(config)
@@ -0,0 +1,605 @@
+"""
+LLM 请求调度器
+
+LLMClient 与 narrative 的 LightRAG 调用函数发往模型的请求统一经过调度器:
+
+1. 按服务商(provider)限制并发数 超出后排队
+2. 可选的每分钟请求数与 token 数令牌桶 额度不足时排队等待 避免触发服务商限流
+3. 排队按优先级出队 interactive(用户对话) > agent(ReAct 步骤 路由) > background(压缩 图谱构建)
+   同级按到达顺序 非 interactive 请求不能占用为 interactive 预留的并发槽位
+4. 按优先级统计排队等待时间
+
+token 桶在请求开始时扣除估算的 prompt token 请求结束后补扣实际生成的 token 额度允许暂时透支
+
+配置见 config.json 的 `llm.scheduler`
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from utils.logger import logger
+
+
+# 优先级名称 -> 排序值 越小越先出队
+PRIORITIES: Dict[str, int] = {"interactive": 0, "agent": 1, "background": 2}
+DEFAULT_PRIORITY = "agent"
+
+# 单个服务商的默认限额 0 表示不限制
+DEFAULT_LIMITS: Dict[str, Any] = {
+    "max_concurrency": 8,
+    "requests_per_minute": 0,
+    "tokens_per_minute": 0,
+    "reserved_interactive": 1,
+}
+
+# 调度器默认配置
+DEFAULT_SCHEDULER_CONFIG: Dict[str, Any] = {
+    "enabled": True,
+    "default": dict(DEFAULT_LIMITS),
+    "providers": {},
+}
+
+# 每个优先级保留的最近等待时间样本数 用于计算分位数
+_WAIT_SAMPLES = 1024
+
+
+class TokenBucket:
+    """
+    每分钟额度的令牌桶 桶容量为一分钟的额度
+
+    Args:
+        per_minute (float): 每分钟额度
+
+    Returns:
+        TokenBucket: 令牌桶实例
+
+    Examples:
+        >>> bucket = TokenBucket(60)
+        >>> bucket.wait_time(1)
+        0.0
+    """
+
+    def __init__(self, per_minute: float):
+        """
+        初始化令牌桶 初始为满
+
+        Args:
+            per_minute (float): 每分钟额度
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        """
+        按流逝时间补充额度
+
+        Returns:
+            None
+        """
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        计算额度足够扣除 amount 还需等待的秒数
+
+        amount 超过桶容量时按桶满计算 避免大请求永远无法执行
+
+        Args:
+            amount (float): 需要的额度
+
+        Returns:
+            float: 等待秒数 0 表示可以立即扣除
+        """
+        self._refill()
+        need = min(amount, self.capacity) - self.level
+        return need / self.rate if need > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        """
+        扣除额度 允许透支 透支部分由之后的补充抵消
+
+        Args:
+            amount (float): 扣除的额度
+
+        Returns:
+            None
+        """
+        self._refill()
+        self.level -= amount
+
+
+class _Waiter:
+    """
+    排队中的请求
+
+    Args:
+        priority (int): 优先级排序值
+        seq (int): 到达序号
+        tokens (int): 估算的 prompt token 数
+        future (asyncio.Future): 获得执行许可时完成
+
+    Returns:
+        _Waiter: 排队记录
+    """
+
+    __slots__ = ("priority", "seq", "tokens", "future")
+
+    def __init__(self, priority: int, seq: int, tokens: int, future: asyncio.Future):
+        """
+        初始化排队记录
+
+        Args:
+            priority (int): 优先级排序值
+            seq (int): 到达序号
+            tokens (int): 估算的 prompt token 数
+            future (asyncio.Future): 获得执行许可时完成
+        """
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        """
+        按 (优先级, 到达序号) 排序
+
+        Args:
+            other (_Waiter): 另一条排队记录
+
+        Returns:
+            bool: 是否先于 other 出队
+        """
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class ProviderLimiter:
+    """
+    单个服务商在单个事件循环内的并发与速率限制
+
+    Args:
+        limits (Dict[str, Any]): 限额配置 字段见 DEFAULT_LIMITS
+
+    Returns:
+        ProviderLimiter: 限制器实例
+    """
+
+    def __init__(self, limits: Dict[str, Any]):
+        """
+        初始化限制器
+
+        Args:
+            limits (Dict[str, Any]): 限额配置
+        """
+        self.active = 0
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.requests: Optional[TokenBucket] = None
+        self.tokens: Optional[TokenBucket] = None
+        self.configure(limits)
+
+    def configure(self, limits: Dict[str, Any]) -> None:
+        """
+        更新限额 已开始的请求不受影响
+
+        Args:
+            limits (Dict[str, Any]): 限额配置
+
+        Returns:
+            None
+        """
+        self.max_concurrency = max(int(limits["max_concurrency"]), 1)
+        self.reserved_interactive = min(max(int(limits["reserved_interactive"]), 0), self.max_concurrency - 1)
+        rpm = float(limits["requests_per_minute"])
+        tpm = float(limits["tokens_per_minute"])
+        if rpm <= 0:
+            self.requests = None
+        elif self.requests is None or self.requests.capacity != rpm:
+            self.requests = TokenBucket(rpm)
+        if tpm <= 0:
+            self.tokens = None
+        elif self.tokens is None or self.tokens.capacity != tpm:
+            self.tokens = TokenBucket(tpm)
+        self._dispatch()
+
+    @property
+    def queued(self) -> int:
+        """
+        排队中的请求数
+
+        Returns:
+            int: 未取消的排队请求数
+        """
+        return sum(1 for waiter in self._queue if not waiter.future.done())
+
+    async def acquire(self, priority: int, tokens: int) -> None:
+        """
+        获取执行许可 额度不足时按优先级排队
+
+        Args:
+            priority (int): 优先级排序值
+            tokens (int): 估算的 prompt token 数
+
+        Returns:
+            None
+        """
+        if not self._queue and self._wait_time(priority, tokens) == 0.0:
+            self._start(tokens)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, _Waiter(priority, next(self._seq), tokens, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 许可已发放但调用方在恢复前被取消 归还许可
+                self.release()
+            else:
+                future.cancel()
+                self._dispatch()
+            raise
+
+    def release(self) -> None:
+        """
+        归还执行许可并唤醒排队请求
+
+        Returns:
+            None
+        """
+        self.active = max(self.active - 1, 0)
+        self._dispatch()
+
+    def settle(self, tokens: int) -> None:
+        """
+        请求结束后补扣实际生成的 token
+
+        Args:
+            tokens (int): 生成的 token 数
+
+        Returns:
+            None
+        """
+        if self.tokens is not None and tokens > 0:
+            self.tokens.take(tokens)
+
+    def _wait_time(self, priority: int, tokens: int) -> Optional[float]:
+        """
+        计算请求还需等待的时间
+
+        Args:
+            priority (int): 优先级排序值
+            tokens (int): 估算的 prompt token 数
+
+        Returns:
+            Optional[float]: 0 表示可以立即开始 正数为速率限制的等待秒数 None 表示需等待其他请求结束
+        """
+        limit = self.max_concurrency
+        if priority != PRIORITIES["interactive"]:
+            limit -= self.reserved_interactive
+        if self.active >= limit:
+            return None
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def _start(self, tokens: int) -> None:
+        """
+        占用并发槽位并扣除速率额度
+
+        Args:
+            tokens (int): 估算的 prompt token 数
+
+        Returns:
+            None
+        """
+        self.active += 1
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+    def _dispatch(self) -> None:
+        """
+        按优先级依次放行队首请求 队首受速率限制时定时重试
+
+        队首无法开始时不越过它放行后面的请求 保证高优先级请求不被低优先级插队
+
+        Returns:
+            None
+        """
+        while self._queue:
+            waiter = self._queue[0]
+            if waiter.future.done():
+                heapq.heappop(self._queue)
+                continue
+            wait = self._wait_time(waiter.priority, waiter.tokens)
+            if wait is None:
+                return
+            if wait > 0:
+                if self._timer is None:
+                    loop = waiter.future.get_loop()
+                    self._timer = loop.call_later(wait, self._on_timer)
+                return
+            heapq.heappop(self._queue)
+            self._start(waiter.tokens)
+            waiter.future.set_result(None)
+
+    def _on_timer(self) -> None:
+        """
+        速率额度恢复后重新放行
+
+        Returns:
+            None
+        """
+        self._timer = None
+        self._dispatch()
+
+
+class Ticket:
+    """
+    一次已获得许可的请求 用于请求结束后补扣生成的 token
+
+    Args:
+        limiter (Optional[ProviderLimiter]): 所属限制器 调度器关闭时为 None
+
+    Returns:
+        Ticket: 许可记录
+    """
+
+    def __init__(self, limiter: Optional[ProviderLimiter]):
+        """
+        初始化许可记录
+
+        Args:
+            limiter (Optional[ProviderLimiter]): 所属限制器
+        """
+        self._limiter = limiter
+
+    def settle(self, tokens: int) -> None:
+        """
+        补扣实际生成的 token
+
+        Args:
+            tokens (int): 生成的 token 数
+
+        Returns:
+            None
+        """
+        if self._limiter is not None:
+            self._limiter.settle(tokens)
+
+
+class LLMScheduler:
+    """
+    按服务商限流 按优先级排队的请求调度器
+
+    Args:
+        config (Optional[Dict[str, Any]]): 调度配置 缺省字段使用 DEFAULT_SCHEDULER_CONFIG
+
+    Returns:
+        LLMScheduler: 调度器实例
+
+    Examples:
+        >>> scheduler = LLMScheduler({"default": {"max_concurrency": 4}})
+        >>> async with scheduler.slot("deepseek", "background", tokens=1200) as ticket:
+        ...     response = await call_llm()
+        ...     ticket.settle(response.usage.completion_tokens)
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        初始化调度器 限制器按 (事件循环, 服务商) 延迟创建
+
+        Args:
+            config (Optional[Dict[str, Any]]): 调度配置
+        """
+        self._lock = threading.Lock()
+        self._limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, ProviderLimiter]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._waits: Dict[str, Deque[float]] = {name: deque(maxlen=_WAIT_SAMPLES) for name in PRIORITIES}
+        self._counts: Dict[str, Dict[str, float]] = {
+            name: {"requests": 0, "queued": 0, "total_wait": 0.0, "max_wait": 0.0} for name in PRIORITIES
+        }
+        self.config: Dict[str, Any] = dict(DEFAULT_SCHEDULER_CONFIG)
+        self.configure(config)
+
+    def configure(self, config: Optional[Dict[str, Any]]) -> None:
+        """
+        更新调度配置 已创建的限制器同步更新限额
+
+        Args:
+            config (Optional[Dict[str, Any]]): 调度配置
+
+        Returns:
+            None
+        """
+        merged = dict(DEFAULT_SCHEDULER_CONFIG)
+        merged.update({k: v for k, v in (config or {}).items() if k in DEFAULT_SCHEDULER_CONFIG})
+        with self._lock:
+            self.config = merged
+            groups = list(self._limiters.values())
+        for limiters in groups:
+            for provider, limiter in limiters.items():
+                limiter.configure(self.limits(provider))
+
+    @property
+    def enabled(self) -> bool:
+        """
+        调度器是否开启
+
+        Returns:
+            bool: 是否开启
+        """
+        return bool(self.config["enabled"])
+
+    def limits(self, provider: str) -> Dict[str, Any]:
+        """
+        获取服务商的生效限额 providers 中的配置覆盖 default
+
+        Args:
+            provider (str): 服务商标识
+
+        Returns:
+            Dict[str, Any]: 限额配置
+        """
+        limits = dict(DEFAULT_LIMITS)
+        limits.update({k: v for k, v in (self.config.get("default") or {}).items() if k in DEFAULT_LIMITS})
+        provider_limits = (self.config.get("providers") or {}).get(provider) or {}
+        limits.update({k: v for k, v in provider_limits.items() if k in DEFAULT_LIMITS})
+        return limits
+
+    def needs_tokens(self, provider: str) -> bool:
+        """
+        服务商是否配置了 token 限额 未配置时调用方无需估算 prompt token
+
+        Args:
+            provider (str): 服务商标识
+
+        Returns:
+            bool: 是否需要 token 估算
+        """
+        return self.enabled and float(self.limits(provider)["tokens_per_minute"]) > 0
+
+    def _limiter(self, provider: str) -> ProviderLimiter:
+        """
+        获取当前事件循环中服务商的限制器
+
+        Args:
+            provider (str): 服务商标识
+
+        Returns:
+            ProviderLimiter: 限制器
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            limiters = self._limiters.setdefault(loop, {})
+            limiter = limiters.get(provider)
+            if limiter is None:
+                limiter = limiters[provider] = ProviderLimiter(self.limits(provider))
+            return limiter
+
+    @asynccontextmanager
+    async def slot(self, provider: str, priority: Optional[str] = None, tokens: int = 0) -> AsyncIterator[Ticket]:
+        """
+        获取执行许可 退出上下文时归还
+
+        Args:
+            provider (str): 服务商标识
+            priority (Optional[str]): 优先级 interactive / agent / background None 使用 agent
+            tokens (int): 估算的 prompt token 数 仅在配置 tokens_per_minute 时使用
+
+        Returns:
+            AsyncIterator[Ticket]: 许可记录
+        """
+        if not self.enabled:
+            yield Ticket(None)
+            return
+
+        name = priority if priority in PRIORITIES else DEFAULT_PRIORITY
+        if priority is not None and priority not in PRIORITIES:
+            logger.warning(f"⚠️ 未知的 LLM 请求优先级 {priority} 使用 {DEFAULT_PRIORITY}")
+        limiter = self._limiter(provider or "default")
+
+        started = time.perf_counter()
+        await limiter.acquire(PRIORITIES[name], tokens)
+        self._record(name, time.perf_counter() - started)
+        try:
+            yield Ticket(limiter)
+        finally:
+            limiter.release()
+
+    def _record(self, name: str, wait: float) -> None:
+        """
+        记录一次排队等待
+
+        Args:
+            name (str): 优先级名称
+            wait (float): 等待秒数
+
+        Returns:
+            None
+        """
+        with self._lock:
+            counts = self._counts[name]
+            counts["requests"] += 1
+            # 不足 1ms 视为未排队
+            if wait >= 0.001:
+                counts["queued"] += 1
+            counts["total_wait"] += wait
+            counts["max_wait"] = max(counts["max_wait"], wait)
+            self._waits[name].append(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取调度统计
+
+        Returns:
+            Dict[str, Any]: 各优先级的请求数 排队次数与等待时间(毫秒) 各服务商的执行中与排队请求数
+
+        Examples:
+            >>> get_llm_scheduler().stats()["classes"]["interactive"]["requests"]
+            0
+        """
+        with self._lock:
+            classes: Dict[str, Any] = {}
+            for name, counts in self._counts.items():
+                samples = sorted(self._waits[name])
+                requests = int(counts["requests"])
+                classes[name] = {
+                    "requests": requests,
+                    "queued": int(counts["queued"]),
+                    "avg_wait_ms": round(counts["total_wait"] / requests * 1000, 2) if requests else 0.0,
+                    "p50_wait_ms": round(samples[len(samples) // 2] * 1000, 2) if samples else 0.0,
+                    "p95_wait_ms": round(samples[int(len(samples) * 0.95)] * 1000, 2) if samples else 0.0,
+                    "max_wait_ms": round(counts["max_wait"] * 1000, 2),
+                }
+            providers: Dict[str, Dict[str, int]] = {}
+            for limiters in self._limiters.values():
+                for provider, limiter in limiters.items():
+                    entry = providers.setdefault(provider, {"active": 0, "queued": 0})
+                    entry["active"] += limiter.active
+                    entry["queued"] += limiter.queued
+            return {"enabled": self.enabled, "classes": classes, "providers": providers}
+
+
+_scheduler = LLMScheduler()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """
+    获取进程级请求调度器
+
+    Returns:
+        LLMScheduler: 调度器单例
+    """
+    return _scheduler
+
+
+def configure_llm_scheduler(config: Optional[Dict[str, Any]]) -> None:
+    """
+    按 config.json 的 llm.scheduler 配置调度器
+
+    Args:
+        config (Optional[Dict[str, Any]]): 调度配置
+
+    Returns:
+        None
+    """
+    _scheduler.configure(config)
@@ -0,0 +1,302 @@
+"""
+LLM 请求合并(single-flight)
+
+多个调用方同时发出完全相同的请求时(多个页面询问同一个 narrative 问题 前端重试等) 只向模型发出一次请求:
+
+1. 非流式请求(`chat` `chat_with_tools`) 后到的调用等待进行中的请求 共享其结果或异常
+2. 流式请求 上游 token 写入共享缓冲区 后到的调用先收到已产出的 token 再继续接收后续 token
+3. 上游请求在独立任务中执行 单个调用方取消不影响其他调用方 所有调用方都离开后才取消上游请求
+4. 请求结束后立即移除 之后的相同请求重新发起 结果复用由 `llm.cache` 负责
+
+请求只在同一事件循环内合并 不同事件循环的请求各自执行
+"""
+
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+class _Call:
+    """
+    进行中的非流式请求
+
+    Args:
+        loop (asyncio.AbstractEventLoop): 所属事件循环
+        task (asyncio.Task): 上游请求任务
+
+    Returns:
+        _Call: 请求记录
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, task: "asyncio.Task[Any]"):
+        """
+        初始化请求记录
+
+        Args:
+            loop (asyncio.AbstractEventLoop): 所属事件循环
+            task (asyncio.Task): 上游请求任务
+        """
+        self.loop = loop
+        self.task = task
+        self.waiters = 0
+
+
+class _Stream:
+    """
+    进行中的流式请求 保存已产出的 token 供后到的调用方回放
+
+    Args:
+        loop (asyncio.AbstractEventLoop): 所属事件循环
+
+    Returns:
+        _Stream: 请求记录
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        """
+        初始化请求记录 上游任务由 SingleFlight 创建后赋值
+
+        Args:
+            loop (asyncio.AbstractEventLoop): 所属事件循环
+        """
+        self.loop = loop
+        self.task: Optional["asyncio.Task[None]"] = None
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        # 每次产出 token 或结束时置位并替换 订阅方等待的是取数前的事件 不会错过通知
+        self.changed = asyncio.Event()
+
+    def notify(self) -> None:
+        """
+        唤醒等待新 token 的订阅方
+
+        Returns:
+            None
+        """
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """
+    相同请求合并器
+
+    Args:
+        None
+
+    Returns:
+        SingleFlight: 合并器实例
+
+    Examples:
+        >>> flights = SingleFlight()
+        >>> text = await flights.do(key, lambda: call_llm())
+        >>> async for token in flights.stream(key, lambda: stream_llm()):
+        ...     print(token)
+    """
+
+    def __init__(self):
+        """
+        初始化合并器
+        """
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Stream] = {}
+        self.leaders = 0
+        self.joined = 0
+        self.stream_leaders = 0
+        self.stream_joined = 0
+
+    async def do(
+        self,
+        key: str,
+        call: Callable[[], Awaitable[Any]],
+        on_join: Optional[Callable[[], None]] = None,
+    ) -> Any:
+        """
+        执行非流式请求 相同键的进行中请求只执行一次
+
+        Args:
+            key (str): 请求键
+            call (Callable[[], Awaitable[Any]]): 发起上游请求的协程工厂
+            on_join (Optional[Callable[[], None]]): 加入进行中的请求时在调用方上下文中同步调用 发起请求时不调用
+
+        Returns:
+            Any: 上游请求结果 所有等待者得到同一对象
+
+        Raises:
+            Exception: 上游请求的异常原样传给所有等待者
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flight = self._calls.get(key)
+            joined = flight is not None and flight.loop is loop
+            if joined:
+                self.joined += 1
+            else:
+                flight = _Call(loop, loop.create_task(call()))
+                self._calls[key] = flight
+                self.leaders += 1
+                flight.task.add_done_callback(lambda task: self._finish_call(key, flight))
+        if joined and on_join is not None:
+            on_join()
+
+        flight.waiters += 1
+        try:
+            # shield: 单个等待者被取消时上游任务继续执行
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finish_call(self, key: str, flight: _Call) -> None:
+        """
+        非流式请求结束后移除记录
+
+        Args:
+            key (str): 请求键
+            flight (_Call): 请求记录
+
+        Returns:
+            None
+        """
+        self._remove(self._calls, key, flight)
+        if not flight.task.cancelled():
+            # 等待者全部离开后失败的请求 避免 "exception was never retrieved" 警告
+            flight.task.exception()
+
+    async def stream(
+        self,
+        key: str,
+        open_stream: Callable[[], AsyncIterator[str]],
+        on_join: Optional[Callable[[], None]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        执行流式请求 相同键的进行中请求共享同一上游流
+
+        后到的订阅方先收到已产出的全部 token 再与其他订阅方同步接收后续 token
+
+        Args:
+            key (str): 请求键
+            open_stream (Callable[[], AsyncIterator[str]]): 创建上游 token 流的工厂
+            on_join (Optional[Callable[[], None]]): 加入进行中的流时在订阅方上下文中同步调用 发起请求时不调用
+
+        Returns:
+            AsyncIterator[str]: 完整的 token 序列
+
+        Raises:
+            Exception: 上游流的异常传给所有订阅方 已产出的 token 仍会先送达
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flight = self._streams.get(key)
+            joined = flight is not None and flight.loop is loop and not flight.done
+            if joined:
+                self.stream_joined += 1
+            else:
+                flight = _Stream(loop)
+                self._streams[key] = flight
+                self.stream_leaders += 1
+                flight.task = loop.create_task(self._pump(key, flight, open_stream))
+        if joined and on_join is not None:
+            on_join()
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                changed = flight.changed
+                while index < len(flight.tokens):
+                    token = flight.tokens[index]
+                    index += 1
+                    yield token
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await changed.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done and flight.task is not None:
+                # 所有订阅方都已离开 取消上游请求 之后的相同请求重新发起
+                self._remove(self._streams, key, flight)
+                flight.task.cancel()
+
+    async def _pump(self, key: str, flight: _Stream, open_stream: Callable[[], AsyncIterator[str]]) -> None:
+        """
+        消费上游 token 流并写入共享缓冲区
+
+        Args:
+            key (str): 请求键
+            flight (_Stream): 请求记录
+            open_stream (Callable[[], AsyncIterator[str]]): 创建上游 token 流的工厂
+
+        Returns:
+            None
+        """
+        try:
+            async for token in open_stream():
+                flight.tokens.append(token)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            self._remove(self._streams, key, flight)
+            flight.notify()
+
+    def _remove(self, flights: Dict[str, Any], key: str, flight: Any) -> None:
+        """
+        移除已结束的请求记录 键已被新请求占用时保留
+
+        Args:
+            flights (Dict[str, Any]): 请求记录表
+            key (str): 请求键
+            flight (Any): 待移除的请求记录
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if flights.get(key) is flight:
+                del flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取合并统计
+
+        Returns:
+            Dict[str, Any]: 进行中的请求数 发起与合并次数
+
+        Examples:
+            >>> get_single_flight().stats()["joined"]
+            0
+        """
+        with self._lock:
+            return {
+                "inflight": len(self._calls),
+                "inflight_streams": len(self._streams),
+                "leaders": self.leaders,
+                "joined": self.joined,
+                "stream_leaders": self.stream_leaders,
+                "stream_joined": self.stream_joined,
+            }
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """
+    获取进程级请求合并器
+
+    Returns:
+        SingleFlight: 合并器单例
+    """
+    return _single_flight
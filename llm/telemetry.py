@@ -0,0 +1,655 @@
+"""
+LLM 调用遥测
+
+LLMClient 的每次 `chat` `stream_chat` `chat_with_tools` 调用记录:
+
+1. 首 token 延迟(TTFT) 总耗时 token 间隔分位数与生成速度(tokens/s)
+2. prompt / completion token 数 优先使用接口返回的 usage 流式请求通过 stream_options.include_usage 获取
+   接口未返回 usage 时按 tokenizer 估算
+3. 按 `llm.telemetry.prices` 价格表(每百万 token 单价)估算费用 价格表中没有的模型费用为 None
+
+调用按会话 模式(chat / agent / narrative)与调用方聚合 会话与模式由 `telemetry_scope` 在协程上下文中传递
+`EmaAgent.run` / `run_stream` 的结果通过 `llm` 字段返回本轮各次调用的明细
+
+配置见 config.json 的 `llm.telemetry`
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from .tokenizer import get_token_counter
+
+
+# 遥测默认参数
+DEFAULT_TELEMETRY_CONFIG: Dict[str, Any] = {
+    "enabled": True,
+    "stream_usage": True,
+    "currency": "USD",
+    "prices": {},
+    "recent_calls": 200,
+    "max_sessions": 500,
+}
+
+# 每个聚合维度保留的延迟样本数 用于计算分位数
+_LATENCY_SAMPLES = 512
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    """
+    计算已排序样本的分位数
+
+    Args:
+        samples (List[float]): 升序样本
+        q (float): 分位 0~1
+
+    Returns:
+        float: 分位数 无样本时为 0
+    """
+    if not samples:
+        return 0.0
+    return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    """
+    秒转换为保留一位小数的毫秒
+
+    Args:
+        seconds (Optional[float]): 秒数
+
+    Returns:
+        Optional[float]: 毫秒数 输入为 None 时返回 None
+    """
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+class TelemetryScope:
+    """
+    一轮对话的遥测上下文 记录会话 模式与本轮的调用明细
+
+    Args:
+        session_id (Optional[str]): 会话标识
+        mode (Optional[str]): 执行模式
+
+    Returns:
+        TelemetryScope: 上下文实例
+    """
+
+    def __init__(self, session_id: Optional[str] = None, mode: Optional[str] = None):
+        """
+        初始化上下文
+
+        Args:
+            session_id (Optional[str]): 会话标识
+            mode (Optional[str]): 执行模式
+        """
+        self.session_id = session_id
+        self.mode = mode
+        self.calls: List[Dict[str, Any]] = []
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        汇总本轮的调用
+
+        Returns:
+            Dict[str, Any]: 合计 token 数 费用与 LLM 耗时 以及各次调用明细
+        """
+        calls = list(self.calls)
+        costs = [call["cost"] for call in calls if call["cost"] is not None]
+        return {
+            "calls": len(calls),
+            "prompt_tokens": sum(call["prompt_tokens"] for call in calls),
+            "completion_tokens": sum(call["completion_tokens"] for call in calls),
+            "cost": round(sum(costs), 6) if costs else None,
+            "latency_ms": round(sum(call["latency_ms"] for call in calls), 1),
+            "details": calls,
+        }
+
+
+class CallTrace:
+    """
+    单次 LLM 调用的计时与用量记录
+
+    Args:
+        caller (str): 调用方名称
+        kind (str): 调用类型 chat / stream / tools
+        provider (str): 服务商
+        model (str): 模型名
+        tokenizer (str): 用于估算 token 的 tokenizer 配置
+
+    Returns:
+        CallTrace: 调用记录
+    """
+
+    def __init__(self, caller: str, kind: str, provider: str, model: str, tokenizer: str = "auto"):
+        """
+        初始化调用记录 从此刻开始计时
+
+        Args:
+            caller (str): 调用方名称
+            kind (str): 调用类型
+            provider (str): 服务商
+            model (str): 模型名
+            tokenizer (str): tokenizer 配置
+        """
+        self.caller = caller
+        self.kind = kind
+        self.provider = provider
+        self.model = model
+        self.tokenizer = tokenizer
+        self.started = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.last_token: Optional[float] = None
+        self.gaps: List[float] = []
+        self.pieces: List[str] = []
+        self.prompt_messages: Optional[List[Dict[str, Any]]] = None
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.cached = False
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def on_token(self, token: str) -> None:
+        """
+        记录一个输出给调用方的 token
+
+        Args:
+            token (str): token 文本
+
+        Returns:
+            None
+        """
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+        else:
+            self.gaps.append(now - self.last_token)
+        self.last_token = now
+        self.pieces.append(token)
+
+    def on_text(self, text: str) -> None:
+        """
+        记录非流式调用的完整回复 首 token 时间即完成时间
+
+        Args:
+            text (str): 回复文本
+
+        Returns:
+            None
+        """
+        self.first_token = self.last_token = time.perf_counter()
+        if text:
+            self.pieces.append(text)
+
+    def on_usage(self, usage: Any, provider: Optional[str] = None, model: Optional[str] = None) -> None:
+        """
+        记录接口返回的 usage 与实际响应的模型
+
+        对冲与服务商池可能由备用模型完成请求 以实际响应的模型计费
+
+        Args:
+            usage (Any): 接口返回的 usage 对象 可为 None
+            provider (Optional[str]): 实际响应的服务商
+            model (Optional[str]): 实际响应的模型
+
+        Returns:
+            None
+        """
+        if provider:
+            self.provider = provider
+        if model:
+            self.model = model
+        if usage is None:
+            return
+        prompt = getattr(usage, "prompt_tokens", None)
+        completion = getattr(usage, "completion_tokens", None)
+        if prompt is not None:
+            self.prompt_tokens = int(prompt)
+        if completion is not None:
+            self.completion_tokens = int(completion)
+
+    def fail(self, exc: BaseException) -> None:
+        """
+        标记调用失败或被取消
+
+        Args:
+            exc (BaseException): 异常
+
+        Returns:
+            None
+        """
+        if isinstance(exc, (asyncio.CancelledError, GeneratorExit)):
+            self.status = "cancelled"
+        else:
+            self.status = "error"
+            self.error = type(exc).__name__
+
+    def to_dict(self, prices: Dict[str, Any], currency: str) -> Dict[str, Any]:
+        """
+        结束计时并生成调用明细
+
+        Args:
+            prices (Dict[str, Any]): 价格表 模型名 -> {"input": 单价, "output": 单价} 单位为每百万 token
+            currency (str): 币种
+
+        Returns:
+            Dict[str, Any]: 调用明细
+        """
+        finished = time.perf_counter()
+        usage = "reported"
+        if self.cached:
+            prompt_tokens = completion_tokens = 0
+            usage = "cached"
+        else:
+            prompt_tokens, completion_tokens = self.prompt_tokens, self.completion_tokens
+            if prompt_tokens is None or completion_tokens is None:
+                usage = "estimated"
+                counter = get_token_counter(self.tokenizer)
+                if prompt_tokens is None:
+                    prompt_tokens = sum(
+                        counter.count(content if isinstance(content, str) else str(content))
+                        for content in ((m.get("content") or "") for m in self.prompt_messages or [])
+                    )
+                if completion_tokens is None:
+                    completion_tokens = counter.count("".join(self.pieces)) if self.pieces else 0
+
+        price = prices.get(self.model)
+        cost = None
+        if price and not self.cached:
+            cost = round(
+                (prompt_tokens * float(price.get("input", 0)) + completion_tokens * float(price.get("output", 0)))
+                / 1_000_000,
+                6,
+            )
+
+        gaps = sorted(self.gaps)
+        ttft = self.first_token - self.started if self.first_token is not None else None
+        generation = self.last_token - self.first_token if self.first_token is not None else 0.0
+        tokens_per_sec = None
+        if completion_tokens and not self.cached:
+            # 流式调用按首 token 之后的生成时间计算 非流式调用按总耗时计算
+            span = generation if generation > 0 else finished - self.started
+            tokens_per_sec = round(completion_tokens / span, 1) if span > 0 else None
+        return {
+            "caller": self.caller,
+            "kind": self.kind,
+            "provider": self.provider,
+            "model": self.model,
+            "status": self.status,
+            "error": self.error,
+            "cached": self.cached,
+            "ttft_ms": _ms(ttft),
+            "latency_ms": _ms(finished - self.started),
+            "gap_p50_ms": _ms(_percentile(gaps, 0.5)) if gaps else None,
+            "gap_p95_ms": _ms(_percentile(gaps, 0.95)) if gaps else None,
+            "gap_max_ms": _ms(gaps[-1]) if gaps else None,
+            "tokens_per_sec": tokens_per_sec,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "usage": usage,
+            "cost": cost,
+            "currency": currency,
+        }
+
+
+class _Aggregate:
+    """
+    一个聚合维度下的累计统计
+
+    Args:
+        None
+
+    Returns:
+        _Aggregate: 累计统计
+    """
+
+    def __init__(self):
+        """
+        初始化累计统计
+        """
+        self.calls = 0
+        self.errors = 0
+        self.cached = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.priced = 0
+        self.latency = 0.0
+        self.generation_tokens = 0
+        self.generation_seconds = 0.0
+        self.ttft: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self.latencies: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self.gaps: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+
+    def add(self, call: Dict[str, Any]) -> None:
+        """
+        累加一次调用
+
+        Args:
+            call (Dict[str, Any]): 调用明细
+
+        Returns:
+            None
+        """
+        self.calls += 1
+        self.errors += call["status"] == "error"
+        self.cached += bool(call["cached"])
+        self.prompt_tokens += call["prompt_tokens"]
+        self.completion_tokens += call["completion_tokens"]
+        if call["cost"] is not None:
+            self.cost += call["cost"]
+            self.priced += 1
+        self.latency += call["latency_ms"]
+        self.latencies.append(call["latency_ms"])
+        if call["ttft_ms"] is not None and not call["cached"]:
+            self.ttft.append(call["ttft_ms"])
+        if call["gap_p50_ms"] is not None:
+            self.gaps.append(call["gap_p50_ms"])
+        if call["tokens_per_sec"]:
+            self.generation_tokens += call["completion_tokens"]
+            self.generation_seconds += call["completion_tokens"] / call["tokens_per_sec"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        生成统计结果
+
+        Returns:
+            Dict[str, Any]: 调用数 错误与缓存命中数 token 数 费用 TTFT 与总耗时分位数(毫秒) 平均生成速度
+        """
+        ttft = sorted(self.ttft)
+        latencies = sorted(self.latencies)
+        gaps = sorted(self.gaps)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "cached": self.cached,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost": round(self.cost, 6) if self.priced else None,
+            "ttft_p50_ms": round(_percentile(ttft, 0.5), 1),
+            "ttft_p95_ms": round(_percentile(ttft, 0.95), 1),
+            "latency_p50_ms": round(_percentile(latencies, 0.5), 1),
+            "latency_p95_ms": round(_percentile(latencies, 0.95), 1),
+            "avg_latency_ms": round(self.latency / self.calls, 1) if self.calls else 0.0,
+            "gap_p50_ms": round(_percentile(gaps, 0.5), 1),
+            "tokens_per_sec": (
+                round(self.generation_tokens / self.generation_seconds, 1) if self.generation_seconds > 0 else None
+            ),
+        }
+
+
+class LLMTelemetry:
+    """
+    LLM 调用遥测收集器 按会话 模式 调用方与模型聚合
+
+    Args:
+        config (Optional[Dict[str, Any]]): 遥测配置 缺省字段使用 DEFAULT_TELEMETRY_CONFIG
+
+    Returns:
+        LLMTelemetry: 收集器实例
+
+    Examples:
+        >>> telemetry = LLMTelemetry({"prices": {"deepseek-chat": {"input": 0.28, "output": 0.42}}})
+        >>> telemetry.stats()["total"]["calls"]
+        0
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        初始化收集器
+
+        Args:
+            config (Optional[Dict[str, Any]]): 遥测配置
+        """
+        self._lock = threading.Lock()
+        self.config: Dict[str, Any] = dict(DEFAULT_TELEMETRY_CONFIG)
+        self._total = _Aggregate()
+        self._modes: Dict[str, _Aggregate] = {}
+        self._callers: Dict[str, _Aggregate] = {}
+        self._models: Dict[str, _Aggregate] = {}
+        self._sessions: "OrderedDict[str, _Aggregate]" = OrderedDict()
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=int(self.config["recent_calls"]))
+        # 以 400 拒绝 stream_options 的服务商 之后的流式请求不再携带
+        self._usage_unsupported: set = set()
+        self.configure(config)
+
+    def configure(self, config: Optional[Dict[str, Any]]) -> None:
+        """
+        更新遥测配置 已有统计保留
+
+        Args:
+            config (Optional[Dict[str, Any]]): 遥测配置
+
+        Returns:
+            None
+        """
+        merged = dict(DEFAULT_TELEMETRY_CONFIG)
+        merged.update({k: v for k, v in (config or {}).items() if k in DEFAULT_TELEMETRY_CONFIG})
+        merged["prices"] = dict(merged.get("prices") or {})
+        with self._lock:
+            self.config = merged
+            if self._recent.maxlen != int(merged["recent_calls"]):
+                self._recent = deque(self._recent, maxlen=max(int(merged["recent_calls"]), 1))
+
+    @property
+    def enabled(self) -> bool:
+        """
+        遥测是否开启
+
+        Returns:
+            bool: 是否开启
+        """
+        return bool(self.config["enabled"])
+
+    @property
+    def stream_usage(self) -> bool:
+        """
+        流式请求是否请求接口返回 usage
+
+        Returns:
+            bool: 是否在流式请求中携带 stream_options.include_usage
+        """
+        return self.enabled and bool(self.config["stream_usage"])
+
+    def wants_stream_usage(self, provider: str) -> bool:
+        """
+        指定服务商的流式请求是否携带 stream_options.include_usage
+
+        Args:
+            provider (str): 服务商名称
+
+        Returns:
+            bool: stream_usage 开启且该服务商未拒绝过 stream_options 时为 True
+        """
+        return self.stream_usage and provider not in self._usage_unsupported
+
+    def mark_stream_usage_unsupported(self, provider: str) -> None:
+        """
+        记录服务商不支持 stream_options 之后该服务商的 usage 按 tokenizer 估算
+
+        Args:
+            provider (str): 服务商名称
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._usage_unsupported.add(provider)
+
+    def record(self, trace: CallTrace) -> Dict[str, Any]:
+        """
+        结束调用记录并计入聚合统计与当前对话上下文
+
+        Args:
+            trace (CallTrace): 调用记录
+
+        Returns:
+            Dict[str, Any]: 调用明细
+        """
+        call = trace.to_dict(self.config["prices"], str(self.config["currency"]))
+        scope = _scope.get()
+        call["session_id"] = scope.session_id if scope else None
+        call["mode"] = (scope.mode if scope else None) or "other"
+        if scope is not None:
+            scope.calls.append(call)
+        with self._lock:
+            self._total.add(call)
+            self._modes.setdefault(call["mode"], _Aggregate()).add(call)
+            self._callers.setdefault(call["caller"], _Aggregate()).add(call)
+            self._models.setdefault(f"{call['provider']}:{call['model']}", _Aggregate()).add(call)
+            if call["session_id"]:
+                session = self._sessions.pop(call["session_id"], None) or _Aggregate()
+                session.add(call)
+                self._sessions[call["session_id"]] = session
+                while len(self._sessions) > int(self.config["max_sessions"]):
+                    self._sessions.popitem(last=False)
+            self._recent.append(call)
+        return call
+
+    def stats(self, session_id: Optional[str] = None, recent: int = 20) -> Dict[str, Any]:
+        """
+        获取遥测统计
+
+        Args:
+            session_id (Optional[str]): 只返回该会话的统计与最近调用
+            recent (int): 返回的最近调用条数
+
+        Returns:
+            Dict[str, Any]: 合计 按模式 调用方 模型 会话的聚合统计 与最近调用明细
+        """
+        with self._lock:
+            calls = [call for call in self._recent if session_id is None or call["session_id"] == session_id]
+            result: Dict[str, Any] = {
+                "enabled": self.enabled,
+                "currency": self.config["currency"],
+                "recent": calls[-recent:] if recent > 0 else [],
+            }
+            if session_id is not None:
+                session = self._sessions.get(session_id)
+                result["session"] = session.to_dict() if session else _Aggregate().to_dict()
+                return result
+            result.update(
+                {
+                    "total": self._total.to_dict(),
+                    "modes": {name: agg.to_dict() for name, agg in self._modes.items()},
+                    "callers": {name: agg.to_dict() for name, agg in self._callers.items()},
+                    "models": {name: agg.to_dict() for name, agg in self._models.items()},
+                    "sessions": {name: agg.to_dict() for name, agg in reversed(self._sessions.items())},
+                }
+            )
+            return result
+
+
+_scope: ContextVar[Optional[TelemetryScope]] = ContextVar("llm_telemetry_scope", default=None)
+_call: ContextVar[Optional[CallTrace]] = ContextVar("llm_telemetry_call", default=None)
+
+_telemetry = LLMTelemetry()
+
+
+def get_llm_telemetry() -> LLMTelemetry:
+    """
+    获取进程级遥测收集器
+
+    Returns:
+        LLMTelemetry: 收集器单例
+    """
+    return _telemetry
+
+
+def configure_llm_telemetry(config: Optional[Dict[str, Any]]) -> None:
+    """
+    按 config.json 的 llm.telemetry 配置遥测
+
+    Args:
+        config (Optional[Dict[str, Any]]): 遥测配置
+
+    Returns:
+        None
+    """
+    _telemetry.configure(config)
+
+
+@contextmanager
+def telemetry_scope(session_id: Optional[str] = None, mode: Optional[str] = None) -> Iterator[TelemetryScope]:
+    """
+    在当前协程上下文中标记会话与模式 期间的 LLM 调用计入该会话与模式
+
+    上下文内创建的后台任务继承同一上下文 其调用同样计入
+
+    Args:
+        session_id (Optional[str]): 会话标识
+        mode (Optional[str]): 执行模式
+
+    Returns:
+        Iterator[TelemetryScope]: 本轮的遥测上下文
+
+    Examples:
+        >>> with telemetry_scope("session_1", "chat") as scope:
+        ...     await client.chat(messages)
+        >>> scope.summary()["calls"]
+        1
+    """
+    scope = TelemetryScope(session_id, mode)
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+@contextmanager
+def trace_call(
+    caller: str,
+    kind: str,
+    provider: str,
+    model: str,
+    tokenizer: str = "auto",
+    messages: Optional[List[Dict[str, Any]]] = None,
+) -> Iterator[Optional[CallTrace]]:
+    """
+    记录一次 LLM 调用 退出时计入统计
+
+    Args:
+        caller (str): 调用方名称
+        kind (str): 调用类型 chat / stream / tools
+        provider (str): 服务商
+        model (str): 模型名
+        tokenizer (str): 用于估算 token 的 tokenizer 配置
+        messages (Optional[List[Dict[str, Any]]]): 请求消息 接口未返回 usage 时用于估算 prompt token
+
+    Returns:
+        Iterator[Optional[CallTrace]]: 调用记录 遥测关闭时为 None
+    """
+    if not _telemetry.enabled:
+        yield None
+        return
+    trace = CallTrace(caller, kind, provider, model, tokenizer)
+    trace.prompt_messages = messages
+    token = _call.set(trace)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.fail(e)
+        raise
+    finally:
+        try:
+            _call.reset(token)
+        except ValueError:
+            # 流式生成器可能在其他上下文中被关闭 此时无需恢复
+            pass
+        _telemetry.record(trace)
+
+
+def current_call() -> Optional[CallTrace]:
+    """
+    获取当前上下文中正在记录的调用 供底层请求上报 usage 与实际响应的模型
+
+    Returns:
+        Optional[CallTrace]: 调用记录 不在 LLMClient 调用中时为 None
+    """
+    return _call.get()
@@ -0,0 +1,207 @@
+"""
+该模块提供可插拔的 token 计数器
+
+1. `tiktoken`: 本地 BPE 分词器 计数精确 依赖 tiktoken 及其编码文件
+2. `approx`: 按字符类别估算 无任何依赖 作为兜底
+3. `auto`: 优先 tiktoken 不可用时自动退化为 approx
+
+计数器按名称注册 可通过 `register_token_counter` 扩展
+tiktoken 首次使用时会同步下载编码文件 异步代码应通过 `load_token_counter` 在线程中创建计数器
+"""
+
+import asyncio
+import re
+from typing import Callable, Dict, Optional
+
+from utils.logger import logger
+from utils.tokens import MESSAGE_OVERHEAD_TOKENS, TokenCounter
+
+
+# 异步加载计数器的超时(秒) 编码文件下载超时后退化为近似计数
+TOKENIZER_LOAD_TIMEOUT = 10.0
+
+# CJK 统一表意文字 假名 谚文 全角标点 每个字符约计 1 token
+_CJK_RE = re.compile(r"[　-〿぀-ヿ㐀-䶿一-鿿가-힯＀-￯]")
+
+
+class ApproxTokenCounter(TokenCounter):
+    """
+    近似 token 计数器
+
+    CJK 字符按 1 token/字 其余字符按 4 字符/token 估算 中英混排时明显优于纯字符数
+
+    Args:
+        None
+
+    Returns:
+        ApproxTokenCounter: 计数器实例
+
+    Examples:
+    >>> ApproxTokenCounter().count("你好")
+    2
+    """
+
+    name = "approx"
+
+    def count(self, text: str) -> int:
+        """
+        估算文本 token 数
+
+        Args:
+            text (str): 文本
+
+        Returns:
+            int: 估算的 token 数
+        """
+        if not text:
+            return 0
+        cjk = len(_CJK_RE.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+
+class TiktokenCounter(TokenCounter):
+    """
+    基于 tiktoken 的精确计数器
+
+    Args:
+        encoding (str): tiktoken 编码名称
+
+    Returns:
+        TiktokenCounter: 计数器实例
+
+    Raises:
+        ImportError: 未安装 tiktoken 时抛出
+        Exception: 编码文件无法加载(如离线)时抛出
+
+    Examples:
+    >>> TiktokenCounter().count("hello")
+    1
+    """
+
+    name = "tiktoken"
+
+    def __init__(self, encoding: str = "cl100k_base"):
+        """
+        加载编码
+
+        Args:
+            encoding (str): tiktoken 编码名称
+        """
+        import tiktoken
+
+        self._encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        """
+        统计文本 token 数
+
+        Args:
+            text (str): 文本
+
+        Returns:
+            int: token 数
+        """
+        if not text:
+            return 0
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+def _auto_counter() -> TokenCounter:
+    """
+    优先创建 tiktoken 计数器 失败时退化为近似计数
+
+    Returns:
+        TokenCounter: 可用的计数器
+    """
+    try:
+        return TiktokenCounter()
+    except Exception as e:
+        logger.warning(f"⚠️ tiktoken 不可用 使用近似 token 计数: {e}")
+        return ApproxTokenCounter()
+
+
+_FACTORIES: Dict[str, Callable[[], TokenCounter]] = {
+    "auto": _auto_counter,
+    "tiktoken": TiktokenCounter,
+    "approx": ApproxTokenCounter,
+}
+_COUNTERS: Dict[str, TokenCounter] = {}
+
+
+def register_token_counter(name: str, factory: Callable[[], TokenCounter]) -> None:
+    """
+    注册自定义 token 计数器
+
+    Args:
+        name (str): 计数器名称 对应配置中的 tokenizer 字段
+        factory (Callable[[], TokenCounter]): 计数器工厂
+
+    Returns:
+        None
+
+    Examples:
+    >>> register_token_counter("chars", ApproxTokenCounter)
+    """
+    _FACTORIES[name] = factory
+    _COUNTERS.pop(name, None)
+
+
+def get_token_counter(name: Optional[str] = "auto") -> TokenCounter:
+    """
+    按名称获取计数器 实例按名称缓存
+
+    未知名称或创建失败时退化为近似计数器
+
+    Args:
+        name (Optional[str]): 计数器名称 默认为 auto
+
+    Returns:
+        TokenCounter: 计数器实例
+
+    Examples:
+    >>> get_token_counter("approx").name
+    'approx'
+    """
+    name = name or "auto"
+    counter = _COUNTERS.get(name)
+    if counter is not None:
+        return counter
+
+    factory = _FACTORIES.get(name)
+    if factory is None:
+        logger.warning(f"⚠️ 未知的 tokenizer: {name} 使用近似 token 计数")
+        factory = ApproxTokenCounter
+    try:
+        counter = factory()
+    except Exception as e:
+        logger.warning(f"⚠️ tokenizer {name} 初始化失败 使用近似 token 计数: {e}")
+        counter = ApproxTokenCounter()
+    # 已有实例(如加载超时后的近似计数器)时保留 同一进程内计数口径不变
+    return _COUNTERS.setdefault(name, counter)
+
+
+async def load_token_counter(name: Optional[str] = "auto", timeout: float = TOKENIZER_LOAD_TIMEOUT) -> TokenCounter:
+    """
+    在线程中获取计数器 避免 tiktoken 下载编码文件时阻塞事件循环
+
+    超时后该名称固定使用近似计数器 后台线程完成加载也不再替换
+
+    Args:
+        name (Optional[str]): 计数器名称 默认为 auto
+        timeout (float): 等待创建的秒数
+
+    Returns:
+        TokenCounter: 计数器实例
+
+    Examples:
+    >>> counter = await load_token_counter("auto")
+    """
+    name = name or "auto"
+    counter = _COUNTERS.get(name)
+    if counter is not None:
+        return counter
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(get_token_counter, name), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"⚠️ tokenizer {name} 加载超过 {timeout:g} 秒 使用近似 token 计数")
+        return _COUNTERS.setdefault(name, ApproxTokenCounter())
@@ -3,15 +3,31 @@ Memory 模块 - 会话管理
 
 结构：
 - schema.py: 数据模型（Session, Message, CompressionHistory）
-- manager.py: 会话管理器（CRUD 操作）
-- compressor.py: 上下文压缩器（LLM 智能压缩）
+- manager.py: 会话管理器（CRUD 操作 + 写时复制分支）
+- compressor.py: 上下文压缩器（LLM 智能压缩 + 对话后后台调度）
+- journal.py: 会话追加日志（增量保存 + 后台压实）
+- cache.py: 有界会话缓存（LRU + 休眠）
+- catalog.py: 会话目录索引（SQLite 分页列表）
+- search.py: 全文检索索引（SQLite FTS5 跨会话检索）
+- archive.py: 冷会话归档（单文件压缩 + 透明还原）
+- transfer.py: 会话导出导入（NDJSON 流式备份与迁移）
+- embedding.py: 文本向量化（接口嵌入 + 本地哈希兜底）
+- longterm.py: 跨会话长期记忆（向量索引 + 语义检索）
+- persister.py: 后台写回队列（保存合并 + 后台落盘）
+- message_index.py: 消息偏移索引（游标分页读取）
+- codec.py: 快照编解码（JSON / 紧凑 JSON / msgpack 自动识别）
 
 存储结构：
 sessions/
+├── catalog.db              # 会话目录索引（可重建）
+├── search.db               # 全文检索索引（可重建）
 └── {session_id}/
-    ├── session.json        # 会话元信息
-    ├── messages.json       # 完整对话历史
-    └── compression.json    # 压缩记录
+    ├── session.json        # 会话元信息（快照）
+    ├── messages.json       # 完整对话历史（快照 msgpack 格式为 messages.msgpack）
+    ├── messages.idx        # 消息字节偏移索引（随快照生成）
+    ├── compression.json    # 压缩记录（快照）
+    ├── journal.jsonl       # 追加日志（快照之后的增量）
+    └── archive.json.gz     # 归档文件（归档后替代上述明文快照与日志）
 """
 from memory.schema import (
     Session,
@@ -22,11 +38,14 @@ from memory.schema import (
     SystemMessage,
     CompressionRecord,
     CompressionHistory,
+    CompressionPlan,
     AgentStatus,
     AgentRuntimeState,
 )
 from memory.manager import SessionManager
-from memory.compressor import Compressor
+from memory.search import SearchIndex
+from memory.longterm import LongTermMemory
+from memory.compressor import Compressor, CompressionScheduler
 
 __all__ = [
     # 数据模型
@@ -38,9 +57,13 @@ __all__ = [
     "SystemMessage",
     "CompressionRecord",
     "CompressionHistory",
+    "CompressionPlan",
     "AgentStatus",
     "AgentRuntimeState",
     # 管理器
     "SessionManager",
+    "SearchIndex",
+    "LongTermMemory",
     "Compressor",
+    "CompressionScheduler",
 ]
\ No newline at end of file
@@ -0,0 +1,309 @@
+"""
+冷会话归档模块
+
+长期未更新的会话将消息历史与压缩记录打包为单个压缩文件 释放 messages.json 等快照文件
+session.json 保留在原目录并记录归档信息 会话列表 目录索引重建无需解压
+
+归档文件格式:
+    {"version": 1, "messages": [...], "compression": {...}}
+
+压缩算法:
+- gzip: 标准库实现 默认
+- zstd: 需要安装 zstandard 未安装时退化为 gzip
+
+用法(在仓库根目录执行):
+    python -m memory.archive --days 30 [--codec zstd] [--dir sessions_dir]
+"""
+
+import gzip
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from memory.codec import COMPRESSION_STEM, MESSAGES_STEM, read_snapshot, snapshot_filenames
+from memory.journal import SessionJournal
+from utils.logger import logger
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 可选依赖
+    zstandard = None
+
+
+ARCHIVE_VERSION = 1
+ARCHIVE_STEM = "archive.json"
+# session.json 中记录归档信息的字段
+ARCHIVE_META_KEY = "archived"
+DEFAULT_CODEC = "gzip"
+
+# 归档后删除的快照文件(各种格式) journal 由 SessionJournal.reset 清理
+HOT_FILES = (*snapshot_filenames(MESSAGES_STEM), "messages.idx", *snapshot_filenames(COMPRESSION_STEM))
+
+
+def _zstd_compress(data: bytes, level: int) -> bytes:
+    """
+    zstd 压缩
+
+    Args:
+        data (bytes): 原始数据
+        level (int): 压缩级别
+
+    Returns:
+        bytes: 压缩后的数据
+    """
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    """
+    zstd 解压
+
+    Args:
+        data (bytes): 压缩数据
+
+    Returns:
+        bytes: 原始数据
+    """
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# 名称 -> (文件后缀, 默认级别, 压缩函数, 解压函数)
+_CODECS: Dict[str, Tuple[str, int, Callable[[bytes, int], bytes], Callable[[bytes], bytes]]] = {
+    "gzip": (".gz", 6, lambda data, level: gzip.compress(data, compresslevel=level, mtime=0), gzip.decompress),
+}
+if zstandard is not None:
+    _CODECS["zstd"] = (".zst", 10, _zstd_compress, _zstd_decompress)
+
+
+def available_codecs() -> List[str]:
+    """
+    获取当前环境可用的压缩算法
+
+    Returns:
+        List[str]: 算法名称列表
+
+    Examples:
+        >>> "gzip" in available_codecs()
+        True
+    """
+    return list(_CODECS)
+
+
+def resolve_codec(name: Optional[str]) -> str:
+    """
+    校验压缩算法名称 不可用时退化为 gzip
+
+    Args:
+        name (Optional[str]): 配置中的算法名称
+
+    Returns:
+        str: 可用的算法名称
+    """
+    name = (name or DEFAULT_CODEC).lower()
+    if name not in _CODECS:
+        logger.warning(f"⚠️ 归档压缩算法 {name} 不可用 使用 {DEFAULT_CODEC}")
+        return DEFAULT_CODEC
+    return name
+
+
+def find_archive(session_dir: Path) -> Optional[Path]:
+    """
+    查找会话目录中的归档文件
+
+    Args:
+        session_dir (Path): 会话目录
+
+    Returns:
+        Optional[Path]: 归档文件路径 未归档返回 None
+    """
+    for suffix, _, _, _ in _CODECS.values():
+        path = session_dir / (ARCHIVE_STEM + suffix)
+        if path.exists():
+            return path
+    # 由其他环境写出但当前未安装对应依赖的归档 仍需识别 以便给出明确错误
+    for path in session_dir.glob(ARCHIVE_STEM + ".*"):
+        if not path.name.endswith(".tmp"):
+            return path
+    return None
+
+
+def read_archive(path: Path) -> Dict[str, Any]:
+    """
+    读取并解压归档文件
+
+    Args:
+        path (Path): 归档文件路径
+
+    Returns:
+        Dict[str, Any]: 包含 messages 与 compression 的字典
+
+    Raises:
+        ValueError: 归档使用的压缩算法在当前环境不可用时抛出
+    """
+    for suffix, _, _, decompress in _CODECS.values():
+        if path.name == ARCHIVE_STEM + suffix:
+            return json.loads(decompress(path.read_bytes()).decode("utf-8"))
+    raise ValueError(f"不支持的归档文件: {path.name} (可用算法: {', '.join(_CODECS)})")
+
+
+def read_session_files(session_dir: Path) -> Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    读取会话目录的快照(自动识别格式)并回放追加日志 不反序列化消息对象
+
+    Args:
+        session_dir (Path): 会话目录
+
+    Returns:
+        Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any]]: 元信息 消息字典列表 压缩历史字典
+    """
+    meta = json.loads((session_dir / "session.json").read_text(encoding="utf-8"))
+    messages: List[Dict[str, Any]] = read_snapshot(session_dir, MESSAGES_STEM) or []
+    compression: Dict[str, Any] = read_snapshot(session_dir, COMPRESSION_STEM) or {"records": []}
+
+    records = compression.setdefault("records", [])
+    for record in SessionJournal(session_dir).replay():
+        op = record.get("op")
+        if op == "append" and record.get("index", len(messages)) == len(messages):
+            messages.append(record["message"])
+        elif op == "compression":
+            offset = record.get("offset", len(records))
+            for i, data in enumerate(record.get("records", [])):
+                if offset + i == len(records):
+                    # 与 CompressionHistory.add_record 一致 同步更新汇总字段
+                    records.append(data)
+                    compression["current_summary"] = data.get("summary", "")
+                    compression["last_compression_time"] = data.get("compressed_at")
+                    compression["total_compressions"] = compression.get("total_compressions", 0) + 1
+        elif op == "meta":
+            meta.update({k: v for k, v in record.get("data", {}).items() if k != "session_id"})
+    return meta, messages, compression
+
+
+def write_archive(
+    session_dir: Path,
+    meta: Dict[str, Any],
+    messages: List[Dict[str, Any]],
+    compression: Dict[str, Any],
+    codec: str = DEFAULT_CODEC,
+    level: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    写出归档文件并在 session.json 中记录归档信息
+
+    先原子写出归档与元信息并 fsync 文件与目录 再删除明文快照 中途退出时两份数据同时存在 加载时以归档为准
+
+    Args:
+        session_dir (Path): 会话目录
+        meta (Dict[str, Any]): 会话元信息
+        messages (List[Dict[str, Any]]): 消息字典列表
+        compression (Dict[str, Any]): 压缩历史字典
+        codec (str): 压缩算法
+        level (Optional[int]): 压缩级别 None 表示使用算法默认值
+
+    Returns:
+        Dict[str, Any]: 归档信息 包含压缩前后字节数
+    """
+    suffix, default_level, compress, _ = _CODECS[codec]
+    hot_bytes = sum(
+        path.stat().st_size
+        for path in session_dir.iterdir()
+        if path.is_file() and path.name != "session.json"
+    )
+    payload = json.dumps(
+        {"version": ARCHIVE_VERSION, "messages": messages, "compression": compression},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    data = compress(payload, default_level if level is None else level)
+
+    archive_path = session_dir / (ARCHIVE_STEM + suffix)
+    tmp_path = archive_path.with_name(archive_path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, archive_path)
+
+    info = {
+        "codec": codec,
+        "message_count": len(messages),
+        "raw_bytes": hot_bytes,
+        "archived_bytes": len(data),
+    }
+    meta = {**meta, ARCHIVE_META_KEY: info}
+    _write_json(session_dir / "session.json", meta)
+    # 快照删除后归档是唯一副本 删除前确保归档与重命名已落盘
+    _fsync_dir(session_dir)
+
+    for name in HOT_FILES:
+        path = session_dir / name
+        if path.exists():
+            path.unlink()
+    return info
+
+
+def _write_json(path: Path, data: Any) -> None:
+    """
+    原子写入 JSON 文件
+
+    Args:
+        path (Path): 目标文件路径
+        data (Any): 可序列化数据
+
+    Returns:
+        None
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _fsync_dir(path: Path) -> None:
+    """
+    fsync 目录 使其中的重命名落盘
+
+    Windows 不支持打开目录 此时跳过
+
+    Args:
+        path (Path): 目录路径
+
+    Returns:
+        None
+    """
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # 仓库根目录 用于定位默认的数据目录 模块需以 python -m 方式运行
+    root = Path(__file__).parent.parent
+
+    parser = argparse.ArgumentParser(description="EmaAgent 冷会话归档工具")
+    parser.add_argument("--days", type=float, default=30, help="超过该天数未更新的会话被归档")
+    parser.add_argument("--codec", default=DEFAULT_CODEC, help=f"压缩算法 可选: {', '.join(_CODECS)}")
+    parser.add_argument("--dir", dest="sessions_dir", help="会话根目录 默认使用 data/sessions")
+    args = parser.parse_args()
+
+    if args.sessions_dir:
+        sessions_dir = Path(args.sessions_dir)
+    else:
+        from config.paths import init_paths
+
+        sessions_dir = init_paths(root).sessions_dir
+
+    from memory.manager import SessionManager
+
+    manager = SessionManager(sessions_dir, archive_codec=args.codec, write_behind=False)
+    print(manager.archive_cold_sessions(days=args.days))
+    manager.close()
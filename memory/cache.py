@@ -0,0 +1,411 @@
+"""
+会话缓存模块
+
+该模块提供按会话数量与近似内存占用双重限制的 LRU 会话缓存
+被淘汰的空闲会话会写回磁盘 仅在内存中保留对象弱引用(休眠)
+淘汰回调在释放缓存锁之后调用 回调可以安全地获取其他锁
+"""
+
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from memory.schema import Message, Session
+
+
+# 单条消息除正文外的近似固定开销(对象头 字段 时间戳字符串等)
+MESSAGE_OVERHEAD_BYTES = 600
+# 单个 tool_call 结构的近似开销
+TOOL_CALL_OVERHEAD_BYTES = 512
+# 会话对象本身与压缩历史的近似固定开销
+SESSION_OVERHEAD_BYTES = 2048
+
+
+def estimate_message_bytes(message: Message) -> int:
+    """
+    估算单条消息的内存占用
+
+    Args:
+        message (Message): 消息对象
+
+    Returns:
+        int: 近似字节数
+
+    Examples:
+        >>> estimate_message_bytes(Message(role="user", content="hi")) > 0
+        True
+    """
+    size = MESSAGE_OVERHEAD_BYTES + sys.getsizeof(message.content or "")
+    if message.tool_calls:
+        size += TOOL_CALL_OVERHEAD_BYTES * len(message.tool_calls)
+    return size
+
+
+@dataclass
+class _CacheEntry:
+    """
+    常驻缓存条目
+
+    Args:
+        session (Session): 会话对象
+        counted_messages (int): 已计入 size 的消息条数
+        size (int): 近似字节数
+    """
+    session: Session
+    counted_messages: int = 0
+    size: int = SESSION_OVERHEAD_BYTES
+
+
+@dataclass
+class _HibernatedEntry:
+    """
+    休眠条目
+
+    只保留对象弱引用 若对象仍被其他请求持有则可直接唤醒同一对象
+
+    Args:
+        ref (weakref.ref): 会话对象弱引用
+    """
+    ref: "weakref.ref[Session]"
+
+
+class SessionCache:
+    """
+    有界会话缓存
+
+    兼容原 `Dict[str, Session]` 的常用操作(in / [] / del / pop / clear)
+    超出会话数或近似字节上限时按 LRU 淘汰 淘汰后通过 on_evict 回调写回磁盘
+    回调在释放缓存锁之后执行 期间会话仍可通过弱引用唤醒
+
+    Args:
+        max_sessions (int): 常驻会话数量上限
+        max_bytes (int): 常驻会话近似内存上限(字节)
+        max_hibernated (int): 休眠条目上限
+        on_evict (Optional[Callable[[Session], None]]): 淘汰回调 用于落盘
+
+    Returns:
+        SessionCache: SessionCache 实例
+
+    Examples:
+        >>> cache = SessionCache(max_sessions=2)
+        >>> cache["a"] = Session("a")
+        >>> "a" in cache
+        True
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 64,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_hibernated: int = 10000,
+        on_evict: Optional[Callable[[Session], None]] = None,
+    ):
+        """
+        初始化缓存
+
+        Args:
+            max_sessions (int): 常驻会话数量上限
+            max_bytes (int): 常驻会话近似内存上限(字节)
+            max_hibernated (int): 休眠条目上限
+            on_evict (Optional[Callable[[Session], None]]): 淘汰回调
+        """
+        self.max_sessions = max(1, int(max_sessions))
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_hibernated = max(0, int(max_hibernated))
+        self.on_evict = on_evict
+
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._hibernated: "OrderedDict[str, _HibernatedEntry]" = OrderedDict()
+        self._bytes = 0
+        # 缓存可能被后台线程(持久化 压实)访问 统一加锁
+        self._lock = threading.RLock()
+
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.wakeups = 0
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """
+        获取会话并刷新 LRU 顺序
+
+        常驻命中直接返回 休眠条目的对象若仍存活则唤醒为常驻 否则记为未命中
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            Optional[Session]: 命中的会话对象 未命中返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return entry.session
+
+            session, evicted = self._wake(session_id)
+            if session is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.wakeups += 1
+
+        self._notify_evicted(evicted)
+        return session
+
+    def put(self, session_id: str, session: Session) -> None:
+        """
+        放入会话并执行容量约束
+
+        Args:
+            session_id (str): 会话ID
+            session (Session): 会话对象
+
+        Returns:
+            None
+        """
+        with self._lock:
+            evicted = self._put_locked(session_id, session)
+        self._notify_evicted(evicted)
+
+    def refresh(self, session_id: str) -> None:
+        """
+        重新计算会话占用 会话在使用中增长后调用
+
+        只计算新增消息 历史被裁剪时才全量重算
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            None
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            self._bytes -= entry.size
+            self._account(entry)
+            self._bytes += entry.size
+            evicted = self._enforce_limits(keep=session_id)
+        self._notify_evicted(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        导出缓存统计
+
+        Args:
+            None
+
+        Returns:
+            Dict[str, Any]: 命中 未命中 淘汰 唤醒计数与当前容量
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "wakeups": self.wakeups,
+                "resident_sessions": len(self._entries),
+                "resident_bytes": self._bytes,
+                "hibernated_sessions": len(self._hibernated),
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _account(self, entry: _CacheEntry) -> None:
+        """
+        增量更新条目的近似字节数
+
+        Args:
+            entry (_CacheEntry): 缓存条目
+
+        Returns:
+            None
+        """
+        session = entry.session
+        messages = session.messages
+        if len(messages) < entry.counted_messages:
+            entry.counted_messages = 0
+            entry.size = SESSION_OVERHEAD_BYTES
+        # 分支会话与父会话共享前缀消息对象 只计入自有消息
+        base = session.branch_point if session.parent_id is not None else 0
+        for message in messages[max(entry.counted_messages, base):]:
+            entry.size += estimate_message_bytes(message)
+        entry.counted_messages = len(messages)
+
+    def _put_locked(self, session_id: str, session: Session) -> List[Session]:
+        """
+        放入会话并执行容量约束 调用方需持有锁
+
+        Args:
+            session_id (str): 会话ID
+            session (Session): 会话对象
+
+        Returns:
+            List[Session]: 被淘汰的会话 由调用方在释放锁后交给 on_evict
+        """
+        old = self._entries.pop(session_id, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._hibernated.pop(session_id, None)
+
+        entry = _CacheEntry(session=session)
+        self._account(entry)
+        self._entries[session_id] = entry
+        self._bytes += entry.size
+        return self._enforce_limits(keep=session_id)
+
+    def _wake(self, session_id: str) -> Tuple[Optional[Session], List[Session]]:
+        """
+        唤醒仍被外部持有的休眠会话 调用方需持有锁
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            Tuple[Optional[Session], List[Session]]: 存活的会话对象(已被回收为 None) 与因唤醒而被淘汰的会话
+        """
+        hibernated = self._hibernated.get(session_id)
+        if hibernated is None:
+            return None, []
+        session = hibernated.ref()
+        if session is None:
+            return None, []
+        return session, self._put_locked(session_id, session)
+
+    def _enforce_limits(self, keep: Optional[str] = None) -> List[Session]:
+        """
+        按 LRU 淘汰直到满足数量与字节上限 调用方需持有锁
+
+        Args:
+            keep (Optional[str]): 本次访问的会话ID 不参与淘汰
+
+        Returns:
+            List[Session]: 被淘汰的会话
+        """
+        evicted: List[Session] = []
+        while self._entries and (
+            len(self._entries) > self.max_sessions
+            or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            victim_id = next(iter(self._entries))
+            if victim_id == keep:
+                # 唯一剩余的就是当前会话 即使超出字节上限也保留
+                if len(self._entries) == 1:
+                    break
+                self._entries.move_to_end(victim_id)
+                continue
+            evicted.append(self._evict(victim_id))
+        return evicted
+
+    def _evict(self, session_id: str) -> Session:
+        """
+        淘汰单个会话: 转为休眠条目 调用方需持有锁
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            Session: 被淘汰的会话对象 落盘由 _notify_evicted 在锁外完成
+        """
+        entry = self._entries.pop(session_id)
+        self._bytes -= entry.size
+        self.evictions += 1
+
+        session = entry.session
+        if self.max_hibernated:
+            self._hibernated[session_id] = _HibernatedEntry(ref=weakref.ref(session))
+            while len(self._hibernated) > self.max_hibernated:
+                self._hibernated.popitem(last=False)
+        return session
+
+    def _notify_evicted(self, sessions: List[Session]) -> None:
+        """
+        对被淘汰的会话调用 on_evict 必须在释放缓存锁之后调用
+
+        回调通常需要获取管理器的写锁 在缓存锁内调用会与持有写锁后刷新缓存的保存路径形成锁顺序反转
+
+        Args:
+            sessions (List[Session]): 被淘汰的会话
+
+        Returns:
+            None
+        """
+        if self.on_evict is None:
+            return
+        for session in sessions:
+            self.on_evict(session)
+
+    # ---- Dict 兼容接口 供服务层沿用原有 `_cache` 用法 ----
+
+    def __contains__(self, session_id: object) -> bool:
+        with self._lock:
+            if session_id in self._entries:
+                return True
+            hibernated = self._hibernated.get(session_id)  # type: ignore[arg-type]
+            return hibernated is not None and hibernated.ref() is not None
+
+    def __getitem__(self, session_id: str) -> Session:
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def __setitem__(self, session_id: str, session: Session) -> None:
+        self.put(session_id, session)
+
+    def __delitem__(self, session_id: str) -> None:
+        if self.pop(session_id, None) is None:
+            raise KeyError(session_id)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._entries))
+
+    def pop(self, session_id: str, default: Any = None) -> Any:
+        """
+        移除会话(常驻与休眠) 不触发落盘
+
+        Args:
+            session_id (str): 会话ID
+            default (Any): 不存在时的返回值
+
+        Returns:
+            Any: 被移除的会话对象 或 default
+        """
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            hibernated = self._hibernated.pop(session_id, None)
+            if entry is not None:
+                self._bytes -= entry.size
+                return entry.session
+            if hibernated is not None:
+                session = hibernated.ref()
+                if session is not None:
+                    return session
+            return default
+
+    def clear(self) -> None:
+        """
+        清空缓存(常驻与休眠) 不触发落盘
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._entries.clear()
+            self._hibernated.clear()
+            self._bytes = 0
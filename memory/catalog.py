@@ -0,0 +1,346 @@
+"""
+会话目录索引模块
+
+该模块使用内置 SQLite 维护全部会话的元信息索引
+会话列表接口只查询索引 不再读取任何消息文件
+
+用法(在仓库根目录执行):
+    python -m memory.catalog --rebuild [sessions_dir]
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from memory.archive import ARCHIVE_META_KEY
+from memory.codec import MESSAGES_STEM, find_snapshot, read_snapshot
+from memory.journal import SessionJournal
+from memory.message_index import MessageFileIndex
+from utils.logger import logger
+
+
+CATALOG_FILE = "catalog.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    parent_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at DESC);
+"""
+
+# 旧版本索引缺少的列 打开时补齐
+_MIGRATIONS = {
+    "parent_id": "ALTER TABLE sessions ADD COLUMN parent_id TEXT",
+}
+
+
+class SessionCatalog:
+    """
+    会话目录索引
+
+    在会话创建 保存 重命名 删除时同步更新 支持按更新时间排序的分页查询
+    索引是可重建的派生数据 使用 WAL + synchronous=NORMAL 避免每次提交 fsync
+
+    Args:
+        storage_path (Path): 会话根目录 索引文件位于其下的 catalog.db
+
+    Returns:
+        SessionCatalog: SessionCatalog 实例
+
+    Examples:
+        >>> catalog = SessionCatalog(Path("./data/sessions"))
+        >>> catalog.count()
+        0
+    """
+
+    def __init__(self, storage_path: Path):
+        """
+        打开或创建索引数据库
+
+        Args:
+            storage_path (Path): 会话根目录
+        """
+        self.storage_path = Path(storage_path)
+        self.db_path = self.storage_path / CATALOG_FILE
+        # 新建索引时由调用方决定是否从现有目录重建
+        self.created = not self.db_path.exists()
+
+        # 保存可能来自后台线程 共享连接并用锁串行化
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+            for column, statement in _MIGRATIONS.items():
+                if column not in columns:
+                    self._conn.execute(statement)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_parent_id ON sessions(parent_id)")
+            self._conn.commit()
+
+    def upsert(self, meta: Dict[str, Any], message_count: int) -> None:
+        """
+        写入或更新单个会话条目
+
+        Args:
+            meta (Dict[str, Any]): 会话元信息 需包含 session_id created_at updated_at 分支会话带 parent_id
+            message_count (int): 消息条数 分支会话包含共享的前缀
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO sessions (session_id, created_at, updated_at, message_count, parent_id)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    created_at = excluded.created_at,
+                    updated_at = excluded.updated_at,
+                    message_count = excluded.message_count,
+                    parent_id = excluded.parent_id
+                """,
+                (
+                    meta["session_id"],
+                    str(meta.get("created_at", "")),
+                    str(meta.get("updated_at", "")),
+                    int(message_count),
+                    meta.get("parent_id"),
+                ),
+            )
+            self._conn.commit()
+
+    def rename(self, old_id: str, new_id: str) -> None:
+        """
+        重命名会话条目 并同步其分支的父会话ID
+
+        Args:
+            old_id (str): 原会话ID
+            new_id (str): 新会话ID
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (new_id,))
+            self._conn.execute(
+                "UPDATE sessions SET session_id = ? WHERE session_id = ?",
+                (new_id, old_id),
+            )
+            self._conn.execute(
+                "UPDATE sessions SET parent_id = ? WHERE parent_id = ?",
+                (new_id, old_id),
+            )
+            self._conn.commit()
+
+    def remove(self, session_id: str) -> None:
+        """
+        删除会话条目
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查询单个会话条目
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            Optional[Dict[str, Any]]: 会话条目 不存在返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def list(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        按更新时间倒序分页列出会话
+
+        Args:
+            offset (int): 跳过条数
+            limit (Optional[int]): 返回条数上限 None 表示不限制
+
+        Returns:
+            List[Dict[str, Any]]: 会话条目列表
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM sessions ORDER BY updated_at DESC, session_id LIMIT ? OFFSET ?",
+                (-1 if limit is None else max(0, int(limit)), max(0, int(offset))),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_stale(self, cutoff: str) -> List[str]:
+        """
+        列出更新时间早于 cutoff 的会话
+
+        Args:
+            cutoff (str): ISO 格式时间
+
+        Returns:
+            List[str]: 按更新时间升序的会话ID列表
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id FROM sessions WHERE updated_at < ? ORDER BY updated_at",
+                (cutoff,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def children(self, session_id: str) -> List[str]:
+        """
+        列出直接从该会话分叉出的分支
+
+        Args:
+            session_id (str): 父会话ID
+
+        Returns:
+            List[str]: 分支会话ID列表
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id FROM sessions WHERE parent_id = ? ORDER BY session_id",
+                (session_id,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self) -> int:
+        """
+        统计会话总数
+
+        Returns:
+            int: 会话条目数
+        """
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def rebuild(self) -> int:
+        """
+        扫描会话目录重建索引
+
+        读取每个会话的快照与追加日志 得到与加载后一致的元信息和消息条数
+
+        Returns:
+            int: 重建后的会话条目数
+        """
+        entries = []
+        for item in self.storage_path.iterdir():
+            session_file = item / "session.json"
+            if not item.is_dir() or not session_file.exists():
+                continue
+            try:
+                entries.append(_read_summary(item))
+            except Exception as e:
+                logger.warning(f"⚠️ 重建索引时跳过会话 {item.name}: {e}")
+
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions")
+            self._conn.executemany(
+                "INSERT INTO sessions (session_id, created_at, updated_at, message_count, parent_id) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        meta["session_id"],
+                        str(meta.get("created_at", "")),
+                        str(meta.get("updated_at", "")),
+                        count,
+                        meta.get("parent_id"),
+                    )
+                    for meta, count in entries
+                ],
+            )
+            self._conn.commit()
+
+        logger.info(f"📇 会话索引重建完成: {len(entries)} 个会话")
+        return len(entries)
+
+    def close(self) -> None:
+        """
+        关闭数据库连接
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._conn.close()
+
+
+def _read_summary(session_dir: Path) -> Tuple[Dict[str, Any], int]:
+    """
+    读取会话目录的元信息与消息条数 不反序列化消息对象
+
+    Args:
+        session_dir (Path): 会话目录
+
+    Returns:
+        Tuple[Dict[str, Any], int]: 回放日志后的元信息与消息条数 分支会话包含共享的前缀
+    """
+    meta = json.loads((session_dir / "session.json").read_text(encoding="utf-8"))
+    # 分支会话只落盘分支点之后的消息 父会话信息只记录在 session.json 中
+    base = int(meta.get("branch_point", 0)) if meta.get("parent_id") is not None else 0
+    # 已归档的会话在元信息中记录消息条数 无需解压
+    archived = meta.pop(ARCHIVE_META_KEY, None)
+    if archived is not None:
+        meta["session_id"] = session_dir.name
+        return meta, base + int(archived.get("message_count", 0))
+
+    count = 0
+    messages_file = find_snapshot(session_dir, MESSAGES_STEM)
+    if messages_file is not None:
+        # 偏移索引头中记录了消息条数 有效时无需解析快照
+        file_index = MessageFileIndex.load(messages_file)
+        count = file_index.count if file_index is not None else len(read_snapshot(session_dir, MESSAGES_STEM) or [])
+
+    for record in SessionJournal(session_dir).replay():
+        op = record.get("op")
+        if op == "append" and record.get("index", count) == count:
+            count += 1
+        elif op == "meta":
+            meta.update(record.get("data", {}))
+
+    # session_id 以目录为准
+    meta["session_id"] = session_dir.name
+    return meta, base + count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # 仓库根目录 用于定位默认的数据目录 模块需以 python -m 方式运行
+    root = Path(__file__).parent.parent
+
+    parser = argparse.ArgumentParser(description="EmaAgent 会话索引工具")
+    parser.add_argument("sessions_dir", nargs="?", help="会话根目录 默认使用 data/sessions")
+    parser.add_argument("--rebuild", action="store_true", help="扫描会话目录重建索引")
+    args = parser.parse_args()
+
+    if args.sessions_dir:
+        sessions_dir = Path(args.sessions_dir)
+    else:
+        from config.paths import init_paths
+
+        sessions_dir = init_paths(root).sessions_dir
+
+    catalog = SessionCatalog(sessions_dir)
+    if args.rebuild:
+        catalog.rebuild()
+    print(f"会话总数: {catalog.count()}")
+    catalog.close()
@@ -0,0 +1,447 @@
+"""
+会话快照编解码模块
+
+messages 与 compression 快照的序列化格式可配置:
+- json: 两格缩进 JSON 便于人工查看与调试 与旧版本格式一致
+- json_compact: 无缩进 JSON 安装 orjson 时由 orjson 编解码
+- msgpack: 二进制格式 需要安装 msgpack 未安装时退化为 json_compact
+
+文件名按格式区分(messages.json / messages.msgpack) 读取时按目录中实际存在的文件识别格式 与当前配置无关
+session.json 体积固定且被目录索引等多处直接读取 始终保持 JSON
+
+用法(在仓库根目录执行):
+    python -m memory.codec --to msgpack [--dir sessions_dir]
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from utils.logger import logger
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    msgpack = None
+
+
+DEFAULT_SNAPSHOT_CODEC = "json"
+# 快照文件主名 后缀由编解码器决定
+MESSAGES_STEM = "messages"
+COMPRESSION_STEM = "compression"
+
+
+class SnapshotCodec:
+    """
+    快照编解码器基类
+
+    dump_items 同时返回每个元素在输出中的 (偏移, 长度) 供 messages.idx 定位单条消息
+
+    Args:
+        None
+
+    Returns:
+        SnapshotCodec: 编解码器实例
+
+    Examples:
+        >>> codec = get_snapshot_codec("json_compact")
+        >>> codec.loads(codec.dumps({"a": 1}))
+        {'a': 1}
+    """
+
+    name = ""
+    suffix = ""
+
+    def filename(self, stem: str) -> str:
+        """
+        获取快照文件名
+
+        Args:
+            stem (str): 文件主名 如 messages
+
+        Returns:
+            str: 带后缀的文件名
+        """
+        return stem + self.suffix
+
+    def dumps(self, data: Any) -> bytes:
+        """
+        序列化任意数据
+
+        Args:
+            data (Any): 可序列化数据
+
+        Returns:
+            bytes: 序列化结果
+        """
+        raise NotImplementedError
+
+    def loads(self, raw: bytes) -> Any:
+        """
+        反序列化完整文件或单个元素
+
+        Args:
+            raw (bytes): 序列化数据
+
+        Returns:
+            Any: 反序列化结果
+        """
+        raise NotImplementedError
+
+    def dump_items(self, items: Sequence[Any]) -> Tuple[bytes, List[Tuple[int, int]]]:
+        """
+        序列化列表 并记录每个元素的字节位置
+
+        Args:
+            items (Sequence[Any]): 元素列表
+
+        Returns:
+            Tuple[bytes, List[Tuple[int, int]]]: 序列化结果与每个元素的 (偏移, 长度)
+        """
+        raise NotImplementedError
+
+
+class JsonCodec(SnapshotCodec):
+    """
+    JSON 编解码器
+
+    Args:
+        indent (Optional[int]): 缩进 None 表示紧凑格式
+
+    Returns:
+        JsonCodec: 编解码器实例
+    """
+
+    suffix = ".json"
+
+    def __init__(self, indent: Optional[int]):
+        """
+        初始化编解码器
+
+        Args:
+            indent (Optional[int]): 缩进 None 表示紧凑格式
+        """
+        self.indent = indent
+        self.name = "json" if indent else "json_compact"
+
+    def dumps(self, data: Any) -> bytes:
+        """
+        序列化为 UTF-8 JSON 中文不转义
+
+        Args:
+            data (Any): 可序列化数据
+
+        Returns:
+            bytes: JSON 字节串
+        """
+        if orjson is not None:
+            try:
+                return orjson.dumps(data, option=orjson.OPT_INDENT_2 if self.indent else 0)
+            except TypeError:
+                # orjson 不支持的类型(如超出 64 位的整数) 交给标准库处理
+                pass
+        separators = None if self.indent else (",", ":")
+        return json.dumps(data, ensure_ascii=False, indent=self.indent, separators=separators).encode("utf-8")
+
+    def loads(self, raw: bytes) -> Any:
+        """
+        解析 JSON 缩进与紧凑格式均可读取
+
+        Args:
+            raw (bytes): JSON 字节串
+
+        Returns:
+            Any: 解析结果
+        """
+        if orjson is not None:
+            return orjson.loads(raw)
+        return json.loads(raw)
+
+    def dump_items(self, items: Sequence[Any]) -> Tuple[bytes, List[Tuple[int, int]]]:
+        """
+        逐个序列化元素后拼接为 JSON 数组
+
+        缩进格式与 json.dump(indent=2) 的输出完全一致
+
+        Args:
+            items (Sequence[Any]): 元素列表
+
+        Returns:
+            Tuple[bytes, List[Tuple[int, int]]]: JSON 数组与每个元素的 (偏移, 长度)
+        """
+        if not items:
+            return b"[]", []
+        if self.indent:
+            head, sep, tail, pad = b"[\n", b",\n", b"\n]", b"  "
+        else:
+            head, sep, tail, pad = b"[", b",", b"]", b""
+        parts = [head]
+        spans: List[Tuple[int, int]] = []
+        offset = len(head)
+        for i, data in enumerate(items):
+            if i:
+                parts.append(sep)
+                offset += len(sep)
+            item = self.dumps(data)
+            if pad:
+                # 嵌套层级整体右移一级 字符串中的换行已被转义 不受影响
+                item = item.replace(b"\n", b"\n" + pad)
+                parts.append(pad)
+                offset += len(pad)
+            parts.append(item)
+            spans.append((offset, len(item)))
+            offset += len(item)
+        parts.append(tail)
+        return b"".join(parts), spans
+
+
+class MsgpackCodec(SnapshotCodec):
+    """
+    msgpack 编解码器 依赖 msgpack
+
+    Args:
+        None
+
+    Returns:
+        MsgpackCodec: 编解码器实例
+    """
+
+    name = "msgpack"
+    suffix = ".msgpack"
+
+    def dumps(self, data: Any) -> bytes:
+        """
+        序列化为 msgpack
+
+        Args:
+            data (Any): 可序列化数据
+
+        Returns:
+            bytes: msgpack 字节串
+        """
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, raw: bytes) -> Any:
+        """
+        解析 msgpack
+
+        Args:
+            raw (bytes): msgpack 字节串
+
+        Returns:
+            Any: 解析结果
+        """
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+    def dump_items(self, items: Sequence[Any]) -> Tuple[bytes, List[Tuple[int, int]]]:
+        """
+        写出数组头后逐个拼接元素 每个元素可单独解析
+
+        Args:
+            items (Sequence[Any]): 元素列表
+
+        Returns:
+            Tuple[bytes, List[Tuple[int, int]]]: msgpack 数组与每个元素的 (偏移, 长度)
+        """
+        packer = msgpack.Packer(use_bin_type=True)
+        parts = [packer.pack_array_header(len(items))]
+        spans: List[Tuple[int, int]] = []
+        offset = len(parts[0])
+        for data in items:
+            item = packer.pack(data)
+            parts.append(item)
+            spans.append((offset, len(item)))
+            offset += len(item)
+        return b"".join(parts), spans
+
+
+_CODECS: Dict[str, SnapshotCodec] = {
+    "json": JsonCodec(indent=2),
+    "json_compact": JsonCodec(indent=None),
+}
+if msgpack is not None:
+    _CODECS["msgpack"] = MsgpackCodec()
+
+# 后缀 -> 读取用编解码器 缩进与紧凑 JSON 共用同一后缀
+_READERS: Dict[str, SnapshotCodec] = {".json": _CODECS["json"], ".msgpack": MsgpackCodec()}
+
+
+def available_snapshot_codecs() -> List[str]:
+    """
+    获取当前环境可用的快照格式
+
+    Returns:
+        List[str]: 格式名称列表
+
+    Examples:
+        >>> "json_compact" in available_snapshot_codecs()
+        True
+    """
+    return list(_CODECS)
+
+
+def get_snapshot_codec(name: Optional[str]) -> SnapshotCodec:
+    """
+    按名称获取快照编解码器 不可用时退化为紧凑 JSON
+
+    Args:
+        name (Optional[str]): 配置中的格式名称
+
+    Returns:
+        SnapshotCodec: 可用的编解码器
+    """
+    name = (name or DEFAULT_SNAPSHOT_CODEC).lower()
+    codec = _CODECS.get(name)
+    if codec is None:
+        logger.warning(f"⚠️ 快照格式 {name} 不可用 使用 json_compact")
+        return _CODECS["json_compact"]
+    return codec
+
+
+def snapshot_filenames(stem: str) -> List[str]:
+    """
+    获取某类快照所有可能的文件名
+
+    Args:
+        stem (str): 文件主名
+
+    Returns:
+        List[str]: 文件名列表
+    """
+    return [stem + suffix for suffix in _READERS]
+
+
+def find_snapshot(session_dir: Path, stem: str) -> Optional[Path]:
+    """
+    查找会话目录中的快照文件
+
+    切换格式的写入中途退出时可能新旧两份并存 以修改时间较新者为准
+
+    Args:
+        session_dir (Path): 会话目录
+        stem (str): 文件主名
+
+    Returns:
+        Optional[Path]: 快照路径 不存在返回 None
+    """
+    found = None
+    found_mtime = -1.0
+    for name in snapshot_filenames(stem):
+        path = session_dir / name
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            continue
+        if mtime > found_mtime:
+            found, found_mtime = path, mtime
+    return found
+
+
+def codec_for_path(path: Path) -> SnapshotCodec:
+    """
+    按文件后缀获取读取用编解码器
+
+    Args:
+        path (Path): 快照文件路径
+
+    Returns:
+        SnapshotCodec: 编解码器
+
+    Raises:
+        ValueError: 后缀未知或对应依赖未安装时抛出
+    """
+    codec = _READERS.get(path.suffix)
+    if codec is None:
+        raise ValueError(f"未知的快照格式: {path.name}")
+    if codec.name == "msgpack" and msgpack is None:
+        raise ValueError(f"读取 {path.name} 需要安装 msgpack")
+    return codec
+
+
+def read_snapshot(session_dir: Path, stem: str) -> Optional[Any]:
+    """
+    读取快照并自动识别格式
+
+    Args:
+        session_dir (Path): 会话目录
+        stem (str): 文件主名
+
+    Returns:
+        Optional[Any]: 快照内容 不存在返回 None
+    """
+    path = find_snapshot(session_dir, stem)
+    if path is None:
+        return None
+    return codec_for_path(path).loads(path.read_bytes())
+
+
+def write_snapshot(session_dir: Path, stem: str, data: Any, codec: SnapshotCodec) -> Path:
+    """
+    原子写出快照 并删除其他格式的旧文件
+
+    Args:
+        session_dir (Path): 会话目录
+        stem (str): 文件主名
+        data (Any): 可序列化数据
+        codec (SnapshotCodec): 编解码器
+
+    Returns:
+        Path: 写出的文件路径
+    """
+    path = session_dir / codec.filename(stem)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(codec.dumps(data))
+    os.replace(tmp_path, path)
+    remove_stale_snapshots(session_dir, stem, path.name)
+    return path
+
+
+def remove_stale_snapshots(session_dir: Path, stem: str, keep: str) -> None:
+    """
+    删除其他格式的同类快照
+
+    Args:
+        session_dir (Path): 会话目录
+        stem (str): 文件主名
+        keep (str): 保留的文件名
+
+    Returns:
+        None
+    """
+    for name in snapshot_filenames(stem):
+        if name != keep:
+            path = session_dir / name
+            if path.exists():
+                path.unlink()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # 仓库根目录 用于定位默认的数据目录 模块需以 python -m 方式运行
+    root = Path(__file__).parent.parent
+
+    parser = argparse.ArgumentParser(description="EmaAgent 会话快照格式迁移工具 需在服务停止时执行")
+    parser.add_argument("--to", dest="codec", required=True, help=f"目标格式 可选: {', '.join(_CODECS)}")
+    parser.add_argument("--dir", dest="sessions_dir", help="会话根目录 默认使用 data/sessions")
+    args = parser.parse_args()
+
+    if args.sessions_dir:
+        sessions_dir = Path(args.sessions_dir)
+    else:
+        from config.paths import init_paths
+
+        sessions_dir = init_paths(root).sessions_dir
+
+    from memory.manager import SessionManager
+
+    manager = SessionManager(sessions_dir, snapshot_codec=args.codec, write_behind=False)
+    print(manager.migrate_snapshots())
+    manager.close()
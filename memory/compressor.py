@@ -7,23 +7,25 @@
 
 from __future__ import annotations
 
-from typing import List, Optional
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
 
 from llm.client import LLMClient
-from memory.schema import Message
+from memory.schema import CompressionPlan, CompressionRecord, Message, Session
 from utils.logger import logger
 
 COMPRESSION_PROMPT = """
 你是艾玛的记忆压缩助手。
-请将以下对话历史压缩为简洁的摘要，保留关键信息：
+请将以下这一段新的对话压缩为简洁的摘要，保留关键信息：
 
 要求：
 1. 提取主要讨论的话题和结论
 2. 如果涉及工具调用，保留工具名称、操作对象和结果
 3. 如果涉及文件操作，保留文件路径和操作类型
 4. 以艾玛的身份,要体现出压缩的文本是从她的记忆中提取的
+5. 上一段摘要仅用于衔接上下文，只摘要新的对话内容，不要复述上一段摘要
 
-## 现有摘要
+## 上一段摘要
 {existing_summary}
 
 ## 新的对话内容
@@ -33,6 +35,23 @@ COMPRESSION_PROMPT = """
 请直接输出压缩后的摘要，不要加任何前缀或解释。
 """
 
+ROLLUP_PROMPT = """
+你是艾玛的记忆压缩助手。
+以下是按时间顺序排列的若干段对话摘要，请将它们合并为一段更精炼的章节摘要：
+
+要求：
+1. 保留贯穿各段的主要话题、结论与未完成事项
+2. 保留关键的工具、文件路径与操作结果
+3. 删除重复与细枝末节，按时间顺序组织
+4. 以艾玛的身份,要体现出压缩的文本是从她的记忆中提取的
+
+## 分段摘要
+{summaries}
+
+## 输出格式
+请直接输出合并后的摘要，不要加任何前缀或解释。
+"""
+
 
 class Compressor:
     """
@@ -46,6 +65,7 @@ class Compressor:
         llm_client (Optional[LLMClient]): 用于压缩的 LLM 客户端实例
         compress_threshold (int): 触发压缩的消息数量阈值
         keep_recent_turns (int): 压缩时保留的最近对话轮数
+        rollup_fanout (int): 每个上级摘要汇总的同级摘要数
 
     Returns:
         Compressor: 压缩器实例对象
@@ -56,6 +76,7 @@ class Compressor:
         llm_client: Optional[LLMClient] = None,  # LLM 客户端
         compress_threshold: int = 30,  # 消息数超过此值触发压缩
         keep_recent_turns: int = 5,  # 保留最近 N 轮对话
+        rollup_fanout: int = 4,  # 每 N 个同级摘要汇总为一个上级摘要
     ):
         """
         初始化压缩器配置
@@ -66,11 +87,13 @@ class Compressor:
             llm_client (Optional[LLMClient]): 用于压缩的 LLM 客户端实例
             compress_threshold (int): 触发压缩的消息数量阈值
             keep_recent_turns (int): 压缩时保留的最近对话轮数
+            rollup_fanout (int): 每个上级摘要汇总的同级摘要数
         """
         # 保存依赖与策略参数 供后续压缩流程使用
         self.llm_client = llm_client
         self.compress_threshold = compress_threshold
         self.keep_recent_turns = keep_recent_turns
+        self.rollup_fanout = rollup_fanout
 
     async def compress(
         self,
@@ -78,15 +101,16 @@ class Compressor:
         existing_summary: str = ""
     ) -> str:
         """
-        压缩一组对话消息并返回摘要
+        压缩一段对话消息并返回该段的摘要
 
         方法会先将消息格式化为压缩输入 再调用 LLM 生成摘要
+        摘要只覆盖本段消息 提示词长度与会话总长度无关
 
         若调用失败则回退到本地简化摘要方案
 
         Args:
             messages (List[Message]): 待压缩的消息列表
-            existing_summary (str): 已有摘要文本 (可选) 用于增量压缩时提供上下文
+            existing_summary (str): 上一段摘要 (可选) 仅用于衔接上下文
 
         Returns:
             str: 压缩后的摘要文本
@@ -97,9 +121,9 @@ class Compressor:
         Examples:
             >>> await compressor.compress(messages, existing_summary="")
         """
-        # 空输入直接返回已有摘要 避免无意义请求
+        # 空输入直接返回空摘要 避免无意义请求
         if not messages:
-            return existing_summary
+            return ""
 
         # 将消息转换为更紧凑、可压缩的文本格式
         formatted_messages = self._format_messages(messages)
@@ -116,7 +140,9 @@ class Compressor:
                 messages=[{"role": "user", "content": prompt}],
                 stream=False,
                 temperature=0.3,  # 低温度 保证输出稳定
-                max_tokens=500
+                max_tokens=500,
+                priority="background",  # 后台压缩 让位于用户对话
+                caller="compressor.compress",
             )
 
             logger.info(f"📦 压缩完成: {len(messages)} 条消息 → {len(summary)} 字符")
@@ -127,6 +153,47 @@ class Compressor:
             # LLM 失败时 回退到本地规则压缩以保持流程可用
             return self._fallback_compress(messages, existing_summary)
 
+    async def rollup(self, summaries: List[str]) -> str:
+        """
+        将若干段同级摘要合并为一段上级摘要
+
+        若调用失败则回退为按段截断拼接
+
+        Args:
+            summaries (List[str]): 按时间顺序排列的摘要
+
+        Returns:
+            str: 合并后的摘要文本
+
+        Examples:
+            >>> await compressor.rollup(["第一段摘要", "第二段摘要"])
+        """
+        summaries = [summary for summary in summaries if summary]
+        if len(summaries) <= 1:
+            return summaries[0] if summaries else ""
+
+        prompt = ROLLUP_PROMPT.format(
+            summaries="\n\n".join(f"### 第 {i} 段\n{summary}" for i, summary in enumerate(summaries, 1))
+        )
+
+        try:
+            summary = await self.llm_client.chat(
+                messages=[{"role": "user", "content": prompt}],
+                stream=False,
+                temperature=0.3,
+                max_tokens=800,
+                priority="background",
+                caller="compressor.rollup",
+            )
+
+            logger.info(f"📦 摘要汇总完成: {len(summaries)} 段 → {len(summary)} 字符")
+            return summary.strip()
+
+        except Exception as e:
+            logger.error(f"❌ 摘要汇总失败: {e}")
+            # 回退: 每段保留开头部分 保证上级摘要长度有界
+            return "\n".join(summary[:300] for summary in summaries)
+
     def _format_messages(self, messages: List[Message]) -> str:
         """
         将消息列表格式化为压缩输入文本
@@ -177,10 +244,10 @@ class Compressor:
 
         Args:
             messages (List[Message]): 原始消息列表
-            existing_summary (str): 已有摘要文本 用于增量压缩时提供上下文
+            existing_summary (str): 上一段摘要 回退逻辑不使用 保留参数以兼容调用方
 
         Returns:
-            str: 回退压缩后的摘要文本
+            str: 回退压缩后的本段摘要文本
 
         Examples:
             >>> text = compressor._fallback_compress(messages, "")
@@ -189,15 +256,190 @@ class Compressor:
         user_messages = [m.content for m in messages if m.role == "user"]
 
         if not user_messages:
-            return existing_summary
+            return ""
 
-        # 合并前若干条用户消息 避免摘要过长
-        simple_summary = "用户讨论了以下话题：" + "、".join(
+        # 合并前若干条用户消息 避免摘要过长 分段摘要不再拼接上一段摘要
+        return "用户讨论了以下话题：" + "、".join(
             msg[:100] + "..." if len(msg) > 100 else msg
             for msg in user_messages[:10]
         )
 
-        # 若已有摘要则追加增量摘要 否则直接返回新摘要
-        if existing_summary:
-            return f"{existing_summary}\n\n{simple_summary}"
-        return simple_summary
+
+class CompressionScheduler:
+    """
+    会话后台压缩调度器
+
+    压缩在一轮对话结束后作为后台任务执行 不占用下一轮请求的关键路径
+    下一轮直接使用最近一次已提交的摘要 不等待进行中的压缩
+
+    - 同一会话同时最多一个压缩任务 重复调度直接忽略
+    - 压缩区间在调度时截取 提交时校验游标与记录未被改动 否则丢弃结果
+    - 提交与对话轮次都运行在事件循环线程 提交本身是原子的
+
+    Args:
+        on_commit (Optional[Callable[[Session, List[CompressionRecord]], None]]): 压缩提交后的回调
+            参数为会话与本次提交新增的压缩记录(含逐级汇总) 通常用于保存会话
+
+    Returns:
+        CompressionScheduler: CompressionScheduler 实例
+
+    Examples:
+        >>> scheduler = CompressionScheduler(on_commit=lambda session, records: session_service.save_session(session))
+        >>> scheduler.schedule(session, compressor)
+        True
+    """
+
+    def __init__(self, on_commit: Optional[Callable[[Session, List[CompressionRecord]], None]] = None):
+        """
+        初始化调度器
+
+        Args:
+            on_commit (Optional[Callable[[Session, List[CompressionRecord]], None]]): 压缩提交后的回调
+        """
+        self.on_commit = on_commit
+        # key 为会话对象 id 任务持有会话强引用 id 在任务期间不会被复用
+        self._tasks: Dict[int, "asyncio.Task[None]"] = {}
+
+        self.scheduled = 0
+        self.committed = 0
+        self.rollups = 0
+        self.discarded = 0
+        self.failures = 0
+
+    def schedule(self, session: Session, compressor: Optional[Compressor]) -> bool:
+        """
+        在满足压缩条件时启动后台压缩
+
+        Args:
+            session (Session): 会话对象
+            compressor (Optional[Compressor]): 压缩器
+
+        Returns:
+            bool: 是否启动了新的压缩任务
+        """
+        key = id(session)
+        if compressor is None or key in self._tasks:
+            return False
+
+        plan = session.plan_compression()
+        if plan is None:
+            return False
+
+        task = asyncio.get_running_loop().create_task(self._run(session, compressor, plan))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        self.scheduled += 1
+        logger.debug(f"📦 已调度后台压缩 [{session.session_id}]: {len(plan.messages)} 条消息")
+        return True
+
+    def is_pending(self, session: Session) -> bool:
+        """
+        判断会话是否有进行中的压缩
+
+        Args:
+            session (Session): 会话对象
+
+        Returns:
+            bool: 存在进行中的压缩返回 True
+        """
+        return id(session) in self._tasks
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待当前全部压缩任务完成
+
+        Args:
+            timeout (Optional[float]): 最长等待秒数
+
+        Returns:
+            bool: 在超时前全部完成返回 True
+        """
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return True
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        return not pending
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """
+        等待进行中的压缩 超时后取消
+
+        被取消的压缩不会提交 下次对话结束后会重新调度
+
+        Args:
+            timeout (Optional[float]): 最长等待秒数
+
+        Returns:
+            None
+        """
+        if await self.wait(timeout):
+            return
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        logger.warning(f"⚠️ 关闭时取消了 {len(tasks)} 个未完成的后台压缩")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        导出调度统计
+
+        Args:
+            None
+
+        Returns:
+            Dict[str, Any]: 进行中任务数与累计调度 提交 汇总 丢弃 失败次数
+        """
+        return {
+            "inflight": len(self._tasks),
+            "scheduled": self.scheduled,
+            "committed": self.committed,
+            "rollups": self.rollups,
+            "discarded": self.discarded,
+            "failures": self.failures,
+        }
+
+    async def _run(self, session: Session, compressor: Compressor, plan: CompressionPlan) -> None:
+        """
+        执行一次压缩并尝试提交
+
+        Args:
+            session (Session): 会话对象
+            compressor (Compressor): 压缩器
+            plan (CompressionPlan): 调度时截取的压缩计划
+
+        Returns:
+            None
+        """
+        try:
+            summary = await compressor.compress(
+                messages=plan.messages,
+                existing_summary=plan.existing_summary
+            )
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"❌ 后台压缩失败 [{session.session_id}]: {e}")
+            return
+
+        if not session.commit_compression(plan, summary):
+            self.discarded += 1
+            logger.info(f"⏭️ 压缩期间会话已变化 丢弃本次摘要 [{session.session_id}]")
+            return
+
+        self.committed += 1
+        logger.info(f"📦 后台压缩已提交 [{session.session_id}]: 游标 → {plan.end}")
+
+        # 末尾同级摘要满 fanout 时逐级汇总 汇总失败不影响已提交的分段摘要
+        try:
+            self.rollups += await session.rollup_summaries(compressor)
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"❌ 摘要汇总失败 [{session.session_id}]: {e}")
+
+        if self.on_commit is not None:
+            # 压缩记录只追加 提交时已校验记录数等于 plan.record_count 之后的即本次新增
+            added = session.compression_history.records[plan.record_count:]
+            try:
+                self.on_commit(session, added)
+            except Exception as e:
+                logger.error(f"❌ 压缩结果保存失败 [{session.session_id}]: {e}")
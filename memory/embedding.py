@@ -0,0 +1,249 @@
+"""
+文本向量化模块
+
+长期记忆使用的嵌入器:
+1. `openai`: 调用 config.json 中 embeddings 配置的 OpenAI 兼容接口(如 SiliconFlow bge-m3)
+2. `local`: 对检索分词结果做特征哈希 无网络与模型依赖 用于离线运行与测试
+
+所有嵌入器输出 L2 归一化的 float32 向量 点积即余弦相似度
+"""
+
+import zlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from memory.search import tokenize
+from utils.logger import logger
+
+
+# 单次请求的文本条数上限
+EMBED_BATCH_SIZE = 64
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    按行 L2 归一化 全零行保持为零
+
+    Args:
+        vectors (np.ndarray): (n, dim) 向量矩阵
+
+    Returns:
+        np.ndarray: 归一化后的 float32 矩阵
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class Embedder:
+    """
+    嵌入器基类
+
+    Args:
+        None
+
+    Returns:
+        Embedder: 嵌入器实例
+
+    Examples:
+        >>> vectors = await HashEmbedder(64).embed(["你好"])
+        >>> vectors.shape
+        (1, 64)
+    """
+
+    name = "base"
+    dim = 0
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        将文本转换为归一化向量
+
+        Args:
+            texts (List[str]): 文本列表
+
+        Returns:
+            np.ndarray: (len(texts), dim) float32 矩阵
+        """
+        raise NotImplementedError
+
+
+class HashEmbedder(Embedder):
+    """
+    本地特征哈希嵌入器
+
+    复用全文检索的分词(中日韩二字 + 单字 + 英文词) 每个词按 crc32 映射到一个维度并带正负号
+    词面重叠越多相似度越高 不理解同义词 适合作为离线兜底与测试替身
+
+    Args:
+        dim (int): 向量维度
+
+    Returns:
+        HashEmbedder: 嵌入器实例
+
+    Examples:
+        >>> HashEmbedder(256).name
+        'local:256'
+    """
+
+    def __init__(self, dim: int = 256):
+        """
+        初始化嵌入器
+
+        Args:
+            dim (int): 向量维度
+        """
+        self.dim = int(dim)
+        self.name = f"local:{self.dim}"
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        """
+        同步计算向量
+
+        Args:
+            texts (List[str]): 文本列表
+
+        Returns:
+            np.ndarray: (len(texts), dim) float32 矩阵
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                if token.isascii():
+                    self._add(vectors[row], token, 1.0)
+                else:
+                    # 中日韩二字与单字都计入 单字权重较低 使"养的猫"与"养了一只猫"也有重叠
+                    if len(token) == 2:
+                        self._add(vectors[row], token, 1.0)
+                    self._add(vectors[row], token[0], 0.5)
+        return normalize_rows(vectors)
+
+    def _add(self, vector: np.ndarray, token: str, weight: float) -> None:
+        """
+        将词按 crc32 哈希累加到对应维度 最高位决定正负号
+
+        Args:
+            vector (np.ndarray): (dim,) 向量
+            token (str): 词
+            weight (float): 权重
+
+        Returns:
+            None
+        """
+        h = zlib.crc32(token.encode("utf-8"))
+        vector[h % self.dim] += weight if h & 0x80000000 else -weight
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        计算向量
+
+        Args:
+            texts (List[str]): 文本列表
+
+        Returns:
+            np.ndarray: (len(texts), dim) float32 矩阵
+        """
+        return self.embed_sync(texts)
+
+
+class OpenAIEmbedder(Embedder):
+    """
+    OpenAI 兼容接口嵌入器
+
+    Args:
+        model (str): 模型名称
+        dim (int): 期望的向量维度
+        api_key (str): 接口密钥
+        base_url (Optional[str]): 接口地址
+
+    Returns:
+        OpenAIEmbedder: 嵌入器实例
+
+    Raises:
+        ValueError: 接口返回的维度与配置不一致时 embed 抛出
+    """
+
+    def __init__(self, model: str, dim: int, api_key: str, base_url: Optional[str] = None):
+        """
+        初始化嵌入器 客户端在请求时从共享注册表获取
+
+        Args:
+            model (str): 模型名称
+            dim (int): 期望的向量维度
+            api_key (str): 接口密钥
+            base_url (Optional[str]): 接口地址
+        """
+        self.model = model
+        self.dim = int(dim)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.name = f"openai:{model}:{self.dim}"
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        分批调用嵌入接口
+
+        Args:
+            texts (List[str]): 文本列表
+
+        Returns:
+            np.ndarray: (len(texts), dim) float32 矩阵
+        """
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        # 与 LLMClient 及 narrative 共享连接池
+        from llm.pool import get_openai_client
+
+        client = get_openai_client(self.api_key, self.base_url)
+
+        rows: List[List[float]] = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            batch = [t if t.strip() else " " for t in texts[start:start + EMBED_BATCH_SIZE]]
+            response = await client.embeddings.create(
+                model=self.model,
+                input=batch,
+                encoding_format="float",
+            )
+            rows.extend(item.embedding for item in response.data)
+
+        vectors = np.asarray(rows, dtype=np.float32)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"embedding 维度不一致: 期望 {self.dim} 实际 {vectors.shape[1]}")
+        return normalize_rows(vectors)
+
+
+def create_embedder(embeddings_cfg: Optional[Dict[str, Any]], mode: str = "auto", local_dim: int = 256) -> Embedder:
+    """
+    按配置创建嵌入器
+
+    - auto: embeddings 配置了模型与密钥时使用接口 否则退化为本地哈希
+    - remote: 总是使用接口
+    - local: 总是使用本地哈希
+
+    Args:
+        embeddings_cfg (Optional[Dict[str, Any]]): config.json 中的 embeddings 配置
+        mode (str): 选择策略
+        local_dim (int): 本地哈希嵌入的维度
+
+    Returns:
+        Embedder: 嵌入器实例
+
+    Examples:
+        >>> create_embedder({}, mode="local").name
+        'local:256'
+    """
+    cfg = embeddings_cfg or {}
+    if mode != "local":
+        model = cfg.get("model")
+        api_key = cfg.get("api_key", "")
+        if model and (api_key or mode == "remote"):
+            return OpenAIEmbedder(
+                model=model,
+                dim=int(cfg.get("embedding_dim", 1024)),
+                api_key=api_key,
+                base_url=cfg.get("base_url"),
+            )
+        if mode == "auto":
+            logger.warning("⚠️ 未配置 embeddings 密钥 长期记忆使用本地哈希向量")
+    return HashEmbedder(local_dim)
@@ -0,0 +1,248 @@
+"""
+会话追加日志模块
+
+该模块为单个会话目录提供 JSONL 追加日志能力
+每轮对话只追加新增消息与元信息增量 避免整份 messages.json 重写
+日志会在后台压实(compaction)为快照文件 加载时按 快照 + 日志 回放
+每批记录写入后 fsync 一次 进程退出后已确认的增量不会丢失
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+from utils.logger import logger
+
+
+# 活跃日志文件 新记录总是追加到这里
+JOURNAL_FILE = "journal.jsonl"
+# 压实中的日志段 压实完成后删除 若进程中途退出则在加载时继续回放
+COMPACTING_FILE = "journal.compacting.jsonl"
+# 修复残缺尾行时每次向前读取的字节数
+_TAIL_CHUNK = 4096
+
+
+class SessionJournal:
+    """
+    单会话追加日志
+
+    记录格式为每行一个 JSON 对象 通过 `op` 字段区分类型:
+    - append: 新增消息 {"op": "append", "index": int, "message": dict}
+    - meta: 会话元信息增量 {"op": "meta", "data": dict}
+    - compression: 新增压缩记录 {"op": "compression", "offset": int, "records": list}
+
+    Args:
+        session_dir (Path): 会话目录路径
+
+    Returns:
+        SessionJournal: SessionJournal 实例
+
+    Examples:
+        >>> journal = SessionJournal(Path("./data/sessions/demo"))
+        >>> journal.append([{"op": "meta", "data": {}}])
+        1
+    """
+
+    def __init__(self, session_dir: Path):
+        """
+        初始化追加日志
+
+        Args:
+            session_dir (Path): 会话目录路径
+        """
+        self.session_dir = Path(session_dir)
+        self.active_file = self.session_dir / JOURNAL_FILE
+        self.compacting_file = self.session_dir / COMPACTING_FILE
+        # 追加与轮转需要互斥 避免轮转时丢失正在写入的记录
+        self._lock = threading.Lock()
+        # 快照写入锁与代次: 同步写入完整快照会使进行中的后台压实作废
+        self.snapshot_lock = threading.Lock()
+        self.generation = 0
+        # 首次追加前检查日志末尾 上次写入中断留下的残缺行需要先修复
+        self._tail_checked = False
+
+    def append(self, records: List[Dict[str, Any]]) -> int:
+        """
+        追加一批日志记录
+
+        单批记录合并为一次 write 调用 减少系统调用次数 写入后 fsync 作为提交点
+        首次追加前修复日志末尾的残缺行 否则新记录会拼接在残缺行之后一起损坏
+
+        Args:
+            records (List[Dict[str, Any]]): 待追加的记录列表
+
+        Returns:
+            int: 本次写入的记录条数
+        """
+        if not records:
+            return 0
+
+        payload = "".join(
+            json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for record in records
+        )
+        with self._lock:
+            if not self._tail_checked:
+                _repair_tail(self.active_file)
+                self._tail_checked = True
+            try:
+                with open(self.active_file, "a", encoding="utf-8") as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError:
+                # 写入可能只完成一部分 下次追加前重新检查末尾
+                self._tail_checked = False
+                raise
+        return len(records)
+
+    def rotate(self) -> bool:
+        """
+        将活跃日志轮转为压实段
+
+        若上一次压实段仍然存在(例如进程中途退出) 则把活跃日志并入该段
+
+        Args:
+            None
+
+        Returns:
+            bool: 是否存在可压实的日志段
+        """
+        with self._lock:
+            if not self.active_file.exists():
+                return self.compacting_file.exists()
+
+            if self.compacting_file.exists():
+                # 残留压实段尚未清理 将新记录接到其后 保持回放顺序
+                _repair_tail(self.compacting_file)
+                with open(self.active_file, "r", encoding="utf-8") as src, \
+                        open(self.compacting_file, "a", encoding="utf-8") as dst:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                self.active_file.unlink()
+            else:
+                os.replace(self.active_file, self.compacting_file)
+            return True
+
+    def discard_compacted(self) -> None:
+        """
+        删除已经折叠进快照的压实段
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self.compacting_file.exists():
+                self.compacting_file.unlink()
+
+    def reset(self) -> None:
+        """
+        清空全部日志文件
+
+        在写入完整快照后调用 快照已包含全部状态
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        with self._lock:
+            for path in (self.compacting_file, self.active_file):
+                if path.exists():
+                    path.unlink()
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """
+        按写入顺序回放日志记录
+
+        先回放压实段 再回放活跃日志 末尾不完整的行(写入中断)会被跳过
+
+        Args:
+            None
+
+        Returns:
+            Iterator[Dict[str, Any]]: 日志记录迭代器
+        """
+        for path in (self.compacting_file, self.active_file):
+            if not path.exists():
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line_no, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"⚠️ 跳过损坏的日志记录: {path.name}:{line_no}")
+
+    def has_records(self) -> bool:
+        """
+        判断是否存在待回放的日志
+
+        Args:
+            None
+
+        Returns:
+            bool: 存在任一日志文件时返回 True
+        """
+        return self.active_file.exists() or self.compacting_file.exists()
+
+
+def _repair_tail(path: Path) -> None:
+    """
+    修复日志末尾因写入中断留下的残缺行
+
+    末尾不以换行结束时: 残缺部分是完整的 JSON 记录则补上换行 否则截断到最后一个换行
+    文件不存在或末尾完好时不做任何事
+
+    Args:
+        path (Path): 日志文件路径
+
+    Returns:
+        None
+    """
+    try:
+        f = open(path, "rb+")
+    except FileNotFoundError:
+        return
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+
+        # 向前分块查找最后一个换行
+        end = size
+        tail = b""
+        while end > 0:
+            start = max(0, end - _TAIL_CHUNK)
+            f.seek(start)
+            chunk = f.read(end - start)
+            pos = chunk.rfind(b"\n")
+            if pos >= 0:
+                tail = chunk[pos + 1:] + tail
+                break
+            tail = chunk + tail
+            end = start
+        keep = size - len(tail)
+
+        try:
+            json.loads(tail.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            f.truncate(keep)
+            logger.warning(f"⚠️ 截断日志末尾的残缺记录: {path.name} ({len(tail)} 字节)")
+        else:
+            f.seek(size)
+            f.write(b"\n")
+        f.flush()
+        os.fsync(f.fileno())
@@ -0,0 +1,871 @@
+"""
+长期记忆模块
+
+跨会话保存压缩摘要与用户陈述的事实 对话时按语义检索最相关的若干条注入上下文
+
+存储结构(data/long_term_memory):
+    meta.json       # 向量维度与嵌入器名称 不一致时后台重新向量化
+    items.jsonl     # 记忆条目 按写入顺序追加 条目序号即向量编号 其间穿插会话删除(forget)与改名(rename)记录
+    vectors.f32     # float32 向量 按行追加 与 items.jsonl 一一对应
+    centroids.npy   # 倒排索引聚类中心 重启时免训练
+
+检索:
+- 条目较少时精确计算全部余弦相似度
+- 条目超过 IVF_MIN_ITEMS 后按聚类中心分桶(IVF) 只扫描最近的 nprobe 个桶 与训练后新增的尾部向量
+
+用法(在仓库根目录执行):
+    python -m memory.longterm "查询文本" [--dir storage_dir]
+"""
+
+import asyncio
+import json
+import math
+import os
+import re
+import threading
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from memory.embedding import Embedder
+from utils.logger import logger
+
+
+META_FILE = "meta.json"
+ITEMS_FILE = "items.jsonl"
+VECTORS_FILE = "vectors.f32"
+CENTROIDS_FILE = "centroids.npy"
+STORE_VERSION = 1
+
+# 条目数达到该值后启用 IVF 之前精确检索已足够快
+IVF_MIN_ITEMS = 20000
+# 训练后新增的尾部向量超过已分桶数量的该比例时重新训练
+IVF_RETRAIN_RATIO = 0.5
+KMEANS_ITERATIONS = 8
+# 每个聚类中心参与训练的样本数
+KMEANS_SAMPLES_PER_LIST = 64
+
+MEMORY_KINDS = {"summary", "fact"}
+
+# 用户自我陈述: 身份 偏好 经历 计划与显式的"记住"
+_FACT_RE = re.compile(
+    r"(我(是|叫|的|喜欢|爱|讨厌|不喜欢|不吃|住|在|来自|养|有|想|希望|打算|正在|每天|习惯|经常)"
+    r"|记住|别忘|以后"
+    r"|\b(my|i am|i'm|i like|i love|i hate|i live|i work|i have|remember)\b)",
+    re.IGNORECASE,
+)
+# 中文标点与换行直接分句 英文句点需后跟空白 避免拆开小数与缩写
+_SENTENCE_RE = re.compile(r"(?:[^。！？!?；;.\n]|\.(?!\s|$))+[。！？!?；;.]?")
+MIN_FACT_CHARS = 4
+MAX_FACT_CHARS = 200
+MAX_FACTS_PER_MESSAGE = 5
+
+
+def extract_facts(text: str) -> List[str]:
+    """
+    从用户消息中挑出值得长期记住的陈述句
+
+    只保留包含第一人称陈述或"记住"等提示词的句子 疑问句与过短过长的句子被忽略
+
+    Args:
+        text (str): 用户消息
+
+    Returns:
+        List[str]: 事实句子 最多 MAX_FACTS_PER_MESSAGE 条
+
+    Examples:
+        >>> extract_facts("我叫小明，我喜欢猫。你喜欢什么？")
+        ['我叫小明，我喜欢猫。']
+    """
+    facts = []
+    for sentence in _SENTENCE_RE.findall(text or ""):
+        sentence = sentence.strip()
+        if not (MIN_FACT_CHARS <= len(sentence) <= MAX_FACT_CHARS):
+            continue
+        if sentence.endswith(("？", "?")) or not _FACT_RE.search(sentence):
+            continue
+        facts.append(sentence)
+        if len(facts) >= MAX_FACTS_PER_MESSAGE:
+            break
+    return facts
+
+
+@dataclass
+class MemoryItem:
+    """
+    长期记忆条目
+
+    Args:
+        id (int): 条目编号 即向量所在行
+        kind (str): 类型 summary(压缩摘要) 或 fact(用户陈述)
+        text (str): 记忆文本
+        session_id (str): 来源会话ID
+        created_at (str): 写入时间 ISO 格式
+        key (str): 去重键 同一键只写入一次
+
+    Returns:
+        MemoryItem: MemoryItem 实例
+    """
+    id: int
+    kind: str
+    text: str
+    session_id: str
+    created_at: str
+    key: str
+
+
+class VectorIndex:
+    """
+    基于 numpy 的向量索引
+
+    - 精确模式: 所有向量位于尾部数组 一次矩阵向量乘得到全部相似度
+    - IVF 模式: 向量按最近聚类中心重排为连续分桶 检索只扫描 nprobe 个桶 新增向量先进入尾部
+
+    线程安全: 检索与追加持有同一把锁 训练在锁外进行 完成后原子替换
+
+    Args:
+        dim (int): 向量维度
+        nprobe (int): IVF 模式下扫描的桶数
+
+    Returns:
+        VectorIndex: VectorIndex 实例
+
+    Examples:
+        >>> index = VectorIndex(4)
+        >>> index.add(np.eye(4, dtype=np.float32), np.arange(4))
+        >>> index.search(np.array([1, 0, 0, 0], dtype=np.float32), 1)[0].tolist()
+        [0]
+    """
+
+    def __init__(self, dim: int, nprobe: int = 16):
+        """
+        初始化空索引
+
+        Args:
+            dim (int): 向量维度
+            nprobe (int): IVF 模式下扫描的桶数
+        """
+        self.dim = int(dim)
+        self.nprobe = max(1, int(nprobe))
+        self._lock = threading.Lock()
+        # IVF 分桶: 重排后的向量 对应编号 每个桶的起止偏移
+        self._centroids: Optional[np.ndarray] = None
+        self._ivf_vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._ivf_ids = np.zeros(0, dtype=np.int64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        # 尾部: 容量倍增的数组 只使用前 _tail_size 行
+        self._tail = np.zeros((0, self.dim), dtype=np.float32)
+        self._tail_ids = np.zeros(0, dtype=np.int64)
+        self._tail_size = 0
+        self._training = False
+
+    def __len__(self) -> int:
+        """
+        获取向量总数
+
+        Returns:
+            int: 向量总数
+        """
+        return len(self._ivf_ids) + self._tail_size
+
+    @property
+    def is_ivf(self) -> bool:
+        """
+        是否已启用 IVF 分桶
+
+        Returns:
+            bool: 已训练聚类中心返回 True
+        """
+        return self._centroids is not None
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        """
+        追加向量
+
+        Args:
+            vectors (np.ndarray): (n, dim) 归一化向量
+            ids (np.ndarray): (n,) 条目编号
+
+        Returns:
+            None
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        n = len(vectors)
+        if not n:
+            return
+        with self._lock:
+            need = self._tail_size + n
+            if need > len(self._tail):
+                capacity = max(need, 2 * len(self._tail), 1024)
+                tail = np.zeros((capacity, self.dim), dtype=np.float32)
+                tail_ids = np.zeros(capacity, dtype=np.int64)
+                tail[:self._tail_size] = self._tail[:self._tail_size]
+                tail_ids[:self._tail_size] = self._tail_ids[:self._tail_size]
+                self._tail, self._tail_ids = tail, tail_ids
+            self._tail[self._tail_size:need] = vectors
+            self._tail_ids[self._tail_size:need] = ids
+            self._tail_size = need
+
+    def needs_training(self) -> bool:
+        """
+        判断是否应(重新)训练 IVF
+
+        Returns:
+            bool: 条目足够多且尾部过长时返回 True
+        """
+        if self._training or len(self) < IVF_MIN_ITEMS:
+            return False
+        return not self.is_ivf or self._tail_size > IVF_RETRAIN_RATIO * len(self._ivf_ids)
+
+    def train(self, centroids: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """
+        训练聚类中心并把全部向量重排为分桶 可传入已保存的中心跳过训练
+
+        耗时操作在锁外执行 期间新增的向量保留在尾部
+
+        Args:
+            centroids (Optional[np.ndarray]): 已有的聚类中心
+
+        Returns:
+            Optional[np.ndarray]: 使用的聚类中心 条目不足时返回 None
+        """
+        with self._lock:
+            if self._training:
+                return None
+            self._training = True
+            vectors = np.concatenate([self._ivf_vectors, self._tail[:self._tail_size]])
+            ids = np.concatenate([self._ivf_ids, self._tail_ids[:self._tail_size]])
+            taken = self._tail_size
+        try:
+            if len(vectors) == 0:
+                return None
+            if centroids is None or centroids.shape[1] != self.dim:
+                centroids = _train_kmeans(vectors, _list_count(len(vectors)))
+            assign = _assign(vectors, centroids)
+            order = np.argsort(assign, kind="stable")
+            offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+            ivf_vectors = np.ascontiguousarray(vectors[order])
+            ivf_ids = ids[order]
+            del vectors
+
+            with self._lock:
+                # 训练期间新增的尾部向量保留
+                rest = self._tail_size - taken
+                tail = np.zeros((max(rest, 1024), self.dim), dtype=np.float32)
+                tail_ids = np.zeros(len(tail), dtype=np.int64)
+                tail[:rest] = self._tail[taken:self._tail_size]
+                tail_ids[:rest] = self._tail_ids[taken:self._tail_size]
+                self._centroids = centroids
+                self._ivf_vectors, self._ivf_ids, self._offsets = ivf_vectors, ivf_ids, offsets
+                self._tail, self._tail_ids, self._tail_size = tail, tail_ids, rest
+            return centroids
+        finally:
+            self._training = False
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        allowed: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        检索最相似的 k 个向量
+
+        Args:
+            query (np.ndarray): (dim,) 归一化查询向量
+            k (int): 返回数量
+            allowed (Optional[np.ndarray]): 按条目编号索引的布尔数组 False 的条目被排除
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: 条目编号与相似度 按相似度降序
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            parts_ids = [self._tail_ids[:self._tail_size]]
+            parts_scores = [self._tail[:self._tail_size] @ query]
+            if self._centroids is not None:
+                nprobe = min(self.nprobe, len(self._centroids))
+                probe = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+                for bucket in probe:
+                    lo, hi = self._offsets[bucket], self._offsets[bucket + 1]
+                    if hi > lo:
+                        parts_ids.append(self._ivf_ids[lo:hi])
+                        parts_scores.append(self._ivf_vectors[lo:hi] @ query)
+
+        ids = np.concatenate(parts_ids)
+        scores = np.concatenate(parts_scores)
+        if allowed is not None and len(ids):
+            keep = allowed[ids]
+            ids, scores = ids[keep], scores[keep]
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores)
+        return ids[order], scores[order]
+
+
+def _list_count(n: int) -> int:
+    """
+    按向量数选择桶数 约为 sqrt(n)
+
+    Args:
+        n (int): 向量数
+
+    Returns:
+        int: 桶数
+    """
+    return int(min(4096, max(16, math.sqrt(n))))
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    """
+    分块计算每个向量最近的聚类中心
+
+    Args:
+        vectors (np.ndarray): (n, dim) 向量
+        centroids (np.ndarray): (nlist, dim) 聚类中心
+        chunk (int): 每块行数 控制临时矩阵大小
+
+    Returns:
+        np.ndarray: (n,) 桶编号
+    """
+    assign = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        assign[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+    return assign
+
+
+def _train_kmeans(vectors: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """
+    球面 k-means 训练聚类中心
+
+    Args:
+        vectors (np.ndarray): (n, dim) 归一化向量
+        nlist (int): 聚类数
+        seed (int): 随机种子
+
+    Returns:
+        np.ndarray: (nlist, dim) 归一化聚类中心
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * KMEANS_SAMPLES_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    nlist = min(nlist, sample_size)
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+        # 空桶重新随机选点
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+class LongTermMemory:
+    """
+    跨会话长期记忆库
+
+    - remember: 向量化并追加记忆 按 key 去重
+    - recall: 检索与查询最相关的记忆 可排除当前会话
+    - forget_session: 删除来自某个会话的全部记忆
+    - rename_session: 会话改名后把其记忆归到新会话ID
+
+    嵌入器(名称或维度)变化后 已保存的文本会在后台重新向量化 期间检索返回空
+
+    Args:
+        storage_path (Path): 存储目录
+        embedder (Embedder): 嵌入器
+        nprobe (int): IVF 模式下扫描的桶数
+
+    Returns:
+        LongTermMemory: LongTermMemory 实例
+
+    Examples:
+        >>> memory = LongTermMemory(Path("./data/long_term_memory"), HashEmbedder())
+        >>> await memory.remember("fact", "我喜欢猫", "demo", key="demo:fact:1")
+        1
+        >>> [item.text for item, _ in await memory.recall("猫")]
+        ['我喜欢猫']
+    """
+
+    def __init__(self, storage_path: Path, embedder: Embedder, nprobe: int = 16):
+        """
+        加载已有记忆 构建索引
+
+        Args:
+            storage_path (Path): 存储目录
+            embedder (Embedder): 嵌入器
+            nprobe (int): IVF 模式下扫描的桶数
+        """
+        self.storage_path = Path(storage_path)
+        self.storage_path.mkdir(parents=True, exist_ok=True)
+        self.embedder = embedder
+        self.nprobe = nprobe
+
+        self.items: List[MemoryItem] = []
+        self._keys: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._session_codes: Dict[str, int] = {}
+        self._item_sessions = np.zeros(0, dtype=np.int32)
+        # 文件追加与内存结构更新互斥 向量化在锁外进行
+        self._write_lock = threading.Lock()
+        self._train_lock = threading.Lock()
+        self.index = VectorIndex(embedder.dim, nprobe=nprobe)
+        self.ready = True
+        self._load()
+
+    def __len__(self) -> int:
+        """
+        获取有效记忆条数
+
+        Returns:
+            int: 未被删除的条目数
+        """
+        return int(self._alive.sum())
+
+    async def remember(self, kind: str, text: str, session_id: str, key: Optional[str] = None) -> int:
+        """
+        写入一条记忆
+
+        Args:
+            kind (str): 类型 summary 或 fact
+            text (str): 记忆文本
+            session_id (str): 来源会话ID
+            key (Optional[str]): 去重键 默认使用文本本身
+
+        Returns:
+            int: 实际写入条数
+        """
+        return await self.remember_many([(kind, text, session_id, key)])
+
+    async def remember_many(self, entries: Sequence[Tuple[str, str, str, Optional[str]]]) -> int:
+        """
+        批量写入记忆 一次向量化调用
+
+        Args:
+            entries (Sequence[Tuple[str, str, str, Optional[str]]]): (类型, 文本, 会话ID, 去重键)
+
+        Returns:
+            int: 实际写入条数 已存在的键与空文本被跳过
+        """
+        if not self.ready:
+            return 0
+        pending = []
+        seen = set()
+        for kind, text, session_id, key in entries:
+            text = (text or "").strip()
+            key = key or f"{kind}:{text}"
+            if kind not in MEMORY_KINDS or not text or key in self._keys or key in seen:
+                continue
+            seen.add(key)
+            pending.append((kind, text, session_id, key))
+        if not pending:
+            return 0
+
+        vectors = await self.embedder.embed([text for _, text, _, _ in pending])
+        now = datetime.now().isoformat()
+        written = 0
+        with self._write_lock:
+            lines, rows = [], []
+            for (kind, text, session_id, key), vector in zip(pending, vectors):
+                if key in self._keys:
+                    continue
+                item = MemoryItem(len(self.items), kind, text, session_id, now, key)
+                self._append_item(item)
+                lines.append(json.dumps(asdict(item), ensure_ascii=False) + "\n")
+                rows.append(vector)
+            if rows:
+                matrix = np.asarray(rows, dtype=np.float32)
+                # 先写向量再写条目 中途退出时加载以两者较短者为准
+                with open(self.storage_path / VECTORS_FILE, "ab") as f:
+                    f.write(matrix.tobytes())
+                with open(self.storage_path / ITEMS_FILE, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+                self.index.add(matrix, np.arange(len(self.items) - len(rows), len(self.items)))
+                written = len(rows)
+
+        if self.index.needs_training():
+            asyncio.get_running_loop().run_in_executor(None, self._train)
+        return written
+
+    async def recall(
+        self,
+        query: str,
+        k: int = 5,
+        exclude_session: Optional[str] = None,
+        min_score: float = 0.0,
+    ) -> List[Tuple[MemoryItem, float]]:
+        """
+        检索与查询最相关的记忆
+
+        Args:
+            query (str): 查询文本
+            k (int): 返回条数上限
+            exclude_session (Optional[str]): 排除来自该会话的记忆
+            min_score (float): 相似度下限
+
+        Returns:
+            List[Tuple[MemoryItem, float]]: (记忆, 相似度) 按相似度降序
+        """
+        if not self.ready or not query.strip() or not len(self.index):
+            return []
+        vector = (await self.embedder.embed([query]))[0]
+        return self.search_vector(vector, k, exclude_session=exclude_session, min_score=min_score)
+
+    def search_vector(
+        self,
+        vector: np.ndarray,
+        k: int = 5,
+        exclude_session: Optional[str] = None,
+        min_score: float = 0.0,
+    ) -> List[Tuple[MemoryItem, float]]:
+        """
+        按查询向量检索
+
+        Args:
+            vector (np.ndarray): (dim,) 归一化查询向量
+            k (int): 返回条数上限
+            exclude_session (Optional[str]): 排除来自该会话的记忆
+            min_score (float): 相似度下限
+
+        Returns:
+            List[Tuple[MemoryItem, float]]: (记忆, 相似度) 按相似度降序
+        """
+        allowed = self._alive
+        code = self._session_codes.get(exclude_session) if exclude_session is not None else None
+        if code is not None:
+            allowed = allowed & (self._item_sessions != code)
+        ids, scores = self.index.search(vector, k, allowed=allowed)
+        return [
+            (self.items[i], float(score))
+            for i, score in zip(ids.tolist(), scores.tolist())
+            if score >= min_score
+        ]
+
+    def forget_session(self, session_id: str) -> int:
+        """
+        删除来自某个会话的全部记忆
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            int: 删除的条目数
+        """
+        with self._write_lock:
+            code = self._session_codes.get(session_id)
+            if code is None:
+                return 0
+            mask = self._alive & (self._item_sessions == code)
+            removed = int(mask.sum())
+            if removed:
+                with open(self.storage_path / ITEMS_FILE, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"op": "forget", "session_id": session_id}, ensure_ascii=False) + "\n")
+                self._apply_forget(session_id)
+            return removed
+
+    def rename_session(self, old_id: str, new_id: str) -> int:
+        """
+        将来自某个会话的记忆改归新会话ID 以旧ID为前缀的去重键同步改写
+
+        Args:
+            old_id (str): 原会话ID
+            new_id (str): 新会话ID
+
+        Returns:
+            int: 改写的有效条目数
+        """
+        if old_id == new_id:
+            return 0
+        with self._write_lock:
+            if old_id not in self._session_codes:
+                return 0
+            with open(self.storage_path / ITEMS_FILE, "a", encoding="utf-8") as f:
+                record = {"op": "rename", "session_id": old_id, "new_session_id": new_id}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            return self._apply_rename(old_id, new_id)
+
+    def use_embedder(self, embedder: Embedder) -> bool:
+        """
+        切换嵌入器 名称或维度变化时需要调用 reembed 重建向量
+
+        Args:
+            embedder (Embedder): 新的嵌入器
+
+        Returns:
+            bool: 需要重建向量返回 True
+        """
+        changed = embedder.name != self.embedder.name or embedder.dim != self.embedder.dim
+        self.embedder = embedder
+        if changed:
+            self.ready = False
+        return changed
+
+    async def reembed(self, batch_size: int = 256) -> int:
+        """
+        使用当前嵌入器重新向量化全部条目 完成前检索返回空
+
+        Args:
+            batch_size (int): 每批向量化的条目数
+
+        Returns:
+            int: 重新向量化的条目数
+        """
+        self.ready = False
+        tmp_path = self.storage_path / (VECTORS_FILE + ".tmp")
+        index = VectorIndex(self.embedder.dim, nprobe=self.nprobe)
+        items = list(self.items)
+        with open(tmp_path, "wb") as f:
+            for start in range(0, len(items), batch_size):
+                batch = items[start:start + batch_size]
+                vectors = await self.embedder.embed([item.text for item in batch])
+                f.write(np.asarray(vectors, dtype=np.float32).tobytes())
+                index.add(vectors, np.arange(start, start + len(batch)))
+
+        with self._write_lock:
+            os.replace(tmp_path, self.storage_path / VECTORS_FILE)
+            centroids_file = self.storage_path / CENTROIDS_FILE
+            if centroids_file.exists():
+                centroids_file.unlink()
+            self._write_meta()
+            self.index = index
+            self.ready = True
+        logger.info(f"🧠 长期记忆重新向量化完成: {len(items)} 条 ({self.embedder.name})")
+        if self.index.needs_training():
+            await asyncio.get_running_loop().run_in_executor(None, self._train)
+        return len(items)
+
+    def _load(self) -> None:
+        """
+        从磁盘加载条目与向量 嵌入器不一致时标记为待重建
+
+        Returns:
+            None
+        """
+        meta_path = self.storage_path / META_FILE
+        meta = json.loads(meta_path.read_text(encoding="utf-8")) if meta_path.exists() else None
+        items_path = self.storage_path / ITEMS_FILE
+        # 删除与改名记录 按出现位置只作用于其之前写入的条目
+        operations: List[Tuple[int, Dict[str, Any]]] = []
+        if items_path.exists():
+            with open(items_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        data = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning("⚠️ 跳过损坏的长期记忆条目")
+                        continue
+                    if data.get("op") in ("forget", "rename"):
+                        operations.append((len(self.items), data))
+                    else:
+                        self._append_item(MemoryItem(**{**data, "id": len(self.items)}))
+
+        if meta is None:
+            self._write_meta()
+            meta = {"dim": self.embedder.dim, "embedder": self.embedder.name}
+        stored_dim = int(meta.get("dim", self.embedder.dim))
+
+        vectors = np.zeros((0, stored_dim), dtype=np.float32)
+        vectors_path = self.storage_path / VECTORS_FILE
+        if vectors_path.exists():
+            raw = np.fromfile(vectors_path, dtype=np.float32)
+            vectors = raw[: len(raw) - len(raw) % stored_dim].reshape(-1, stored_dim)
+        # 写入中途退出时 向量与条目以较短者为准
+        count = min(len(vectors), len(self.items))
+        if count < len(self.items):
+            del self.items[count:]
+            self._rebuild_lookup()
+        for position, operation in operations:
+            if operation["op"] == "forget":
+                self._apply_forget(operation.get("session_id"), limit=min(position, count))
+            else:
+                self._apply_rename(operation.get("session_id"), operation.get("new_session_id"), limit=min(position, count))
+
+        if meta.get("embedder") != self.embedder.name or stored_dim != self.embedder.dim:
+            logger.warning(
+                f"⚠️ 长期记忆嵌入器已变化 ({meta.get('embedder')} -> {self.embedder.name}) 需要重新向量化"
+            )
+            self.ready = False
+            return
+
+        self.index.add(vectors[:count], np.arange(count))
+        if self.index.needs_training():
+            self._train()
+        logger.info(f"🧠 长期记忆加载完成: {len(self)} 条")
+
+    def _train(self) -> None:
+        """
+        训练或重建 IVF 分桶 已保存的聚类中心在维度一致时直接复用
+
+        Returns:
+            None
+        """
+        if not self._train_lock.acquire(blocking=False):
+            return
+        try:
+            centroids_path = self.storage_path / CENTROIDS_FILE
+            centroids = None
+            if not self.index.is_ivf and centroids_path.exists():
+                centroids = np.load(centroids_path)
+                # 条目数增长较多时旧中心分布已不具代表性
+                if len(centroids) < _list_count(len(self.index)) // 2:
+                    centroids = None
+            centroids = self.index.train(centroids)
+            if centroids is not None:
+                np.save(centroids_path, centroids)
+        except Exception as e:
+            logger.error(f"❌ 长期记忆索引训练失败: {e}")
+        finally:
+            self._train_lock.release()
+
+    def _append_item(self, item: MemoryItem) -> None:
+        """
+        在内存结构中登记条目
+
+        Args:
+            item (MemoryItem): 记忆条目
+
+        Returns:
+            None
+        """
+        self.items.append(item)
+        self._keys[item.key] = item.id
+        code = self._session_codes.setdefault(item.session_id, len(self._session_codes))
+        if len(self.items) > len(self._alive):
+            capacity = max(len(self.items), 2 * len(self._alive), 1024)
+            self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+            self._item_sessions = np.concatenate(
+                [self._item_sessions, np.full(capacity - len(self._item_sessions), -1, dtype=np.int32)]
+            )
+        self._alive[item.id] = True
+        self._item_sessions[item.id] = code
+
+    def _apply_forget(self, session_id: str, limit: Optional[int] = None) -> None:
+        """
+        将某会话的条目标记为删除
+
+        Args:
+            session_id (str): 会话ID
+            limit (Optional[int]): 只处理编号小于该值的条目(回放删除记录时使用)
+
+        Returns:
+            None
+        """
+        code = self._session_codes.get(session_id)
+        if code is None:
+            return
+        end = len(self.items) if limit is None else limit
+        mask = self._item_sessions[:end] == code
+        self._alive[:end][mask] = False
+        for item_id in np.nonzero(mask)[0].tolist():
+            self._keys.pop(self.items[item_id].key, None)
+
+    def _apply_rename(self, old_id: str, new_id: str, limit: Optional[int] = None) -> int:
+        """
+        将某会话的条目改归新会话ID 并改写以旧ID为前缀的去重键
+
+        Args:
+            old_id (str): 原会话ID
+            new_id (str): 新会话ID
+            limit (Optional[int]): 只处理编号小于该值的条目(回放改名记录时使用)
+
+        Returns:
+            int: 改写的有效条目数
+        """
+        code = self._session_codes.get(old_id)
+        if code is None or not new_id:
+            return 0
+        end = len(self.items) if limit is None else limit
+        new_code = self._session_codes.setdefault(new_id, len(self._session_codes))
+        item_ids = np.nonzero(self._item_sessions[:end] == code)[0]
+        self._item_sessions[item_ids] = new_code
+        prefix = f"{old_id}:"
+        for item_id in item_ids.tolist():
+            item = self.items[item_id]
+            item.session_id = new_id
+            if item.key.startswith(prefix):
+                if self._keys.get(item.key) == item_id:
+                    del self._keys[item.key]
+                item.key = f"{new_id}:{item.key[len(prefix):]}"
+                if self._alive[item_id]:
+                    self._keys[item.key] = item_id
+        return int(self._alive[item_ids].sum())
+
+    def _rebuild_lookup(self) -> None:
+        """
+        截断条目后重建去重键与会话编码
+
+        Returns:
+            None
+        """
+        items = self.items
+        self.items, self._keys, self._session_codes = [], {}, {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._item_sessions = np.zeros(0, dtype=np.int32)
+        for item in items:
+            self._append_item(item)
+
+    def _write_meta(self) -> None:
+        """
+        写出存储元信息
+
+        Returns:
+            None
+        """
+        meta = {"version": STORE_VERSION, "dim": self.embedder.dim, "embedder": self.embedder.name}
+        (self.storage_path / META_FILE).write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def format_memories(memories: Sequence[Tuple[MemoryItem, float]]) -> List[str]:
+    """
+    将记忆格式化为注入上下文的文本行
+
+    Args:
+        memories (Sequence[Tuple[MemoryItem, float]]): 检索结果
+
+    Returns:
+        List[str]: 每条记忆一行 带日期与类型
+    """
+    labels = {"summary": "往事", "fact": "用户说过"}
+    return [
+        f"- [{item.created_at[:10]} {labels.get(item.kind, item.kind)}] {item.text}"
+        for item, _ in memories
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # 仓库根目录 用于定位默认的数据目录 模块需以 python -m 方式运行
+    root = Path(__file__).parent.parent
+
+    from config.paths import init_paths
+    from memory.embedding import create_embedder
+
+    parser = argparse.ArgumentParser(description="EmaAgent 长期记忆检索工具")
+    parser.add_argument("query", help="查询文本")
+    parser.add_argument("--dir", dest="storage_dir", help="存储目录 默认使用 data/long_term_memory")
+    parser.add_argument("-k", type=int, default=5, help="返回条数")
+    args = parser.parse_args()
+
+    paths = init_paths(root)
+    config = paths.load_config()
+    cfg = config.get("long_term_memory", {})
+    store = LongTermMemory(
+        Path(args.storage_dir) if args.storage_dir else paths.long_term_memory_dir,
+        create_embedder(config.get("embeddings"), cfg.get("embedder", "local"), int(cfg.get("local_dim", 256))),
+    )
+    for item, score in asyncio.run(store.recall(args.query, k=args.k)):
+        print(f"{score:.3f} [{item.kind} {item.session_id}] {item.text}")
@@ -3,17 +3,77 @@
 
 该模块负责会话的创建、加载、保存、删除与缓存管理
 并将会话元信息、消息历史和压缩记录持久化到文件系统
+
+存储模式:
+- snapshot: 每次保存重写 session.json / messages.json / compression.json
+- journal: 每次保存只向 journal.jsonl 追加增量 由后台线程定期压实为快照
+
+消息与压缩记录快照的格式由 snapshot_codec 决定(json / json_compact / msgpack) 读取时按文件自动识别
+
+长期未更新的会话可归档为单个压缩文件 加载时透明解压还原
+
+分支会话(fork_session)只落盘分支点之后的消息 加载时与父会话共享前缀消息对象
 """
 
+import os
 import shutil
-from typing import Dict, Optional, List
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, List, Tuple
 import uuid
 import json
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from utils.logger import logger
-from memory.schema import Session, Message, CompressionHistory
+from memory.archive import ARCHIVE_META_KEY, find_archive, read_archive, read_session_files, resolve_codec, write_archive
+from memory.cache import SessionCache
+from memory.catalog import SessionCatalog
+from memory.codec import (
+    COMPRESSION_STEM,
+    MESSAGES_STEM,
+    find_snapshot,
+    get_snapshot_codec,
+    read_snapshot,
+    write_snapshot,
+)
+from memory.search import SearchIndex
+from memory.journal import SessionJournal
+from memory.message_index import MessageFileIndex, VisibleIndex, dump_messages, is_visible, select_window
+from memory.persister import WriteBehindPersister
+from memory.schema import Session, Message, CompressionHistory, CompressionRecord
+
+
+STORAGE_MODES = {"snapshot", "journal"}
+# 只记录在 session.json 中的分支字段 不写入日志 父会话重命名时只需改写 session.json
+BRANCH_META_KEYS = ("parent_id", "branch_point")
+# 加载期间会话被后台归档时 重新还原归档的最大次数
+_ARCHIVE_RESTORE_ATTEMPTS = 3
+
+
+@dataclass
+class _PersistCursor:
+    """
+    会话持久化游标
+
+    记录某个会话对象已经落盘到哪里 用于计算下一次保存的增量
+
+    Args:
+        session_ref (weakref.ref): 会话对象弱引用 对象更换时游标失效
+        message_count (int): 已落盘的消息条数
+        last_message (Optional[Message]): 已落盘的最后一条消息 用于识别历史被替换
+        compression_count (int): 已落盘的压缩记录条数
+        journal_records (int): 活跃日志中的记录条数 用于触发压实
+        last_meta (Optional[Dict[str, Any]]): 已落盘的元信息 无变化时跳过写入
+    """
+    session_ref: "weakref.ref[Session]"
+    message_count: int
+    last_message: Optional[Message]
+    compression_count: int
+    journal_records: int = 0
+    last_meta: Optional[Dict[str, Any]] = None
 
 
 class SessionManager:
@@ -30,7 +90,18 @@ class SessionManager:
         SessionManager: SessionManager 实例
     """
 
-    def __init__(self, storage_path: Path):
+    def __init__(
+        self,
+        storage_path: Path,
+        storage_mode: str = "journal",
+        compact_threshold: int = 200,
+        cache_max_sessions: int = 64,
+        cache_max_bytes: int = 256 * 1024 * 1024,
+        write_behind: bool = True,
+        archive_after_days: float = 0,
+        archive_codec: str = "gzip",
+        snapshot_codec: str = "json",
+    ):
         """
         初始化会话管理器
 
@@ -38,24 +109,70 @@ class SessionManager:
 
         Args:
             storage_path (Path): 存储会话数据的目录路径
+            storage_mode (str): 存储模式 "journal"(追加日志) 或 "snapshot"(整份重写)
+            compact_threshold (int): 活跃日志记录数达到该值后触发后台压实
+            cache_max_sessions (int): 内存中常驻会话数量上限
+            cache_max_bytes (int): 内存中常驻会话近似字节上限 0 表示不限制
+            write_behind (bool): schedule_save 是否交给后台线程写回 关闭时同步保存
+            archive_after_days (float): 超过该天数未更新的会话可被归档 0 表示不归档
+            archive_codec (str): 归档压缩算法 "gzip" 或 "zstd"(需安装 zstandard)
+            snapshot_codec (str): 消息与压缩记录快照格式 "json" "json_compact" 或 "msgpack"(需安装 msgpack)
 
         Returns:
             None
 
         Raises:
-            ValueError: 当 storage_path 参数未提供时抛出
+            ValueError: 当 storage_path 参数未提供或 storage_mode 非法时抛出
 
         Examples:
             >>> manager = SessionManager(Path("./data/sessions"))
         """
         if storage_path is None:
             raise ValueError("必须提供 storage_path 参数")
+        if storage_mode not in STORAGE_MODES:
+            raise ValueError(f"不支持的 storage_mode: {storage_mode}")
 
         self.storage_path = Path(storage_path)
         self.storage_path.mkdir(parents=True, exist_ok=True)
+        self.storage_mode = storage_mode
+        self.compact_threshold = compact_threshold
+        self.archive_after_days = max(0.0, float(archive_after_days))
+        self.archive_codec = resolve_codec(archive_codec)
+        self.snapshot_codec = get_snapshot_codec(snapshot_codec)
+
+        # 内存缓存: key 为 session_id value 为会话对象 超出上限的空闲会话写回磁盘后休眠
+        self._cache = SessionCache(
+            max_sessions=cache_max_sessions,
+            max_bytes=cache_max_bytes,
+            on_evict=self._persist_evicted,
+        )
 
-        # 内存缓存: key 为 session_id value 为会话对象
-        self._cache: Dict[str, Session] = {}
+        # 持久化游标: key 为 session_id 记录每个会话已落盘的位置
+        self._cursors: Dict[str, _PersistCursor] = {}
+        # 日志对象按目录复用 保证同一目录的追加与轮转共享同一把锁
+        self._journals: Dict[Path, SessionJournal] = {}
+        self._journals_lock = threading.Lock()
+        # 后台压实线程 单线程即可 压实本身是顺序磁盘写
+        self._compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-compact")
+        self._compacting: set = set()
+        # 常驻会话的可见消息位置索引 用于分页读取消息
+        self._visible: Dict[str, VisibleIndex] = {}
+        # 已读出快照但尚未放入缓存的会话及其进行中的加载数 归档需跳过这些会话
+        self._loading: Dict[str, int] = {}
+
+        # 写锁: 串行化后台写回 淘汰写回与删除/重命名等目录操作
+        self.write_lock = threading.RLock()
+        # 后台写回队列: 同一会话的多次保存合并 只写最新状态
+        self._writer = WriteBehindPersister(self._write_behind) if write_behind else None
+
+        # 会话目录索引: 列表查询只读索引 首次创建时从现有目录重建
+        self.catalog = SessionCatalog(self.storage_path)
+        if self.catalog.created:
+            self.catalog.rebuild()
+        # 全文检索索引: 随保存增量更新 检索时不加载会话
+        self.search = SearchIndex(self.storage_path)
+        if self.search.created:
+            self.search.rebuild()
 
         logger.info(f"✅ SessionManager 初始化完成，存储路径: {self.storage_path.absolute()}")
 
@@ -95,7 +212,7 @@ class SessionManager:
 
     def _get_messages_file(self, session_id: str) -> Path:
         """
-        获取消息文件路径
+        获取消息文件路径 已存在的快照优先 否则为当前格式下的路径
 
         Args:
             session_id (str): 会话ID
@@ -108,24 +225,8 @@ class SessionManager:
             >>> path.name
             'messages.json'
         """
-        return self._get_session_dir(session_id) / "messages.json"
-
-    def _get_compression_file(self, session_id: str) -> Path:
-        """
-        获取压缩记录文件路径。
-
-        Args:
-            session_id (str): 会话ID
-
-        Returns:
-            Path: 压缩记录文件路径
-
-        Examples:
-            >>> path = manager._get_compression_file("abc123")
-            >>> path.name
-            'compression.json'
-        """
-        return self._get_session_dir(session_id) / "compression.json"
+        session_dir = self._get_session_dir(session_id)
+        return find_snapshot(session_dir, MESSAGES_STEM) or session_dir / self.snapshot_codec.filename(MESSAGES_STEM)
 
     def create_session(self, session_id: Optional[str] = None) -> Session:
         """
@@ -182,31 +283,35 @@ class SessionManager:
         if not session_file.exists():
             return None
 
+        session_dir = self._get_session_dir(session_id)
+        journal = self._get_journal(session_id)
         try:
-            # 加载会话元信息
-            with open(session_file, "r", encoding="utf-8") as f:
-                session_data = json.load(f)
-
-            session = Session.from_dict(session_data)
-
-            # 加载消息历史
-            messages_file = self._get_messages_file(session_id)
-            if messages_file.exists():
-                with open(messages_file, "r", encoding="utf-8") as f:
-                    messages_data = json.load(f)
-                session.messages = [
-                    Message.from_dict(m) for m in messages_data
-                ]
+            for _ in range(_ARCHIVE_RESTORE_ATTEMPTS):
+                # 已归档的会话先解压还原为明文快照 之后按常规路径加载
+                if not self._restore_archive(session_id):
+                    return None
+                # 快照写入与后台压实都持有 snapshot_lock 快照与日志需在同一把锁内读取 否则可能读到新快照 + 旧日志
+                with journal.snapshot_lock:
+                    # 还原后到持锁前 后台归档扫描可能再次归档该会话 归档同样持有此锁 锁内复查即可
+                    if find_archive(session_dir) is None:
+                        session, replayed = self._read_session_locked(session_id, journal)
+                        self._loading[session_id] = self._loading.get(session_id, 0) + 1
+                        break
+            else:
+                logger.error(f"❌ 加载会话失败 [{session_id}]: 会话在加载期间被反复归档")
+                return None
+        except Exception as e:
+            logger.error(f"❌ 加载会话失败 [{session_id}]: {e}")
+            return None
 
-            # 加载压缩记录
-            compression_file = self._get_compression_file(session_id)
-            if compression_file.exists():
-                try:
-                    with open(compression_file, "r", encoding="utf-8") as f:
-                        compression_data = json.load(f)
-                    session.compression_history = CompressionHistory.from_dict(compression_data)
-                except Exception as e:
-                    logger.warning(f"⚠️ 压缩记录加载失败: {e}")
+        try:
+            # 分支会话拼接父会话的前缀 消息对象与父会话共享
+            if session.parent_id is not None and not self._attach_parent(session):
+                # 前缀不完整 磁盘布局已与内存不一致 下次保存写出完整快照
+                self._cursors.pop(session_id, None)
+            else:
+                # 记录落盘游标 后续保存只需追加增量
+                self._remember_cursor(session, journal_records=replayed)
 
             # 放入缓存中 提升后续访问性能
             self._cache[session_id] = session
@@ -216,6 +321,109 @@ class SessionManager:
         except Exception as e:
             logger.error(f"❌ 加载会话失败 [{session_id}]: {e}")
             return None
+        finally:
+            with journal.snapshot_lock:
+                remaining = self._loading.pop(session_id) - 1
+                if remaining:
+                    self._loading[session_id] = remaining
+
+    def _read_session_locked(self, session_id: str, journal: SessionJournal) -> Tuple[Session, int]:
+        """
+        读取会话快照并回放追加日志 调用方需持有 journal.snapshot_lock
+
+        Args:
+            session_id (str): 会话ID
+            journal (SessionJournal): 会话的追加日志
+
+        Returns:
+            Tuple[Session, int]: 会话对象与回放的日志记录数
+        """
+        session_file = self._get_session_file(session_id)
+        session_dir = self._get_session_dir(session_id)
+        # 加载会话元信息
+        with open(session_file, "r", encoding="utf-8") as f:
+            session_data = json.load(f)
+
+        session = Session.from_dict(session_data)
+
+        # 加载消息历史 格式按快照文件自动识别 分支会话只有分支点之后的消息
+        messages_data = read_snapshot(session_dir, MESSAGES_STEM)
+        if messages_data is not None:
+            session.messages = [
+                Message.from_dict(m) for m in messages_data
+            ]
+
+        # 加载压缩记录
+        try:
+            compression_data = read_snapshot(session_dir, COMPRESSION_STEM)
+            if compression_data is not None:
+                session.compression_history = CompressionHistory.from_dict(compression_data)
+        except Exception as e:
+            logger.warning(f"⚠️ 压缩记录加载失败: {e}")
+
+        # 在快照之上回放追加日志 得到最新状态
+        replayed = self._replay_journal(session, journal) if journal.has_records() else 0
+        return session, replayed
+
+    def _attach_parent(self, session: Session) -> bool:
+        """
+        在分支会话的自有消息之前拼接父会话的前缀
+
+        父会话优先取缓存 未常驻时按常规路径加载(父会话本身也可以是分支)
+        前缀是父会话消息列表的切片 只复制引用 不重复反序列化消息
+
+        Args:
+            session (Session): 已加载自有消息的分支会话
+
+        Returns:
+            bool: 前缀完整返回 True 父会话缺失或消息不足时解除分支关系并返回 False
+        """
+        parent = self._cache.get(session.parent_id)
+        if parent is None:
+            parent = self.load_session(session.parent_id)
+        if parent is not None and len(parent.messages) >= session.branch_point:
+            session.messages = parent.messages[:session.branch_point] + session.messages
+            return True
+
+        prefix = parent.messages[:session.branch_point] if parent is not None else []
+        logger.warning(
+            f"⚠️ 分支会话的父会话缺失或消息不足 解除分支关系: {session.session_id} "
+            f"(父会话 {session.parent_id} 分支点 {session.branch_point} 可用 {len(prefix)} 条)"
+        )
+        session.messages = prefix + session.messages
+        session.parent_id = None
+        session.branch_point = 0
+        return False
+
+    @staticmethod
+    def _branch_base(session: Session) -> int:
+        """
+        获取会话落盘消息的起始位置 分支会话为分支点 普通会话为 0
+
+        Args:
+            session (Session): 会话对象
+
+        Returns:
+            int: 共享前缀条数
+        """
+        return session.branch_point if session.parent_id is not None else 0
+
+    @staticmethod
+    def _journal_meta(session: Session) -> Dict[str, Any]:
+        """
+        获取写入日志的元信息 session_id 以目录为准 分支字段只记录在 session.json 中
+
+        Args:
+            session (Session): 会话对象
+
+        Returns:
+            Dict[str, Any]: 元信息字典
+        """
+        meta = session.to_dict()
+        meta.pop("session_id", None)
+        for key in BRANCH_META_KEYS:
+            meta.pop(key, None)
+        return meta
 
     def get_or_create_session(self, session_id: str = None) -> Session:
         """
@@ -237,8 +445,8 @@ class SessionManager:
             True
         """
         # 优先从缓存中找
-        if session_id in self._cache:
-            session = self._cache[session_id]
+        session = self._cache.get(session_id)
+        if session is not None:
             logger.info(f"📂 从缓存加载会话: {session_id}")
         else:
             # 缓存未命中时从磁盘加载
@@ -270,6 +478,22 @@ class SessionManager:
         Examples:
             >>> manager.save_session(session)
         """
+        with self.write_lock:
+            self._save_locked(session)
+        # 会话在使用中增长 保存后刷新缓存占用并按上限淘汰其他空闲会话
+        # 必须在释放写锁后调用 淘汰回调会获取写锁
+        self._cache.refresh(session.session_id)
+
+    def _save_locked(self, session: Session):
+        """
+        刷新更新时间并落盘 调用方需持有 write_lock
+
+        Args:
+            session (Session): 需要保存的会话对象
+
+        Returns:
+            None
+        """
         # 刷新更新时间 反映最新修改时间点
         session.updated_at = datetime.now().isoformat()
 
@@ -277,13 +501,508 @@ class SessionManager:
         session_dir = self._get_session_dir(session.session_id)
         session_dir.mkdir(parents=True, exist_ok=True)
 
-        # 分文件写入 避免单文件结构过大难维护
-        self._save_session_meta(session)
-        self._save_messages(session)
-        self._save_compression(session)
+        self._persist(session)
 
+    def schedule_save(self, session: Session):
+        """
+        异步保存会话 立即返回
+
+        保存请求进入后台写回队列 未启用写回时退化为同步保存
+
+        Args:
+            session (Session): 需要保存的会话对象
+
+        Returns:
+            None
+
+        Examples:
+            >>> manager.schedule_save(session)
+            >>> manager.flush()
+            True
+        """
+        if self._writer is None:
+            self.save_session(session)
+            return
+        self._writer.enqueue(session)
+
+    def _write_behind(self, session: Session):
+        """
+        后台写回回调
+
+        会话目录已被删除时跳过 避免出队晚于删除而重新创建目录
+
+        Args:
+            session (Session): 需要保存的会话对象
+
+        Returns:
+            None
+        """
+        with self.write_lock:
+            if not self._get_session_file(session.session_id).exists():
+                logger.debug(f"⏭️ 会话已删除 跳过后台保存: {session.session_id}")
+                return
+            self._save_locked(session)
+        self._cache.refresh(session.session_id)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待后台写回队列排空
+
+        Args:
+            timeout (Optional[float]): 最长等待秒数 None 表示一直等待
+
+        Returns:
+            bool: 在超时前排空返回 True
+
+        Examples:
+            >>> manager.flush()
+            True
+        """
+        if self._writer is None:
+            return True
+        return self._writer.flush(timeout)
+
+    async def aflush(self, timeout: Optional[float] = None) -> bool:
+        """
+        在线程池中等待后台写回队列排空 不阻塞事件循环
+
+        Args:
+            timeout (Optional[float]): 最长等待秒数
+
+        Returns:
+            bool: 在超时前排空返回 True
+
+        Examples:
+            >>> await manager.aflush()
+            True
+        """
+        if self._writer is None:
+            return True
+        return await self._writer.aflush(timeout)
+
+    def persist_stats(self) -> Dict[str, Any]:
+        """
+        获取后台写回队列统计
+
+        Args:
+            None
+
+        Returns:
+            Dict[str, Any]: 队列深度 合并次数与写入延迟
+
+        Examples:
+            >>> manager.persist_stats()["queue_depth"]
+            0
+        """
+        if self._writer is None:
+            return {"enabled": False}
+        return {"enabled": True, **self._writer.stats()}
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        排空写回队列并等待后台压实完成 进程退出前调用
+
+        Args:
+            timeout (Optional[float]): 写回队列最长等待秒数
+
+        Returns:
+            bool: 写回队列是否在超时前排空
+
+        Examples:
+            >>> manager.close()
+            True
+        """
+        drained = self._writer.close(timeout) if self._writer is not None else True
+        self.wait_for_compaction()
+        return drained
+
+    def _persist(self, session: Session):
+        """
+        按存储模式落盘 不修改 updated_at
+
+        Args:
+            session (Session): 需要保存的会话对象
+
+        Returns:
+            None
+        """
+        # 日志模式下优先追加增量 游标失效(首次保存 历史被裁剪或替换)时回退为完整快照
+        if self.storage_mode == "journal" and self._append_to_journal(session):
+            self._update_catalog(session)
+            logger.debug(f"💾 追加保存会话: {session.session_id}")
+            return
+
+        self._get_session_dir(session.session_id).mkdir(parents=True, exist_ok=True)
+        self._save_snapshot(session)
+        self._update_catalog(session)
         logger.debug(f"💾 保存会话: {session.session_id}")
 
+    def _update_catalog(self, session: Session):
+        """
+        同步会话目录索引与检索索引 索引是派生数据 失败只记录日志
+
+        Args:
+            session (Session): 已落盘的会话对象
+
+        Returns:
+            None
+        """
+        try:
+            self.catalog.upsert(session.to_dict(), len(session.messages))
+        except Exception as e:
+            logger.warning(f"⚠️ 会话索引更新失败 [{session.session_id}]: {e}")
+        try:
+            self.search.index_session(session.session_id, list(session.messages), self._branch_base(session))
+        except Exception as e:
+            logger.warning(f"⚠️ 检索索引更新失败 [{session.session_id}]: {e}")
+
+    def _persist_evicted(self, session: Session):
+        """
+        缓存淘汰回调: 将空闲会话写回磁盘
+
+        缓存在释放自身的锁后调用 启用写回队列时交给后台线程 不在事件循环中写盘
+
+        Args:
+            session (Session): 被淘汰的会话对象
+
+        Returns:
+            None
+        """
+        self._visible.pop(session.session_id, None)
+        if self._writer is not None:
+            self._writer.enqueue(session, write_fn=self._write_evicted)
+            return
+        try:
+            self._write_evicted(session)
+        except Exception as e:
+            logger.error(f"❌ 休眠会话写回失败 [{session.session_id}]: {e}")
+
+    def _write_evicted(self, session: Session):
+        """
+        写回被淘汰的会话 不修改 updated_at 会话目录已被删除时跳过
+
+        Args:
+            session (Session): 被淘汰的会话对象
+
+        Returns:
+            None
+        """
+        with self.write_lock:
+            if not self._get_session_file(session.session_id).exists():
+                return
+            self._persist(session)
+        logger.debug(f"💤 会话休眠: {session.session_id}")
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        获取会话缓存统计
+
+        Args:
+            None
+
+        Returns:
+            Dict[str, Any]: 命中 未命中 淘汰计数与当前常驻容量
+
+        Examples:
+            >>> manager.cache_stats()["evictions"]
+            0
+        """
+        return self._cache.stats()
+
+    def _save_snapshot(self, session: Session):
+        """
+        写入完整快照并清空追加日志
+
+        Args:
+            session (Session): 需要保存的会话对象
+
+        Returns:
+            None
+        """
+        journal = self._get_journal(session.session_id)
+        # 后台写回时事件循环可能仍在追加消息 先截取列表 游标与写出内容保持一致
+        messages = list(session.messages)
+        base = self._branch_base(session)
+        if len(messages) < base:
+            # 历史被裁剪到分支点之前 共享前缀已不成立 转为普通会话
+            session.parent_id = None
+            session.branch_point = base = 0
+        with journal.snapshot_lock:
+            journal.generation += 1
+            # 分文件写入 避免单文件结构过大难维护 分支会话只写出自有消息
+            self._save_session_meta(session)
+            self._save_messages(session, messages[base:])
+            self._save_compression(session)
+            journal.reset()
+        self._remember_cursor(session, messages=messages)
+
+    def _append_to_journal(self, session: Session) -> bool:
+        """
+        将会话相对上次落盘的增量追加到日志
+
+        Args:
+            session (Session): 需要保存的会话对象
+
+        Returns:
+            bool: 成功追加返回 True 游标失效需要完整快照时返回 False
+        """
+        cursor = self._cursors.get(session.session_id)
+        if cursor is None or cursor.session_ref() is not session:
+            return False
+        # 目录在外部被删除或替换时 需要重新写出完整快照
+        if not self._get_session_file(session.session_id).exists():
+            return False
+
+        # 后台写回时事件循环可能仍在追加消息 先截取列表 游标与写出内容保持一致
+        messages = list(session.messages)
+        count = cursor.message_count
+        base = self._branch_base(session)
+        # 历史被裁剪或已落盘的尾消息被替换 增量无法表达 回退为快照
+        if len(messages) < count or len(messages) < base:
+            return False
+        if count and messages[count - 1] is not cursor.last_message:
+            return False
+
+        records: List[Dict[str, Any]] = [
+            # 日志中的位置相对落盘消息 分支会话不含共享前缀
+            {"op": "append", "index": index - base, "message": messages[index].to_dict(cache=False)}
+            for index in range(max(count, base), len(messages))
+        ]
+
+        history = session.compression_history
+        if len(history.records) < cursor.compression_count:
+            return False
+        if len(history.records) > cursor.compression_count:
+            records.append({
+                "op": "compression",
+                "offset": cursor.compression_count,
+                "records": [r.to_dict() for r in history.records[cursor.compression_count:]],
+            })
+
+        # 元信息体积固定 有变化时写一条即可
+        meta = self._journal_meta(session)
+        if meta != cursor.last_meta:
+            records.append({"op": "meta", "data": meta})
+        if not records:
+            return True
+
+        journal = self._get_journal(session.session_id)
+        written = journal.append(records)
+
+        cursor.message_count = len(messages)
+        cursor.last_message = messages[-1] if messages else None
+        cursor.compression_count = len(history.records)
+        cursor.journal_records += written
+        cursor.last_meta = meta
+
+        if cursor.journal_records >= self.compact_threshold:
+            self._schedule_compaction(session, journal, cursor)
+        return True
+
+    def _replay_journal(self, session: Session, journal: SessionJournal) -> int:
+        """
+        在已加载的快照上回放追加日志
+
+        append 与 compression 记录带有位置信息 已包含在快照中的记录会被跳过
+        因此压实中途退出时重复回放也不会产生重复数据
+        分支会话在拼接父会话前缀之前回放 append 位置相对自有消息
+
+        Args:
+            session (Session): 已加载快照的会话对象
+            journal (SessionJournal): 会话日志对象
+
+        Returns:
+            int: 回放的记录条数
+        """
+        replayed = 0
+        for record in journal.replay():
+            replayed += 1
+            op = record.get("op")
+            if op == "append":
+                index = record.get("index", len(session.messages))
+                if index == len(session.messages):
+                    session.messages.append(Message.from_dict(record["message"]))
+                elif index > len(session.messages):
+                    logger.warning(f"⚠️ 日志消息索引不连续: {session.session_id} @ {index}")
+            elif op == "compression":
+                history = session.compression_history
+                offset = record.get("offset", len(history.records))
+                for i, data in enumerate(record.get("records", [])):
+                    if offset + i == len(history.records):
+                        history.add_record(CompressionRecord.from_dict(data))
+            elif op == "meta":
+                # session_id 以目录为准 重命名后不会被旧记录覆盖 分支字段以 session.json 为准
+                for key, value in record.get("data", {}).items():
+                    if key != "session_id" and key not in BRANCH_META_KEYS and hasattr(session, key):
+                        setattr(session, key, value)
+        return replayed
+
+    def _schedule_compaction(self, session: Session, journal: SessionJournal, cursor: _PersistCursor):
+        """
+        轮转活跃日志并提交后台压实任务
+
+        压实使用当前内存中的状态生成快照 新的保存继续写入新的活跃日志
+
+        Args:
+            session (Session): 会话对象
+            journal (SessionJournal): 会话日志对象
+            cursor (_PersistCursor): 会话持久化游标
+
+        Returns:
+            None
+        """
+        session_dir = journal.session_dir
+        if session_dir in self._compacting:
+            return
+        if not journal.rotate():
+            return
+
+        cursor.journal_records = 0
+        self._compacting.add(session_dir)
+
+        # 在调用线程中截取当前状态 列表复制只拷贝引用 成本远低于序列化
+        meta = session.to_dict()
+        messages = list(session.messages)[self._branch_base(session):]
+        compression = session.compression_history.to_dict()
+
+        future = self._compactor.submit(
+            self._compact, journal, journal.generation, meta, messages, compression
+        )
+        future.add_done_callback(lambda _: self._compacting.discard(session_dir))
+
+    def _compact(
+        self,
+        journal: SessionJournal,
+        generation: int,
+        meta: Dict[str, Any],
+        messages: List[Message],
+        compression: Dict[str, Any],
+    ):
+        """
+        后台压实: 写出快照并删除已折叠的日志段
+
+        Args:
+            journal (SessionJournal): 会话日志对象
+            generation (int): 提交时的快照代次 期间写过完整快照则放弃本次压实
+            meta (Dict[str, Any]): 截取时的会话元信息
+            messages (List[Message]): 截取时的消息列表
+            compression (Dict[str, Any]): 截取时的压缩历史
+
+        Returns:
+            None
+        """
+        session_dir = journal.session_dir
+        try:
+            with journal.snapshot_lock:
+                # 期间已写入更新的完整快照 本次截取的状态已过期
+                if journal.generation != generation:
+                    return
+                # 会话在压实期间被删除或重命名 放弃本次压实 日志段会随目录一起处理
+                if not session_dir.exists():
+                    return
+                dump_messages(session_dir, [m.to_dict(cache=False) for m in messages], self.snapshot_codec)
+                write_snapshot(session_dir, COMPRESSION_STEM, compression, self.snapshot_codec)
+                self._write_json(session_dir / "session.json", meta)
+                journal.discard_compacted()
+            logger.debug(f"🗜️ 会话日志压实完成: {session_dir.name} ({len(messages)} 条消息)")
+        except Exception as e:
+            logger.error(f"❌ 会话日志压实失败 [{session_dir.name}]: {e}")
+
+    def wait_for_compaction(self) -> None:
+        """
+        等待已提交的后台压实任务完成
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        Examples:
+            >>> manager.wait_for_compaction()
+        """
+        self._compactor.submit(lambda: None).result()
+
+    def _get_journal(self, session_id: str) -> SessionJournal:
+        """
+        获取会话目录对应的日志对象
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            SessionJournal: 日志对象
+        """
+        session_dir = self._get_session_dir(session_id)
+        with self._journals_lock:
+            journal = self._journals.get(session_dir)
+            if journal is None:
+                journal = SessionJournal(session_dir)
+                self._journals[session_dir] = journal
+            return journal
+
+    def _drop_journal(self, session_id: str) -> None:
+        """
+        移除会话目录对应的日志对象 目录被重命名后旧路径的日志对象不再使用
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            None
+        """
+        with self._journals_lock:
+            self._journals.pop(self._get_session_dir(session_id), None)
+
+    def _remember_cursor(
+        self,
+        session: Session,
+        journal_records: int = 0,
+        messages: Optional[List[Message]] = None,
+    ):
+        """
+        记录会话当前已落盘的位置
+
+        Args:
+            session (Session): 会话对象
+            journal_records (int): 活跃日志中已有的记录条数
+            messages (Optional[List[Message]]): 实际写出的消息列表 默认取会话当前消息
+
+        Returns:
+            None
+        """
+        if messages is None:
+            messages = session.messages
+        meta = self._journal_meta(session)
+        self._cursors[session.session_id] = _PersistCursor(
+            session_ref=weakref.ref(session),
+            message_count=len(messages),
+            last_message=messages[-1] if messages else None,
+            compression_count=len(session.compression_history.records),
+            journal_records=journal_records,
+            last_meta=meta,
+        )
+
+    @staticmethod
+    def _write_json(path: Path, data: Any, indent: Optional[int] = 2):
+        """
+        原子写入 JSON 文件
+
+        先写临时文件再 os.replace 避免写入中途退出留下半个文件
+
+        Args:
+            path (Path): 目标文件路径
+            data (Any): 可序列化数据
+            indent (Optional[int]): 缩进 None 表示紧凑格式
+
+        Returns:
+            None
+        """
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+        os.replace(tmp_path, path)
+
     def _save_session_meta(self, session: Session):
         """
         保存会话元信息
@@ -299,15 +1018,15 @@ class SessionManager:
         """
         # 获取会话元信息文件路径并写入 JSON 格式数据
         session_file = self._get_session_file(session.session_id)
-        with open(session_file, "w", encoding="utf-8") as f:
-            json.dump(session.to_dict(), f, ensure_ascii=False, indent=2)
+        self._write_json(session_file, session.to_dict())
 
-    def _save_messages(self, session: Session):
+    def _save_messages(self, session: Session, messages: Optional[List[Message]] = None):
         """
         保存会话消息历史
 
         Args:
             session (Session): 会话类
+            messages (Optional[List[Message]]): 要写出的消息列表 默认取会话当前消息
 
         Returns:
             None
@@ -315,13 +1034,12 @@ class SessionManager:
         Examples:
             >>> manager._save_messages(session)
         """
-        # 获取消息文件路径并写入消息列表的 JSON 格式数据
-        messages_file = self._get_messages_file(session.session_id)
-        messages_data = [m.to_dict() for m in session.messages]
+        if messages is None:
+            messages = session.messages
+        messages_data = [m.to_dict(cache=False) for m in messages]
 
-        # 写入
-        with open(messages_file, "w", encoding="utf-8") as f:
-            json.dump(messages_data, f, ensure_ascii=False, indent=2)
+        # 按当前快照格式写入 同时生成偏移索引 供分页读取使用
+        dump_messages(self._get_session_dir(session.session_id), messages_data, self.snapshot_codec)
 
     def _save_compression(self, session: Session):
         """
@@ -336,15 +1054,13 @@ class SessionManager:
         Examples:
             >>> manager._save_compression(session)
         """
-        # 获取压缩记录文件路径并写入压缩历史的 JSON 格式数据
-        compression_file = self._get_compression_file(session.session_id)
-        with open(compression_file, "w", encoding="utf-8") as f:
-            json.dump(
-                session.compression_history.to_dict(),
-                f,
-                ensure_ascii=False,
-                indent=2
-            )
+        # 按当前快照格式写入压缩历史
+        write_snapshot(
+            self._get_session_dir(session.session_id),
+            COMPRESSION_STEM,
+            session.compression_history.to_dict(),
+            self.snapshot_codec,
+        )
 
     def delete_session(self, session_id: str) -> bool:
         """
@@ -365,20 +1081,224 @@ class SessionManager:
         if not session_dir.exists():
             return False
 
-        try:
-            # 物理删除会话目录 shutil.rmtree 会递归删除整个目录及其内容 包括 session.json messages.json compression.json 等所有文件
-            shutil.rmtree(session_dir)
+        # 丢弃尚未落盘的保存 持有写锁避免进行中的后台写回重新创建目录
+        if self._writer is not None:
+            self._writer.discard(session_id)
 
-            # 同步移除缓存中的会话对象 避免后续访问时出现残留数据
-            if session_id in self._cache:
-                del self._cache[session_id]
+        with self.write_lock:
+            try:
+                # 分支依赖本会话的消息作为前缀 删除前先把前缀写入各分支自身
+                self._detach_branches(session_id)
 
-            logger.info(f"🗑️ 删除会话: {session_id}")
-            return True
+                # 物理删除会话目录 shutil.rmtree 会递归删除整个目录及其内容 包括 session.json messages.json compression.json 等所有文件
+                shutil.rmtree(session_dir)
 
-        except Exception as e:
-            logger.error(f"❌ 删除会话失败 [{session_id}]: {e}")
-            return False
+                # 同步移除缓存中的会话对象 避免后续访问时出现残留数据
+                if session_id in self._cache:
+                    del self._cache[session_id]
+                self._cursors.pop(session_id, None)
+                self._visible.pop(session_id, None)
+                self.catalog.remove(session_id)
+                self.search.remove(session_id)
+
+                logger.info(f"🗑️ 删除会话: {session_id}")
+                return True
+
+            except Exception as e:
+                logger.error(f"❌ 删除会话失败 [{session_id}]: {e}")
+                return False
+
+    def fork_session(self, session_id: str, at: int, new_id: Optional[str] = None) -> Optional[Session]:
+        """
+        从会话的第 at 条消息处创建分支
+
+        分支与父会话共享前 at 条消息 只写出元信息与覆盖前缀的压缩记录 不复制消息
+        创建成本与历史长度无关 分支首次访问时按常规路径加载并拼接父会话的前缀
+
+        Args:
+            session_id (str): 父会话ID
+            at (int): 分支点 分支保留父会话的前 at 条消息
+            new_id (Optional[str]): 分支会话ID 默认自动生成
+
+        Returns:
+            Optional[Session]: 分支会话对象(消息尚未加载) 父会话不存在返回 None
+
+        Raises:
+            ValueError: 分支点超出父会话消息范围或 new_id 已存在时抛出
+
+        Examples:
+            >>> branch = manager.fork_session("demo", at=4)
+            >>> branch.parent_id, branch.branch_point
+            ('demo', 4)
+        """
+        new_id = new_id or self._generate_id()
+        with self.write_lock:
+            if self._get_session_dir(new_id).exists():
+                raise ValueError(f"会话已存在: {new_id}")
+
+            parent = self._cache.get(session_id)
+            if parent is not None:
+                # 分支引用的前缀必须已经落盘 先写出常驻父会话的未保存消息
+                self._persist(parent)
+                meta = parent.to_dict()
+                count = len(parent.messages)
+                records = list(parent.compression_history.records)
+            else:
+                if not self._get_session_file(session_id).exists():
+                    return None
+                if not self._restore_archive(session_id):
+                    return None
+                meta, count, records = self._read_fork_source(session_id)
+
+            if not 0 <= at <= count:
+                raise ValueError(f"分支点超出范围: {at} (会话共有 {count} 条消息)")
+
+            now = datetime.now().isoformat()
+            branch = Session.from_dict({
+                **meta,
+                "session_id": new_id,
+                "created_at": now,
+                "updated_at": now,
+                "total_runs": 0,
+                "parent_id": session_id,
+                "branch_point": at,
+            })
+            # 只继承完全落在前缀内的摘要 已压缩游标随之回退到分支点之前
+            branch.compressed_until_index = 0
+            for record in records:
+                if record.covers()[1] <= at:
+                    branch.compression_history.add_record(record)
+                    branch.compressed_until_index = max(branch.compressed_until_index, record.covers()[1])
+
+            session_dir = self._get_session_dir(new_id)
+            session_dir.mkdir(parents=True)
+            journal = self._get_journal(new_id)
+            with journal.snapshot_lock:
+                journal.generation += 1
+                self._save_session_meta(branch)
+                self._save_messages(branch, [])
+                self._save_compression(branch)
+            self.catalog.upsert(branch.to_dict(), at)
+
+        logger.info(f"🌿 创建分支: {new_id} <- {session_id} @ {at}")
+        return branch
+
+    def _read_fork_source(self, session_id: str) -> Tuple[Dict[str, Any], int, List[CompressionRecord]]:
+        """
+        读取未常驻父会话的元信息 消息条数与压缩记录 不反序列化消息
+
+        消息条数优先取 messages.idx 追加日志只需扫描 条数受压实阈值约束
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            Tuple[Dict[str, Any], int, List[CompressionRecord]]: 回放日志后的元信息 消息条数(含共享前缀) 压缩记录
+        """
+        session_dir = self._get_session_dir(session_id)
+        journal = self._get_journal(session_id)
+        with journal.snapshot_lock:
+            meta = json.loads((session_dir / "session.json").read_text(encoding="utf-8"))
+            compression = read_snapshot(session_dir, COMPRESSION_STEM) or {}
+            records = [CompressionRecord.from_dict(r) for r in compression.get("records", [])]
+
+            file_index = MessageFileIndex.load(self._get_messages_file(session_id))
+            if file_index is not None:
+                count = file_index.count
+            else:
+                count = len(read_snapshot(session_dir, MESSAGES_STEM) or [])
+
+            for record in journal.replay():
+                op = record.get("op")
+                if op == "append" and record.get("index") == count:
+                    count += 1
+                elif op == "compression":
+                    offset = record.get("offset", len(records))
+                    for i, data in enumerate(record.get("records", [])):
+                        if offset + i == len(records):
+                            records.append(CompressionRecord.from_dict(data))
+                elif op == "meta":
+                    meta.update({
+                        k: v for k, v in record.get("data", {}).items()
+                        if k != "session_id" and k not in BRANCH_META_KEYS
+                    })
+
+        base = int(meta.get("branch_point", 0)) if meta.get("parent_id") is not None else 0
+        return meta, base + count, records
+
+    def _detach_branches(self, session_id: str, after: Optional[int] = None) -> int:
+        """
+        将分支的共享前缀写入分支自身的快照 解除与父会话的关系
+
+        父会话被删除或历史被裁剪到分支点之前时调用 被解除的分支加载后留在缓存中
+
+        Args:
+            session_id (str): 父会话ID
+            after (Optional[int]): 只处理分支点大于该值的分支 None 表示全部
+
+        Returns:
+            int: 解除的分支数
+        """
+        detached = 0
+        with self.write_lock:
+            for child_id in self.catalog.children(session_id):
+                child = self._cache.get(child_id)
+                if child is None:
+                    child = self.load_session(child_id)
+                if child is None or child.parent_id != session_id:
+                    continue
+                if after is not None and child.branch_point <= after:
+                    continue
+                child.parent_id = None
+                child.branch_point = 0
+                self._save_snapshot(child)
+                # 检索索引原先跳过了共享前缀 整体重建该会话的条目
+                self.search.remove(child_id)
+                self._update_catalog(child)
+                detached += 1
+                logger.info(f"🌿 分支转为独立会话: {child_id} (父会话 {session_id})")
+        return detached
+
+    def repoint_branches(self, old_id: str, new_id: str) -> int:
+        """
+        父会话重命名后 更新分支 session.json 中的父会话ID
+
+        需在目录重命名与目录索引 rename 之后调用 分支字段不写入日志 只需改写 session.json
+
+        Args:
+            old_id (str): 父会话原ID
+            new_id (str): 父会话新ID
+
+        Returns:
+            int: 更新的分支数
+
+        Examples:
+            >>> manager.repoint_branches("demo", "demo-renamed")
+            0
+        """
+        updated = 0
+        with self.write_lock:
+            for child_id in self.catalog.children(new_id):
+                child = self._cache.get(child_id)
+                if child is not None and child.parent_id == old_id:
+                    child.parent_id = new_id
+
+                session_file = self._get_session_file(child_id)
+                journal = self._get_journal(child_id)
+                with journal.snapshot_lock:
+                    # 使进行中的后台压实作废 其截取的元信息仍指向旧ID
+                    journal.generation += 1
+                    try:
+                        meta = json.loads(session_file.read_text(encoding="utf-8"))
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"⚠️ 更新分支父会话失败 [{child_id}]: {e}")
+                        continue
+                    if meta.get("parent_id") != old_id:
+                        continue
+                    meta["parent_id"] = new_id
+                    self._write_json(session_file, meta)
+                updated += 1
+        return updated
 
     def list_sessions(self) -> List[Dict]:
         """
@@ -404,6 +1324,436 @@ class SessionManager:
 
         return sorted(sessions)
 
+    def list_session_summaries(self, offset: int = 0, limit: Optional[int] = None) -> tuple:
+        """
+        从目录索引分页列出会话摘要 不读取任何消息文件
+
+        Args:
+            offset (int): 跳过条数
+            limit (Optional[int]): 返回条数上限 None 表示全部
+
+        Returns:
+            tuple: (按更新时间倒序的摘要列表, 会话总数)
+
+        Examples:
+            >>> summaries, total = manager.list_session_summaries(limit=20)
+        """
+        return self.catalog.list(offset=offset, limit=limit), self.catalog.count()
+
+    def rebuild_catalog(self) -> int:
+        """
+        扫描会话目录重建索引 用于索引损坏或目录被外部修改后
+
+        Args:
+            None
+
+        Returns:
+            int: 重建后的会话数
+
+        Examples:
+            >>> manager.rebuild_catalog()
+        """
+        return self.catalog.rebuild()
+
+    def search_messages(
+        self,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        session_id: Optional[str] = None,
+    ) -> tuple:
+        """
+        全文检索全部会话的可见消息 只查询检索索引 不加载会话
+
+        Args:
+            query (str): 检索词 多个词之间为 AND 关系
+            limit (int): 返回条数上限
+            offset (int): 跳过条数
+            session_id (Optional[str]): 只在指定会话中检索
+
+        Returns:
+            tuple: (按相关度排序的命中列表, 命中总数)
+
+        Examples:
+            >>> hits, total = manager.search_messages("天气")
+        """
+        return self.search.search(query, limit=limit, offset=offset, session_id=session_id)
+
+    def is_archived(self, session_id: str) -> bool:
+        """
+        判断会话是否已归档
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            bool: 会话目录中存在归档文件返回 True
+
+        Examples:
+            >>> manager.is_archived("demo")
+            False
+        """
+        return find_archive(self._get_session_dir(session_id)) is not None
+
+    def archive_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        将会话的消息历史与压缩记录打包为单个压缩文件
+
+        常驻内存(含休眠后仍被引用) 正在加载或已归档的会话不处理
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            Optional[Dict[str, Any]]: 归档信息(算法 消息条数 压缩前后字节数) 未归档返回 None
+
+        Examples:
+            >>> info = manager.archive_session("demo")
+        """
+        session_dir = self._get_session_dir(session_id)
+        with self.write_lock:
+            if session_id in self._cache or not (session_dir / "session.json").exists():
+                return None
+            if find_archive(session_dir) is not None:
+                return None
+
+            journal = self._get_journal(session_id)
+            with journal.snapshot_lock:
+                # 已读出快照的加载即将放入缓存 此时归档会使其后的保存落在被删除的快照之上
+                if session_id in self._loading:
+                    return None
+                # 使进行中的后台压实作废 日志内容已折叠进归档
+                journal.generation += 1
+                meta, messages, compression = read_session_files(session_dir)
+                info = write_archive(session_dir, meta, messages, compression, codec=self.archive_codec)
+                journal.reset()
+            self._cursors.pop(session_id, None)
+            self._visible.pop(session_id, None)
+
+        logger.debug(
+            f"📦 归档会话: {session_id} ({info['raw_bytes']} -> {info['archived_bytes']} 字节)"
+        )
+        return info
+
+    def archive_cold_sessions(self, days: Optional[float] = None) -> Dict[str, Any]:
+        """
+        归档超过指定天数未更新的会话
+
+        候选会话从目录索引按 updated_at 筛选 不扫描会话目录
+
+        Args:
+            days (Optional[float]): 未更新天数阈值 None 表示使用 archive_after_days
+
+        Returns:
+            Dict[str, Any]: 归档会话数 跳过数 压缩前后总字节数
+
+        Examples:
+            >>> manager.archive_cold_sessions(days=30)["archived"]
+            0
+        """
+        days = self.archive_after_days if days is None else days
+        stats = {"archived": 0, "skipped": 0, "raw_bytes": 0, "archived_bytes": 0}
+        if not days or days <= 0:
+            return stats
+
+        cutoff = datetime.now() - timedelta(days=days)
+        for session_id in self.catalog.list_stale(cutoff.isoformat()):
+            # 近期被还原(读取)过的会话 session.json 会被重写 视为仍在使用
+            try:
+                if self._get_session_file(session_id).stat().st_mtime > cutoff.timestamp():
+                    stats["skipped"] += 1
+                    continue
+            except OSError:
+                stats["skipped"] += 1
+                continue
+            try:
+                info = self.archive_session(session_id)
+            except Exception as e:
+                logger.error(f"❌ 归档会话失败 [{session_id}]: {e}")
+                info = None
+            if info is None:
+                stats["skipped"] += 1
+                continue
+            stats["archived"] += 1
+            stats["raw_bytes"] += info["raw_bytes"]
+            stats["archived_bytes"] += info["archived_bytes"]
+
+        if stats["archived"]:
+            logger.info(
+                f"📦 冷会话归档完成: {stats['archived']} 个会话 "
+                f"{stats['raw_bytes']} -> {stats['archived_bytes']} 字节"
+            )
+        return stats
+
+    def migrate_snapshots(self, codec: Optional[str] = None) -> Dict[str, Any]:
+        """
+        将全部会话的消息与压缩记录快照重写为指定格式
+
+        只转换快照文件 追加日志保持不变 已归档的会话跳过(还原时按当前格式写出)
+
+        Args:
+            codec (Optional[str]): 目标格式 None 表示使用 snapshot_codec
+
+        Returns:
+            Dict[str, Any]: 迁移统计 包含转换与跳过的会话数及转换前后字节数
+
+        Examples:
+            >>> manager.migrate_snapshots("msgpack")["migrated"]
+            3
+        """
+        target = get_snapshot_codec(codec) if codec else self.snapshot_codec
+        self.flush()
+        stats = {"codec": target.name, "migrated": 0, "skipped": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0}
+
+        for session_dir in sorted(p for p in self.storage_path.iterdir() if p.is_dir()):
+            if not (session_dir / "session.json").exists():
+                continue
+            if find_archive(session_dir) is not None:
+                stats["skipped"] += 1
+                continue
+            journal = self._get_journal(session_dir.name)
+            try:
+                with self.write_lock, journal.snapshot_lock:
+                    before = sum(
+                        path.stat().st_size
+                        for path in (find_snapshot(session_dir, MESSAGES_STEM), find_snapshot(session_dir, COMPRESSION_STEM))
+                        if path is not None
+                    )
+                    messages = read_snapshot(session_dir, MESSAGES_STEM) or []
+                    compression = read_snapshot(session_dir, COMPRESSION_STEM) or {"records": []}
+                    after = [
+                        dump_messages(session_dir, messages, target),
+                        write_snapshot(session_dir, COMPRESSION_STEM, compression, target),
+                    ]
+                stats["bytes_before"] += before
+                stats["bytes_after"] += sum(path.stat().st_size for path in after)
+                stats["migrated"] += 1
+            except Exception as e:
+                stats["failed"] += 1
+                logger.error(f"❌ 快照格式迁移失败 [{session_dir.name}]: {e}")
+
+        logger.info(
+            f"🔁 快照格式迁移完成: {stats['migrated']} 个会话 -> {target.name} "
+            f"{stats['bytes_before']} -> {stats['bytes_after']} 字节"
+        )
+        return stats
+
+    def read_session_data(
+        self, session_id: str
+    ) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any]]]:
+        """
+        读取会话落盘状态的原始字典 不创建会话对象 不写入缓存 不还原归档
+
+        分支会话返回包含共享前缀的完整消息 元信息中不含分支字段
+
+        调用方需先 flush 写回队列 才能读到最新保存
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            Optional[Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any]]]: 元信息 消息字典列表 压缩历史字典 会话不存在返回 None
+
+        Examples:
+            >>> meta, messages, compression = manager.read_session_data("demo")
+        """
+        session_dir = self._get_session_dir(session_id)
+        if not (session_dir / "session.json").exists():
+            return None
+
+        # 快照写入与后台压实都持有 snapshot_lock 读取期间快照与日志保持一致
+        with self._get_journal(session_id).snapshot_lock:
+            archive_path = find_archive(session_dir)
+            if archive_path is None:
+                meta, messages, compression = read_session_files(session_dir)
+            else:
+                data = read_archive(archive_path)
+                meta = json.loads((session_dir / "session.json").read_text(encoding="utf-8"))
+                messages = data.get("messages", [])
+                compression = data.get("compression", {"records": []})
+        meta.pop(ARCHIVE_META_KEY, None)
+        meta["session_id"] = session_id
+
+        # 分支会话拼接父会话的前缀 导出结果是不依赖父会话的完整会话
+        parent_id = meta.get("parent_id")
+        if parent_id is not None:
+            branch_point = int(meta.get("branch_point", 0))
+            parent = self.read_session_data(parent_id)
+            prefix = parent[1][:branch_point] if parent is not None else []
+            if len(prefix) < branch_point:
+                logger.warning(f"⚠️ 分支会话的父会话缺失或消息不足: {session_id} (父会话 {parent_id})")
+            messages = prefix + messages
+        for key in BRANCH_META_KEYS:
+            meta.pop(key, None)
+        return meta, messages, compression
+
+    def _restore_archive(self, session_id: str) -> bool:
+        """
+        将已归档的会话解压还原为明文快照 未归档时直接返回
+
+        还原后的会话回到常规存储 再次长期未更新时重新归档
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            bool: 会话可按常规路径读取返回 True 归档损坏或算法不可用返回 False
+        """
+        session_dir = self._get_session_dir(session_id)
+        if find_archive(session_dir) is None:
+            return True
+
+        with self.write_lock:
+            archive_path = find_archive(session_dir)
+            if archive_path is None:
+                return True
+            journal = self._get_journal(session_id)
+            try:
+                with journal.snapshot_lock:
+                    data = read_archive(archive_path)
+                    meta = json.loads((session_dir / "session.json").read_text(encoding="utf-8"))
+                    meta.pop(ARCHIVE_META_KEY, None)
+                    dump_messages(session_dir, data.get("messages", []), self.snapshot_codec)
+                    write_snapshot(
+                        session_dir, COMPRESSION_STEM, data.get("compression", {"records": []}), self.snapshot_codec
+                    )
+                    self._write_json(session_dir / "session.json", meta)
+                    archive_path.unlink()
+            except Exception as e:
+                logger.error(f"❌ 还原归档会话失败 [{session_id}]: {e}")
+                return False
+
+        logger.info(f"📤 还原归档会话: {session_id}")
+        return True
+
+    def get_message_window(
+        self,
+        session_id: str,
+        since: Optional[int] = None,
+        before: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> Optional[Tuple[List[Tuple[int, Dict[str, Any]]], bool]]:
+        """
+        分页读取会话中对前端可见的消息
+
+        游标为消息在完整历史中的位置 常驻会话使用增量维护的可见位置索引
+        未常驻的会话通过 messages.idx 只读取目标片段 不加载会话也不写入缓存
+        已归档的会话先解压还原 分支会话需要父会话的前缀 先加载再读取
+
+        Args:
+            session_id (str): 会话ID
+            since (Optional[int]): 只返回位置大于 since 的消息
+            before (Optional[int]): 只返回位置小于 before 的消息
+            limit (Optional[int]): 每页条数上限 None 表示不限制
+
+        Returns:
+            Optional[Tuple[List[Tuple[int, Dict[str, Any]]], bool]]: (位置 消息字典) 列表与是否还有更多 会话不存在返回 None
+
+        Examples:
+            >>> items, has_more = manager.get_message_window("demo", limit=20)
+        """
+        if session_id in self._cache:
+            session = self._cache.get(session_id)
+            if session is not None:
+                return self._session_window(session, since, before, limit)
+
+        session_file = self._get_session_file(session_id)
+        if not session_file.exists():
+            return None
+        if not self._restore_archive(session_id):
+            return None
+        # 分支会话的前缀位于父会话中 加载后按常驻会话读取
+        if json.loads(session_file.read_text(encoding="utf-8")).get("parent_id") is not None:
+            session = self.load_session(session_id)
+            if session is None:
+                return None
+            return self._session_window(session, since, before, limit)
+        return self._read_message_window(session_id, since, before, limit)
+
+    def _session_window(
+        self,
+        session: Session,
+        since: Optional[int],
+        before: Optional[int],
+        limit: Optional[int],
+    ) -> Tuple[List[Tuple[int, Dict[str, Any]]], bool]:
+        """
+        从常驻会话分页读取可见消息 可见位置索引随消息追加增量维护
+
+        Args:
+            session (Session): 会话对象
+            since (Optional[int]): 起始游标(不含)
+            before (Optional[int]): 结束游标(不含)
+            limit (Optional[int]): 每页条数上限
+
+        Returns:
+            Tuple[List[Tuple[int, Dict[str, Any]]], bool]: (位置 消息字典) 列表与是否还有更多
+        """
+        index = self._visible.setdefault(session.session_id, VisibleIndex())
+        messages = session.messages
+        selected, has_more = select_window(index.update(messages), since, before, limit)
+        return [(pos, messages[pos].to_dict(cache=False)) for pos in selected], has_more
+
+    def _read_message_window(
+        self,
+        session_id: str,
+        since: Optional[int],
+        before: Optional[int],
+        limit: Optional[int],
+    ) -> Tuple[List[Tuple[int, Dict[str, Any]]], bool]:
+        """
+        从磁盘分页读取可见消息
+
+        快照部分优先使用偏移索引 索引缺失(旧数据)时退化为解析完整消息快照
+        快照之后的增量来自追加日志 日志条数受压实阈值约束
+
+        Args:
+            session_id (str): 会话ID
+            since (Optional[int]): 起始游标(不含)
+            before (Optional[int]): 结束游标(不含)
+            limit (Optional[int]): 每页条数上限
+
+        Returns:
+            Tuple[List[Tuple[int, Dict[str, Any]]], bool]: (位置 消息字典) 列表与是否还有更多
+        """
+        journal = self._get_journal(session_id)
+
+        # 快照写入与后台压实都持有 snapshot_lock 读取期间数据文件与索引保持一致
+        with journal.snapshot_lock:
+            messages_file = self._get_messages_file(session_id)
+            file_index = MessageFileIndex.load(messages_file)
+            raw_messages: Optional[List[Dict[str, Any]]] = None
+            if file_index is not None:
+                count = file_index.count
+                positions = file_index.visible_positions()
+            else:
+                raw_messages = read_snapshot(messages_file.parent, MESSAGES_STEM) or []
+                count = len(raw_messages)
+                positions = [
+                    i for i, m in enumerate(raw_messages)
+                    if is_visible(m.get("role"), m.get("tool_calls"))
+                ]
+
+            # 追加日志中快照之后的消息
+            tail: Dict[int, Dict[str, Any]] = {}
+            for record in journal.replay():
+                if record.get("op") != "append" or record.get("index") != count + len(tail):
+                    continue
+                message = record["message"]
+                if is_visible(message.get("role"), message.get("tool_calls")):
+                    positions.append(record["index"])
+                tail[record["index"]] = message
+
+            selected, has_more = select_window(positions, since, before, limit)
+            from_file = [pos for pos in selected if pos < count]
+            if file_index is not None:
+                loaded = dict(zip(from_file, file_index.read(from_file)))
+            else:
+                loaded = {pos: raw_messages[pos] for pos in from_file}
+
+        loaded.update(tail)
+        return [(pos, loaded[pos]) for pos in selected], has_more
+
     def clear_cache(self) -> None:
         """
         清空内存缓存
@@ -462,6 +1812,8 @@ class SessionManager:
             if tool_call_ids - found_responses:
                 for i in range(len(session.messages) - 1, -1, -1):
                     if session.messages[i] == last_msg:
+                        # 分支点落在被裁剪片段中的分支 先写出完整前缀
+                        self._detach_branches(session.session_id, after=i)
                         session.messages = session.messages[:i]
                         logger.info("🔧 清理了不完整的 tool_call 消息")
                         break
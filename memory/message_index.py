@@ -0,0 +1,261 @@
+"""
+消息偏移索引模块
+
+该模块在写出消息快照(messages.json / messages.msgpack)时同步生成 messages.idx
+记录每条消息在文件中的字节偏移 长度与是否对前端可见
+分页读取尾部消息时只需 seek 读取目标片段 无需反序列化完整历史
+"""
+
+import os
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from memory.codec import MESSAGES_STEM, SnapshotCodec, codec_for_path, get_snapshot_codec, remove_stale_snapshots
+
+
+INDEX_FILE = "messages.idx"
+# 索引头: [索引版本, 消息快照字节数, 消息条数]
+INDEX_VERSION = 1
+_HEADER_SIZE = 3
+# 每条消息占用的字段数: 偏移 长度 可见标记
+_ENTRY_SIZE = 3
+
+
+def is_visible(role: Optional[str], tool_calls: Any = None) -> bool:
+    """
+    判断消息是否在会话历史接口中展示
+
+    仅展示 user 与 assistant 消息 带 tool_calls 的 assistant 思考片段不展示
+
+    Args:
+        role (Optional[str]): 消息角色
+        tool_calls (Any): 消息携带的 tool_calls
+
+    Returns:
+        bool: 可见返回 True
+
+    Examples:
+        >>> is_visible("user")
+        True
+        >>> is_visible("assistant", [{"id": "call_1"}])
+        False
+    """
+    if role == "assistant":
+        return not tool_calls
+    return role == "user"
+
+
+def select_window(
+    positions: Sequence[int],
+    since: Optional[int] = None,
+    before: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> Tuple[List[int], bool]:
+    """
+    在有序的可见消息位置中选出一页
+
+    - since: 返回位置大于 since 的最早 limit 条 has_more 表示之后还有
+    - before: 返回位置小于 before 的最近 limit 条 has_more 表示之前还有
+    - 均未提供: 返回最近 limit 条(limit 为空时返回全部)
+
+    Args:
+        positions (Sequence[int]): 升序的可见消息位置
+        since (Optional[int]): 起始游标(不含)
+        before (Optional[int]): 结束游标(不含)
+        limit (Optional[int]): 每页条数上限
+
+    Returns:
+        Tuple[List[int], bool]: 选中的位置(升序)与是否还有更多
+
+    Examples:
+        >>> select_window([0, 2, 4, 6], since=2, limit=1)
+        ([4], True)
+    """
+    lo = bisect_right(positions, since) if since is not None else 0
+    hi = bisect_left(positions, before) if before is not None else len(positions)
+    if hi <= lo:
+        return [], False
+    if limit is None or hi - lo <= limit:
+        return list(positions[lo:hi]), False
+    if since is not None:
+        return list(positions[lo:lo + limit]), True
+    return list(positions[hi - limit:hi]), True
+
+
+def dump_messages(
+    session_dir: Path,
+    messages_data: List[Dict[str, Any]],
+    codec: Optional[SnapshotCodec] = None,
+) -> Path:
+    """
+    原子写出消息快照与对应的偏移索引 并删除其他格式的旧快照
+
+    Args:
+        session_dir (Path): 会话目录
+        messages_data (List[Dict[str, Any]]): 消息字典列表
+        codec (Optional[SnapshotCodec]): 快照编解码器 默认两格缩进 JSON
+
+    Returns:
+        Path: 写出的消息快照路径
+    """
+    codec = codec or get_snapshot_codec(None)
+    payload, spans = codec.dump_items(messages_data)
+    index = array("q", [INDEX_VERSION, len(payload), len(messages_data)])
+    for (offset, length), data in zip(spans, messages_data):
+        index.extend((offset, length, 1 if is_visible(data.get("role"), data.get("tool_calls")) else 0))
+
+    path = session_dir / codec.filename(MESSAGES_STEM)
+    index_path = session_dir / INDEX_FILE
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_index = index_path.with_name(INDEX_FILE + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    with open(tmp_index, "wb") as f:
+        index.tofile(f)
+    # 先替换数据文件再替换索引 中途退出时索引头中的字节数不匹配会被判为失效
+    os.replace(tmp_path, path)
+    os.replace(tmp_index, index_path)
+    remove_stale_snapshots(session_dir, MESSAGES_STEM, path.name)
+    return path
+
+
+class MessageFileIndex:
+    """
+    消息快照的只读偏移索引
+
+    Args:
+        messages_file (Path): 消息快照路径
+        entries (array): 扁平化的 (偏移 长度 可见) 三元组
+
+    Returns:
+        MessageFileIndex: MessageFileIndex 实例
+
+    Examples:
+        >>> index = MessageFileIndex.load(Path("./data/sessions/demo/messages.json"))
+        >>> index is None or index.count >= 0
+        True
+    """
+
+    def __init__(self, messages_file: Path, entries: array):
+        """
+        初始化索引
+
+        Args:
+            messages_file (Path): 消息快照路径
+            entries (array): 扁平化的索引条目
+        """
+        self.messages_file = messages_file
+        self._entries = entries
+        self.count = len(entries) // _ENTRY_SIZE
+
+    @classmethod
+    def load(cls, messages_file: Path) -> Optional["MessageFileIndex"]:
+        """
+        读取索引 索引缺失或与数据文件不一致时返回 None
+
+        Args:
+            messages_file (Path): 消息快照路径
+
+        Returns:
+            Optional[MessageFileIndex]: 有效索引或 None
+        """
+        index_path = messages_file.with_name(INDEX_FILE)
+        try:
+            raw = index_path.read_bytes()
+            size = messages_file.stat().st_size
+        except OSError:
+            return None
+
+        data = array("q")
+        data.frombytes(raw[: len(raw) - len(raw) % data.itemsize])
+        if len(data) < _HEADER_SIZE or data[0] != INDEX_VERSION or data[1] != size:
+            return None
+        entries = data[_HEADER_SIZE:]
+        if len(entries) != data[2] * _ENTRY_SIZE:
+            return None
+        return cls(messages_file, entries)
+
+    def visible_positions(self) -> List[int]:
+        """
+        获取全部可见消息的位置
+
+        Returns:
+            List[int]: 升序位置列表
+        """
+        flags = self._entries[2::_ENTRY_SIZE]
+        return [i for i, flag in enumerate(flags) if flag]
+
+    def read(self, positions: Sequence[int]) -> List[Dict[str, Any]]:
+        """
+        按位置读取消息字典 只解析目标片段
+
+        Args:
+            positions (Sequence[int]): 消息位置
+
+        Returns:
+            List[Dict[str, Any]]: 消息字典列表 顺序与 positions 一致
+        """
+        codec = codec_for_path(self.messages_file)
+        result = []
+        with open(self.messages_file, "rb") as f:
+            for pos in positions:
+                base = pos * _ENTRY_SIZE
+                f.seek(self._entries[base])
+                result.append(codec.loads(f.read(self._entries[base + 1])))
+        return result
+
+
+class VisibleIndex:
+    """
+    内存会话的可见消息位置索引
+
+    随消息追加增量扫描 历史被裁剪或替换时整体重建
+    只通过弱引用记住已扫描的尾消息 不延长消息对象生命周期
+
+    Args:
+        None
+
+    Returns:
+        VisibleIndex: VisibleIndex 实例
+
+    Examples:
+        >>> index = VisibleIndex()
+        >>> index.update([UserMessage("hi")])
+        [0]
+    """
+
+    def __init__(self):
+        """
+        初始化空索引
+        """
+        self.positions: List[int] = []
+        self.scanned = 0
+        self._last: Optional["weakref.ref"] = None
+
+    def update(self, messages: Sequence[Any]) -> List[int]:
+        """
+        同步到当前消息列表并返回可见位置
+
+        Args:
+            messages (Sequence[Any]): 会话消息列表
+
+        Returns:
+            List[int]: 升序的可见消息位置
+        """
+        count = len(messages)
+        if count < self.scanned or (
+            self.scanned and (self._last is None or messages[self.scanned - 1] is not self._last())
+        ):
+            self.positions = []
+            self.scanned = 0
+
+        for i in range(self.scanned, count):
+            message = messages[i]
+            if is_visible(message.role, message.tool_calls):
+                self.positions.append(i)
+        self.scanned = count
+        self._last = weakref.ref(messages[-1]) if count else None
+        return self.positions
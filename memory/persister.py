@@ -0,0 +1,251 @@
+"""
+会话写回队列模块
+
+该模块提供后台写回(write-behind)能力
+保存请求只入队 同一会话的多次保存合并为最新状态 由后台线程顺序落盘
+避免大会话序列化与磁盘写入阻塞事件循环
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from memory.schema import Session
+from utils.logger import logger
+
+
+class WriteBehindPersister:
+    """
+    会话后台写回队列
+
+    - enqueue: 入队保存 同一会话未落盘前重复入队只保留最新对象 可为单次入队指定落盘函数
+    - flush / aflush: 等待队列清空且无进行中的写入
+    - close: 排空队列并停止后台线程 之后的入队退化为同步写入
+
+    Args:
+        write_fn (Callable[[Session], None]): 实际落盘函数 在后台线程调用
+        name (str): 后台线程名
+
+    Returns:
+        WriteBehindPersister: WriteBehindPersister 实例
+
+    Examples:
+        >>> persister = WriteBehindPersister(manager.save_session)
+        >>> persister.enqueue(session)
+        >>> persister.flush()
+        True
+    """
+
+    # 参与延迟分位统计的最近写入次数
+    LATENCY_WINDOW = 512
+
+    def __init__(self, write_fn: Callable[[Session], None], name: str = "session-writer"):
+        """
+        初始化写回队列 后台线程在首次入队时启动
+
+        Args:
+            write_fn (Callable[[Session], None]): 实际落盘函数
+            name (str): 后台线程名
+        """
+        self.write_fn = write_fn
+        self.name = name
+
+        # 待写会话: key 为 session_id 保持首次入队顺序 value 为(最新会话对象, 落盘函数)
+        self._pending: "OrderedDict[str, Tuple[Session, Callable[[Session], None]]]" = OrderedDict()
+        self._inflight = 0
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._cond = threading.Condition()
+
+        # 统计计数
+        self.enqueued = 0
+        self.coalesced = 0
+        self.writes = 0
+        self.failures = 0
+        self._latencies: Deque[float] = deque(maxlen=self.LATENCY_WINDOW)
+        self._max_latency = 0.0
+
+    def enqueue(self, session: Session, write_fn: Optional[Callable[[Session], None]] = None) -> None:
+        """
+        入队保存会话
+
+        Args:
+            session (Session): 会话对象
+            write_fn (Optional[Callable[[Session], None]]): 本次使用的落盘函数 默认为构造时的 write_fn
+                与已排队的默认保存合并时仍使用默认保存
+
+        Returns:
+            None
+        """
+        fn = write_fn or self.write_fn
+        with self._cond:
+            if not self._closed:
+                self.enqueued += 1
+                pending = self._pending.get(session.session_id)
+                if pending is not None:
+                    self.coalesced += 1
+                    if pending[1] is self.write_fn:
+                        fn = self.write_fn
+                self._pending[session.session_id] = (session, fn)
+                self._ensure_thread()
+                self._cond.notify_all()
+                return
+
+        # 已关闭(进程退出阶段)时直接同步写入 避免丢失最后的保存
+        self._write(session, fn)
+
+    def discard(self, session_id: str) -> bool:
+        """
+        丢弃尚未落盘的保存请求 用于删除会话
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            bool: 是否存在被丢弃的请求
+        """
+        with self._cond:
+            removed = self._pending.pop(session_id, None) is not None
+            self._cond.notify_all()
+            return removed
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        阻塞等待全部已入队的保存落盘
+
+        Args:
+            timeout (Optional[float]): 最长等待秒数 None 表示一直等待
+
+        Returns:
+            bool: 在超时前排空返回 True
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and self._inflight == 0, timeout
+            )
+
+    async def aflush(self, timeout: Optional[float] = None) -> bool:
+        """
+        在线程池中等待排空 不阻塞事件循环
+
+        Args:
+            timeout (Optional[float]): 最长等待秒数
+
+        Returns:
+            bool: 在超时前排空返回 True
+        """
+        return await asyncio.to_thread(self.flush, timeout)
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        排空队列并停止后台线程
+
+        Args:
+            timeout (Optional[float]): 最长等待秒数
+
+        Returns:
+            bool: 是否在超时前排空
+        """
+        drained = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        if not drained:
+            logger.warning(f"⚠️ 写回队列关闭时仍有 {len(self._pending)} 个会话未落盘")
+        return drained
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        导出队列深度与写入延迟统计
+
+        Args:
+            None
+
+        Returns:
+            Dict[str, Any]: 队列深度 合并次数 写入次数 延迟(毫秒)
+        """
+        with self._cond:
+            latencies = sorted(self._latencies)
+            depth = len(self._pending)
+            inflight = self._inflight
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+
+        return {
+            "queue_depth": depth,
+            "inflight": inflight,
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "writes": self.writes,
+            "failures": self.failures,
+            "write_latency_ms": {
+                "avg": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(self._max_latency * 1000, 3),
+            },
+        }
+
+    def _ensure_thread(self) -> None:
+        """
+        启动后台写线程(需持有 _cond)
+
+        Returns:
+            None
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        """
+        后台线程主循环: 按入队顺序逐个落盘
+
+        Returns:
+            None
+        """
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                _, (session, fn) = self._pending.popitem(last=False)
+                self._inflight += 1
+            try:
+                self._write(session, fn)
+            finally:
+                with self._cond:
+                    self._inflight -= 1
+                    self._cond.notify_all()
+
+    def _write(self, session: Session, fn: Callable[[Session], None]) -> None:
+        """
+        执行一次落盘并记录耗时
+
+        Args:
+            session (Session): 会话对象
+            fn (Callable[[Session], None]): 落盘函数
+
+        Returns:
+            None
+        """
+        start = time.perf_counter()
+        try:
+            fn(session)
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"❌ 后台保存会话失败 [{session.session_id}]: {e}")
+            return
+        elapsed = time.perf_counter() - start
+        with self._cond:
+            self.writes += 1
+            self._latencies.append(elapsed)
+            self._max_latency = max(self._max_latency, elapsed)
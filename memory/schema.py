@@ -6,16 +6,36 @@
 """
 
 from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional, TYPE_CHECKING
+from typing import List, Dict, Any, Optional, Sequence, Tuple, TYPE_CHECKING
 from datetime import datetime
 from enum import Enum
+from collections import deque
 import json
+import sys
+import weakref
+
+from utils.tokens import MESSAGE_OVERHEAD_TOKENS, TokenCounter
+
+# 旧版本压缩记录的层级 其摘要为覆盖此前全部历史的累积摘要
+LEGACY_SUMMARY_LEVEL = -1
+# 上下文中摘要消息的前缀
+SUMMARY_PREFIX = "[历史对话摘要]\n"
 
 if TYPE_CHECKING:
     from memory.compressor import Compressor
 
-@dataclass
-class Message:
+class _WireCache:
+    """
+    消息序列化缓存槽位
+
+    单独放在基类中 使其不成为 dataclass 字段 不参与比较与 repr
+    _tokens 缓存 (计数器名称, token 数) 与序列化缓存同时失效
+    """
+    __slots__ = ("_wire", "_tokens", "__weakref__")
+
+
+@dataclass(slots=True)
+class Message(_WireCache):
     """
     消息基础模型
 
@@ -23,13 +43,16 @@ class Message:
 
     并提供序列化与反序列化方法
 
+    使用 __slots__ 存储字段 role 字符串驻留 序列化结果懒缓存并在字段赋值时失效
+    tool_calls 赋值时转为元组保存 只能整体替换 避免原地修改后缓存仍是旧内容
+
     Args:
         role (str): Message 角色 通常为 "user"、"assistant"、"system" 或 "tool"
         content (str): Message 内容 可为文本或 JSON 字符串
         timestamp (str): 消息时间戳 ISO 格式字符串 由默认工厂生成当前时间
         name (Optional[str]): 工具名称仅 tool 消息使用
         tool_call_id (Optional[str]): 工具调用 ID 仅 tool 消息使用
-        tool_calls (Optional[List[Dict[str, Any]]]): 工具调用列表仅 assistant 消息使用
+        tool_calls (Optional[Sequence[Dict[str, Any]]]): 工具调用列表仅 assistant 消息使用 保存为元组
         base64_image (Optional[str]): 可选的 Base64 编码图像数据 暂不使用
 
     Returns:
@@ -46,10 +69,30 @@ class Message:
 
     name: Optional[str] = None  # 工具名称（tool 消息用）
     tool_call_id: Optional[str] = None  # 工具调用 ID（tool 消息用）
-    tool_calls: Optional[List[Dict[str, Any]]] = None  # 工具调用列表（assistant 消息用）
+    tool_calls: Optional[Tuple[Dict[str, Any], ...]] = None  # 工具调用列表（assistant 消息用 保存为元组）
 
     base64_image: Optional[str] = None  # (2026.2.2)暂时不打算使用
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        """
+        字段赋值时驻留 role 将 tool_calls 转为元组 并使序列化缓存失效
+
+        Args:
+            name (str): 字段名
+            value (Any): 字段值
+
+        Returns:
+            None
+        """
+        if name == "role" and type(value) is str:
+            value = sys.intern(value)
+        elif name == "tool_calls" and value is not None and type(value) is not tuple:
+            # 元组不可原地增删 修改只能整体赋值 从而触发缓存失效
+            value = tuple(value)
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, "_wire", None)
+        object.__setattr__(self, "_tokens", None)
+
     def __add__(self, other) -> List["Message"]:
         """
         支持消息加法操作
@@ -109,14 +152,17 @@ class Message:
                 f"不支持的 type(s): '{type(other).__name__}' and '{type(self).__name__}' 当前仅支持 list[Message] + Message 的组合方式"
             )
 
-    def to_dict(self) -> dict:
+    def to_dict(self, cache: bool = True) -> dict:
         """
         将消息对象序列化为字典
 
         该方法会根据不同角色附加对应字段，并确保 content 为可序列化字符串
 
+        返回值是独立的字典 调用方可以自由修改
+
         Args:
-            None:
+            cache (bool): 是否缓存序列化结果 上下文构建等重复调用场景缓存
+                持久化等一次性全量序列化传 False 避免为全部历史常驻缓存
 
         Returns:
             dict: 序列化的JSON兼容字典
@@ -127,6 +173,76 @@ class Message:
             >>> d["role"]
             'user'
         """
+        wire = getattr(self, "_wire", None)
+        if wire is None:
+            if not cache:
+                return self._build_wire()
+            wire = self.to_wire()
+        return dict(wire)
+
+    def to_wire(self) -> dict:
+        """
+        获取缓存的序列化字典
+
+        首次调用时构建 之后直接返回同一对象 供只读场景使用 调用方不得修改
+
+        Args:
+            None:
+
+        Returns:
+            dict: 序列化的JSON兼容字典(只读)
+
+        Examples:
+            >>> msg = Message(role="user", content="hello")
+            >>> msg.to_wire() is msg.to_wire()
+            True
+        """
+        wire = getattr(self, "_wire", None)
+        if wire is None:
+            wire = self._build_wire()
+            object.__setattr__(self, "_wire", wire)
+        return wire
+
+    def token_count(self, counter: "TokenCounter") -> int:
+        """
+        统计消息发送给 LLM 时占用的 token 数
+
+        结果按计数器名称缓存 字段赋值时失效 包含每条消息的固定格式开销
+
+        Args:
+            counter (TokenCounter): token 计数器
+
+        Returns:
+            int: token 数
+
+        Examples:
+            >>> from llm.tokenizer import get_token_counter
+            >>> Message(role="user", content="你好").token_count(get_token_counter("approx"))
+            6
+        """
+        cached = getattr(self, "_tokens", None)
+        if cached is not None and cached[0] == counter.name:
+            return cached[1]
+
+        wire = self.to_wire()
+        tokens = MESSAGE_OVERHEAD_TOKENS + counter.count(wire["content"])
+        if "tool_calls" in wire:
+            tokens += counter.count(json.dumps(wire["tool_calls"], ensure_ascii=False))
+        if "name" in wire:
+            tokens += counter.count(wire["name"])
+        object.__setattr__(self, "_tokens", (counter.name, tokens))
+        return tokens
+
+    def _build_wire(self) -> dict:
+        """
+        构建序列化字典
+
+        Args:
+            None:
+
+        Returns:
+            dict: 序列化的JSON兼容字典
+        """
         message = {"role": self.role, "timestamp": self.timestamp}
 
         # 统一处理 content 避免 dict/list 直接写入导致结构不一致
@@ -183,8 +299,8 @@ class Message:
         elif content is None:
             content = ""
 
-        # 读取已有时间戳 若缺失则补当前时间
-        ts = data.get("timestamp", datetime.now().isoformat())
+        # 读取已有时间戳 若缺失则补当前时间(只在缺失时取当前时间 批量加载历史时避免逐条格式化)
+        ts = data["timestamp"] if "timestamp" in data else datetime.now().isoformat()
 
         msg_obj = None
 
@@ -221,7 +337,7 @@ class Message:
         return msg_obj
 
 
-@dataclass
+@dataclass(slots=True)
 class SystemMessage(Message):
     """
     系统消息模型
@@ -254,10 +370,11 @@ class SystemMessage(Message):
             >>> msg.content
             'rules'
         """
-        super().__init__(role="system", content=content)
+        # slots 类由 dataclass 重建 零参数 super() 会指向旧类 显式调用基类
+        Message.__init__(self, role="system", content=content)
 
 
-@dataclass
+@dataclass(slots=True)
 class UserMessage(Message):
     """
     用户消息模型
@@ -292,17 +409,18 @@ class UserMessage(Message):
             >>> msg.content
             'hello'
         """
-        super().__init__(role="user", content=content, base64_image=base64_image)
+        # slots 类由 dataclass 重建 零参数 super() 会指向旧类 显式调用基类
+        Message.__init__(self, role="user", content=content, base64_image=base64_image)
 
 
-@dataclass
+@dataclass(slots=True)
 class AssistantMessage(Message):
     """
     助手消息模型
 
     Args:
         content (str): Assistant text content
-        tool_calls (Optional[List[Dict]]): Optional tool call list
+        tool_calls (Optional[Sequence[Dict]]): Optional tool call list stored as a tuple
 
     Returns:
         AssistantMessage: Assistant message instance
@@ -314,13 +432,13 @@ class AssistantMessage(Message):
     """
     role: str = field(default="assistant", init=False)
 
-    def __init__(self, content: str = "", tool_calls: Optional[List[Dict]] = None):
+    def __init__(self, content: str = "", tool_calls: Optional[Sequence[Dict]] = None):
         """
         初始化助手消息
 
         Args:
             content (str): Assistant text
-            tool_calls (Optional[List[Dict]]): Tool call metadata
+            tool_calls (Optional[Sequence[Dict]]): Tool call metadata
 
         Returns:
             None
@@ -330,10 +448,11 @@ class AssistantMessage(Message):
             >>> msg.content
             'done'
         """
-        super().__init__(role="assistant", content=content, tool_calls=tool_calls)
+        # slots 类由 dataclass 重建 零参数 super() 会指向旧类 显式调用基类
+        Message.__init__(self, role="assistant", content=content, tool_calls=tool_calls)
 
 
-@dataclass
+@dataclass(slots=True)
 class ToolMessage(Message):
     """
     工具消息模型
@@ -370,7 +489,8 @@ class ToolMessage(Message):
             >>> msg.name
             'run'
         """
-        super().__init__(role="tool", content=content, name=name, tool_call_id=tool_call_id)
+        # slots 类由 dataclass 重建 零参数 super() 会指向旧类 显式调用基类
+        Message.__init__(self, role="tool", content=content, name=name, tool_call_id=tool_call_id)
 
 
 @dataclass
@@ -384,6 +504,8 @@ class CompressionRecord:
         compressed_count (int): 压缩后消息数
         summary (str): 压缩摘要文本
         compressed_range (tuple): 压缩的消息范围 (start_idx, end_idx)
+        level (int): 摘要层级 0 为消息段摘要 L+1 由若干 L 级摘要汇总而成
+            旧版本记录为累积摘要(覆盖此前全部历史) 以 LEGACY_SUMMARY_LEVEL 表示
 
     Returns:
         CompressionRecord: CompressionRecord 实例
@@ -398,6 +520,36 @@ class CompressionRecord:
     compressed_count: int  # 压缩后消息数
     summary: str  # 压缩摘要
     compressed_range: tuple  # 压缩的消息范围 (start_idx, end_idx)
+    level: int = 0  # 摘要层级
+
+    # token 数缓存 (计数器名称, token 数) 不参与序列化
+    _tokens: Optional[tuple] = field(default=None, init=False, repr=False, compare=False)
+
+    def covers(self) -> tuple:
+        """
+        获取摘要实际覆盖的消息区间
+
+        旧版本累积摘要覆盖从会话开头到 end_idx 的全部历史
+
+        Returns:
+            tuple: (start_idx, end_idx)
+        """
+        start, end = self.compressed_range
+        return (0, end) if self.level == LEGACY_SUMMARY_LEVEL else (start, end)
+
+    def token_count(self, counter: "TokenCounter") -> int:
+        """
+        统计摘要文本的 token 数 按计数器名称缓存
+
+        Args:
+            counter (TokenCounter): token 计数器
+
+        Returns:
+            int: token 数
+        """
+        if self._tokens is None or self._tokens[0] != counter.name:
+            self._tokens = (counter.name, counter.count(self.summary))
+        return self._tokens[1]
 
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -419,7 +571,8 @@ class CompressionRecord:
             "original_count": self.original_count,
             "compressed_count": self.compressed_count,
             "summary": self.summary,
-            "compressed_range": list(self.compressed_range)
+            "compressed_range": list(self.compressed_range),
+            "level": self.level,
         }
 
     @classmethod
@@ -443,7 +596,9 @@ class CompressionRecord:
             original_count=data["original_count"],
             compressed_count=data["compressed_count"],
             summary=data["summary"],
-            compressed_range=tuple(data["compressed_range"])
+            compressed_range=tuple(data["compressed_range"]),
+            # 缺少层级字段的是旧版本累积摘要
+            level=data.get("level", LEGACY_SUMMARY_LEVEL),
         )
 
 
@@ -452,9 +607,14 @@ class CompressionHistory:
     """
     压缩历史模型
 
+    records 按提交顺序只追加 构成多级摘要树:
+    - 0 级: 每次压缩只摘要最新一段消息
+    - L+1 级: 末尾连续 fanout 个 L 级摘要汇总为一个上级摘要
+    nodes 为覆盖全部已压缩历史 且层级尽量高的最少节点集合 由 records 推导 不单独持久化
+
     Args:
         records (List[CompressionRecord]): 历史压缩记录列表
-        current_summary (str): 当前有效的压缩摘要文本
+        current_summary (str): 最近一次提交的摘要文本
         last_compression_time (Optional[str]): 上次压缩时间 ISO 格式字符串
         total_compressions (int): 总压缩次数
 
@@ -467,9 +627,91 @@ class CompressionHistory:
         0
     """
     records: List[CompressionRecord] = field(default_factory=list)
-    current_summary: str = ""  # 当前有效的压缩摘要
+    current_summary: str = ""  # 最近一次提交的摘要
     last_compression_time: Optional[str] = None  # 上次压缩时间
     total_compressions: int = 0  # 总压缩次数
+    nodes: List[CompressionRecord] = field(default_factory=list, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        """
+        由压缩记录重建摘要节点
+        """
+        for record in self.records:
+            self._place(record)
+
+    def _place(self, record: CompressionRecord) -> None:
+        """
+        将记录放入节点集合 被新记录完全覆盖的下级节点移出
+
+        Args:
+            record (CompressionRecord): 压缩记录
+
+        Returns:
+            None
+        """
+        start, end = record.covers()
+        kept = []
+        for node in self.nodes:
+            node_start, node_end = node.covers()
+            if not (start <= node_start and node_end <= end):
+                kept.append(node)
+        kept.append(record)
+        kept.sort(key=lambda node: node.covers()[0])
+        self.nodes = kept
+
+    def tail_run(self, fanout: int) -> List[CompressionRecord]:
+        """
+        获取需要向上汇总的节点
+
+        末尾连续同级节点数达到 fanout 时返回其中最早的 fanout 个
+
+        Args:
+            fanout (int): 每个上级摘要汇总的下级节点数
+
+        Returns:
+            List[CompressionRecord]: 待汇总节点 无需汇总时返回空列表
+        """
+        if fanout < 2 or not self.nodes:
+            return []
+        level = self.nodes[-1].level
+        if level < 0:
+            return []
+        run = 0
+        for node in reversed(self.nodes):
+            if node.level != level:
+                break
+            run += 1
+        if run < fanout:
+            return []
+        first = len(self.nodes) - run
+        return self.nodes[first:first + fanout]
+
+    def select_nodes(self, counter: "TokenCounter", budget: int) -> List[CompressionRecord]:
+        """
+        在 token 预算内选择注入上下文的摘要节点
+
+        nodes 已是覆盖全部历史的最粗粒度集合(代价最低)
+        预算不足时从最新节点向前保留 较早的历史被舍弃
+
+        Args:
+            counter (TokenCounter): token 计数器
+            budget (int): 摘要 token 预算
+
+        Returns:
+            List[CompressionRecord]: 按时间顺序排列的节点
+        """
+        selected = []
+        used = 0
+        for node in reversed(self.nodes):
+            if not node.summary:
+                continue
+            tokens = node.token_count(counter)
+            if used + tokens > budget:
+                break
+            selected.append(node)
+            used += tokens
+        selected.reverse()
+        return selected
 
     def add_record(self, record: CompressionRecord):
         """
@@ -489,6 +731,7 @@ class CompressionHistory:
         """
         # 添加新记录并更新
         self.records.append(record)
+        self._place(record)
         self.current_summary = record.summary
         self.last_compression_time = record.compressed_at
         self.total_compressions += 1
@@ -539,6 +782,159 @@ class CompressionHistory:
         )
 
 
+class ContextWindow:
+    """
+    LLM 上下文窗口
+
+    增量维护未压缩消息段中最近 max_context_messages 条清洗后的消息
+    清洗规则与 Session.get_context_for_llm 一致: 丢弃 tool 消息 assistant 去除 tool_calls
+
+    - 新消息只扫描新增部分
+    - 压缩游标前移时从窗口左侧弹出已被摘要覆盖的消息
+    - 消息列表被替换 裁剪 或窗口参数变化时 只从尾部反向扫描重建窗口
+
+    Args:
+        None
+
+    Returns:
+        ContextWindow: ContextWindow 实例
+
+    Examples:
+        >>> window = ContextWindow()
+        >>> window.sync([UserMessage("hi")], start=0, maxlen=20)
+        >>> len(window.messages())
+        1
+    """
+    __slots__ = ("_items", "_list", "_last", "scanned", "start", "maxlen")
+
+    def __init__(self):
+        """
+        初始化空窗口
+        """
+        self._items: deque = deque()
+        self._list: Optional[List[Message]] = None
+        self._last: Optional["weakref.ref"] = None
+        self.scanned = 0
+        self.start = 0
+        self.maxlen = 0
+
+    @staticmethod
+    def clean(message: Message) -> Optional[Message]:
+        """
+        清洗单条消息
+
+        Args:
+            message (Message): 原始消息
+
+        Returns:
+            Optional[Message]: 清洗后的消息 tool 消息返回 None
+        """
+        if message.role == "tool":
+            return None
+        if message.role == "assistant" and message.tool_calls:
+            # 去除 tool_calls 的副本沿用原时间戳 保证同一历史生成的上下文稳定
+            cleaned = AssistantMessage(content=message.content, tool_calls=None)
+            cleaned.timestamp = message.timestamp
+            return cleaned
+        return message
+
+    def sync(self, messages: List[Message], start: int, maxlen: int) -> None:
+        """
+        同步到会话当前状态
+
+        Args:
+            messages (List[Message]): 会话完整消息列表
+            start (int): 压缩游标 compressed_until_index
+            maxlen (int): 上下文最大消息数 小于等于 0 表示不限制
+
+        Returns:
+            None
+        """
+        count = len(messages)
+        stale = (
+            messages is not self._list
+            or maxlen != self.maxlen
+            or start < self.start
+            or count < self.scanned
+            or (self.scanned and (self._last is None or messages[self.scanned - 1] is not self._last()))
+        )
+        if stale:
+            self._rebuild(messages, start, maxlen)
+        else:
+            # 压缩游标前移 弹出已被摘要覆盖的消息
+            while self._items and self._items[0][0] < start:
+                self._items.popleft()
+            for index in range(max(self.scanned, start), count):
+                cleaned = self.clean(messages[index])
+                if cleaned is not None:
+                    self._items.append((index, cleaned))
+
+        self.start = start
+        self.scanned = count
+        self._last = weakref.ref(messages[-1]) if count else None
+
+    def _rebuild(self, messages: List[Message], start: int, maxlen: int) -> None:
+        """
+        从尾部反向扫描重建窗口 成本与窗口大小(加上其间的 tool 消息)成正比
+
+        Args:
+            messages (List[Message]): 会话完整消息列表
+            start (int): 压缩游标
+            maxlen (int): 上下文最大消息数
+
+        Returns:
+            None
+        """
+        self._list = messages
+        self.maxlen = maxlen
+        self._items = deque(maxlen=maxlen if maxlen > 0 else None)
+        collected = []
+        for index in range(len(messages) - 1, max(start, 0) - 1, -1):
+            if maxlen > 0 and len(collected) >= maxlen:
+                break
+            cleaned = self.clean(messages[index])
+            if cleaned is not None:
+                collected.append((index, cleaned))
+        self._items.extend(reversed(collected))
+
+    def messages(self) -> List[Message]:
+        """
+        获取窗口内的消息
+
+        Returns:
+            List[Message]: 按时间顺序排列的清洗后消息
+        """
+        return [message for _, message in self._items]
+
+
+@dataclass
+class CompressionPlan:
+    """
+    一次压缩的输入快照
+
+    消息段压缩(level 为 0)携带待压缩消息 上级汇总(level 大于 0)携带待汇总的下级节点
+
+    Args:
+        start (int): 覆盖区间起点 消息段压缩时即计划生成时的 compressed_until_index
+        end (int): 覆盖区间终点(不含)
+        messages (List[Message]): 待压缩消息 即 messages[start:end]
+        existing_summary (str): 上一段摘要 仅作衔接参考
+        record_count (int): 计划生成时的压缩记录条数 用于提交时校验
+        level (int): 生成的摘要层级
+        nodes (List[CompressionRecord]): 待汇总的下级节点
+
+    Returns:
+        CompressionPlan: CompressionPlan 实例
+    """
+    start: int
+    end: int
+    messages: List[Message]
+    existing_summary: str
+    record_count: int
+    level: int = 0
+    nodes: List[CompressionRecord] = field(default_factory=list)
+
+
 @dataclass
 class Session:
     """
@@ -558,6 +954,8 @@ class Session:
         keep_recent_turns (int): 压缩时保留的最近对话轮数 以避免破坏短期上下文连贯性
         min_compression_interval_hours (float): 最小压缩间隔(小时) 当距离上次压缩时间未超过该值时会跳过压缩以避免过度压缩
         total_runs (int): 总运行次数 该统计字段可用于监控会话活跃度与压缩触发频率
+        parent_id (Optional[str]): 分支会话的父会话ID 普通会话为 None
+        branch_point (int): 分支点 前 branch_point 条消息与父会话共享 只落盘之后的消息
 
     Returns:
         Session: Session 对象实例
@@ -587,6 +985,13 @@ class Session:
     # 统计数据
     total_runs: int = 0
 
+    # 分支: 前 branch_point 条消息来自父会话 加载时复用父会话的消息对象
+    parent_id: Optional[str] = None
+    branch_point: int = 0
+
+    # 增量维护的 LLM 上下文窗口 不参与序列化与比较
+    context_window: ContextWindow = field(default_factory=ContextWindow, init=False, repr=False, compare=False)
+
     def add_message(self, message: Message):
         """
         追加一条消息并刷新会话状态
@@ -606,6 +1011,21 @@ class Session:
         self.messages.append(message)
         self.updated_at = datetime.now().isoformat()
         self.total_runs += 1
+        self._sync_context_window()
+
+    def _sync_context_window(self) -> None:
+        """
+        将上下文窗口同步到当前消息与压缩游标
+
+        直接修改 messages 列表(如 ReActAgent 追加消息)也会在下次构建上下文时被补扫
+
+        Args:
+            None:
+
+        Returns:
+            None:
+        """
+        self.context_window.sync(self.messages, self.compressed_until_index, self.max_context_messages)
 
     def get_uncompressed_messages(self) -> List[Message]:
         """
@@ -624,7 +1044,7 @@ class Session:
         """
         return self.messages[self.compressed_until_index:]
 
-    def get_context_for_llm(self) -> List[Message]:
+    def get_context_for_llm(self, include_summary: bool = True) -> List[Message]:
         """
         构建提供给 LLM 的上下文消息
 
@@ -633,7 +1053,7 @@ class Session:
         2) 再附加清洗后的最近消息 过滤 tool 消息和 tool_calls 结构
 
         Args:
-            None:
+            include_summary (bool): 是否插入全部摘要节点 调用方需要按预算挑选节点时传 False
 
         Returns:
             List[Message]: 构建好的上下文消息列表 可直接输入 LLM 进行对话生成
@@ -647,34 +1067,38 @@ class Session:
         context = []
 
         # 1) 先注入摘要系统消息 提供历史记忆
-        if self.compression_history.current_summary:
-            context.append(SystemMessage(
-                content=f"[历史对话摘要]\n{self.compression_history.current_summary}"
-            ))
-
-        # 2) 读取未压缩消息并执行清洗
-        uncompressed = self.get_uncompressed_messages()
-
-        # 清洗规则: assistant 消息去除 tool_calls, tool 消息直接丢弃
-        cleaned_messages = []
-        for msg in uncompressed:
-            if msg.role == "assistant" and (isinstance(msg, AssistantMessage) or msg.tool_calls):
-                cleaned_msg = AssistantMessage(
-                    content=msg.content,
-                    tool_calls=None
-                )
-                cleaned_messages.append(cleaned_msg)
-            elif msg.role == "tool":
-                continue  # 丢弃 Tool 消息
-            else:
-                cleaned_messages.append(msg)
+        summary = self.summary_message() if include_summary else None
+        if summary is not None:
+            context.append(summary)
 
-        # 3) 从清洗后的消息中截取最近 max_context_messages 条以构建上下文
-        recent_messages = cleaned_messages[-self.max_context_messages:]
-        context.extend(recent_messages)
+        # 2) 附加增量维护的上下文窗口 窗口内已完成清洗与截取
+        # 清洗规则: assistant 消息去除 tool_calls, tool 消息直接丢弃 保留最近 max_context_messages 条
+        self._sync_context_window()
+        context.extend(self.context_window.messages())
 
         return context
 
+    def summary_message(self, nodes: Optional[List[CompressionRecord]] = None) -> Optional[Message]:
+        """
+        将摘要节点合并为一条系统消息
+
+        Args:
+            nodes (Optional[List[CompressionRecord]]): 摘要节点 为空时使用全部节点
+
+        Returns:
+            Optional[Message]: 摘要系统消息 无摘要时返回 None
+
+        Examples:
+            >>> Session("x").summary_message() is None
+            True
+        """
+        if nodes is None:
+            nodes = self.compression_history.nodes
+        summaries = [node.summary for node in nodes if node.summary]
+        if not summaries:
+            return None
+        return SystemMessage(content=SUMMARY_PREFIX + "\n\n".join(summaries))
+
     def should_compress(self) -> bool:
         """
         判断当前是否满足压缩条件
@@ -726,46 +1150,154 @@ class Session:
             >>> # Returns False when conditions are not met.
             pass
         """
-        # 前置检查: 压缩器实例必须存在 且 满足压缩条件 否则直接返回 False 跳过压缩
+        # 前置检查: 压缩器实例必须存在 否则直接返回 False 跳过压缩
         if compressor is None:
             return False
-        
+
+        plan = self.plan_compression()
+        if plan is None:
+            return False
+
+        # 调用压缩器生成最新消息段的摘要
+        summary = await compressor.compress(
+            messages=plan.messages,
+            existing_summary=plan.existing_summary
+        )
+        if not self.commit_compression(plan, summary):
+            return False
+        await self.rollup_summaries(compressor)
+        return True
+
+    def plan_rollup(self, fanout: int) -> Optional["CompressionPlan"]:
+        """
+        截取需要向上汇总的摘要节点
+
+        Args:
+            fanout (int): 每个上级摘要汇总的下级节点数
+
+        Returns:
+            Optional[CompressionPlan]: 汇总计划 无需汇总时返回 None
+
+        Examples:
+            >>> Session("x").plan_rollup(4) is None
+            True
+        """
+        nodes = self.compression_history.tail_run(fanout)
+        if not nodes:
+            return None
+        return CompressionPlan(
+            start=nodes[0].covers()[0],
+            end=nodes[-1].covers()[1],
+            messages=[],
+            existing_summary="",
+            record_count=len(self.compression_history.records),
+            level=nodes[0].level + 1,
+            nodes=nodes,
+        )
+
+    async def rollup_summaries(self, compressor: "Compressor") -> int:
+        """
+        逐级汇总摘要节点 直到末尾不再有满 fanout 的同级节点
+
+        每次汇总只读取 fanout 个下级摘要 均摊到每次压缩的成本为常数
+
+        Args:
+            compressor (Compressor): Compressor 对象实例
+
+        Returns:
+            int: 提交的汇总次数
+        """
+        committed = 0
+        while True:
+            plan = self.plan_rollup(compressor.rollup_fanout)
+            if plan is None:
+                return committed
+            summary = await compressor.rollup([node.summary for node in plan.nodes])
+            if not self.commit_compression(plan, summary):
+                return committed
+            committed += 1
+
+    def plan_compression(self) -> Optional["CompressionPlan"]:
+        """
+        截取本次压缩的消息区间
+
+        区间在调用 LLM 之前确定 摘要生成期间追加的新消息不会被计入
+
+        Args:
+            None:
+
+        Returns:
+            Optional[CompressionPlan]: 压缩计划 不满足压缩条件时返回 None
+
+        Examples:
+            >>> Session("x").plan_compression() is None
+            True
+        """
         # 检查是否满足压缩条件 包括未压缩消息数和压缩间隔
         if not self.should_compress():
-            return False
+            return None
 
         # 获取可压缩消息段
         messages_to_compress = self.get_uncompressed_messages()
 
-        # 保留最近轮次 避免破坏短期上下文连贯性 只有当可压缩消息数超过保留轮次时才执行压缩 否则直接返回 False 跳过压缩
+        # 保留最近轮次 避免破坏短期上下文连贯性 只有当可压缩消息数超过保留轮次时才执行压缩
         if len(messages_to_compress) <= self.keep_recent_turns:
-            return False
+            return None
+
+        # 只把上一段摘要作为衔接参考 提示词长度不随会话变长而增长
+        nodes = self.compression_history.nodes
+        return CompressionPlan(
+            start=self.compressed_until_index,
+            end=len(self.messages) - self.keep_recent_turns,
+            messages=messages_to_compress[:-self.keep_recent_turns],
+            existing_summary=nodes[-1].summary if nodes else "",
+            record_count=len(self.compression_history.records),
+        )
 
-        compress_messages = messages_to_compress[:-self.keep_recent_turns]
+    def commit_compression(self, plan: "CompressionPlan", summary: str) -> bool:
+        """
+        提交压缩结果 写入压缩记录 消息段压缩同时前移游标
 
-        # 调用压缩器生成新的汇总摘要
-        summary = await compressor.compress(
-            messages=compress_messages,
-            existing_summary=self.compression_history.current_summary
-        )
+        计划生成后若游标 压缩记录或被压缩的消息已变化(并发压缩 历史被替换) 则放弃本次结果
+
+        Args:
+            plan (CompressionPlan): plan_compression 返回的压缩计划
+            summary (str): 压缩器生成的摘要
+
+        Returns:
+            bool: 是否提交成功
 
-        # 计算压缩区间并生成记录
-        start_idx = self.compressed_until_index
-        end_idx = len(self.messages) - self.keep_recent_turns
+        Examples:
+            >>> # plan = session.plan_compression()
+            >>> # session.commit_compression(plan, await compressor.compress(plan.messages))
+            pass
+        """
+        if len(self.compression_history.records) != plan.record_count:
+            return False
+        if plan.level == 0 and (
+            self.compressed_until_index != plan.start
+            or len(self.messages) < plan.end
+            or self.messages[plan.end - 1] is not plan.messages[-1]
+        ):
+            return False
 
         record = CompressionRecord(
             compressed_at=datetime.now().isoformat(),
-            original_count=len(compress_messages),
+            original_count=len(plan.messages) if plan.level == 0 else sum(n.original_count for n in plan.nodes),
             compressed_count=1,  # 压缩成一条摘要
             summary=summary,
-            compressed_range=(start_idx, end_idx)
+            compressed_range=(plan.start, plan.end),
+            level=plan.level,
         )
 
         # 更新压缩历史与已压缩游标
         self.compression_history.add_record(record)
         # 这里不进行 self.compression_history.current_summary = summary 的原因是 
         # add_record 方法已经在内部处理了 current_summary 的更新 因此无需在外部重复设置
-        self.compressed_until_index = end_idx
+        if plan.level == 0:
+            self.compressed_until_index = plan.end
+            self._sync_context_window()
+        return True
 
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -784,7 +1316,7 @@ class Session:
             >>> d["session_id"]
             'x'
         """
-        return {
+        data = {
             "session_id": self.session_id,
             "created_at": self.created_at,
             "updated_at": self.updated_at,
@@ -794,6 +1326,11 @@ class Session:
             "min_compression_interval_hours": self.min_compression_interval_hours,
             "total_runs": self.total_runs
         }
+        # 只有分支会话写出父会话信息 普通会话的 session.json 保持不变
+        if self.parent_id is not None:
+            data["parent_id"] = self.parent_id
+            data["branch_point"] = self.branch_point
+        return data
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "Session":
@@ -821,7 +1358,9 @@ class Session:
             max_context_messages=data.get("max_context_messages", 20),
             compression_threshold=data.get("compression_threshold", 15),
             min_compression_interval_hours=data.get("min_compression_interval_hours", 1.0),
-            total_runs=data.get("total_runs", 0)
+            total_runs=data.get("total_runs", 0),
+            parent_id=data.get("parent_id"),
+            branch_point=data.get("branch_point", 0) if data.get("parent_id") is not None else 0,
         )
 
 
@@ -0,0 +1,481 @@
+"""
+会话全文检索模块
+
+该模块使用内置 SQLite FTS5 为全部会话的可见消息建立倒排索引
+中日韩文字按相邻二字切分(bigram) 其余文字按词切分 检索时无需加载任何会话
+
+用法(在仓库根目录执行):
+    python -m memory.search --rebuild [sessions_dir]
+    python -m memory.search "关键词" [sessions_dir]
+"""
+
+import json
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from memory.archive import find_archive, read_archive
+from memory.codec import MESSAGES_STEM, read_snapshot
+from memory.journal import SessionJournal
+from memory.message_index import is_visible
+from utils.logger import logger
+
+
+SEARCH_FILE = "search.db"
+
+# 中日韩文字: 假名 CJK 扩展 A 统一表意文字 兼容表意文字 谚文
+_CJK = "぀-ヿ㐀-䶿一-鿿豈-﫿가-힯"
+# 第一组为中日韩连续文字 第二组为其他文字的词
+_TOKEN_RE = re.compile(rf"([{_CJK}]+)|([^\W{_CJK}]+)")
+
+# 摘要片段在命中位置前后保留的字符数
+_SNIPPET_BEFORE = 30
+_SNIPPET_AFTER = 70
+
+_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+    tokens,
+    session_id UNINDEXED,
+    position UNINDEXED,
+    role UNINDEXED,
+    timestamp UNINDEXED,
+    content UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 0'
+);
+CREATE TABLE IF NOT EXISTS indexed_sessions (
+    session_id TEXT PRIMARY KEY,
+    message_count INTEGER NOT NULL,
+    last_timestamp TEXT NOT NULL DEFAULT ''
+);
+"""
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    将文本切分为索引词
+
+    - 中日韩连续文字: 相邻二字 再补上末字 保证任意单字都是某个词的前缀
+    - 其他文字: 按词切分并转小写
+
+    Args:
+        text (str): 原始文本
+
+    Returns:
+        List[str]: 索引词序列
+
+    Examples:
+        >>> tokenize("你好世界 Hello")
+        ['你好', '好世', '世界', '界', 'hello']
+    """
+    tokens = []
+    for run, word in _TOKEN_RE.findall((text or "").lower()):
+        if word:
+            tokens.append(word)
+            continue
+        tokens.extend([run[i:i + 2] for i in range(len(run) - 1)])
+        tokens.append(run[-1])
+    return tokens
+
+
+def build_query(query: str) -> Optional[str]:
+    """
+    将用户输入转换为 FTS5 查询表达式
+
+    每个词之间为 AND 关系 中日韩连续文字转为相邻二字组成的短语 保证按原文连续匹配
+    单个中日韩字使用前缀查询
+
+    Args:
+        query (str): 用户输入
+
+    Returns:
+        Optional[str]: FTS5 MATCH 表达式 无有效词时返回 None
+
+    Examples:
+        >>> build_query("好世界 hello")
+        '"好世 世界" AND "hello"'
+    """
+    terms = []
+    for run, word in _TOKEN_RE.findall((query or "").lower()):
+        if word:
+            terms.append(f'"{word}"')
+        elif len(run) == 1:
+            terms.append(f'"{run}"*')
+        else:
+            terms.append('"' + " ".join(run[i:i + 2] for i in range(len(run) - 1)) + '"')
+    return " AND ".join(terms) if terms else None
+
+
+def make_snippet(content: str, query: str) -> str:
+    """
+    截取命中位置附近的片段
+
+    Args:
+        content (str): 消息内容
+        query (str): 用户输入
+
+    Returns:
+        str: 片段文本 截断处以省略号标记
+    """
+    lowered = content.lower()
+    hit = -1
+    for run, word in _TOKEN_RE.findall((query or "").lower()):
+        pos = lowered.find(run or word)
+        if pos >= 0 and (hit < 0 or pos < hit):
+            hit = pos
+    hit = max(hit, 0)
+    start = max(0, hit - _SNIPPET_BEFORE)
+    end = min(len(content), hit + _SNIPPET_AFTER)
+    snippet = content[start:end].replace("\n", " ")
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(content) else "")
+
+
+class SearchIndex:
+    """
+    会话全文检索索引
+
+    - index_session: 保存后增量索引新增的可见消息 历史被替换时重建该会话
+    - append: 批量追加消息字典 供导入使用
+    - search: 按相关度返回命中的会话ID 消息位置与片段
+    - rename / remove / rebuild: 与会话目录操作保持同步
+
+    索引是可重建的派生数据 使用 WAL + synchronous=NORMAL 避免每次提交 fsync
+
+    Args:
+        storage_path (Path): 会话根目录 索引文件位于其下的 search.db
+
+    Returns:
+        SearchIndex: SearchIndex 实例
+
+    Examples:
+        >>> index = SearchIndex(Path("./data/sessions"))
+        >>> index.search("天气")
+        ([], 0)
+    """
+
+    def __init__(self, storage_path: Path):
+        """
+        打开或创建索引数据库
+
+        Args:
+            storage_path (Path): 会话根目录
+        """
+        self.storage_path = Path(storage_path)
+        self.db_path = self.storage_path / SEARCH_FILE
+        # 新建索引时由调用方决定是否从现有目录重建
+        self.created = not self.db_path.exists()
+
+        # 索引更新来自后台写线程 查询来自接口线程 共享连接并用锁串行化
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    def index_session(self, session_id: str, messages: Sequence[Any], base: int = 0) -> int:
+        """
+        增量索引会话消息
+
+        只处理上次索引之后新增的消息 已索引的尾消息时间戳不一致(历史被裁剪或替换)时整体重建
+        分支会话的前 base 条消息与父会话共享 由父会话的条目覆盖 不重复索引
+
+        Args:
+            session_id (str): 会话ID
+            messages (Sequence[Any]): 会话完整消息列表(Message 对象)
+            base (int): 跳过的共享前缀条数
+
+        Returns:
+            int: 本次新写入的索引条数
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT message_count, last_timestamp FROM indexed_sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            start = 0
+            if row is not None:
+                count, last_timestamp = row
+                if count <= len(messages) and (count == 0 or messages[count - 1].timestamp == last_timestamp):
+                    start = count
+                else:
+                    self._conn.execute("DELETE FROM message_fts WHERE session_id = ?", (session_id,))
+            if row is not None and start == len(messages):
+                return 0
+
+            rows = [
+                self._row(session_id, i, m.role, m.content, m.timestamp)
+                for i in range(max(start, base), len(messages))
+                if is_visible(messages[i].role, messages[i].tool_calls)
+                for m in (messages[i],)
+            ]
+            self._insert(rows)
+            self._mark(session_id, len(messages), messages[-1].timestamp if messages else "")
+            self._conn.commit()
+            return len(rows)
+
+    def append(self, session_id: str, start: int, messages: Sequence[Dict[str, Any]]) -> int:
+        """
+        追加索引一批消息字典 用于导入等不创建会话对象的批量写入
+
+        Args:
+            session_id (str): 会话ID
+            start (int): 第一条消息在会话中的位置 为 0 时清空该会话已有条目
+            messages (Sequence[Dict[str, Any]]): 消息字典列表
+
+        Returns:
+            int: 本次写入的索引条数
+        """
+        with self._lock:
+            if start == 0:
+                self._conn.execute("DELETE FROM message_fts WHERE session_id = ?", (session_id,))
+            rows = [
+                self._row(session_id, start + i, m.get("role"), m.get("content"), m.get("timestamp", ""))
+                for i, m in enumerate(messages)
+                if is_visible(m.get("role"), m.get("tool_calls"))
+            ]
+            self._insert(rows)
+            if messages:
+                self._mark(session_id, start + len(messages), messages[-1].get("timestamp", ""))
+            self._conn.commit()
+            return len(rows)
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        session_id: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        检索消息
+
+        Args:
+            query (str): 检索词 多个词之间为 AND 关系
+            limit (int): 返回条数上限
+            offset (int): 跳过条数
+            session_id (Optional[str]): 只在指定会话中检索
+
+        Returns:
+            Tuple[List[Dict[str, Any]], int]: 按相关度排序的命中列表与命中总数
+        """
+        expression = build_query(query)
+        if expression is None:
+            return [], 0
+
+        where = "message_fts MATCH ?"
+        params: List[Any] = [expression]
+        if session_id is not None:
+            where += " AND session_id = ?"
+            params.append(session_id)
+
+        with self._lock:
+            try:
+                total = self._conn.execute(
+                    f"SELECT COUNT(*) FROM message_fts WHERE {where}", params
+                ).fetchone()[0]
+                rows = self._conn.execute(
+                    f"""
+                    SELECT session_id, position, role, timestamp, content FROM message_fts
+                    WHERE {where} ORDER BY rank LIMIT ? OFFSET ?
+                    """,
+                    params + [max(0, int(limit)), max(0, int(offset))],
+                ).fetchall()
+            except sqlite3.OperationalError as e:
+                logger.warning(f"⚠️ 检索表达式无效 [{query}]: {e}")
+                return [], 0
+
+        return [
+            {
+                "session_id": sid,
+                "index": int(position),
+                "role": role,
+                "timestamp": timestamp,
+                "snippet": make_snippet(content, query),
+            }
+            for sid, position, role, timestamp, content in rows
+        ], total
+
+    def rename(self, old_id: str, new_id: str) -> None:
+        """
+        重命名会话的索引条目
+
+        Args:
+            old_id (str): 原会话ID
+            new_id (str): 新会话ID
+
+        Returns:
+            None
+        """
+        with self._lock:
+            for table in ("message_fts", "indexed_sessions"):
+                self._conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (new_id,))
+                self._conn.execute(f"UPDATE {table} SET session_id = ? WHERE session_id = ?", (new_id, old_id))
+            self._conn.commit()
+
+    def remove(self, session_id: str) -> None:
+        """
+        删除会话的全部索引条目
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM message_fts WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM indexed_sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def rebuild(self) -> int:
+        """
+        扫描会话目录重建索引 只读取消息文件 不创建会话对象
+
+        Returns:
+            int: 索引的消息条数
+        """
+        sessions = []
+        for item in self.storage_path.iterdir():
+            if not item.is_dir() or not (item / "session.json").exists():
+                continue
+            try:
+                sessions.append((item.name, *_read_messages(item)))
+            except Exception as e:
+                logger.warning(f"⚠️ 重建检索索引时跳过会话 {item.name}: {e}")
+
+        indexed = 0
+        with self._lock:
+            self._conn.execute("DELETE FROM message_fts")
+            self._conn.execute("DELETE FROM indexed_sessions")
+            for session_id, base, messages in sessions:
+                rows = [
+                    self._row(session_id, base + i, m.get("role"), m.get("content"), m.get("timestamp", ""))
+                    for i, m in enumerate(messages)
+                    if is_visible(m.get("role"), m.get("tool_calls"))
+                ]
+                self._insert(rows)
+                # 分支会话没有自有消息时 以分支点作为已索引位置 下次增量索引跳过共享前缀
+                last_timestamp = messages[-1].get("timestamp", "") if messages else ""
+                self._mark(session_id, base + len(messages) if messages else 0, last_timestamp)
+                indexed += len(rows)
+            self._conn.commit()
+
+        logger.info(f"🔎 检索索引重建完成: {len(sessions)} 个会话 {indexed} 条消息")
+        return indexed
+
+    def close(self) -> None:
+        """
+        关闭数据库连接
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _row(session_id: str, position: int, role: Any, content: Any, timestamp: Any) -> tuple:
+        """
+        构造一条索引记录
+
+        Returns:
+            tuple: (tokens, session_id, position, role, timestamp, content)
+        """
+        text = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+        return (" ".join(tokenize(text)), session_id, position, role, str(timestamp or ""), text)
+
+    def _insert(self, rows: List[tuple]) -> None:
+        """
+        批量写入索引记录(需持有锁)
+
+        Args:
+            rows (List[tuple]): 索引记录
+
+        Returns:
+            None
+        """
+        if rows:
+            self._conn.executemany(
+                "INSERT INTO message_fts (tokens, session_id, position, role, timestamp, content) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def _mark(self, session_id: str, count: int, last_timestamp: str) -> None:
+        """
+        记录会话已索引到的位置(需持有锁)
+
+        Args:
+            session_id (str): 会话ID
+            count (int): 已索引的消息条数
+            last_timestamp (str): 最后一条已索引消息的时间戳
+
+        Returns:
+            None
+        """
+        self._conn.execute(
+            """
+            INSERT INTO indexed_sessions (session_id, message_count, last_timestamp) VALUES (?, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET
+                message_count = excluded.message_count,
+                last_timestamp = excluded.last_timestamp
+            """,
+            (session_id, count, last_timestamp),
+        )
+
+
+def _read_messages(session_dir: Path) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    读取会话目录的消息字典 快照之上回放日志中的追加记录 已归档的会话从归档文件读取
+
+    Args:
+        session_dir (Path): 会话目录
+
+    Returns:
+        Tuple[int, List[Dict[str, Any]]]: 第一条消息在会话中的位置(分支会话为分支点) 与落盘的消息字典列表
+    """
+    meta = json.loads((session_dir / "session.json").read_text(encoding="utf-8"))
+    base = int(meta.get("branch_point", 0)) if meta.get("parent_id") is not None else 0
+
+    archive_path = find_archive(session_dir)
+    if archive_path is not None:
+        return base, read_archive(archive_path).get("messages", [])
+
+    messages: List[Dict[str, Any]] = read_snapshot(session_dir, MESSAGES_STEM) or []
+
+    for record in SessionJournal(session_dir).replay():
+        if record.get("op") == "append" and record.get("index", len(messages)) == len(messages):
+            messages.append(record["message"])
+    return base, messages
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # 仓库根目录 用于定位默认的数据目录 模块需以 python -m 方式运行
+    root = Path(__file__).parent.parent
+
+    parser = argparse.ArgumentParser(description="EmaAgent 会话检索工具")
+    parser.add_argument("query", nargs="?", help="检索词")
+    parser.add_argument("--dir", dest="sessions_dir", help="会话根目录 默认使用 data/sessions")
+    parser.add_argument("--rebuild", action="store_true", help="扫描会话目录重建索引")
+    args = parser.parse_args()
+
+    if args.sessions_dir:
+        sessions_dir = Path(args.sessions_dir)
+    else:
+        from config.paths import init_paths
+
+        sessions_dir = init_paths(root).sessions_dir
+
+    index = SearchIndex(sessions_dir)
+    if args.rebuild or index.created:
+        index.rebuild()
+    if args.query:
+        results, total = index.search(args.query)
+        print(f"命中 {total} 条")
+        for item in results:
+            print(f"[{item['session_id']} #{item['index']}] {item['snippet']}")
+    index.close()
@@ -0,0 +1,419 @@
+"""
+会话导出导入模块
+
+以 NDJSON(每行一个 JSON 对象) 流式导出与导入全部会话 用于备份与跨主机迁移
+导出逐个会话读取落盘数据 导入按批写入追加日志 内存占用与会话总数无关
+
+记录格式(按顺序出现):
+    {"type": "header", "format": "emaagent-sessions", "version": 1, "exported_at": str}
+    {"type": "session", "session_id": str, "meta": dict}
+    {"type": "message", "session_id": str, "index": int, "message": dict}   # 0..N-1
+    {"type": "compression", "session_id": str, "history": dict}
+    {"type": "end", "session_id": str, "message_count": int}
+
+用法(在仓库根目录执行):
+    python -m memory.transfer export [--out backup.ndjson] [--dir sessions_dir]
+    python -m memory.transfer import backup.ndjson [--on-conflict rename|skip] [--dir sessions_dir]
+"""
+
+import json
+import re
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional
+
+from memory.codec import COMPRESSION_STEM, write_snapshot
+from memory.journal import SessionJournal
+from memory.schema import CompressionHistory, Message, Session
+from utils.logger import logger
+
+if TYPE_CHECKING:
+    from memory.manager import SessionManager
+
+
+EXPORT_FORMAT = "emaagent-sessions"
+EXPORT_VERSION = 1
+CONFLICT_POLICIES = {"rename", "skip"}
+
+# 会话ID 同时作为目录名 拒绝路径分隔符与相对路径
+_INVALID_ID_RE = re.compile(r"[/\\\x00]")
+
+
+def _dumps(record: Dict[str, Any]) -> str:
+    """
+    序列化一条 NDJSON 记录
+
+    Args:
+        record (Dict[str, Any]): 记录
+
+    Returns:
+        str: 以换行结尾的 JSON 文本
+    """
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def iter_export(manager: "SessionManager", session_ids: Optional[Iterable[str]] = None) -> Iterator[str]:
+    """
+    逐行生成导出内容
+
+    每次只读取一个会话的落盘数据 不加载会话对象 不写入缓存 已归档会话直接从归档文件读取
+
+    Args:
+        manager (SessionManager): 会话管理器
+        session_ids (Optional[Iterable[str]]): 要导出的会话ID 默认导出全部
+
+    Returns:
+        Iterator[str]: NDJSON 行迭代器
+
+    Examples:
+        >>> with open("backup.ndjson", "w", encoding="utf-8") as f:
+        ...     f.writelines(iter_export(manager))
+    """
+    # 先排空写回队列 保证导出包含最后一次保存
+    manager.flush()
+    yield _dumps({
+        "type": "header",
+        "format": EXPORT_FORMAT,
+        "version": EXPORT_VERSION,
+        "exported_at": datetime.now().isoformat(),
+    })
+
+    ids = manager.list_sessions() if session_ids is None else list(session_ids)
+    for session_id in ids:
+        try:
+            data = manager.read_session_data(session_id)
+        except Exception as e:
+            logger.error(f"❌ 导出会话失败 [{session_id}]: {e}")
+            continue
+        if data is None:
+            continue
+
+        meta, messages, compression = data
+        yield _dumps({"type": "session", "session_id": session_id, "meta": meta})
+        for index, message in enumerate(messages):
+            yield _dumps({"type": "message", "session_id": session_id, "index": index, "message": message})
+        yield _dumps({"type": "compression", "session_id": session_id, "history": compression})
+        yield _dumps({"type": "end", "session_id": session_id, "message_count": len(messages)})
+
+
+class SessionImporter:
+    """
+    NDJSON 会话导入器
+
+    逐条接收记录 每个会话先写入消息日志再写 session.json 中途失败的会话目录会被清理
+    目录扫描只识别含 session.json 的目录 导入中的会话对其他读取方不可见
+
+    - 消息每 batch_size 条合并为一次日志追加与一次检索索引提交
+    - 会话ID冲突: rename 与 SessionService.create_new_session 一致追加时分秒后缀 skip 跳过该会话
+
+    Args:
+        manager (SessionManager): 会话管理器
+        on_conflict (str): 会话ID冲突策略 "rename" 或 "skip"
+        batch_size (int): 每批写入的消息条数
+
+    Returns:
+        SessionImporter: SessionImporter 实例
+
+    Raises:
+        ValueError: on_conflict 非法时抛出
+
+    Examples:
+        >>> importer = SessionImporter(manager)
+        >>> importer.feed_lines(open("backup.ndjson", encoding="utf-8"))
+        >>> importer.close()["imported"]
+        3
+    """
+
+    def __init__(self, manager: "SessionManager", on_conflict: str = "rename", batch_size: int = 500):
+        """
+        初始化导入器
+
+        Args:
+            manager (SessionManager): 会话管理器
+            on_conflict (str): 会话ID冲突策略
+            batch_size (int): 每批写入的消息条数
+        """
+        if on_conflict not in CONFLICT_POLICIES:
+            raise ValueError(f"不支持的 on_conflict: {on_conflict}")
+        self.manager = manager
+        self.on_conflict = on_conflict
+        self.batch_size = max(1, int(batch_size))
+
+        self.imported: List[str] = []
+        self.renamed: Dict[str, str] = {}
+        self.skipped: List[str] = []
+        self.errors: List[str] = []
+        self.messages = 0
+        # 已读取的行数 跨多次 feed_lines 累计 错误信息中的行号相对整个输入
+        self.line_no = 0
+
+        # 当前导入中的会话
+        self._source_id: Optional[str] = None
+        self._target_id: Optional[str] = None
+        self._meta: Optional[Dict[str, Any]] = None
+        self._compression: Dict[str, Any] = {"records": []}
+        self._batch: List[Dict[str, Any]] = []
+        self._count = 0
+        self._skipping = False
+
+    def feed_lines(self, lines: Iterable[Any]) -> None:
+        """
+        导入多行 NDJSON 文本 空行被忽略
+
+        Args:
+            lines (Iterable[Any]): 文本行(str 或 bytes)
+
+        Returns:
+            None
+        """
+        for line in lines:
+            self.line_no += 1
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                self._fail(f"第 {self.line_no} 行不是合法 JSON: {e}")
+                continue
+            if not isinstance(record, dict):
+                self._fail(f"第 {self.line_no} 行不是 JSON 对象: {type(record).__name__}")
+                continue
+            self.feed(record)
+
+    def feed(self, record: Dict[str, Any]) -> None:
+        """
+        导入一条记录
+
+        Args:
+            record (Dict[str, Any]): 解析后的 NDJSON 记录
+
+        Returns:
+            None
+        """
+        kind = record.get("type")
+        if kind == "header":
+            if record.get("format") != EXPORT_FORMAT or int(record.get("version", 0)) > EXPORT_VERSION:
+                raise ValueError(f"不支持的导出格式: {record.get('format')} v{record.get('version')}")
+            return
+        if kind == "session":
+            if self._source_id is not None and not self._skipping:
+                self._fail(f"会话 {self._source_id} 缺少结束记录")
+            self._begin(record.get("session_id"), record.get("meta") or {})
+            return
+
+        if record.get("session_id") != self._source_id or self._source_id is None:
+            self._fail(f"记录不属于当前会话: {record.get('type')} {record.get('session_id')}")
+            return
+        if self._skipping:
+            if kind == "end":
+                self._reset()
+            return
+
+        try:
+            if kind == "message":
+                if record.get("index") != self._count + len(self._batch):
+                    raise ValueError(f"消息位置不连续: {record.get('index')}")
+                message = Message.from_dict(record["message"]).to_dict(cache=False)
+                self._batch.append(message)
+                if len(self._batch) >= self.batch_size:
+                    self._flush_batch()
+            elif kind == "compression":
+                self._compression = CompressionHistory.from_dict(record.get("history") or {}).to_dict()
+            elif kind == "end":
+                if record.get("message_count") != self._count + len(self._batch):
+                    raise ValueError(f"消息条数不符: {record.get('message_count')}")
+                self._finish()
+        except Exception as e:
+            self._fail(f"会话 {self._source_id} 导入失败: {e}")
+
+    def close(self) -> Dict[str, Any]:
+        """
+        结束导入 未收到结束记录的会话视为不完整并清理
+
+        Returns:
+            Dict[str, Any]: 导入统计
+        """
+        if self._source_id is not None and not self._skipping:
+            self._fail(f"会话 {self._source_id} 缺少结束记录")
+        self._reset()
+        return {
+            "imported": len(self.imported),
+            "messages": self.messages,
+            "renamed": self.renamed,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
+
+    def _begin(self, source_id: Any, meta: Dict[str, Any]) -> None:
+        """
+        开始导入一个会话 处理ID冲突并预留目录
+
+        Args:
+            source_id (Any): 导出文件中的会话ID
+            meta (Dict[str, Any]): 会话元信息
+
+        Returns:
+            None
+        """
+        self._reset()
+        self._source_id = source_id
+        if not isinstance(source_id, str) or not source_id or source_id in (".", "..") \
+                or _INVALID_ID_RE.search(source_id):
+            self._skipping = True
+            self.errors.append(f"非法会话ID: {source_id!r}")
+            return
+
+        target_id = source_id
+        base: Optional[str] = None
+        suffix = 1
+        while True:
+            try:
+                # 目录即预留 mkdir 原子地占用名称 并发创建或导入抢先占用时同样按冲突处理
+                (self.manager.storage_path / target_id).mkdir(parents=True)
+                break
+            except FileExistsError:
+                if self.on_conflict == "skip":
+                    self._skipping = True
+                    self.skipped.append(source_id)
+                    return
+                # 与 create_new_session 一致 同名冲突时追加时分秒后缀 同一秒内再次冲突时追加序号
+                if base is None:
+                    base = target_id = f"{source_id}_{datetime.now().strftime('%H%M%S')}"
+                else:
+                    suffix += 1
+                    target_id = f"{base}_{suffix}"
+            except OSError as e:
+                self._fail(f"会话 {source_id} 导入失败: {e}")
+                return
+        self._target_id = target_id
+        # 导出的分支会话已包含完整消息 导入后作为普通会话 不依赖父会话
+        meta = {k: v for k, v in meta.items() if k not in ("parent_id", "branch_point")}
+        self._meta = Session.from_dict({**meta, "session_id": target_id}).to_dict()
+
+    def _flush_batch(self) -> None:
+        """
+        将缓冲的消息追加到会话日志并写入检索索引
+
+        Returns:
+            None
+        """
+        if not self._batch:
+            return
+        session_dir = self.manager.storage_path / self._target_id
+        SessionJournal(session_dir).append([
+            {"op": "append", "index": self._count + i, "message": message}
+            for i, message in enumerate(self._batch)
+        ])
+        self.manager.search.append(self._target_id, self._count, self._batch)
+        self._count += len(self._batch)
+        self._batch = []
+
+    def _finish(self) -> None:
+        """
+        写出压缩历史与 session.json 使会话对外可见 并更新目录索引
+
+        Returns:
+            None
+        """
+        self._flush_batch()
+        session_dir = self.manager.storage_path / self._target_id
+        write_snapshot(session_dir, COMPRESSION_STEM, self._compression, self.manager.snapshot_codec)
+        self.manager._write_json(session_dir / "session.json", self._meta)
+        self.manager.catalog.upsert(self._meta, self._count)
+
+        self.imported.append(self._target_id)
+        if self._target_id != self._source_id:
+            self.renamed[self._source_id] = self._target_id
+        self.messages += self._count
+        logger.debug(f"📥 导入会话: {self._target_id} ({self._count} 条消息)")
+        self._reset()
+
+    def _fail(self, reason: str) -> None:
+        """
+        记录错误并清理当前会话已写入的数据
+
+        Args:
+            reason (str): 错误说明
+
+        Returns:
+            None
+        """
+        self.errors.append(reason)
+        logger.warning(f"⚠️ {reason}")
+        if self._target_id is not None:
+            shutil.rmtree(self.manager.storage_path / self._target_id, ignore_errors=True)
+            self.manager.search.remove(self._target_id)
+        # 跳过该会话剩余记录 直到下一个会话开始
+        source_id = self._source_id
+        self._reset()
+        if source_id is not None:
+            self._source_id = source_id
+            self._skipping = True
+
+    def _reset(self) -> None:
+        """
+        清空当前会话状态
+
+        Returns:
+            None
+        """
+        self._source_id = None
+        self._target_id = None
+        self._meta = None
+        self._compression = {"records": []}
+        self._batch = []
+        self._count = 0
+        self._skipping = False
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    # 仓库根目录 用于定位默认的数据目录 模块需以 python -m 方式运行
+    root = Path(__file__).parent.parent
+
+    parser = argparse.ArgumentParser(description="EmaAgent 会话导出导入工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_parser = sub.add_parser("export", help="导出全部会话")
+    export_parser.add_argument("--out", help="输出文件 默认写到标准输出")
+    import_parser = sub.add_parser("import", help="从 NDJSON 文件导入会话")
+    import_parser.add_argument("file", help="NDJSON 文件 - 表示标准输入")
+    import_parser.add_argument("--on-conflict", default="rename", choices=sorted(CONFLICT_POLICIES))
+    for p in (export_parser, import_parser):
+        p.add_argument("--dir", dest="sessions_dir", help="会话根目录 默认使用 data/sessions")
+    args = parser.parse_args()
+
+    if args.sessions_dir:
+        sessions_dir = Path(args.sessions_dir)
+    else:
+        from config.paths import init_paths
+
+        sessions_dir = init_paths(root).sessions_dir
+
+    import memory.manager
+
+    manager = memory.manager.SessionManager(sessions_dir, write_behind=False)
+    if args.command == "export":
+        out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+        try:
+            out.writelines(iter_export(manager))
+        finally:
+            if args.out:
+                out.close()
+    else:
+        importer = SessionImporter(manager, on_conflict=args.on_conflict)
+        source = sys.stdin if args.file == "-" else open(args.file, "r", encoding="utf-8")
+        try:
+            importer.feed_lines(source)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            # 中途出错时同样清理未完成的会话目录
+            summary = importer.close()
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    manager.close()
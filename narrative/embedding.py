@@ -1,19 +1,30 @@
 ﻿"""
 构建LightRAG所需要的文本嵌入函数
 使用 OpenAI 的 Embedding API 来生成文本的向量表示
+客户端取自 llm.pool 注册表 与 LLMClient 共享连接池
 """
 
+from typing import Dict, Optional, Tuple
+
 import numpy as np
-from openai import AsyncOpenAI
 from lightrag.utils import EmbeddingFunc
 
 from .exceptions import EmbeddingError
 from config.paths import get_paths
+from llm.pool import get_openai_client
+
+
+# (配置版本, embeddings 配置) 配置文件未变化时不重新解析
+_embedding_cache: Optional[Tuple[Tuple[int, ...], Dict]] = None
 
 
 def _get_embedding_config():
-    config = get_paths().load_config()
-    return config.get("embeddings", {})
+    global _embedding_cache
+    paths = get_paths()
+    version = paths.config_version()
+    if _embedding_cache is None or _embedding_cache[0] != version:
+        _embedding_cache = (version, paths.load_config().get("embeddings", {}))
+    return _embedding_cache[1]
 
 
 async def siliconflow_embedding_func(texts: list[str]) -> np.ndarray:
@@ -30,10 +41,7 @@ async def siliconflow_embedding_func(texts: list[str]) -> np.ndarray:
     embedding_cfg = _get_embedding_config()
 
     try:
-        client = AsyncOpenAI(
-            api_key=embedding_cfg.get("api_key", ""),
-            base_url=embedding_cfg.get("base_url"),
-        )
+        client = get_openai_client(embedding_cfg.get("api_key", ""), embedding_cfg.get("base_url"))
 
         response = await client.embeddings.create(
             model=embedding_cfg.get("model"),
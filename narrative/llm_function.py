@@ -1,18 +1,32 @@
 ﻿"""
 构建Narrative Pipeline所需要的LLM调用函数
 使用 OpenAI 的 Chat Completions API 来生成文本回复
+客户端取自 llm.pool 注册表 与 LLMClient 共享连接池
+请求经 llm.scheduler 调度 图谱构建按 background 优先级 查询关键词提取按 agent 优先级
+暂时性错误按 llm.retry 策略重试 与 LLMClient 共用重试预算
 """
 
-from typing import Dict, List, Optional
-
-from openai import AsyncOpenAI
+from typing import Dict, List, Optional, Tuple
 
 from .exceptions import LLMError
 from config.paths import get_paths
+from llm.pool import get_openai_client
+from llm.retry import get_retry_policy
+from llm.scheduler import get_llm_scheduler
+from llm.tokenizer import get_token_counter
+
+
+# (配置版本, 运行参数) 配置文件未变化时不重新解析
+_runtime_cache: Optional[Tuple[Tuple[int, ...], Dict]] = None
 
 
 def _get_runtime_llm_config() -> Dict:
+    global _runtime_cache
     paths = get_paths()
+    version = paths.config_version()
+    if _runtime_cache is not None and _runtime_cache[0] == version:
+        return _runtime_cache[1]
+
     config = paths.load_config()
     settings = paths.load_settings()
 
@@ -28,12 +42,16 @@ def _get_runtime_llm_config() -> Dict:
 
     model_meta = model_catalog.get(selected_model, {}) if isinstance(model_catalog, dict) else {}
 
-    return {
+    runtime = {
+        "provider": model_meta.get("provider") or api_settings.get("provider") or llm_defaults.get("provider") or "deepseek",
         "model": selected_model,
         "base_url": model_meta.get("base_url") or api_settings.get("openai_base_url") or llm_defaults.get("base_url"),
         "api_key": model_meta.get("api_key") or llm_defaults.get("api_key", ""),
         "temperature": api_settings.get("temperature", llm_defaults.get("temperature", 0.7)),
+        "timeout": api_settings.get("timeout", llm_defaults.get("timeout", 60)),
     }
+    _runtime_cache = (version, runtime)
+    return runtime
 
 
 async def llm_func(
@@ -45,7 +63,7 @@ async def llm_func(
     """Call configured chat model."""
     try:
         runtime = _get_runtime_llm_config()
-        client = AsyncOpenAI(api_key=runtime["api_key"], base_url=runtime["base_url"])
+        client = get_openai_client(runtime["api_key"], runtime["base_url"]).with_options(max_retries=0)
 
         messages = []
         if system_prompt:
@@ -54,12 +72,28 @@ async def llm_func(
             messages.extend(history_messages)
         messages.append({"role": "user", "content": prompt})
 
-        response = await client.chat.completions.create(
-            model=runtime["model"],
-            messages=messages,
-            temperature=kwargs.get("temperature", runtime["temperature"]),
-            n=kwargs.get("n", 1),
-        )
+        # LightRAG 查询时以 keyword_extraction=True 调用 其余调用来自后台图谱构建
+        priority = "agent" if kwargs.get("keyword_extraction") else "background"
+        scheduler = get_llm_scheduler()
+        tokens = 0
+        if scheduler.needs_tokens(runtime["provider"]):
+            counter = get_token_counter()
+            tokens = sum(counter.count(str(message.get("content") or "")) for message in messages)
+
+        async def create():
+            async with scheduler.slot(runtime["provider"], priority, tokens) as ticket:
+                response = await client.chat.completions.create(
+                    model=runtime["model"],
+                    messages=messages,
+                    temperature=kwargs.get("temperature", runtime["temperature"]),
+                    n=kwargs.get("n", 1),
+                    timeout=runtime["timeout"],
+                )
+                if tokens and response.usage is not None:
+                    ticket.settle(response.usage.completion_tokens or 0)
+                return response
+
+        response = await get_retry_policy().run(create, label="Narrative")
 
         return response.choices[0].message.content
 
@@ -66,6 +66,9 @@ class Router:
             ],
             temperature=0.3,
             stream=False,
+            # 路由是回答前的准备步骤 优先级低于用户可见的流式回复 高于后台任务
+            priority="agent",
+            caller="narrative.router",
         )
 
         try:
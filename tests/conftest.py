@@ -0,0 +1,57 @@
+"""
+pytest 公共配置
+
+测试从仓库根目录导入各模块 与 main.py 的运行方式一致
+"""
+
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from memory.manager import SessionManager  # noqa: E402
+
+
+@pytest.fixture
+def make_manager(tmp_path):
+    """
+    创建日志模式 同步写回的 SessionManager 默认使用 tmp_path 测试结束时统一关闭
+
+    同一目录可多次创建 用于模拟进程重启后重新加载
+    """
+    managers = []
+
+    def factory(path=None, **kwargs):
+        options = {"storage_mode": "journal", "write_behind": False, **kwargs}
+        manager = SessionManager(path or tmp_path, **options)
+        managers.append(manager)
+        return manager
+
+    yield factory
+    for manager in managers:
+        manager.close()
+
+
+@pytest.fixture
+def make_service(make_manager, tmp_path, monkeypatch):
+    """
+    创建绑定到 tmp_path 的独立 SessionService 不复用进程级单例
+    """
+    # 服务层依赖较多 只在用到的测试中导入
+    from api.services import session_service
+    from api.services.session_service import SessionService
+
+    monkeypatch.setattr(SessionService, "_instance", None)
+    monkeypatch.setattr(session_service, "get_paths", lambda: SimpleNamespace(sessions_dir=tmp_path))
+
+    def factory(**kwargs):
+        service = SessionService()
+        service._manager = make_manager(**kwargs)
+        return service
+
+    return factory
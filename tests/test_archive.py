@@ -0,0 +1,43 @@
+"""
+冷会话归档测试
+"""
+
+from memory.archive import find_archive
+from memory.schema import AssistantMessage, UserMessage
+
+
+def test_load_survives_archive_between_restore_and_read(make_manager, tmp_path):
+    manager = make_manager()
+    session = manager.create_session("cold")
+    for i in range(10):
+        session.add_message(UserMessage(f"q{i}"))
+        session.add_message(AssistantMessage(f"a{i}"))
+    manager.save_session(session)
+    manager.close()
+
+    manager = make_manager()
+    assert manager.archive_session("cold") is not None
+
+    # 模拟启动时的归档扫描恰好在还原之后 读取快照之前再次归档该会话
+    restore = manager._restore_archive
+    swept = []
+
+    def restore_then_sweep(session_id):
+        ok = restore(session_id)
+        if not swept:
+            swept.append(manager.archive_session(session_id))
+        return ok
+
+    manager._restore_archive = restore_then_sweep
+    session = manager.load_session("cold")
+    assert swept[0] is not None
+    assert len(session.messages) == 20
+    assert find_archive(tmp_path / "cold") is None
+
+    session.add_message(UserMessage("new"))
+    manager.save_session(session)
+    manager.close()
+
+    reloaded = make_manager().load_session("cold")
+    assert len(reloaded.messages) == 21
+    assert reloaded.messages[-1].content == "new"
@@ -0,0 +1,50 @@
+"""
+会话目录索引测试
+"""
+
+from memory.catalog import CATALOG_FILE
+from memory.schema import AssistantMessage, UserMessage
+
+
+def _create(manager, count):
+    for i in range(count):
+        session = manager.create_session(f"s{i}")
+        for j in range(i):
+            session.add_message(UserMessage(f"q{j}"))
+            session.add_message(AssistantMessage(f"a{j}"))
+        manager.save_session(session)
+
+
+def test_list_pages_newest_first(make_manager):
+    manager = make_manager()
+    _create(manager, 5)
+    # 再次保存使 s1 成为最近更新的会话
+    session = manager.get_or_create_session("s1")
+    session.add_message(UserMessage("again"))
+    manager.save_session(session)
+
+    first, total = manager.list_session_summaries(offset=0, limit=2)
+    second, _ = manager.list_session_summaries(offset=2, limit=2)
+    rest, _ = manager.list_session_summaries(offset=4, limit=2)
+
+    assert total == 5
+    assert [s["session_id"] for s in first + second + rest] == ["s1", "s4", "s3", "s2", "s0"]
+    assert first[0]["message_count"] == 3
+
+
+def test_rebuild_after_catalog_is_deleted(make_manager, tmp_path):
+    manager = make_manager()
+    _create(manager, 4)
+    expected, _ = manager.list_session_summaries()
+    manager.close()
+    manager.catalog.close()
+
+    for path in tmp_path.glob(CATALOG_FILE + "*"):
+        path.unlink()
+
+    # 新建索引时从会话目录(快照 + 追加日志)重建
+    rebuilt = make_manager()
+    assert rebuilt.catalog.created
+    summaries, total = rebuilt.list_session_summaries()
+    assert total == 4
+    assert summaries == expected
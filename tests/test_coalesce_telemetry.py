@@ -0,0 +1,77 @@
+"""
+合并请求的遥测测试
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from llm.client import LLMClient
+from llm.config import LLMConfig
+from llm.telemetry import configure_llm_telemetry, telemetry_scope
+
+USAGE = SimpleNamespace(prompt_tokens=10, completion_tokens=2)
+
+
+class FakeCompletions:
+    """响应前稍作等待 使相同请求重叠的假上游"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, stream=False, **params):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        if not stream:
+            message = SimpleNamespace(content="hello world")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=USAGE)
+        return self._stream()
+
+    async def _stream(self):
+        for token in ("hello", " world"):
+            await asyncio.sleep(0.01)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))], usage=None)
+        yield SimpleNamespace(choices=[], usage=USAGE)
+
+
+class FakeClient(LLMClient):
+    """把上游替换为 FakeCompletions 的 LLMClient"""
+
+    def __init__(self, completions):
+        super().__init__(LLMConfig(provider="coalesce-provider", model="deepseek-chat", api_key="k"))
+        self.fake = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    @property
+    def client(self):
+        return self.fake
+
+
+@pytest.fixture(autouse=True)
+def _telemetry():
+    configure_llm_telemetry({"prices": {"deepseek-chat": {"input": 1, "output": 2}}})
+    yield
+    configure_llm_telemetry(None)
+
+
+async def _call(client, stream):
+    with telemetry_scope("s", "chat") as scope:
+        await client.chat([{"role": "user", "content": "hi"}], stream=stream, cache=False)
+    return scope.calls[0]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_joined_calls_are_not_billed(stream):
+    completions = FakeCompletions()
+    client = FakeClient(completions)
+
+    async def run():
+        return await asyncio.gather(_call(client, stream), _call(client, stream))
+
+    leader, joiner = asyncio.run(run())
+    assert completions.calls == 1
+    assert leader["cached"] is False
+    assert (leader["prompt_tokens"], leader["completion_tokens"]) == (10, 2)
+    assert leader["usage"] == "reported" and leader["cost"] > 0
+    assert joiner["cached"] is True
+    assert joiner["usage"] == "cached" and joiner["cost"] is None
@@ -0,0 +1,77 @@
+"""
+快照编解码测试
+"""
+
+import pytest
+
+from memory.codec import get_snapshot_codec, read_snapshot
+from memory.schema import AssistantMessage, CompressionRecord, UserMessage
+
+
+CODECS = ["json", "json_compact", pytest.param("msgpack", marks=pytest.mark.skipif(
+    get_snapshot_codec("msgpack").name != "msgpack", reason="msgpack 未安装"
+))]
+
+
+def _save(manager, session_id):
+    session = manager.create_session(session_id)
+    for i in range(3):
+        session.add_message(UserMessage(f"问题{i}"))
+        session.add_message(AssistantMessage(f"回答{i}", tool_calls=[{"id": f"c{i}", "type": "function"}]))
+    session.compression_history.add_record(CompressionRecord("t", 2, 1, "摘要", (0, 2)))
+    manager.save_session(session)
+    return session
+
+
+def _snapshot_files(session_dir):
+    return sorted(p.name for p in session_dir.iterdir() if p.name.startswith(("messages.", "compression.")))
+
+
+@pytest.mark.parametrize("written", CODECS)
+@pytest.mark.parametrize("configured", ["json", "json_compact"])
+def test_load_detects_format_from_file(make_manager, tmp_path, written, configured):
+    session = _save(make_manager(storage_mode="snapshot", snapshot_codec=written), "s")
+    suffix = ".msgpack" if written == "msgpack" else ".json"
+    assert {"messages" + suffix, "compression" + suffix} <= set(_snapshot_files(tmp_path / "s"))
+
+    # 读取格式只取决于目录中的文件 与当前配置无关
+    loaded = make_manager(storage_mode="snapshot", snapshot_codec=configured).load_session("s")
+
+    assert loaded.messages == session.messages
+    assert [r.to_dict() for r in loaded.compression_history.records] == [
+        r.to_dict() for r in session.compression_history.records
+    ]
+
+
+def test_json_compact_has_no_indentation(make_manager, tmp_path):
+    _save(make_manager(storage_mode="snapshot", snapshot_codec="json_compact"), "s")
+    text = (tmp_path / "s" / "messages.json").read_text(encoding="utf-8")
+    assert "\n " not in text
+
+
+@pytest.mark.parametrize("target", CODECS[1:])
+def test_migrate_rewrites_snapshots_and_removes_old_files(make_manager, tmp_path, target):
+    manager = make_manager(storage_mode="snapshot")
+    sessions = [_save(manager, f"s{i}") for i in range(2)]
+    before = {s.session_id: read_snapshot(tmp_path / s.session_id, "messages") for s in sessions}
+
+    stats = manager.migrate_snapshots(target)
+
+    assert stats["codec"] == target
+    assert (stats["migrated"], stats["skipped"], stats["failed"]) == (2, 0, 0)
+    assert stats["bytes_after"] < stats["bytes_before"]
+    suffix = ".msgpack" if target == "msgpack" else ".json"
+    for session in sessions:
+        session_dir = tmp_path / session.session_id
+        assert [n for n in _snapshot_files(session_dir) if not n.endswith(".idx")] == [
+            "compression" + suffix, "messages" + suffix,
+        ]
+        assert read_snapshot(session_dir, "messages") == before[session.session_id]
+
+    # 迁移后由另一个配置的管理器加载 内容不变
+    reloaded = make_manager(storage_mode="snapshot", snapshot_codec="json").load_session("s1")
+    assert reloaded.messages == sessions[1].messages
+
+    # 迁回缩进 JSON
+    assert manager.migrate_snapshots("json")["migrated"] == 2
+    assert read_snapshot(tmp_path / "s0", "messages") == before["s0"]
@@ -0,0 +1,99 @@
+"""
+增量上下文窗口属性测试
+
+随机的 追加 / 压缩 / 裁剪 / 窗口大小变化 序列下
+Session.get_context_for_llm 的结果必须与按完整历史重新清洗截取的结果一致
+"""
+
+from hypothesis import given, settings, strategies as st
+
+from memory.schema import AssistantMessage, Message, Session, SystemMessage, ToolMessage, UserMessage
+
+
+def _full_rebuild(session):
+    """增量窗口之前的实现: 每次从压缩游标开始重新清洗 再截取最近 max_context_messages 条"""
+    cleaned = []
+    for msg in session.messages[session.compressed_until_index:]:
+        if msg.role == "assistant" and (isinstance(msg, AssistantMessage) or msg.tool_calls):
+            cleaned.append(AssistantMessage(content=msg.content, tool_calls=None))
+        elif msg.role == "tool":
+            continue
+        else:
+            cleaned.append(msg)
+    return cleaned[-session.max_context_messages:]
+
+
+def _key(msg):
+    return msg.role, msg.content, msg.tool_calls, msg.name, msg.tool_call_id
+
+
+def _make(kind, i):
+    if kind == 0:
+        return UserMessage(f"u{i}")
+    if kind == 1:
+        return AssistantMessage(f"a{i}")
+    if kind == 2:
+        return AssistantMessage(f"t{i}", tool_calls=[{"id": f"c{i}"}])
+    if kind == 3:
+        return ToolMessage(f"r{i}", "tool", f"c{i}")
+    if kind == 4:
+        return Message(role="assistant", content=f"m{i}")
+    return SystemMessage(f"s{i}")
+
+
+_OPS = st.one_of(
+    # add_message 同步窗口 / 直接追加到 messages(ReActAgent 的写法)
+    st.tuples(st.just("add"), st.integers(0, 5)),
+    st.tuples(st.just("append"), st.integers(0, 5)),
+    # 压缩游标前移 / 回退
+    st.tuples(st.just("compress"), st.integers(0, 30)),
+    st.tuples(st.just("reset_cursor"), st.integers(0, 30)),
+    # 窗口大小变化与历史裁剪
+    st.tuples(st.just("max"), st.integers(0, 25)),
+    st.tuples(st.just("trim"), st.integers(0, 30)),
+    st.tuples(st.just("trim_in_place"), st.integers(0, 30)),
+    # 替换已有消息(列表对象不变)
+    st.tuples(st.just("replace"), st.integers(0, 5)),
+)
+
+
+@settings(max_examples=500, deadline=None)
+@given(st.lists(_OPS, max_size=80))
+def test_incremental_window_matches_full_rebuild(ops):
+    session = Session("prop")
+    for i, (name, arg) in enumerate(ops):
+        if name == "add":
+            session.add_message(_make(arg, i))
+        elif name == "append":
+            session.messages.append(_make(arg, i))
+        elif name == "compress":
+            session.compressed_until_index = min(len(session.messages), session.compressed_until_index + arg)
+        elif name == "reset_cursor":
+            session.compressed_until_index = min(arg, len(session.messages))
+        elif name == "max":
+            session.max_context_messages = arg
+        elif name == "trim":
+            session.messages = session.messages[:max(0, len(session.messages) - arg)]
+            session.compressed_until_index = min(session.compressed_until_index, len(session.messages))
+        elif name == "trim_in_place":
+            del session.messages[max(0, len(session.messages) - arg):]
+            session.compressed_until_index = min(session.compressed_until_index, len(session.messages))
+        elif name == "replace" and session.messages:
+            session.messages[-1] = _make(arg, i)
+
+        got = session.get_context_for_llm(include_summary=False)
+        assert [_key(m) for m in got] == [_key(m) for m in _full_rebuild(session)]
+
+
+def test_window_keeps_original_message_objects():
+    session = Session("keep")
+    user = UserMessage("hello")
+    session.add_message(user)
+    session.add_message(AssistantMessage("calling", tool_calls=[{"id": "c1"}]))
+    session.add_message(ToolMessage("result", "tool", "c1"))
+
+    context = session.get_context_for_llm(include_summary=False)
+    # 非 assistant 消息原样复用 时间戳不变
+    assert context[0] is user
+    assert [m.role for m in context] == ["user", "assistant"]
+    assert context[1].tool_calls is None
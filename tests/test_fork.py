@@ -0,0 +1,103 @@
+"""
+会话分支测试
+"""
+
+import pytest
+
+from memory.codec import read_snapshot
+from memory.schema import AssistantMessage, CompressionRecord, UserMessage
+
+
+def _add_turns(session, start, count):
+    for i in range(start, start + count):
+        session.add_message(UserMessage(f"q{i}"))
+        session.add_message(AssistantMessage(f"a{i}"))
+
+
+def _contents(session):
+    return [m.content for m in session.messages]
+
+
+def _parent(manager, turns=3):
+    parent = manager.create_session("parent")
+    _add_turns(parent, 0, turns)
+    parent.compression_history.add_record(CompressionRecord("t", 2, 1, "前两条", (0, 2)))
+    parent.compression_history.add_record(CompressionRecord("t", 4, 1, "跨过分支点", (2, 6)))
+    parent.compressed_until_index = 6
+    manager.save_session(parent)
+    return parent
+
+
+def test_fork_shares_prefix_up_to_branch_point(make_manager, tmp_path):
+    manager = make_manager()
+    parent = _parent(manager)
+
+    fork = manager.fork_session("parent", at=4, new_id="child")
+    assert (fork.parent_id, fork.branch_point) == ("parent", 4)
+    # 只继承完全落在前缀内的摘要
+    assert [r.summary for r in fork.compression_history.records] == ["前两条"]
+    assert fork.compressed_until_index == 2
+    # 分支目录不复制共享前缀
+    assert read_snapshot(tmp_path / "child", "messages") == []
+
+    child = manager.load_session("child")
+    assert _contents(child) == ["q0", "a0", "q1", "a1"]
+    # 父会话常驻时前缀直接引用父会话的消息对象
+    assert all(a is b for a, b in zip(child.messages, parent.messages[:4]))
+
+    with pytest.raises(ValueError):
+        manager.fork_session("parent", at=7)
+    with pytest.raises(ValueError):
+        manager.fork_session("parent", at=2, new_id="child")
+    assert manager.fork_session("missing", at=0) is None
+
+
+def test_child_unaffected_by_later_parent_appends(make_manager):
+    manager = make_manager()
+    parent = _parent(manager)
+    manager.fork_session("parent", at=4, new_id="child")
+
+    child = manager.load_session("child")
+    child.add_message(UserMessage("分支问题"))
+    manager.save_session(child)
+
+    _add_turns(parent, 3, 2)
+    manager.save_session(parent)
+
+    assert _contents(child) == ["q0", "a0", "q1", "a1", "分支问题"]
+    assert len(parent.messages) == 10
+
+    # 重新加载后两边各自保持
+    fresh = make_manager()
+    child = fresh.load_session("child")
+    parent = fresh.load_session("parent")
+    assert _contents(child) == ["q0", "a0", "q1", "a1", "分支问题"]
+    assert _contents(parent) == [f"{r}{i}" for i in range(5) for r in ("q", "a")]
+    assert child.parent_id == "parent" and child.branch_point == 4
+
+
+def test_fork_of_non_resident_parent_and_nested_fork(make_manager):
+    _parent(make_manager())
+    manager = make_manager()
+
+    manager.fork_session("parent", at=6, new_id="child")
+    child = manager.load_session("child")
+    child.add_message(UserMessage("c0"))
+    manager.save_session(child)
+
+    manager.fork_session("child", at=7, new_id="grandchild")
+    grandchild = manager.load_session("grandchild")
+    assert _contents(grandchild) == ["q0", "a0", "q1", "a1", "q2", "a2", "c0"]
+    assert [r.summary for r in grandchild.compression_history.records] == ["前两条", "跨过分支点"]
+
+
+def test_deleting_parent_detaches_branch(make_manager):
+    manager = make_manager()
+    _parent(manager)
+    manager.fork_session("parent", at=4, new_id="child")
+
+    assert manager.delete_session("parent")
+
+    child = make_manager().load_session("child")
+    assert child.parent_id is None and child.branch_point == 0
+    assert _contents(child) == ["q0", "a0", "q1", "a1"]
@@ -0,0 +1,61 @@
+"""
+会话追加日志测试
+"""
+
+from memory.journal import JOURNAL_FILE
+from memory.schema import AssistantMessage, UserMessage
+
+
+def _add_turns(session, start, count):
+    for i in range(start, start + count):
+        session.add_message(UserMessage(f"q{i}"))
+        session.add_message(AssistantMessage(f"a{i}"))
+
+
+def test_append_after_torn_tail_keeps_every_message(make_manager, tmp_path):
+    manager = make_manager()
+    session = manager.create_session("torn")
+    manager.save_session(session)
+    _add_turns(session, 0, 3)
+    manager.save_session(session)
+    manager.close()
+
+    # 模拟进程在写入下一条记录途中退出
+    journal_file = tmp_path / "torn" / JOURNAL_FILE
+    with open(journal_file, "a", encoding="utf-8") as f:
+        f.write('{"op":"append","index":6,"mess')
+
+    manager = make_manager()
+    session = manager.load_session("torn")
+    assert len(session.messages) == 6
+    _add_turns(session, 3, 3)
+    manager.save_session(session)
+    manager.close()
+
+    reloaded = make_manager().load_session("torn")
+    assert [m.content for m in reloaded.messages] == [
+        text for i in range(6) for text in (f"q{i}", f"a{i}")
+    ]
+
+
+def test_complete_record_without_newline_is_kept(make_manager, tmp_path):
+    manager = make_manager()
+    session = manager.create_session("nl")
+    manager.save_session(session)
+    _add_turns(session, 0, 1)
+    manager.save_session(session)
+    manager.close()
+
+    # 记录已完整写入 只缺结尾换行
+    journal_file = tmp_path / "nl" / JOURNAL_FILE
+    data = journal_file.read_bytes()
+    journal_file.write_bytes(data.rstrip(b"\n"))
+
+    manager = make_manager()
+    session = manager.load_session("nl")
+    _add_turns(session, 1, 1)
+    manager.save_session(session)
+    manager.close()
+
+    reloaded = make_manager().load_session("nl")
+    assert [m.content for m in reloaded.messages] == ["q0", "a0", "q1", "a1"]
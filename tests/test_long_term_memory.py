@@ -0,0 +1,155 @@
+"""
+长期记忆检索测试 使用本地哈希嵌入器
+"""
+
+import asyncio
+
+from agent.EmaAgent import EmaAgent
+from llm.tokenizer import get_token_counter
+from memory.embedding import HashEmbedder
+from memory.longterm import LongTermMemory
+from memory.schema import Session, UserMessage
+
+
+FACTS = [
+    ("cats", "我养了一只橘猫 叫小橘"),
+    ("cats", "小橘喜欢吃鱼"),
+    ("dogs", "我家的狗叫旺财"),
+    ("trip", "下个月去京都旅行"),
+]
+
+
+def _fill(memory):
+    entries = [("fact", text, session_id, f"{session_id}:fact:{i}") for i, (session_id, text) in enumerate(FACTS)]
+    return asyncio.run(memory.remember_many(entries))
+
+
+def _recall(memory, query, **kwargs):
+    return [(item.session_id, item.text) for item, _ in asyncio.run(memory.recall(query, **kwargs))]
+
+
+def test_recall_top_k_and_exclude_session(tmp_path):
+    memory = LongTermMemory(tmp_path, HashEmbedder(256))
+    assert _fill(memory) == 4
+    # 相同去重键不重复写入
+    assert _fill(memory) == 0
+
+    hits = _recall(memory, "小橘是什么猫", k=2)
+    assert sorted(hits) == sorted([("cats", "我养了一只橘猫 叫小橘"), ("cats", "小橘喜欢吃鱼")])
+    assert _recall(memory, "小橘是什么猫", k=1) == hits[:1]
+
+    # 排除当前会话后 次相关的其他会话记忆补位
+    assert _recall(memory, "小橘和旺财", k=1, exclude_session="cats") == [("dogs", "我家的狗叫旺财")]
+    assert _recall(memory, "小橘是什么猫", k=2, exclude_session="cats") == []
+    assert _recall(memory, "小橘是什么猫", k=2, min_score=0.99) == []
+
+
+def test_forget_and_rename_stay_consistent_after_reload(tmp_path):
+    memory = LongTermMemory(tmp_path, HashEmbedder(256))
+    _fill(memory)
+
+    assert memory.rename_session("cats", "pets") == 2
+    assert memory.forget_session("dogs") == 1
+    assert memory.forget_session("dogs") == 0
+    assert len(memory) == 3
+
+    for current in (memory, LongTermMemory(tmp_path, HashEmbedder(256))):
+        assert len(current) == 3
+        assert {s for s, _ in _recall(current, "小橘 狗 旺财", k=10)} == {"pets", "trip"}
+        assert _recall(current, "小橘 京都", k=10, exclude_session="pets") == [("trip", "下个月去京都旅行")]
+        # 去重键随会话改名 旧键已不存在 新键仍去重
+        assert "pets:fact:0" in current._keys and "cats:fact:0" not in current._keys
+
+    reloaded = LongTermMemory(tmp_path, HashEmbedder(256))
+    assert asyncio.run(reloaded.remember("fact", "我养了一只橘猫 叫小橘", "pets", key="pets:fact:0")) == 0
+    assert asyncio.run(reloaded.remember("fact", "旺财会握手", "dogs", key="dogs:fact:9")) == 1
+    assert _recall(reloaded, "旺财", k=1) == [("dogs", "旺财会握手")]
+
+
+def test_reembed_when_embedder_changes(tmp_path):
+    memory = LongTermMemory(tmp_path, HashEmbedder(256))
+    _fill(memory)
+    expected = _recall(memory, "京都旅行", k=1)
+
+    # 维度变化后加载 检索返回空 直到重新向量化完成
+    stale = LongTermMemory(tmp_path, HashEmbedder(128))
+    assert not stale.ready
+    assert _recall(stale, "京都旅行", k=1) == []
+    assert asyncio.run(stale.remember("fact", "新条目", "trip")) == 0
+
+    assert asyncio.run(stale.reembed(batch_size=3)) == 4
+    assert stale.ready and stale.index.dim == 128
+    assert _recall(stale, "京都旅行", k=1) == expected
+
+    # 重建后的向量已落盘 再次加载无需重建
+    reloaded = LongTermMemory(tmp_path, HashEmbedder(128))
+    assert reloaded.ready
+    assert _recall(reloaded, "京都旅行", k=1) == expected
+
+    # 运行中切换嵌入器 同名同维度不触发重建
+    assert not reloaded.use_embedder(HashEmbedder(128))
+    assert reloaded.use_embedder(HashEmbedder(64)) and not reloaded.ready
+
+
+class SlowEmbedder(HashEmbedder):
+    """查询向量化前等待 用于模拟远端嵌入接口过慢"""
+
+    def __init__(self, delay):
+        super().__init__(256)
+        self.delay = delay
+
+    async def embed(self, texts):
+        await asyncio.sleep(self.delay)
+        return self.embed_sync(texts)
+
+
+class StubAgent(EmaAgent):
+    """跳过配置加载 只保留长期记忆检索需要的组件"""
+
+    def __init__(self, memory, recall_timeout):
+        self.memory_config = {"enabled": True, "recall_timeout": recall_timeout, "min_score": 0.1}
+        self._long_term_memory = memory
+        self._memory_init_lock = asyncio.Lock()
+        self._memory_tasks = set()
+
+
+def _session(query):
+    session = Session(session_id="current")
+    session.add_message(UserMessage(query))
+    return session
+
+
+def test_agent_recall_injects_memories_within_budget(tmp_path):
+    memory = LongTermMemory(tmp_path, HashEmbedder(256))
+    _fill(memory)
+    agent = StubAgent(memory, recall_timeout=1.0)
+    counter = get_token_counter("approx")
+
+    text = asyncio.run(agent._recall_memories(_session("小橘爱吃什么"), counter, 200))
+    assert text.startswith("[长期记忆]") and "小橘喜欢吃鱼" in text
+    assert counter.count(text) <= 200
+
+    assert asyncio.run(agent._recall_memories(_session("小橘爱吃什么"), counter, 0)) == ""
+
+
+def test_agent_recall_timeout_skips_injection(tmp_path):
+    seed = LongTermMemory(tmp_path, HashEmbedder(256))
+    _fill(seed)
+    memory = LongTermMemory(tmp_path, SlowEmbedder(delay=0.5))
+    agent = StubAgent(memory, recall_timeout=0.05)
+    counter = get_token_counter("approx")
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        text = await agent._recall_memories(_session("小橘爱吃什么"), counter, 200)
+        return text, loop.time() - start
+
+    text, elapsed = asyncio.run(scenario())
+    assert text == ""
+    assert elapsed < 0.4
+
+    # 超时只影响本轮 检索足够快时照常注入
+    memory.embedder.delay = 0
+    text = asyncio.run(agent._recall_memories(_session("小橘爱吃什么"), counter, 200))
+    assert "小橘喜欢吃鱼" in text
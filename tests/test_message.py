@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from llm.tokenizer import get_token_counter
+from memory.schema import AssistantMessage, Message, UserMessage
+
+
+def test_assigning_content_invalidates_caches():
+    counter = get_token_counter("approx")
+    msg = UserMessage("你好")
+    wire = msg.to_wire()
+    tokens = msg.token_count(counter)
+    assert msg.to_wire() is wire
+
+    msg.content = "你好" * 20
+
+    assert msg.to_wire() is not wire
+    assert msg.to_wire()["content"] == "你好" * 20
+    assert msg.token_count(counter) > tokens
+
+
+def test_assigning_tool_calls_invalidates_caches():
+    counter = get_token_counter("approx")
+    msg = AssistantMessage("", tool_calls=[{"id": "c1", "type": "function"}])
+    wire = msg.to_wire()
+    tokens = msg.token_count(counter)
+
+    msg.tool_calls = msg.tool_calls + ({"id": "c2", "type": "function"},)
+
+    assert msg.to_wire() is not wire
+    assert [tc["id"] for tc in msg.to_wire()["tool_calls"]] == ["c1", "c2"]
+    assert msg.token_count(counter) > tokens
+
+
+def test_tool_calls_stored_as_tuple():
+    calls = [{"id": "c1", "type": "function"}]
+    msg = AssistantMessage("", tool_calls=calls)
+    calls.append({"id": "c2", "type": "function"})
+
+    assert msg.tool_calls == ({"id": "c1", "type": "function"},)
+    with pytest.raises(AttributeError):
+        msg.tool_calls.append({"id": "c3"})
+
+    restored = Message.from_dict(json.loads(json.dumps(msg.to_dict())))
+    assert restored == msg
@@ -0,0 +1,54 @@
+"""
+会话消息游标分页测试
+"""
+
+from memory.schema import AssistantMessage, ToolMessage, UserMessage
+
+
+def _add_round(session, i):
+    session.add_message(UserMessage(f"q{i}"))
+    session.add_message(AssistantMessage("", tool_calls=[{"id": f"call_{i}", "type": "function"}]))
+    session.add_message(ToolMessage(f"result{i}", name="search", tool_call_id=f"call_{i}"))
+    session.add_message(AssistantMessage(f"a{i}"))
+
+
+def _page_back(manager, session_id, limit):
+    """从最新消息开始用 before 游标向前翻页"""
+    pages = []
+    items, has_more = manager.get_message_window(session_id, limit=limit)
+    pages.append(items)
+    while has_more:
+        items, has_more = manager.get_message_window(session_id, before=items[0][0], limit=limit)
+        pages.append(items)
+    return pages
+
+
+def test_cursor_pages_skip_tool_steps_and_match_on_disk(make_manager):
+    # 每两轮压实一次 最后一轮留在追加日志
+    manager = make_manager(compact_threshold=8)
+    session = manager.create_session("paged")
+    for i in range(5):
+        _add_round(session, i)
+        manager.save_session(session)
+    manager.wait_for_compaction()
+
+    resident = _page_back(manager, "paged", limit=3)
+    contents = [[m["content"] for _, m in page] for page in resident]
+    assert contents == [
+        ["a3", "q4", "a4"],
+        ["q2", "a2", "q3"],
+        ["a0", "q1", "a1"],
+        ["q0"],
+    ]
+    # 游标是消息在完整历史中的位置 工具调用与工具结果不展示但占位
+    assert [pos for pos, _ in resident[-2]] == [3, 4, 7]
+
+    # 未常驻的会话从快照索引与追加日志读取 结果与常驻会话一致
+    manager.close()
+    fresh = make_manager()
+    assert _page_back(fresh, "paged", limit=3) == resident
+    assert "paged" not in fresh._cache
+
+    newer, has_more = fresh.get_message_window("paged", since=7, limit=2)
+    assert [pos for pos, _ in newer] == [8, 11]
+    assert has_more
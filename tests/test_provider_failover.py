@@ -0,0 +1,175 @@
+"""
+服务商池故障切换与对冲测试
+
+两个本地 OpenAI 兼容桩服务分别扮演故障或变慢的服务商
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm.client import LLMClient
+from llm.config import LLMConfig
+from llm.hedging import configure_hedging
+from llm import provider_pool
+from llm.provider_pool import ProviderPool, configure_provider_pool, get_provider_pool
+from llm.retry import configure_retry_policy
+
+
+class StubProvider:
+    """
+    最小的 OpenAI 兼容 /v1/chat/completions 桩服务 支持流式与非流式
+
+    Args:
+        reply (str): 回复文本 流式时按空格切分为 token
+    """
+
+    def __init__(self, reply):
+        self.reply = reply
+        # 非 200 时直接返回该状态码
+        self.status = 200
+        # 首个 token(或非流式响应)之前的等待秒数
+        self.delay = 0.0
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.requests += 1
+                if stub.status != 200:
+                    self._send(stub.status, {"error": {"message": "stub failure", "type": "server_error"}})
+                    return
+                time.sleep(stub.delay)
+                try:
+                    if body.get("stream"):
+                        self._stream(body["model"])
+                    else:
+                        self._send(200, {
+                            "id": "stub", "object": "chat.completion", "created": 0, "model": body["model"],
+                            "choices": [{
+                                "index": 0, "finish_reason": "stop",
+                                "message": {"role": "assistant", "content": stub.reply},
+                            }],
+                        })
+                except (BrokenPipeError, ConnectionResetError):
+                    # 对冲失败的一路被客户端取消
+                    pass
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                tokens = [token + " " for token in stub.reply.split()]
+                for i, token in enumerate(tokens + [None]):
+                    chunk = {
+                        "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "delta": {"content": token} if token else {},
+                            "finish_reason": None if token else "stop",
+                        }],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def config(self, model):
+        return LLMConfig(provider="openai", model=model, api_key="stub", base_url=self.base_url, coalesce_requests=False)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    # 服务商池是进程级单例 重新配置时保留健康状态 每个测试使用新的池
+    monkeypatch.setattr(provider_pool, "_pool", ProviderPool())
+    first, second = StubProvider("from primary"), StubProvider("from backup")
+    # 重试间隔缩短 避免测试等待退避
+    configure_retry_policy({"base_delay": 0.01, "max_delay": 0.05})
+    yield first, second
+    first.close()
+    second.close()
+    configure_hedging(None)
+    configure_retry_policy(None)
+
+
+def _enable_pool():
+    # primary 权重远高于 backup 正常情况下总是先尝试 primary
+    configure_provider_pool({
+        "enabled": True,
+        "members": {"primary-model": 1.0, "backup-model": 1e-9},
+        "health": {"consecutive_failures": 3, "open_seconds": 60},
+    })
+
+
+def test_pool_fails_over_and_opens_the_breaker(providers):
+    primary, backup = providers
+    primary.status = 503
+    _enable_pool()
+    client = LLMClient(primary.config("primary-model"), pool=[primary.config("primary-model"), backup.config("backup-model")])
+
+    async def calls():
+        return [
+            await client.chat([{"role": "user", "content": f"q{i}"}], stream=False, cache=False, priority="agent")
+            for i in range(8)
+        ]
+
+    assert asyncio.run(calls()) == ["from backup"] * 8
+    # 连续失败 3 次后熔断 之后的请求直接走 backup
+    assert primary.requests == 3
+    assert backup.requests == 8
+    assert get_provider_pool().stats()["members"]["primary-model"]["state"] == "open"
+
+
+def test_pool_fails_over_streaming_requests(providers):
+    primary, backup = providers
+    primary.status = 503
+    _enable_pool()
+    client = LLMClient(primary.config("primary-model"), pool=[primary.config("primary-model"), backup.config("backup-model")])
+
+    async def stream():
+        return "".join([token async for token in client.stream_chat([{"role": "user", "content": "hi"}])])
+
+    assert asyncio.run(stream()) == "from backup "
+    assert primary.requests == 1
+
+
+def test_hedge_wins_when_primary_first_token_is_slow(providers):
+    primary, backup = providers
+    primary.delay = 2.0
+    configure_hedging({"enabled": True, "delay_ms": 100, "auto_delay": False})
+    client = LLMClient(primary.config("primary-model"), hedges=[backup.config("backup-model")])
+
+    async def stream():
+        started = time.perf_counter()
+        text = "".join([token async for token in client.stream_chat([{"role": "user", "content": "hi"}])])
+        return text, time.perf_counter() - started
+
+    text, elapsed = asyncio.run(stream())
+    assert text == "from backup "
+    # 不等待 primary 的 2 秒首 token 延迟
+    assert elapsed < 1.5
+    assert backup.requests == 1
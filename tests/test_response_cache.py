@@ -0,0 +1,151 @@
+"""
+LLM 响应缓存测试
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import llm.cache
+from llm.cache import ResponseCache, configure_response_cache, get_response_cache
+from llm.client import LLMClient
+from llm.config import LLMConfig
+
+
+def _get(cache, key, text="fresh"):
+    calls = []
+
+    async def call():
+        calls.append(key)
+        return text
+
+    result = asyncio.run(cache.get_or_call(key, call))
+    return result, len(calls)
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm.cache.time, "time", lambda: now[0])
+    cache = ResponseCache({"enabled": True, "ttl_seconds": 60})
+
+    assert _get(cache, "k", "v1") == (("v1", False), 1)
+    now[0] += 59
+    assert _get(cache, "k", "v2") == (("v1", True), 0)
+    now[0] += 2
+    assert _get(cache, "k", "v2") == (("v2", False), 1)
+    assert cache.stats()["expired"] == 1
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResponseCache({"enabled": True, "max_entries": 2})
+    _get(cache, "a")
+    _get(cache, "b")
+    # 访问 a 使 b 成为最久未使用
+    assert _get(cache, "a")[1] == 0
+    _get(cache, "c")
+
+    assert _get(cache, "a")[1] == 0
+    assert _get(cache, "c")[1] == 0
+    assert _get(cache, "b")[1] == 1
+    assert cache.stats()["evictions"] == 2
+
+    # 缩小容量立即淘汰
+    cache.configure({"enabled": True, "max_entries": 1})
+    assert cache.stats()["entries"] == 1
+
+
+def test_disk_round_trip(tmp_path, monkeypatch):
+    db_path = tmp_path / "cache.db"
+    config = {"enabled": True, "persist": True, "ttl_seconds": 60}
+    cache = ResponseCache(config, db_path)
+    _get(cache, "k", "persisted")
+    cache.close()
+
+    # 新实例内存为空 从数据库读回并回填内存
+    reopened = ResponseCache(config, db_path)
+    assert _get(reopened, "k") == (("persisted", True), 0)
+    assert reopened.stats()["disk_hits"] == 1
+    assert _get(reopened, "k") == (("persisted", True), 0)
+    assert reopened.stats()["disk_hits"] == 1
+    reopened.close()
+
+    # 数据库中的过期条目同样失效
+    now = llm.cache.time.time()
+    monkeypatch.setattr(llm.cache.time, "time", lambda: now + 120)
+    expired = ResponseCache(config, db_path)
+    assert _get(expired, "k", "again") == (("again", False), 1)
+    expired.close()
+
+
+def test_should_cache_rules():
+    assert not ResponseCache({"enabled": False}).should_cache(0.0)
+    cache = ResponseCache({"enabled": True, "max_temperature": 0.3})
+    assert cache.should_cache(0.0) and cache.should_cache(0.3)
+    assert not cache.should_cache(0.7)
+    assert not cache.should_cache(None)
+    assert cache.should_cache(0.7, cache=True)
+    assert not cache.should_cache(0.0, cache=False)
+    assert cache.stats()["bypassed"] == 1
+
+
+def test_make_key_ignores_transport_params():
+    params = {"model": "m", "messages": [{"role": "user", "content": "hi"}], "temperature": 0}
+    key = ResponseCache.make_key(params)
+    assert ResponseCache.make_key({**params, "timeout": 5, "stream": True}) == key
+    assert ResponseCache.make_key({**params, "temperature": 0.1}) != key
+
+
+class FakeCompletions:
+    """按调用次数返回不同文本的假上游"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, stream=False, **params):
+        self.calls += 1
+        text = f"reply{self.calls}"
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None)
+        return self._stream(text)
+
+    async def _stream(self, text):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+
+class FakeClient(LLMClient):
+    """把上游替换为 FakeCompletions 的 LLMClient"""
+
+    def __init__(self, completions):
+        super().__init__(LLMConfig(provider="cache-provider", model="deepseek-chat", api_key="k", temperature=0.7))
+        self.fake = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    @property
+    def client(self):
+        return self.fake
+
+
+@pytest.fixture
+def process_cache():
+    configure_response_cache({"enabled": True, "max_temperature": 0.3})
+    yield get_response_cache()
+    get_response_cache().clear(disk=False)
+    configure_response_cache(None)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_client_skips_cache_above_max_temperature(process_cache, stream):
+    completions = FakeCompletions()
+    client = FakeClient(completions)
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def run():
+        hot = [await client.chat(messages, stream=stream) for _ in range(2)]
+        cold = [await client.chat(messages, stream=stream, temperature=0) for _ in range(2)]
+        return hot, cold
+
+    hot, cold = asyncio.run(run())
+    # 默认温度 0.7 高于 max_temperature 每次都请求模型
+    assert hot == ["reply1", "reply2"]
+    assert cold == ["reply3", "reply3"]
+    assert completions.calls == 3
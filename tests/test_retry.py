@@ -0,0 +1,137 @@
+"""
+LLM 请求重试策略测试
+"""
+
+import asyncio
+import email.utils
+import time
+
+import httpx
+import pytest
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+import llm.retry
+from llm.retry import RetryPolicy, _retry_after, classify_error
+
+REQUEST = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+
+
+def _status(code, headers=None):
+    response = httpx.Response(code, headers=headers or {}, request=REQUEST)
+    return APIStatusError(f"status {code}", response=response, body=None)
+
+
+@pytest.mark.parametrize(
+    "exc, kind",
+    [
+        (_status(408), "server"),
+        (_status(409), "server"),
+        (_status(429), "rate_limit"),
+        (_status(500), "server"),
+        (_status(503), "server"),
+        (_status(400), None),
+        (_status(401), None),
+        (_status(404), None),
+        (APITimeoutError(request=REQUEST), "timeout"),
+        (httpx.ReadTimeout("slow", request=REQUEST), "timeout"),
+        (APIConnectionError(request=REQUEST), "connection"),
+        (httpx.ConnectError("refused", request=REQUEST), "connection"),
+        (ValueError("LLM返回了无效或者空的响应"), None),
+        (asyncio.CancelledError(), None),
+    ],
+)
+def test_classify_error(exc, kind):
+    assert classify_error(exc) == kind
+
+
+def test_retry_after_forms():
+    assert _retry_after(_status(429, {"retry-after-ms": "1500"})) == pytest.approx(1.5)
+    # 毫秒形式优先
+    assert _retry_after(_status(429, {"retry-after-ms": "200", "retry-after": "9"})) == pytest.approx(0.2)
+    assert _retry_after(_status(429, {"retry-after": "7"})) == pytest.approx(7.0)
+    assert _retry_after(_status(429, {"retry-after": "-3"})) == 0.0
+
+    date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert _retry_after(_status(429, {"retry-after": date})) == pytest.approx(30, abs=2)
+    past = email.utils.formatdate(time.time() - 30, usegmt=True)
+    assert _retry_after(_status(429, {"retry-after": past})) == 0.0
+
+    assert _retry_after(_status(429)) is None
+    assert _retry_after(_status(429, {"retry-after": "soon"})) is None
+
+
+def test_next_delay_backs_off_and_honours_retry_after():
+    policy = RetryPolicy({"max_attempts": 4, "base_delay": 1.0, "max_delay": 3.0})
+    policy.record_request()
+
+    assert 0.0 <= policy.next_delay(_status(503), 1) <= 1.0
+    assert 0.0 <= policy.next_delay(_status(503), 3) <= 3.0
+    assert policy.next_delay(_status(429, {"retry-after": "5"}), 1) >= 5.0
+    assert policy.next_delay(_status(503), 4) is None
+    assert policy.next_delay(_status(400), 1) is None
+
+    stats = policy.stats()
+    assert (stats["retries"], stats["exhausted"], stats["not_retryable"]) == (3, 1, 1)
+    assert stats["retries_by_class"] == {"timeout": 0, "connection": 0, "rate_limit": 1, "server": 2}
+
+
+def test_next_delay_refuses_long_retry_after():
+    policy = RetryPolicy({"max_retry_after": 10})
+    policy.record_request()
+
+    assert policy.next_delay(_status(429, {"retry-after": "11"}), 1) is None
+    assert policy.next_delay(_status(429, {"retry-after-ms": "10000"}), 1) == pytest.approx(10.0)
+    assert policy.stats()["retry_after_too_long"] == 1
+
+
+def test_next_delay_refuses_when_budget_is_used_up():
+    policy = RetryPolicy({"max_attempts": 100, "base_delay": 0, "budget_min_retries": 2, "budget_ratio": 0.5})
+    policy.record_request()
+
+    # 请求很少时按 budget_min_retries 放行
+    assert policy.next_delay(_status(503), 1) is not None
+    assert policy.next_delay(_status(503), 2) is not None
+    assert policy.next_delay(_status(503), 3) is None
+    assert policy.stats()["budget_exhausted"] == 1
+
+    # 请求增多后按 budget_ratio 放宽
+    for _ in range(7):
+        policy.record_request()
+    assert policy.stats()["budget"] == {"window_requests": 8, "window_retries": 2, "allowed": 4}
+    assert policy.next_delay(_status(503), 1) is not None
+    assert policy.next_delay(_status(503), 1) is not None
+    assert policy.next_delay(_status(503), 1) is None
+
+
+def test_budget_window_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm.retry.time, "monotonic", lambda: now[0])
+    policy = RetryPolicy({"base_delay": 0, "budget_min_retries": 1, "budget_window": 60})
+    policy.record_request()
+
+    assert policy.next_delay(_status(503), 1) is not None
+    assert policy.next_delay(_status(503), 1) is None
+    now[0] += 61
+    assert policy.next_delay(_status(503), 1) is not None
+
+
+def test_run_retries_transient_errors_only():
+    policy = RetryPolicy({"base_delay": 0})
+    failures = [_status(503), APIConnectionError(request=REQUEST)]
+
+    async def flaky():
+        if failures:
+            raise failures.pop(0)
+        return "ok"
+
+    assert asyncio.run(policy.run(flaky)) == "ok"
+
+    calls = []
+
+    async def bad_request():
+        calls.append(1)
+        raise _status(400)
+
+    with pytest.raises(APIStatusError):
+        asyncio.run(policy.run(bad_request))
+    assert len(calls) == 1
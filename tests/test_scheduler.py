@@ -0,0 +1,144 @@
+"""
+LLM 请求调度测试
+"""
+
+import asyncio
+import time
+
+import pytest
+
+import llm.scheduler
+from llm.scheduler import LLMScheduler, TokenBucket
+
+
+async def _hold(scheduler, order, name, priority, tokens=0, release=None):
+    async with scheduler.slot("p", priority, tokens=tokens):
+        order.append(name)
+        if release is not None:
+            await release.wait()
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_queue_drains_interactive_before_background():
+    scheduler = LLMScheduler({"default": {"max_concurrency": 1, "reserved_interactive": 0}})
+
+    async def run():
+        order = []
+        release = asyncio.Event()
+        blocker = asyncio.create_task(_hold(scheduler, order, "blocker", "background", release=release))
+        await _settle()
+        tasks = []
+        for name, priority in [("bg1", "background"), ("agent", "agent"), ("bg2", "background"), ("chat", "interactive")]:
+            tasks.append(asyncio.create_task(_hold(scheduler, order, name, priority)))
+            await _settle()
+        assert scheduler.stats()["providers"]["p"] == {"active": 1, "queued": 4}
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+        return order
+
+    assert asyncio.run(run()) == ["blocker", "chat", "agent", "bg1", "bg2"]
+    classes = scheduler.stats()["classes"]
+    assert classes["interactive"]["requests"] == 1
+    assert classes["background"]["requests"] == 3
+
+
+def test_reserved_slot_is_only_for_interactive():
+    scheduler = LLMScheduler({"default": {"max_concurrency": 2, "reserved_interactive": 1}})
+
+    async def run():
+        order = []
+        release = asyncio.Event()
+        first = asyncio.create_task(_hold(scheduler, order, "bg1", "background", release=release))
+        second = asyncio.create_task(_hold(scheduler, order, "bg2", "background", release=release))
+        await _settle()
+        # 第二个后台请求排队 用户对话使用预留槽位立即开始
+        chat = asyncio.create_task(_hold(scheduler, order, "chat", "interactive"))
+        await _settle()
+        started = list(order)
+        release.set()
+        await asyncio.gather(first, second, chat)
+        return started, order
+
+    started, order = asyncio.run(run())
+    assert started == ["bg1", "chat"]
+    assert order == ["bg1", "chat", "bg2"]
+
+
+def test_token_bucket_refill_and_overdraft(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(llm.scheduler.time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(60)
+
+    assert bucket.wait_time(60) == 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    now[0] += 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+
+    # 允许透支 之后按透支量等待 超过容量的请求按桶满计算
+    bucket.take(10)
+    assert bucket.wait_time(1) == pytest.approx(10.5)
+    now[0] += 300
+    assert bucket.wait_time(1000) == 0.0
+    assert bucket.level == 60
+
+
+def test_tokens_per_minute_throttles_and_keeps_priority():
+    # 每秒补充 10 个 token
+    scheduler = LLMScheduler({"default": {"max_concurrency": 4, "tokens_per_minute": 600}})
+
+    async def run():
+        order = []
+        await _hold(scheduler, order, "burst", "background", tokens=600)
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(_hold(scheduler, order, "bg", "background", tokens=2))]
+        await _settle()
+        tasks.append(asyncio.create_task(_hold(scheduler, order, "chat", "interactive", tokens=2)))
+        await asyncio.gather(*tasks)
+        return order, time.perf_counter() - started
+
+    order, elapsed = asyncio.run(run())
+    assert order == ["burst", "chat", "bg"]
+    # 两个请求各需 0.2s 的额度
+    assert 0.3 <= elapsed < 1.0
+    assert scheduler.needs_tokens("p")
+
+
+def test_cancelled_waiter_frees_its_place():
+    scheduler = LLMScheduler({"default": {"max_concurrency": 1, "reserved_interactive": 0}})
+
+    async def run():
+        order = []
+        release = asyncio.Event()
+        blocker = asyncio.create_task(_hold(scheduler, order, "blocker", "agent", release=release))
+        await _settle()
+        cancelled = asyncio.create_task(_hold(scheduler, order, "cancelled", "interactive"))
+        waiting = asyncio.create_task(_hold(scheduler, order, "waiting", "background"))
+        await _settle()
+        cancelled.cancel()
+        await _settle()
+        release.set()
+        await asyncio.gather(blocker, waiting)
+        return order
+
+    assert asyncio.run(run()) == ["blocker", "waiting"]
+
+
+def test_disabled_scheduler_does_not_queue():
+    scheduler = LLMScheduler({"enabled": False, "default": {"max_concurrency": 1}})
+
+    async def run():
+        order = []
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(_hold(scheduler, order, i, "background", release=release)) for i in range(3)]
+        await _settle()
+        started = list(order)
+        release.set()
+        await asyncio.gather(*tasks)
+        return started
+
+    assert asyncio.run(run()) == [0, 1, 2]
@@ -0,0 +1,74 @@
+"""
+会话全文检索测试
+"""
+
+from memory.schema import AssistantMessage, ToolMessage, UserMessage
+from memory.search import build_query, tokenize
+
+
+def _save(manager, session_id, *contents):
+    session = manager.create_session(session_id)
+    for i, content in enumerate(contents):
+        session.add_message(UserMessage(content) if i % 2 == 0 else AssistantMessage(content))
+    manager.save_session(session)
+    return session
+
+
+def _hits(manager, query, **kwargs):
+    hits, total = manager.search_messages(query, **kwargs)
+    assert total == len(hits)
+    return sorted((hit["session_id"], hit["index"]) for hit in hits)
+
+
+def test_cjk_bigrams():
+    assert tokenize("今天天气 OK") == ["今天", "天天", "天气", "气", "ok"]
+    assert build_query("天气") == '"天气"'
+    assert build_query("今天天气 ok") == '"今天 天天 天气" AND "ok"'
+    assert build_query("气") == '"气"*'
+
+
+def test_cjk_matches_contiguous_text_only(make_manager):
+    manager = make_manager()
+    _save(manager, "weather", "今天天气很好", "明天下雨", "天很蓝 气温低")
+    _save(manager, "other", "天气预报说 Sunny")
+
+    # 天 气 两字分开出现的第 2 条不算命中
+    assert _hits(manager, "天气") == [("other", 0), ("weather", 0)]
+    assert _hits(manager, "天气很") == [("weather", 0)]
+    assert _hits(manager, "下") == [("weather", 1)]
+    assert _hits(manager, "天气 sunny") == [("other", 0)]
+    assert _hits(manager, "天气", session_id="weather") == [("weather", 0)]
+
+    hits, _ = manager.search_messages("下雨")
+    assert hits[0]["role"] == "assistant" and hits[0]["snippet"] == "明天下雨"
+
+
+def test_tool_messages_are_not_indexed(make_manager):
+    manager = make_manager()
+    session = manager.create_session("tools")
+    session.add_message(UserMessage("查询天气"))
+    session.add_message(AssistantMessage("", tool_calls=[{"id": "c1", "type": "function"}]))
+    session.add_message(ToolMessage("天气数据", name="weather", tool_call_id="c1"))
+    manager.save_session(session)
+
+    assert _hits(manager, "天气") == [("tools", 0)]
+
+
+def test_rename_and_delete_update_the_index(make_service):
+    service = make_service()
+    manager = service.manager
+    _save(manager, "old", "你好世界")
+    _save(manager, "keep", "世界和平")
+
+    assert service.rename_session("old", "new")
+    assert _hits(manager, "世界") == [("keep", 0), ("new", 0)]
+    assert _hits(manager, "世界", session_id="old") == []
+
+    # 重命名后的会话继续追加 新消息按新ID索引
+    session = manager.get_or_create_session("new")
+    session.add_message(AssistantMessage("世界很大"))
+    manager.save_session(session)
+    assert _hits(manager, "世界") == [("keep", 0), ("new", 0), ("new", 1)]
+
+    assert manager.delete_session("new")
+    assert _hits(manager, "世界") == [("keep", 0)]
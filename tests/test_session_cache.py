@@ -0,0 +1,71 @@
+"""
+有界会话缓存测试
+"""
+
+import gc
+
+from memory.cache import SESSION_OVERHEAD_BYTES, SessionCache, estimate_message_bytes
+from memory.schema import Session, UserMessage
+
+
+def _session(session_id, messages=0, text="x"):
+    session = Session(session_id=session_id)
+    for i in range(messages):
+        session.add_message(UserMessage(f"{text}{i}"))
+    return session
+
+
+def test_evicts_least_recently_used_by_count():
+    evicted = []
+    cache = SessionCache(max_sessions=2, on_evict=lambda s: evicted.append(s.session_id))
+    cache["a"] = _session("a")
+    cache["b"] = _session("b")
+    assert cache.get("a") is not None
+    cache["c"] = _session("c")
+
+    assert evicted == ["b"]
+    assert list(cache) == ["a", "c"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evicts_by_bytes_but_keeps_the_session_in_use():
+    big = _session("big", messages=10, text="y" * 1000)
+    size = SESSION_OVERHEAD_BYTES + sum(estimate_message_bytes(m) for m in big.messages)
+    evicted = []
+    cache = SessionCache(max_sessions=10, max_bytes=size + 100, on_evict=lambda s: evicted.append(s.session_id))
+
+    cache["small"] = _session("small", messages=1)
+    cache["big"] = big
+    assert evicted == ["small"]
+    assert cache.stats()["resident_bytes"] == size
+
+    # 常驻会话增长后刷新占用 超出上限时唯一的常驻会话仍保留
+    big.add_message(UserMessage("z" * 1000))
+    cache.refresh("big")
+    assert list(cache) == ["big"]
+    assert cache.stats()["resident_bytes"] > size + 100
+
+
+def test_hibernated_session_wakes_while_still_referenced():
+    cache = SessionCache(max_sessions=1)
+    held = _session("held", messages=2)
+    cache["held"] = held
+    cache["other"] = _session("other")
+    assert list(cache) == ["other"]
+
+    # 仍被外部持有 唤醒的是同一对象 不会出现两个副本
+    assert "held" in cache
+    assert cache.get("held") is held
+    assert cache.stats()["wakeups"] == 1
+    assert list(cache) == ["held"]
+
+
+def test_hibernated_session_is_a_miss_once_collected():
+    cache = SessionCache(max_sessions=1)
+    cache["gone"] = _session("gone")
+    cache["other"] = _session("other")
+    gc.collect()
+
+    assert "gone" not in cache
+    assert cache.get("gone") is None
+    assert cache.stats()["misses"] == 1
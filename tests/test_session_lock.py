@@ -0,0 +1,146 @@
+"""
+会话级串行化压力测试
+"""
+
+import asyncio
+import random
+
+from agent.EmaAgent import EmaAgent
+from agent.session_lock import SessionLocks
+from llm.config import LLMConfig
+from memory.compressor import CompressionScheduler
+from memory.schema import Session
+
+
+class StubLLM:
+    """随机延迟后回显用户输入的假 LLM 未串行化时多个调用会交错写入同一会话"""
+
+    async def chat(self, messages, stream=False, **kwargs):
+        await asyncio.sleep(random.uniform(0.001, 0.01))
+        return f"reply to {messages[-1]['content']}"
+
+    async def stream_chat(self, messages, **kwargs):
+        for token in ("reply", " to ", messages[-1]["content"]):
+            await asyncio.sleep(random.uniform(0.0005, 0.003))
+            yield token
+
+
+class StubSessionService:
+    """只保存在内存中的会话服务"""
+
+    def __init__(self):
+        self.sessions = {}
+
+    def get_or_create_session(self, session_id):
+        return self.sessions.setdefault(session_id, Session(session_id=session_id))
+
+    def save_session(self, session):
+        pass
+
+
+class StubLive2D:
+    def set_emotion(self, emotion):
+        pass
+
+
+class StubAgent(EmaAgent):
+    """跳过配置加载 只保留对话路径需要的组件"""
+
+    def __init__(self):
+        self.service = StubSessionService()
+        self.llm_config = LLMConfig(tokenizer="approx")
+        self.llm_client = StubLLM()
+        self.system_prompt = "system"
+        self._system_tokens_cache = None
+        self.tts_manager = None
+        self.compressor = None
+        self.compression_scheduler = CompressionScheduler()
+        self.session_locks = SessionLocks()
+        self.live2d_service = StubLive2D()
+        self.memory_config = {"enabled": False}
+        self._long_term_memory = None
+        self._memory_init_lock = asyncio.Lock()
+        self._memory_tasks = set()
+
+    @property
+    def session_service(self):
+        return self.service
+
+
+def test_hold_serializes_one_session_in_arrival_order():
+    async def scenario():
+        locks = SessionLocks()
+        session = Session(session_id="locks")
+        inside = 0
+        peak = 0
+        order = []
+
+        async def call(i):
+            nonlocal inside, peak
+            async with locks.hold(session):
+                inside += 1
+                peak = max(peak, inside)
+                order.append(i)
+                await asyncio.sleep(random.uniform(0, 0.002))
+                inside -= 1
+
+        await asyncio.gather(*(call(i) for i in range(100)))
+        return peak, order, locks.stats()
+
+    peak, order, stats = asyncio.run(scenario())
+    assert peak == 1
+    assert order == list(range(100))
+    assert stats == {"active_sessions": 0, "waiting": 0}
+
+
+def test_hold_does_not_block_other_sessions():
+    async def scenario():
+        locks = SessionLocks()
+        first, second = Session(session_id="a"), Session(session_id="b")
+        entered = asyncio.Event()
+
+        async def slow():
+            async with locks.hold(first):
+                entered.set()
+                await asyncio.sleep(0.2)
+
+        task = asyncio.create_task(slow())
+        await entered.wait()
+        # 另一个会话不需要等待 first 释放
+        await asyncio.wait_for(_enter(locks, second), timeout=0.05)
+        await task
+
+    async def _enter(locks, session):
+        async with locks.hold(session):
+            pass
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_runs_on_one_session_are_serialized():
+    agent = StubAgent()
+    calls = 50
+
+    async def scenario():
+        runs = []
+        for i in range(calls):
+            if i % 2:
+                runs.append(agent.run(f"q{i}", session_id="shared", mode="chat"))
+            else:
+                runs.append(agent.run_stream(f"q{i}", session_id="shared", mode="chat", on_token=None))
+        random.shuffle(runs)
+        await asyncio.gather(*runs)
+
+    asyncio.run(scenario())
+
+    messages = agent.service.sessions["shared"].messages
+    # 每次调用写入一问一答 没有丢失
+    assert len(messages) == 2 * calls
+    asked = []
+    for user, assistant in zip(messages[0::2], messages[1::2]):
+        # 问答成对相邻 回复对应紧邻的提问 说明各调用没有交错
+        assert (user.role, assistant.role) == ("user", "assistant")
+        assert assistant.content == f"reply to {user.content}"
+        asked.append(user.content)
+    assert sorted(asked) == sorted(f"q{i}" for i in range(calls))
+    assert agent.session_locks.stats()["active_sessions"] == 0
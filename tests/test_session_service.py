@@ -0,0 +1,118 @@
+"""
+会话服务写回与重命名测试
+"""
+
+import threading
+
+import memory.manager
+from memory.journal import SessionJournal
+from memory.schema import AssistantMessage, UserMessage
+
+
+def _add_turn(session, i):
+    session.add_message(UserMessage(f"q{i}"))
+    session.add_message(AssistantMessage(f"a{i}"))
+
+
+def test_rename_waits_for_inflight_compaction(make_service, make_manager, monkeypatch):
+    service = make_service(compact_threshold=2)
+    manager = service.manager
+    session = manager.create_session("old")
+
+    # 让后台压实停在写快照途中
+    started, release = threading.Event(), threading.Event()
+    dump_messages = memory.manager.dump_messages
+
+    def slow_dump(*args, **kwargs):
+        if threading.current_thread().name.startswith("session-compact"):
+            started.set()
+            release.wait(5)
+        return dump_messages(*args, **kwargs)
+
+    monkeypatch.setattr(memory.manager, "dump_messages", slow_dump)
+    _add_turn(session, 0)
+    manager.save_session(session)
+    assert started.wait(5)
+
+    result = {}
+    renamer = threading.Thread(target=lambda: result.update(ok=service.rename_session("old", "new")))
+    renamer.start()
+    renamer.join(0.2)
+    # 压实持有快照锁期间 改名必须等待 否则压实会写入正在改名的旧目录
+    assert renamer.is_alive()
+
+    release.set()
+    renamer.join(5)
+    manager.wait_for_compaction()
+    assert result["ok"] is True
+    assert manager._get_session_dir("old") not in manager._journals
+
+    _add_turn(session, 1)
+    manager.save_session(session)
+    reloaded = make_manager().load_session("new")
+    assert [m.content for m in reloaded.messages] == ["q0", "a0", "q1", "a1"]
+
+
+def test_repeated_saves_of_one_session_are_coalesced(make_service, make_manager):
+    service = make_service(write_behind=True)
+    manager = service.manager
+    blocker = manager.create_session("blocker")
+    session = manager.create_session("busy")
+
+    # 写线程卡在第一个会话上时 同一会话的多次保存只保留最新状态
+    with manager.write_lock:
+        service.save_session(blocker)
+        for i in range(3):
+            _add_turn(session, i)
+            service.save_session(session)
+    assert manager.flush(5)
+
+    stats = manager.persist_stats()
+    assert stats["enqueued"] == 4
+    assert stats["coalesced"] == 2
+    assert stats["writes"] == 2
+    assert len(make_manager().load_session("busy").messages) == 6
+
+
+def test_close_drains_pending_saves(make_service, make_manager):
+    service = make_service(write_behind=True)
+    sessions = [service.manager.create_session(f"s{i}") for i in range(5)]
+    with service.manager.write_lock:
+        for i, session in enumerate(sessions):
+            _add_turn(session, i)
+            service.save_session(session)
+        assert service.manager.persist_stats()["queue_depth"] > 0
+
+    assert service.close(5)
+    reloaded = make_manager()
+    for i in range(5):
+        assert [m.content for m in reloaded.load_session(f"s{i}").messages] == [f"q{i}", f"a{i}"]
+
+
+def test_failed_save_keeps_the_session_dirty(make_service, make_manager, monkeypatch):
+    service = make_service(write_behind=True)
+    session = service.manager.create_session("flaky")
+    _add_turn(session, 0)
+    service.save_session(session)
+    assert service.manager.flush(5)
+
+    append = SessionJournal.append
+    failures = []
+
+    def fail_once(journal, records):
+        if not failures:
+            failures.append(records)
+            raise OSError("disk full")
+        return append(journal, records)
+
+    monkeypatch.setattr(SessionJournal, "append", fail_once)
+    _add_turn(session, 1)
+    service.save_session(session)
+    assert service.manager.flush(5)
+    assert service.manager.persist_stats()["failures"] == 1
+
+    # 失败的增量未计入游标 下一次保存一并写出
+    _add_turn(session, 2)
+    service.save_session(session)
+    assert service.close(5)
+    assert len(make_manager().load_session("flaky").messages) == 6
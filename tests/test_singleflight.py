@@ -0,0 +1,157 @@
+"""
+相同请求合并测试
+"""
+
+import asyncio
+
+import pytest
+
+from llm.singleflight import SingleFlight
+
+
+class Upstream:
+    """统计调用次数 在 release 置位前挂起的假上游"""
+
+    def __init__(self, result="done", error=None):
+        self.calls = 0
+        self.cancelled = 0
+        self.result = result
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def call(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return {"text": self.result}
+
+    async def tokens(self):
+        self.calls += 1
+        try:
+            for token in ("a", "b", "c"):
+                await self.release.wait()
+                self.release.clear()
+                yield token
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def test_identical_calls_share_one_upstream_request():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream()
+        joins = []
+        tasks = [
+            asyncio.create_task(flights.do("k", upstream.call, on_join=lambda: joins.append(1)))
+            for _ in range(5)
+        ]
+        other = asyncio.create_task(flights.do("other", Upstream().call))
+        await asyncio.sleep(0)
+        upstream.release.set()
+        results = await asyncio.gather(*tasks)
+        other.cancel()
+        return flights, upstream, results, joins
+
+    flights, upstream, results, joins = asyncio.run(run())
+    assert upstream.calls == 1
+    assert all(result is results[0] for result in results)
+    assert len(joins) == 4
+    assert flights.stats() == {
+        "inflight": 0, "inflight_streams": 0, "leaders": 2, "joined": 4, "stream_leaders": 0, "stream_joined": 0,
+    }
+
+
+def test_error_is_shared_and_next_call_starts_fresh():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream(error=RuntimeError("boom"))
+        tasks = [asyncio.create_task(flights.do("k", upstream.call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        errors = await asyncio.gather(*tasks, return_exceptions=True)
+
+        retry = Upstream()
+        retry.release.set()
+        return errors, await flights.do("k", retry.call), retry.calls
+
+    errors, result, calls = asyncio.run(run())
+    assert [str(e) for e in errors] == ["boom"] * 3
+    assert result == {"text": "done"} and calls == 1
+
+
+def test_cancelling_one_caller_keeps_the_others():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream()
+        leader = asyncio.create_task(flights.do("k", upstream.call))
+        joiner = asyncio.create_task(flights.do("k", upstream.call))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        assert leader.cancelled()
+        upstream.release.set()
+        return upstream, await joiner
+
+    upstream, result = asyncio.run(run())
+    assert result == {"text": "done"}
+    assert upstream.calls == 1 and upstream.cancelled == 0
+
+
+def test_last_caller_leaving_cancels_upstream():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream()
+        tasks = [asyncio.create_task(flights.do("k", upstream.call)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(0)
+        return flights, upstream
+
+    flights, upstream = asyncio.run(run())
+    assert upstream.cancelled == 1
+    assert flights.stats()["inflight"] == 0
+
+
+def test_stream_joiner_replays_tokens_and_survives_leader_cancel():
+    async def collect(flights, upstream, received):
+        async for token in flights.stream("k", upstream.tokens):
+            received.append(token)
+
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream()
+        first, second = [], []
+        leader = asyncio.create_task(collect(flights, upstream, first))
+        await asyncio.sleep(0)
+        upstream.release.set()
+        while not first:
+            await asyncio.sleep(0)
+
+        # 后到的订阅方先收到已产出的 token
+        joiner = asyncio.create_task(collect(flights, upstream, second))
+        while not second:
+            await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+        for _ in range(2):
+            upstream.release.set()
+            await asyncio.sleep(0.01)
+        await joiner
+        return flights, upstream, first, second
+
+    flights, upstream, first, second = asyncio.run(run())
+    assert first == ["a"]
+    assert second == ["a", "b", "c"]
+    assert upstream.calls == 1 and upstream.cancelled == 0
+    assert (flights.stats()["stream_leaders"], flights.stats()["stream_joined"]) == (1, 1)
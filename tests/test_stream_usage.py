@@ -0,0 +1,84 @@
+"""
+流式请求 stream_options 回退测试
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from llm.client import LLMClient
+from llm.config import LLMConfig
+from llm.telemetry import configure_llm_telemetry, get_llm_telemetry, telemetry_scope
+
+
+def _bad_request(message):
+    request = httpx.Request("POST", "https://example.invalid/v1/chat/completions")
+    response = httpx.Response(400, request=request)
+    return openai.BadRequestError(message, response=response, body={"error": {"message": message}})
+
+
+class FakeCompletions:
+    """按参数决定返回 400 还是正常流式响应的假上游"""
+
+    def __init__(self, reject):
+        self.reject = reject
+        self.calls = []
+
+    async def create(self, **params):
+        self.calls.append(params)
+        error = self.reject(params)
+        if error is not None:
+            raise error
+        return self._stream()
+
+    async def _stream(self):
+        for token in ("hello", " world"):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))], usage=None)
+
+
+class FakeClient(LLMClient):
+    """把上游替换为 FakeCompletions 的 LLMClient"""
+
+    def __init__(self, provider, completions):
+        super().__init__(LLMConfig(provider=provider, model="deepseek-chat", api_key="k", coalesce_requests=False))
+        self.fake = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    @property
+    def client(self):
+        return self.fake
+
+
+async def _stream(client):
+    with telemetry_scope("s", "chat"):
+        return "".join([token async for token in client.stream_chat([{"role": "user", "content": "hi"}])])
+
+
+@pytest.fixture(autouse=True)
+def _telemetry():
+    configure_llm_telemetry({"stream_usage": True})
+
+
+def test_stream_options_rejection_falls_back_once():
+    completions = FakeCompletions(
+        lambda p: _bad_request("Unrecognized request argument supplied: stream_options") if "stream_options" in p else None
+    )
+    client = FakeClient("strict-provider", completions)
+
+    assert asyncio.run(_stream(client)) == "hello world"
+    assert asyncio.run(_stream(client)) == "hello world"
+    # 首次请求被拒后去掉参数重试 之后的请求不再携带
+    assert ["stream_options" in c for c in completions.calls] == [True, False, False]
+    assert not get_llm_telemetry().wants_stream_usage("strict-provider")
+
+
+def test_other_bad_requests_are_raised_without_marking():
+    completions = FakeCompletions(lambda p: _bad_request("This model's maximum context length is 65536 tokens"))
+    client = FakeClient("context-provider", completions)
+
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(_stream(client))
+    assert len(completions.calls) == 1
+    assert get_llm_telemetry().wants_stream_usage("context-provider")
@@ -0,0 +1,175 @@
+"""
+多级摘要树测试
+"""
+
+import asyncio
+import json
+
+from llm.tokenizer import get_token_counter
+from memory.compressor import CompressionScheduler, Compressor
+from memory.schema import (
+    LEGACY_SUMMARY_LEVEL,
+    AssistantMessage,
+    CompressionHistory,
+    CompressionRecord,
+    Session,
+    UserMessage,
+)
+
+
+class FakeCompressor(Compressor):
+    """
+    不调用 LLM 的压缩器 摘要文本标明覆盖的内容 gate 用于挂起压缩
+    """
+
+    def __init__(self, rollup_fanout=2, gate=None):
+        super().__init__(rollup_fanout=rollup_fanout)
+        self.gate = gate
+
+    async def compress(self, messages, existing_summary=""):
+        if self.gate is not None:
+            await self.gate.wait()
+        return "+".join(m.content for m in messages)
+
+    async def rollup(self, summaries):
+        return "(" + "|".join(summaries) + ")"
+
+
+def _session(turns=0):
+    session = Session("tree", compression_threshold=4, keep_recent_turns=2, min_compression_interval_hours=0)
+    _add_turns(session, turns)
+    return session
+
+
+def _add_turns(session, turns):
+    for _ in range(turns):
+        i = len(session.messages) // 2
+        session.add_message(UserMessage(f"q{i}"))
+        session.add_message(AssistantMessage(f"a{i}"))
+
+
+def _record(start, end, level=0, summary="s"):
+    return CompressionRecord("t", end - start, 1, summary, (start, end), level=level)
+
+
+def test_fanout_siblings_roll_up_into_one_parent():
+    session = _session(1)
+    compressor = FakeCompressor(rollup_fanout=2)
+
+    async def run():
+        for _ in range(4):
+            _add_turns(session, 2)
+            assert await session.compress_if_needed(compressor)
+
+    asyncio.run(run())
+
+    history = session.compression_history
+    assert [(r.level, r.covers()) for r in history.records] == [
+        (0, (0, 4)), (0, (4, 8)), (1, (0, 8)),
+        (0, (8, 12)), (0, (12, 16)), (1, (8, 16)), (2, (0, 16)),
+    ]
+    assert [(n.level, n.covers()) for n in history.nodes] == [(2, (0, 16))]
+    assert history.nodes[0].summary == "((q0+a0+q1+a1|q2+a2+q3+a3)|(q4+a4+q5+a5|q6+a6+q7+a7))"
+    assert history.nodes[0].original_count == 16
+
+
+def test_place_evicts_covered_children():
+    history = CompressionHistory()
+    for record in (_record(0, 4), _record(4, 8), _record(8, 12)):
+        history.add_record(record)
+    assert history.tail_run(2) == history.nodes[:2]
+
+    parent = _record(0, 8, level=1)
+    history.add_record(parent)
+
+    assert history.nodes == [parent, history.records[2]]
+    # 由 records 重建得到相同的节点集合
+    rebuilt = CompressionHistory.from_dict(history.to_dict())
+    assert [n.covers() for n in rebuilt.nodes] == [(0, 8), (8, 12)]
+
+
+def test_select_nodes_keeps_newest_within_budget():
+    counter = get_token_counter("approx")
+    history = CompressionHistory()
+    for i, summary in enumerate(["old " * 50, "mid " * 10, "new " * 10]):
+        history.add_record(_record(i * 4, i * 4 + 4, summary=summary))
+    newest = history.nodes[1:]
+    budget = sum(node.token_count(counter) for node in newest)
+
+    assert history.select_nodes(counter, budget) == newest
+    assert history.select_nodes(counter, budget - 1) == newest[1:]
+    assert history.select_nodes(counter, budget + history.nodes[0].token_count(counter)) == history.nodes
+
+
+def test_stale_plans_are_discarded():
+    session = _session(3)
+    segment = session.plan_compression()
+    assert (segment.start, segment.end) == (0, 4)
+
+    # 消息被替换后 计划中的消息已不在原位置
+    session.messages = [UserMessage(m.content) for m in session.messages]
+    assert not session.commit_compression(segment, "stale")
+    assert session.compressed_until_index == 0
+
+    for record in (_record(0, 4), _record(4, 8)):
+        session.compression_history.add_record(record)
+    rollup = session.plan_rollup(2)
+    assert rollup.level == 1 and (rollup.start, rollup.end) == (0, 8)
+
+    session.compression_history.add_record(_record(8, 12))
+    assert not session.commit_compression(rollup, "stale")
+    assert len(session.compression_history.records) == 3
+
+
+def test_scheduler_discards_result_when_session_changes():
+    session = _session(3)
+    committed = []
+
+    async def run():
+        gate = asyncio.Event()
+        scheduler = CompressionScheduler(on_commit=lambda s, records: committed.append(records))
+        assert scheduler.schedule(session, FakeCompressor(gate=gate))
+        assert not scheduler.schedule(session, FakeCompressor())
+        await asyncio.sleep(0)
+
+        # 后台压缩挂起期间 前台先提交了同一区间
+        plan = session.plan_compression()
+        assert session.commit_compression(plan, "foreground")
+        gate.set()
+        assert await scheduler.wait(timeout=1)
+        return scheduler.stats()
+
+    stats = asyncio.run(run())
+
+    assert stats["discarded"] == 1 and stats["committed"] == 0
+    assert committed == []
+    assert [r.summary for r in session.compression_history.records] == ["foreground"]
+
+
+def test_legacy_compression_json_without_level(make_manager, tmp_path):
+    manager = make_manager(storage_mode="snapshot")
+    session = manager.create_session("legacy")
+    _add_turns(session, 10)
+    manager.save_session(session)
+
+    legacy = {
+        "records": [
+            {"compressed_at": "t", "original_count": 6, "compressed_count": 1, "summary": "first", "compressed_range": [0, 6]},
+            {"compressed_at": "t", "original_count": 6, "compressed_count": 1, "summary": "cumulative", "compressed_range": [6, 12]},
+        ],
+        "current_summary": "cumulative",
+        "total_compressions": 2,
+    }
+    (tmp_path / "legacy" / "compression.json").write_text(json.dumps(legacy), encoding="utf-8")
+
+    loaded = make_manager(storage_mode="snapshot").load_session("legacy")
+    history = loaded.compression_history
+
+    assert [r.level for r in history.records] == [LEGACY_SUMMARY_LEVEL] * 2
+    assert history.records[1].covers() == (0, 12)
+    # 累积摘要覆盖此前全部历史 只保留最新的一条 且不参与向上汇总
+    assert [n.summary for n in history.nodes] == ["cumulative"]
+    assert history.tail_run(2) == []
+
+    history.add_record(_record(12, 16))
+    assert [n.covers() for n in history.nodes] == [(0, 12), (12, 16)]
@@ -0,0 +1,28 @@
+"""
+会话导出导入测试
+"""
+
+from memory.schema import AssistantMessage, UserMessage
+from memory.transfer import SessionImporter, iter_export
+
+
+def test_non_object_lines_are_reported_not_raised(make_manager, tmp_path):
+    source = make_manager(tmp_path / "source")
+    session = source.create_session("demo")
+    session.add_message(UserMessage("q"))
+    session.add_message(AssistantMessage("a"))
+    source.save_session(session)
+    lines = list(iter_export(source))
+    source.close()
+
+    target = make_manager(tmp_path / "target")
+    importer = SessionImporter(target)
+    importer.feed_lines(["[1, 2]", '"x"', *lines])
+    summary = importer.close()
+
+    assert len(importer.errors) == 2
+    assert importer.errors[0].startswith("第 1 行")
+    assert importer.errors[1].startswith("第 2 行")
+    assert importer.imported == ["demo"]
+    assert [m.content for m in target.load_session("demo").messages] == ["q", "a"]
+    assert summary["messages"] == 2
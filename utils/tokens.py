@@ -0,0 +1,41 @@
+"""
+token 计数的公共定义
+
+计数器基类与每条消息的固定开销 不依赖 LLM 客户端 memory 等模块可直接引用
+具体计数器的实现与注册见 `llm.tokenizer`
+"""
+
+
+# 每条消息除正文外的固定开销(角色标记与分隔符) 与 OpenAI 官方估算口径一致
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenCounter:
+    """
+    token 计数器基类
+
+    Args:
+        None
+
+    Returns:
+        TokenCounter: 计数器实例
+
+    Examples:
+    >>> from llm.tokenizer import ApproxTokenCounter
+    >>> isinstance(ApproxTokenCounter(), TokenCounter)
+    True
+    """
+
+    name = "base"
+
+    def count(self, text: str) -> int:
+        """
+        统计文本 token 数
+
+        Args:
+            text (str): 文本
+
+        Returns:
+            int: token 数
+        """
+        raise NotImplementedError